@@ -23,6 +23,7 @@ from binascii import hexlify, unhexlify
 import hashlib
 import logging
 import math
+import multiprocessing
 import os
 import platform
 import random
@@ -56,8 +57,9 @@ from armoryengine.ArmoryUtils import HMAC256, \
    unixTimeToFormatStr, binary_to_hex, BTC_HOME_DIR, secondsToHumanTime, \
    LEVELDB_BLKDATA, LOGPPRINT, hex_to_binary, \
    getRandomHexits_NotSecure, coin2strNZS, bytesToHumanSize, hash256, \
-   DEFAULT_ADDR_TYPE, hex_switchEndian, BLOCKEXPLORE_NAME, getBridgeArgList
-from armoryengine.Settings import TheSettings
+   DEFAULT_ADDR_TYPE, hex_switchEndian, BLOCKEXPLORE_NAME, getBridgeArgList, \
+   logSystemDetails
+from armoryengine.Settings import TheSettings, exitProcess
 from armoryengine.AddressUtils import base58_to_binary, Hash160ToScrAddr, \
    hash160_to_addrStr, addrStr_to_hash160, scrAddr_to_script, \
    scrAddr_to_addrStr, LOGRAWDATA
@@ -316,7 +318,7 @@ class ArmoryMainWindow(QMainWindow):
       # acquireProcessMutex may have set this flag if something went wrong
       if self.abortLoad:
          LOGWARN('Armory startup was aborted.  Closing.')
-         os._exit(0)
+         exitProcess(0)
 
       # We need to query this once at the beginning, to avoid having
       # strange behavior if the user changes the setting but hasn't
@@ -1945,6 +1947,7 @@ class ArmoryMainWindow(QMainWindow):
             wo2 = wltLoad.watchingOnly
             if wo1 and not wo2:
                prevWltPath = self.walletMap[wltID].walletPath
+               self.walletMap[wltID].releaseUtxoCache()
                self.walletMap[wltID] = wltLoad
                LOGWARN('First wallet is more useful than the second one...')
                LOGWARN('     Wallet 1 (loaded):  %s', fpath)
@@ -2673,6 +2676,7 @@ class ArmoryMainWindow(QMainWindow):
 
       #self.walletMap[wltID].unregisterWallet()
 
+      self.walletMap[wltID].releaseUtxoCache()
       del self.walletMap[wltID]
       del self.walletIndices[wltID]
       self.walletIDSet.remove(wltID)
@@ -4633,9 +4637,15 @@ class ArmoryMainWindow(QMainWindow):
 
    #############################################################################
    def updateWalletData(self):
-      for wltid in self.walletMap:
-         self.walletMap[wltid].updateBalancesAndCount()
-         self.walletMap[wltid].getAddrDataFromDB()
+      #pipeline the wallet queries, this is 2 round trips per wallet otherwise
+      applyList = []
+      with TheBridge.newBatch() as batch:
+         for wltid in self.walletMap:
+            applyList.append(
+               self.walletMap[wltid].queueWalletDataUpdate(batch))
+
+      for applyReplies in applyList:
+         applyReplies()
 
       for lbid in self.cppLockboxWltMap:
          self.cppLockboxWltMap[lbid].getBalancesAndCountFromDB(\
@@ -4819,7 +4829,7 @@ class ArmoryMainWindow(QMainWindow):
                               QMessageBox.Ok)
          #this is a critical error reporting channel, should kill the app right
          #after
-         os._exit(0)
+         exitProcess(0)
 
       elif action == SCAN_ACTION:
          idList = args[0]
@@ -5210,10 +5220,11 @@ class ArmoryMainWindow(QMainWindow):
       try:
          # Save the main window geometry in the settings file
          try:
-            TheSettings.set('MainGeometry',   self.saveGeometry().toHex())
-            TheSettings.set('MainWalletCols', saveTableView(self.walletsView))
-            if self.ledgerView:
-               TheSettings.set('MainLedgerCols', saveTableView(self.ledgerView))
+            with TheSettings.transaction():
+               TheSettings.set('MainGeometry',   self.saveGeometry().toHex())
+               TheSettings.set('MainWalletCols', saveTableView(self.walletsView))
+               if self.ledgerView:
+                  TheSettings.set('MainLedgerCols', saveTableView(self.ledgerView))
          except Exception as e:
             print ("- failed to save main geometry -")
             print (e)
@@ -5572,7 +5583,12 @@ class ArmoryMainWindow(QMainWindow):
 
 ############################################
 
-if 1:
+# signature verification workers are spawned, they import this file again
+# and must not start another instance of the application
+if __name__ == '__main__':
+   multiprocessing.freeze_support()
+   logSystemDetails()
+
    #setup splash screen
    pixLogo = QPixmap('./img/splashlogo.png')
    if USE_TESTNET or USE_REGTEST:
@@ -5608,4 +5624,4 @@ if 1:
 
    SPLASH.finish(armoryMainWindow)
    QAPP.setQuitOnLastWindowClosed(True)
-   os._exit(QAPP.exec_())
+   exitProcess(QAPP.exec_())
@@ -16,7 +16,8 @@ import binascii
 from armoryengine.BinaryPacker import BinaryPacker, UINT8, BINARY_CHUNK
 from armoryengine.ArmoryUtils import DATATYPE, ADDRBYTE, P2SHBYTE, \
    binary_to_hex, prettyHex, hash256, hash160, SCRADDR_BYTE_LIST, \
-   ADDRBYTE, P2SHBYTE, LOGERROR
+   SCRADDR_P2WPKH_BYTE, SCRADDR_P2WSH_BYTE, BECH32_PREFIX, LOGERROR, \
+   ChecksumError, InvalidHashError, P2SHNotSupportedError, PRIVKEYBYTE
 
 
 ################################################################################
@@ -55,6 +56,12 @@ def Hash160ToScrAddr(a160):
 
 ################################################################################
 # BINARY/BASE58 CONVERSIONS
+# Encoding pops two digits per divmod off a 58*58 pair table, decoding uses a
+# char->digit dict instead of BASE58CHARS.index()
+BASE58_DIGITS = dict((c, i) for i, c in enumerate(BASE58CHARS))
+BASE58_PAIRS  = [a + b for a in BASE58CHARS for b in BASE58CHARS]
+
+####
 def binary_to_base58(binstr):
    """
    This method applies the Bitcoin-specific conversion from binary to Base58
@@ -65,23 +72,19 @@ def binary_to_base58(binstr):
    special kind of Base58 converter, which makes it usable for encoding other
    data, such as ECDSA keys or scripts.
    """
-   padding = 0
-   for b in binstr:
-      if b==b'\x00':
-         padding+=1
-      else:
-         break
+   binstr = bytes(binstr)
+   stripped = binstr.lstrip(b'\x00')
+   padding = len(binstr) - len(stripped)
 
-   n = 0
-   for ch in binstr:
-      n *= 256
-      n += ch
-
-   b58 = ''
+   n = int.from_bytes(stripped, 'big')
+   pairs = []
    while n > 0:
-      n, r = divmod (n, 58)
-      b58 = BASE58CHARS[r] + b58
-   return '1'*padding + b58
+      n, r = divmod(n, 3364)
+      pairs.append(BASE58_PAIRS[r])
+
+   #the top pair may be zero padded, those aren't leading zero bytes
+   b58 = ''.join(reversed(pairs)).lstrip(BASE58CHARS[0])
+   return BASE58CHARS[0]*padding + b58
 
 ####
 def base58_to_binary(s):
@@ -100,31 +103,53 @@ def base58_to_binary(s):
 
    # Convert the string to an integer
    n = 0
-   for c in s:
-      n *= 58
-      if c not in BASE58CHARS:
-         raise NonBase58CharacterError('Character %r is not a valid base58 character' % c)
-      digit = BASE58CHARS.index(c)
-      n += digit
-
-   # Convert the integer to bytes
-   h = '%x' % n
-   if len(h) % 2:
-      h = '0' + h
-   res = bytes(binascii.unhexlify(h.encode('utf8')))
+   try:
+      for c in s:
+         n = n*58 + BASE58_DIGITS[c]
+   except KeyError:
+      raise NonBase58CharacterError(
+         'Character %r is not a valid base58 character' % c)
 
    # Add padding back.
-   pad = 0
-   for c in s[:-1]:
-      if c == BASE58CHARS[0]: pad += 1
-      else: break
-   return b'\x00' * pad + res
+   pad = len(s) - len(s.lstrip(BASE58CHARS[0]))
+   return b'\x00' * pad + n.to_bytes((n.bit_length() + 7) // 8, 'big')
+
+####
+def binary_to_base58check(binstr):
+   """ Base58 with the 4-byte hash256 checksum appended """
+   return binary_to_base58(binstr + hash256(binstr)[:4])
+
+####
+def base58check_to_binary(s):
+   """ Inverse of binary_to_base58check, raises ChecksumError on mismatch """
+   binstr = base58_to_binary(s)
+   if len(binstr) < 4 or hash256(binstr[:-4])[:4] != binstr[-4:]:
+      raise ChecksumError('Base58 string has invalid checksum')
+   return binstr[:-4]
+
+####
+def base58_encode_many(binList, withChecksum=True):
+   encodeFunc = binary_to_base58check if withChecksum else binary_to_base58
+   return [encodeFunc(binstr) for binstr in binList]
+
+####
+def base58_decode_many(strList, withChecksum=True):
+   """
+   Decodes a list of base58 strings. Entries that fail to decode (bad
+   characters or checksum) come back as None rather than failing the batch.
+   """
+   decodeFunc = base58check_to_binary if withChecksum else base58_to_binary
+   result = []
+   for s in strList:
+      try:
+         result.append(decodeFunc(s))
+      except (ChecksumError, NonBase58CharacterError):
+         result.append(None)
+   return result
 
 ####
 def encodePrivKeyBase58(privKeyBin):
-   bin33 = PRIVKEYBYTE + privKeyBin
-   chk = computeChecksum(bin33)
-   return binary_to_base58(bin33 + chk)
+   return binary_to_base58check(PRIVKEYBYTE + privKeyBin)
 
 ################################################################################
 def hash160_to_addrStr(binStr, netbyte=ADDRBYTE):
@@ -136,24 +161,11 @@ def hash160_to_addrStr(binStr, netbyte=ADDRBYTE):
    if not len(binStr) == 20:
       raise InvalidHashError('Input string is %d bytes' % len(binStr))
 
-   packer = BinaryPacker()
-   packer.put(BINARY_CHUNK, netbyte)
-   packer.put(BINARY_CHUNK, binStr)
-   hash21 = hash256(packer.getBinaryString())
-   packer.put(BINARY_CHUNK, hash21[:4])
-   return binary_to_base58(packer.getBinaryString())
+   return binary_to_base58check(netbyte + binStr)
 
 ################################################################################
 def hash160_to_p2shAddrStr(binStr):
-   if not len(binStr) == 20:
-      raise InvalidHashError('Input string is %d bytes' % len(binStr))
-
-   packer = BinaryPacker()
-   packer.put(BINARY_CHUNK, P2SHBYTE)
-   packer.put(BINARY_CHUNK, binStr)
-   hash21 = hash256(packer.getBinaryString())
-   packer.put(BINARY_CHUNK, hash21[:4])
-   return binary_to_base58(packer.getBinaryString())
+   return hash160_to_addrStr(binStr, P2SHBYTE)
 
 ################################################################################
 def binScript_to_p2shAddrStr(binScript):
@@ -164,17 +176,18 @@ def addrStr_is_p2sh(b58Str):
    if len(b58Str)==0:
       return False
 
-   if sum([(0 if c in BASE58CHARS else 1) for c in b58Str]) > 0:
+   try:
+      binStr = base58_to_binary(b58Str)
+   except NonBase58CharacterError:
       return False
 
-   binStr = base58_to_binary(b58Str)
    if not len(binStr)==25:
       return False
 
    if not hash256(binStr[:21])[:4] == binStr[-4:]:
       return False
 
-   return (binStr[0] == P2SHBYTE)
+   return (binStr[:1] == P2SHBYTE)
 
 ################################################################################
 # As of version 0.90.1, this returns the prefix byte with the hash160.  This is
@@ -187,16 +200,16 @@ def addrStr_to_hash160(b58Str, p2shAllowed=True, \
    addrByteInt = int.from_bytes(addrByte, "little")
    p2shByteInt = int.from_bytes(p2shByte, "little")
 
-   if not p2shAllowed and binStr[0]==addrByteInt:
-      raise P2SHNotSupportedError
    if not len(binStr) == 25:
       raise BadAddressError('Address string is %d bytes' % len(binStr))
+   if not p2shAllowed and binStr[0]==p2shByteInt:
+      raise P2SHNotSupportedError
 
    if not hash256(binStr[:21])[:4] == binStr[-4:]:
       raise ChecksumError('Address string has invalid checksum')
 
    if not binStr[0] in (addrByteInt, p2shByteInt):
-      raise BadAddressError('Unknown addr prefix: %s' % binary_to_hex(binStr[0]))
+      raise BadAddressError('Unknown addr prefix: %s' % binary_to_hex(binStr[:1]))
 
    return (binStr[0], binStr[1:-4])
 
@@ -227,33 +240,150 @@ def isLikelyDataType(theStr, dtype=None):
       return dtype==ret
 
 ################################################################################
+# BECH32 (BIP173) CONVERSIONS
+# Only version 0 witness programs are supported, same as the C++ side
+# (BtcUtils::scrAddrToSegWitAddress)
+BECH32CHARS = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+BECH32_REVERSE = dict((c, i) for i, c in enumerate(BECH32CHARS))
+BECH32_GENERATOR = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+
+####
+def bech32_polymod(values):
+   chk = 1
+   for v in values:
+      top = chk >> 25
+      chk = (chk & 0x1ffffff) << 5 ^ v
+      for i in range(5):
+         if (top >> i) & 1:
+            chk ^= BECH32_GENERATOR[i]
+   return chk
+
+####
+def bech32_hrpExpand(hrp):
+   return [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+
+####
+def convertBits(data, fromBits, toBits, pad=True):
+   acc = 0
+   bits = 0
+   ret = []
+   maxv = (1 << toBits) - 1
+   for value in data:
+      if value < 0 or (value >> fromBits):
+         return None
+      acc = (acc << fromBits) | value
+      bits += fromBits
+      while bits >= toBits:
+         bits -= toBits
+         ret.append((acc >> bits) & maxv)
+   if pad:
+      if bits:
+         ret.append((acc << (toBits - bits)) & maxv)
+   elif bits >= fromBits or ((acc << (toBits - bits)) & maxv):
+      return None
+   return ret
+
+####
+def bech32_encode(witProg, witVer=0, hrp=None):
+   """ Witness program to segwit address string """
+   if hrp is None:
+      hrp = BECH32_PREFIX
+   if witVer != 0 or len(witProg) not in (20, 32):
+      raise BadAddressError('Unsupported witness program')
+
+   data = [witVer] + convertBits(witProg, 8, 5)
+   polymod = bech32_polymod(bech32_hrpExpand(hrp) + data + [0]*6) ^ 1
+   chk = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+   return hrp + '1' + ''.join([BECH32CHARS[d] for d in data + chk])
+
+####
+def bech32_decode(addrStr, hrp=None):
+   """ Segwit address string to (witVer, witProg) """
+   if hrp is None:
+      hrp = BECH32_PREFIX
+
+   if addrStr.lower() != addrStr and addrStr.upper() != addrStr:
+      raise BadAddressError('Mixed case bech32 string')
+   addrStr = addrStr.lower()
+
+   pos = addrStr.rfind('1')
+   if pos < 1 or pos + 7 > len(addrStr) or len(addrStr) > 90:
+      raise BadAddressError('Invalid bech32 string')
+   if addrStr[:pos] != hrp:
+      raise BadAddressError('Wrong bech32 prefix for this network')
+
+   try:
+      data = [BECH32_REVERSE[c] for c in addrStr[pos+1:]]
+   except KeyError:
+      raise BadAddressError('Invalid bech32 character')
+
+   if bech32_polymod(bech32_hrpExpand(hrp) + data) != 1:
+      raise ChecksumError('Address string has invalid checksum')
+
+   witVer = data[0]
+   witProg = convertBits(data[1:-6], 5, 8, False)
+   if witProg is None or witVer != 0 or len(witProg) not in (20, 32):
+      raise BadAddressError('Unsupported witness program')
+   return (witVer, bytes(witProg))
+
+################################################################################
+# SCRIPT/SCRADDR/ADDRSTR CONVERSIONS
+# The standard templates are resolved locally, the bridge is only queried for
+# scripts it takes a hash (P2PK, multisig, non-standard) to reduce.
 def scrAddr_to_script(scraddr):
    """
    Convert a scrAddr string (used by BDM) to the correct TxOut script
-   Note this only works for P2PKH and P2SH scraddrs.  Multi-sig and
-   all non-standard scripts cannot be derived from scrAddrs.  In a way,
-   a scrAddr is intended to be an intelligent "hash" of the script,
+   Note this only works for P2PKH, P2SH, P2WPKH and P2WSH scraddrs.
+   Multi-sig and all non-standard scripts cannot be derived from scrAddrs.
+   In a way, a scrAddr is intended to be an intelligent "hash" of the script,
    and it's a perk that most of the time we can reverse it to get the script.
    """
    if len(scraddr)==0:
       raise BadAddressError('Empty scraddr')
 
-   prefix = scraddr[0]
-   if not prefix in SCRADDR_BYTE_LIST or not len(scraddr)==21:
+   prefix = scraddr[:1]
+   if len(scraddr)==21:
+      if prefix==ADDRBYTE:
+         return b'\x76\xa9\x14' + scraddr[1:] + b'\x88\xac'
+      elif prefix==P2SHBYTE:
+         return b'\xa9\x14' + scraddr[1:] + b'\x87'
+      elif prefix==SCRADDR_P2WPKH_BYTE:
+         return b'\x00\x14' + scraddr[1:]
+   elif len(scraddr)==33 and prefix==SCRADDR_P2WSH_BYTE:
+      return b'\x00\x20' + scraddr[1:]
+
+   if not prefix in SCRADDR_BYTE_LIST:
       LOGERROR('Bad scraddr: "%s"' % binary_to_hex(scraddr))
       raise BadAddressError('Invalid ScrAddress')
 
-   if prefix==ADDRBYTE:
-      return hash160_to_p2pkhash_script(scraddr[1:])
-   elif prefix==P2SHBYTE:
-      return hash160_to_p2sh_script(scraddr[1:])
-   else:
-      LOGERROR('Unsupported scraddr type: "%s"' % binary_to_hex(scraddr))
-      raise BadAddressError('Can only convert P2PKH and P2SH scripts')
+   LOGERROR('Unsupported scraddr type: "%s"' % binary_to_hex(scraddr))
+   raise BadAddressError('Can only convert P2PKH, P2SH and segwit scripts')
+
+####
+def script_to_scrAddrLocal(binScript):
+   """ Template match standard scripts, None if the bridge has to do it """
+   sz = len(binScript)
+   if sz==25:
+      if binScript[:3]==b'\x76\xa9\x14' and binScript[23:]==b'\x88\xac':
+         return ADDRBYTE + binScript[3:23]
+   elif sz==23:
+      if binScript[:2]==b'\xa9\x14' and binScript[22:]==b'\x87':
+         return P2SHBYTE + binScript[2:22]
+   elif sz==22:
+      if binScript[:2]==b'\x00\x14':
+         return SCRADDR_P2WPKH_BYTE + binScript[2:]
+   elif sz==34:
+      if binScript[:2]==b'\x00\x20':
+         return SCRADDR_P2WSH_BYTE + binScript[2:]
+   return None
 
 ################################################################################
 def script_to_scrAddr(binScript):
    """ Convert a binary script to scrAddr string (used by BDM) """
+   scrAddr = script_to_scrAddrLocal(binScript)
+   if scrAddr is not None:
+      return scrAddr
+
    from armoryengine.CppBridge import TheBridge
    return TheBridge.scriptUtils.getScrAddrForScript(binScript)
 
@@ -264,6 +394,13 @@ def script_to_addrStr(binScript):
 
 ################################################################################
 def scrAddr_to_addrStr(scrAddr):
+   prefix = scrAddr[:1]
+   if len(scrAddr)==21 and prefix in (ADDRBYTE, P2SHBYTE):
+      return hash160_to_addrStr(scrAddr[1:], prefix)
+   elif (len(scrAddr)==21 and prefix==SCRADDR_P2WPKH_BYTE) or \
+        (len(scrAddr)==33 and prefix==SCRADDR_P2WSH_BYTE):
+      return bech32_encode(scrAddr[1:])
+
    from armoryengine.CppBridge import TheBridge
    return TheBridge.scriptUtils.getAddrStrForScrAddr(scrAddr)
 
@@ -275,21 +412,71 @@ def scrAddr_to_hash160(scrAddr):
    atype, a160 = addrStr_to_hash160(addr)
    return (atype, a160)
 
+################################################################################
+def addrStr_is_bech32(addrStr):
+   return addrStr.lower().startswith(BECH32_PREFIX + '1')
+
 ################################################################################
 def addrStr_to_scrAddr(addrStr, p2pkhByte = ADDRBYTE, p2shByte = P2SHBYTE):
    if addrStr == '':
       return ''
 
-   if not checkAddrStrValid(addrStr, [p2pkhByte, p2shByte]):
-      BadAddressError('Invalid address: "%s"' % addrStr)
+   if addrStr_is_bech32(addrStr):
+      witVer, witProg = bech32_decode(addrStr)
+      if len(witProg)==20:
+         return SCRADDR_P2WPKH_BYTE + witProg
+      return SCRADDR_P2WSH_BYTE + witProg
 
+   #addrStr_to_hash160 checks length, checksum and prefix
    atype, a160 = addrStr_to_hash160(addrStr, True, p2pkhByte, p2shByte)
    if atype==int.from_bytes(p2pkhByte, "little"):
       return p2pkhByte + a160
    elif atype==int.from_bytes(p2shByte, "little"):
       return p2shByte + a160
    else:
-      BadAddressError('Invalid address: "%s"' % addrStr)
+      raise BadAddressError('Invalid address: "%s"' % addrStr)
+
+################################################################################
+def addrStr_to_script(addrStr):
+   return scrAddr_to_script(addrStr_to_scrAddr(addrStr))
+
+################################################################################
+# Batch conversions. Invalid entries come back as None rather than raising,
+# so a bulk list (payout files and such) can be validated in one pass.
+def batchConvert(convertFunc, items):
+   result = []
+   for item in items:
+      try:
+         result.append(convertFunc(item))
+      except (BadAddressError, ChecksumError, InvalidHashError,
+              NonBase58CharacterError, ValueError):
+         result.append(None)
+   return result
+
+####
+def addrStrs_to_scrAddrs(addrStrList):
+   return batchConvert(addrStr_to_scrAddr, addrStrList)
+
+####
+def addrStrs_to_scripts(addrStrList):
+   return batchConvert(addrStr_to_script, addrStrList)
+
+####
+def scrAddrs_to_scripts(scrAddrList):
+   return batchConvert(scrAddr_to_script, scrAddrList)
+
+####
+def scrAddrs_to_addrStrs(scrAddrList):
+   return batchConvert(scrAddr_to_addrStr, scrAddrList)
+
+####
+def scripts_to_scrAddrs(scriptList):
+   #non-standard scripts still need the bridge (and its script cache)
+   return [script_to_scrAddr(script) for script in scriptList]
+
+####
+def scripts_to_addrStrs(scriptList):
+   return scrAddrs_to_addrStrs(scripts_to_scrAddrs(scriptList))
 
 ################################################################################
 # output script type to address type resolution
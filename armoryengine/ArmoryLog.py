@@ -0,0 +1,139 @@
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+
+"""
+Log pipeline behind the LOGxxx functions in ArmoryUtils.
+
+Callers only pay for a level check, formatting their message and pushing
+a record on a queue. The file, console and (optional) JSON lines handlers
+run on a QueueListener thread. Log files rotate by size, so nothing has to
+trim them at startup.
+
+Stdlib only, ArmoryUtils imports this before anything else is set up.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+
+LOG_DATE_FORMAT      = '%Y-%m-%d %H:%M:%S'
+LOG_FILE_MAX_BYTES   = 1024*1024
+LOG_FILE_BACKUPS     = 1
+
+################################################################################
+class JsonLinesFormatter(logging.Formatter):
+   """ One JSON object per record """
+
+   def format(self, record):
+      entry = {
+         'time'   : self.formatTime(record, LOG_DATE_FORMAT),
+         'level'  : record.levelname,
+         'file'   : record.filename,
+         'line'   : record.lineno,
+         'func'   : record.funcName,
+         'thread' : record.threadName,
+         'msg'    : record.getMessage() }
+      return json.dumps(entry)
+
+################################################################################
+class LogQueueListener(logging.handlers.QueueListener):
+   """ Handles the flush markers LogPipeline.flush() queues """
+
+   def handle(self, record):
+      flushEvent = getattr(record, 'flushEvent', None)
+      if flushEvent is None:
+         super(LogQueueListener, self).handle(record)
+         return
+
+      for handler in self.handlers:
+         handler.flush()
+      flushEvent.set()
+
+################################################################################
+class LogPipeline(object):
+
+   #############################################################################
+   def __init__(self, logger=None):
+      self.logger = logger if logger is not None else logging.getLogger('')
+      self.queue = queue.SimpleQueue()
+      self.queueHandler = None
+      self.listener = None
+      self.handlers = []
+      self.lock = threading.Lock()
+
+   #############################################################################
+   def start(self, logFile, fileLevel, consoleLevel, jsonFile=None,
+             maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS):
+      self.lock.acquire()
+      try:
+         if self.listener is not None:
+            return
+
+         fileHandler = logging.handlers.RotatingFileHandler(logFile,
+            maxBytes=maxBytes, backupCount=backupCount, delay=True)
+         fileHandler.setLevel(fileLevel)
+         fileHandler.setFormatter(logging.Formatter(
+            '%(asctime)s (%(levelname)s) -- %(filename)s:%(lineno)d - '
+            '%(message)s', datefmt=LOG_DATE_FORMAT))
+         self.handlers.append(fileHandler)
+
+         consoleHandler = logging.StreamHandler()
+         consoleHandler.setLevel(consoleLevel)
+         consoleHandler.setFormatter(logging.Formatter(
+            '(%(levelname)s) %(filename)s:%(lineno)d - %(message)s'))
+         self.handlers.append(consoleHandler)
+
+         if jsonFile:
+            jsonHandler = logging.handlers.RotatingFileHandler(jsonFile,
+               maxBytes=maxBytes, backupCount=backupCount, delay=True)
+            jsonHandler.setLevel(fileLevel)
+            jsonHandler.setFormatter(JsonLinesFormatter())
+            self.handlers.append(jsonHandler)
+
+         # the logger level is what callers check before doing any work,
+         # nothing below the most verbose handler gets past it
+         self.logger.setLevel(min(fileLevel, consoleLevel))
+         self.queueHandler = logging.handlers.QueueHandler(self.queue)
+         self.logger.addHandler(self.queueHandler)
+
+         self.listener = LogQueueListener(self.queue,
+            *self.handlers, respect_handler_level=True)
+         self.listener.start()
+         atexit.register(self.stop)
+      finally:
+         self.lock.release()
+
+   #############################################################################
+   def stop(self):
+      """ Drains the queue and closes the handlers """
+      self.lock.acquire()
+      try:
+         if self.listener is None:
+            return
+
+         self.listener.stop()
+         self.listener = None
+         self.logger.removeHandler(self.queueHandler)
+         for handler in self.handlers:
+            handler.close()
+         self.handlers = []
+      finally:
+         self.lock.release()
+
+   #############################################################################
+   def flush(self):
+      """ Blocks until every record queued so far has been written """
+      if self.listener is None:
+         return
+
+      done = threading.Event()
+      self.queue.put(logging.makeLogRecord({'flushEvent' : done}))
+      done.wait()
@@ -12,25 +12,17 @@ from __future__ import (absolute_import, division,
 #                                                                            #
 ##############################################################################
 
-import ast
 import codecs
 from datetime import datetime
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email.utils import COMMASPACE, formatdate
 import hashlib
-import inspect
 import locale
 import logging
 import math
-import multiprocessing
 import optparse
 import os
 import platform
 import random
 import signal
-import smtplib
 from struct import pack, unpack
 import sys
 import threading
@@ -42,6 +34,8 @@ import socket
 import subprocess
 import binascii
 
+from armoryengine.ArmoryLog import LogPipeline
+
 try:
    if os.path.exists('update_version.py') and os.path.exists('.git'):
       subprocess.check_output(["python", "update_version.py"])
@@ -100,6 +94,7 @@ parser.add_option("--interport",       dest="interport",   default=-1,        ty
 parser.add_option("--debug",           dest="doDebug",     default=False,     action="store_true", help="Increase amount of debugging output")
 parser.add_option("--nologging",       dest="logDisable",  default=False,     action="store_true", help="Disable all logging")
 parser.add_option("--netlog",          dest="netlog",      default=False,     action="store_true", help="Log networking messages sent and received by Armory")
+parser.add_option("--jsonlog",         dest="jsonLog",     default=False,     action="store_true", help="Also write the log as JSON lines, next to the log file")
 parser.add_option("--logfile",         dest="logFile",     default=DEFAULT, type='str',          help="Specify a non-default location to send logging information")
 parser.add_option("--mtdebug",         dest="mtdebug",     default=False,     action="store_true", help="Log multi-threaded call sequences")
 parser.add_option("--skip-online-check",dest="forceOnline", default=False,   action="store_true", help="Go into online mode, even if internet connection isn't detected")
@@ -301,7 +296,6 @@ ENABLE_DETSIGN = CLI_OPTIONS.enableDetSign
 
 # Figure out the default directories for Satoshi client, and BicoinArmory
 OS_NAME          = ''
-OS_VARIANT       = ''
 USER_HOME_DIR    = ''  
 BTC_HOME_DIR     = ''
 ARMORY_HOME_DIR  = ''
@@ -316,7 +310,6 @@ if not CLI_OPTIONS.satoshiHome==DEFAULT:
 
 if OS_WINDOWS:
    OS_NAME         = 'Windows'
-   OS_VARIANT      = platform.win32_ver()
 
    import ctypes
    buffer = ctypes.create_unicode_buffer(u'\0' * 260)
@@ -332,9 +325,7 @@ if OS_WINDOWS:
    BLKFILE_DIR     = os.path.join(BTC_HOME_DIR, 'blocks')
    BLKFILE_1stFILE = os.path.join(BLKFILE_DIR, 'blk00000.dat')
 elif OS_LINUX:
-   import distro
    OS_NAME         = 'Linux'
-   OS_VARIANT      = distro.linux_distribution()
    USER_HOME_DIR   = os.getenv('HOME')
 
    if BTC_HOME_DIR == '':
@@ -346,9 +337,7 @@ elif OS_LINUX:
    BLKFILE_DIR     = os.path.join(BTC_HOME_DIR, 'blocks')
    BLKFILE_1stFILE = os.path.join(BLKFILE_DIR, 'blk00000.dat')
 elif OS_MACOSX:
-   platform.mac_ver()
    OS_NAME         = 'MacOSX'
-   OS_VARIANT      = platform.mac_ver()
    USER_HOME_DIR   = os.path.expanduser('~/Library/Application Support')
 
    if BTC_HOME_DIR == '':
@@ -538,6 +527,7 @@ else:
    ADDRBYTE = b'\x6f'
    P2SHBYTE = b'\xc4'
    PRIVKEYBYTE = b'\xef'
+   BECH32_PREFIX = "tb"
 
    #
    BLOCKEXPLORE_NAME     = 'blockexplorer.com' if USE_TESTNET else 'Fake regtest explorer'
@@ -636,6 +626,18 @@ if not CLI_OPTIONS.rpcport == DEFAULT:
 
 
 
+################################################################################
+def getOSVariant():
+   if OS_WINDOWS:
+      return platform.win32_ver()
+   elif OS_LINUX:
+      import distro
+      return distro.linux_distribution()
+   elif OS_MACOSX:
+      return platform.mac_ver()
+   return ''
+
+
 if sys.argv[0]=='ArmoryQt.py':
    print('********************************************************************************')
    print('Loading Armory Engine:')
@@ -643,7 +645,7 @@ if sys.argv[0]=='ArmoryQt.py':
    print('   Armory Build:        ', BTCARMORY_BUILD)
    print('   PyBtcWallet  Version:', getVersionString(PYBTCWALLET_VERSION))
    print('Detected Operating system:', OS_NAME)
-   print('   OS Variant            :', OS_VARIANT)
+   print('   OS Variant            :', getOSVariant())
    print('   User home-directory   :', USER_HOME_DIR)
    print('   Satoshi BTC directory :', BTC_HOME_DIR)
    print('   Armory home dir       :', ARMORY_HOME_DIR)
@@ -709,104 +711,67 @@ def launchProcess(cmd, useStartInfo=True, *args, **kwargs):
 # In debug mode, will write DEBUG+ to file and INFO+ to console
 #
 
-# Want to get the line in which an error was triggered, but by wrapping
-# the logger function (as I will below), the displayed "file:linenum"
-# references the logger function, not the function that called it.
-# So I use traceback to find the file and line number two up in the
-# stack trace, and return that to be displayed instead of default
-# [Is this a hack?  Yes and no.  I see no other way to do this]
-def getCallerLine():
-   stkTwoUp = traceback.extract_stack()[-3]
-   filename,method = stkTwoUp[0], stkTwoUp[1]
-   return '%s:%d' % (os.path.basename(filename),method)
-
-# When there's an error in the logging function, it's impossible to find!
-# These wrappers will print the full stack so that it's possible to find
-# which line triggered the error
+# The LOGxxx wrappers check the level before doing anything else, then
+# hand the record to the log pipeline's queue. stacklevel=2 has logging
+# report the caller's file:line (a frame walk, no traceback extraction).
+# Formatting errors still print the full stack, since an error in a log
+# call is otherwise impossible to find
 def LOGDEBUG(msg, *a):
+   if not rootLogger.isEnabledFor(logging.DEBUG):
+      return
    try:
       logstr = msg if len(a)==0 else (msg%a)
-      callerStr = getCallerLine() + ' - '
-      logging.debug(callerStr + str(logstr))
+      rootLogger.debug(str(logstr), stacklevel=2)
    except TypeError:
       traceback.print_stack()
       raise
 
 def LOGINFO(msg, *a):
+   if not rootLogger.isEnabledFor(logging.INFO):
+      return
    try:
       logstr = msg if len(a)==0 else (msg%a)
-      callerStr = getCallerLine() + ' - '
-      logging.info(callerStr + str(logstr))
+      rootLogger.info(str(logstr), stacklevel=2)
    except TypeError:
       traceback.print_stack()
       raise
 def LOGWARN(msg, *a):
+   if not rootLogger.isEnabledFor(logging.WARNING):
+      return
    try:
       logstr = msg if len(a)==0 else (msg%a)
-      callerStr = getCallerLine() + ' - '
-      logging.warn(callerStr + str(logstr))
+      rootLogger.warning(str(logstr), stacklevel=2)
    except TypeError:
       traceback.print_stack()
       raise
 def LOGERROR(msg, *a):
+   if not rootLogger.isEnabledFor(logging.ERROR):
+      return
    try:
       logstr = msg if len(a)==0 else (msg%a)
-      callerStr = getCallerLine() + ' - '
-      logging.error(callerStr + str(logstr))
+      rootLogger.error(str(logstr), stacklevel=2)
    except TypeError:
       traceback.print_stack()
       raise
 def LOGCRIT(msg, *a):
+   if not rootLogger.isEnabledFor(logging.CRITICAL):
+      return
    try:
       logstr = msg if len(a)==0 else (msg%a)
-      callerStr = getCallerLine() + ' - '
-      logging.critical(callerStr + str(logstr))
+      rootLogger.critical(str(logstr), stacklevel=2)
    except TypeError:
       traceback.print_stack()
       raise
 def LOGEXCEPT(msg, *a):
+   if not rootLogger.isEnabledFor(logging.ERROR):
+      return
    try:
       logstr = msg if len(a)==0 else (msg%a)
-      callerStr = getCallerLine() + ' - '
-      logging.exception(callerStr + str(logstr))
+      rootLogger.exception(str(logstr), stacklevel=2)
    except TypeError:
       traceback.print_stack()
       raise
 
-def chopLogFile(filename, size):
-   if not os.path.exists(filename):
-      print('Log file doesn\'t exist [yet]')
-      return
-
-   logFile = open(filename, 'rb')
-   logFile.seek(0,2) # move the cursor to the end of the file
-   currentSize = logFile.tell()
-   if currentSize > size:
-      # this makes sure we don't get stuck reading an entire file
-      # that is bigger than the available memory.
-      # Also have to avoid cutting off the first line if truncating the file.
-      if currentSize > int(size)+int(MEGABYTE):
-         logFile.seek(-(int(size)+int(MEGABYTE)), 2)
-      else:
-         logFile.seek(0,0)
-      logLines = logFile.readlines()
-      logFile.close()
-
-      nBytes,nLines = 0,0;
-      for line in logLines[::-1]:
-         nBytes += len(line)
-         nLines += 1
-         if nBytes>size:
-            break
-
-      logFile = open(filename, 'wb')
-      for line in logLines[-nLines:]:
-         logFile.write(line)
-      logFile.close()
-
-# Cut down the log file to just the most recent 1 MB
-chopLogFile(ARMORY_LOG_FILE, MEGABYTE)
-
 
 # Now set loglevels
 DEFAULT_CONSOLE_LOGTHRESH = logging.WARNING
@@ -825,20 +790,14 @@ if CLI_OPTIONS.logDisable:
    DEFAULT_FILE_LOGTHRESH     += 100
 
 
-DateFormat = '%Y-%m-%d %H:%M:%S'
-logging.getLogger('').setLevel(logging.DEBUG)
-fileFormatter  = logging.Formatter('%(asctime)s (%(levelname)s) -- %(message)s', \
-                                     datefmt=DateFormat)
-fileHandler = logging.FileHandler(ARMORY_LOG_FILE)
-fileHandler.setLevel(DEFAULT_FILE_LOGTHRESH)
-fileHandler.setFormatter(fileFormatter)
-logging.getLogger('').addHandler(fileHandler)
-
-consoleFormatter = logging.Formatter('(%(levelname)s) %(message)s')
-consoleHandler = logging.StreamHandler()
-consoleHandler.setLevel(DEFAULT_CONSOLE_LOGTHRESH)
-consoleHandler.setFormatter( consoleFormatter )
-logging.getLogger('').addHandler(consoleHandler)
+# Handlers run on the pipeline's writer thread. The log file rotates once
+# it reaches 1 MB, which replaces trimming it on every start
+ARMORY_JSON_LOG_FILE = os.path.splitext(ARMORY_LOG_FILE)[0] + '.jsonl'
+TheLogPipeline = LogPipeline(rootLogger)
+TheLogPipeline.start(ARMORY_LOG_FILE, DEFAULT_FILE_LOGTHRESH,
+   DEFAULT_CONSOLE_LOGTHRESH,
+   jsonFile=ARMORY_JSON_LOG_FILE if CLI_OPTIONS.jsonLog else None,
+   maxBytes=MEGABYTE)
 
 
 
@@ -860,9 +819,9 @@ def LOGPPRINT(theObj, loglevel=DEFAULT_PPRINT_LOGLEVEL):
    theObj.pprint()
    printedStr = sys.stdout.getStr()
    sys.stdout = sys.__stdout__
-   stkOneUp = traceback.extract_stack()[-2]
-   filename,method = stkOneUp[0], stkOneUp[1]
-   methodStr  = '(PPRINT from %s:%d)\n' % (filename,method)
+   caller = sys._getframe(1)
+   methodStr  = '(PPRINT from %s:%d)\n' % \
+      (caller.f_code.co_filename, caller.f_lineno)
    logging.log(loglevel, methodStr + printedStr)
 
 cpplogfile = None
@@ -1055,6 +1014,7 @@ def GetSystemDetails():
       out.CpuStr = 'Unknown'
       raise OSError("Can't get system specs in: %s" % platform.system())
 
+   import multiprocessing
    out.NumCores = multiprocessing.cpu_count()
    if OS_WINDOWS:
       out.IsX64 = platform.machine().lower() == 'amd64'
@@ -1076,20 +1036,36 @@ def GetSystemDetails():
    out.HddAvailB = getHddSize(BTC_HOME_DIR)    // (1024**3)
    return out
 
-SystemSpecs = None
-try:
-   SystemSpecs = GetSystemDetails()
-except:
-   LOGEXCEPT('Error getting system details:')
-   LOGERROR('Skipping.')
-   SystemSpecs = DumbStruct()
-   SystemSpecs.Memory    = -1
-   SystemSpecs.CpuStr    = 'Unknown'
-   SystemSpecs.NumCores  = -1
-   SystemSpecs.IsX64     = 'Unknown'
-   SystemSpecs.Machine   = platform.machine().lower()
-   SystemSpecs.HddAvailA = -1
-   SystemSpecs.HddAvailB = -1
+################################################################################
+def getSystemSpecs():
+   try:
+      return GetSystemDetails()
+   except:
+      LOGEXCEPT('Error getting system details:')
+      LOGERROR('Skipping.')
+      specs = DumbStruct()
+      specs.Memory    = -1
+      specs.CpuStr    = 'Unknown'
+      specs.NumCores  = -1
+      specs.IsX64     = 'Unknown'
+      specs.Machine   = platform.machine().lower()
+      specs.HddAvailA = -1
+      specs.HddAvailB = -1
+      return specs
+
+# Values that are slow to get and rarely needed, computed on first access
+# through the module (PEP 562). Star imports don't see them, import them
+# by name
+LAZY_MODULE_ATTRS = {
+   'OS_VARIANT'  : getOSVariant,
+   'SystemSpecs' : getSystemSpecs }
+
+def __getattr__(name):
+   if name not in LAZY_MODULE_ATTRS:
+      raise AttributeError('module %r has no attribute %r' % (__name__, name))
+   val = LAZY_MODULE_ATTRS[name]()
+   globals()[name] = val
+   return val
 
 # OSX 10.12 just had to go and make things complicated....
 prefEnc = locale.getpreferredencoding()
@@ -1110,31 +1086,42 @@ LOGINFO('   Armory Version        : ' + getVersionString(BTCARMORY_VERSION))
 LOGINFO('   Armory Build:         : ' + str(BTCARMORY_BUILD))
 LOGINFO('   PyBtcWallet  Version  : ' + getVersionString(PYBTCWALLET_VERSION))
 LOGINFO('Detected Operating system: ' + OS_NAME)
-LOGINFO('   OS Variant            : ' + (OS_VARIANT[0] if OS_MACOSX else '-'.join(OS_VARIANT)))
 LOGINFO('   User home-directory   : ' + USER_HOME_DIR)
 LOGINFO('   Satoshi BTC directory : ' + BTC_HOME_DIR)
 LOGINFO('   Armory home dir       : ' + ARMORY_HOME_DIR)
-LOGINFO('Detected System Specs    : ')
-LOGINFO('   Total Available RAM   : %0.2f GB', SystemSpecs.Memory)
-LOGINFO('   CPU ID string         : ' + SystemSpecs.CpuStr)
-LOGINFO('   Number of CPU cores   : %d cores', SystemSpecs.NumCores)
-LOGINFO('   System is 64-bit      : ' + str(SystemSpecs.IsX64))
 LOGINFO('   Preferred Encoding    : ' + prefEnc)
-LOGINFO('   Machine Arch          : ' + SystemSpecs.Machine)
-LOGINFO('   Available HDD (ARM)   : %d GB' % SystemSpecs.HddAvailA)
-LOGINFO('   Available HDD (BTC)   : %d GB' % SystemSpecs.HddAvailB)
 LOGINFO('')
 LOGINFO('Network Name: ' + NETWORKS[ADDRBYTE])
 LOGINFO('Satoshi Port: %d', BITCOIN_PORT)
 LOGINFO('Do wlt check: %s', str(DO_WALLET_CHECK))
 LOGINFO('Named options/arguments to armoryengine.py:')
-for key,val in ast.literal_eval(str(CLI_OPTIONS)).items():
+for key,val in CLI_OPTIONS.__dict__.items():
    LOGINFO('    %-16s: %s', key,val)
 LOGINFO('Other arguments:')
 for val in CLI_ARGS:
    LOGINFO('    %s', val)
 LOGINFO('************************************************************')
 
+################################################################################
+def logSystemDetails():
+   """
+   OS variant and hardware details, for the log of long running processes.
+   Kept out of the import time banner, getting them costs more than the
+   rest of the engine startup
+   """
+   osVariant = getattr(sys.modules[__name__], 'OS_VARIANT')
+   specs = getattr(sys.modules[__name__], 'SystemSpecs')
+   LOGINFO('   OS Variant            : ' + \
+      (osVariant[0] if OS_MACOSX else '-'.join(osVariant)))
+   LOGINFO('Detected System Specs    : ')
+   LOGINFO('   Total Available RAM   : %0.2f GB', specs.Memory)
+   LOGINFO('   CPU ID string         : ' + specs.CpuStr)
+   LOGINFO('   Number of CPU cores   : %d cores', specs.NumCores)
+   LOGINFO('   System is 64-bit      : ' + str(specs.IsX64))
+   LOGINFO('   Machine Arch          : ' + specs.Machine)
+   LOGINFO('   Available HDD (ARM)   : %d GB' % specs.HddAvailA)
+   LOGINFO('   Available HDD (BTC)   : %d GB' % specs.HddAvailB)
+
 
 def GetExecDir():
    """
@@ -1142,6 +1129,7 @@ def GetExecDir():
    expects a function or module name, it can actually inspect its own
    name...
    """
+   import inspect
    srcfile = inspect.getsourcefile(GetExecDir)
    srcpath = os.path.dirname(srcfile)
    srcpath = os.path.abspath(srcpath)
@@ -1351,7 +1339,7 @@ def hash160_to_p2pkhash_script(binStr20):
       raise InvalidHashError('Tried to convert non-20-byte str to p2pkh script')
 
    from armoryengine.Script import scriptPushData, getOpCode
-   outScript = ''.join([  getOpCode('OP_DUP'        ), \
+   outScript = b''.join([ getOpCode('OP_DUP'        ), \
                           getOpCode('OP_HASH160'    ), \
                           scriptPushData(binStr20),
                           getOpCode('OP_EQUALVERIFY'), \
@@ -1367,7 +1355,7 @@ def hash160_to_p2sh_script(binStr20):
       raise InvalidHashError('Tried to convert non-20-byte str to p2sh script')
 
    from armoryengine.Script import scriptPushData, getOpCode
-   outScript = ''.join([  getOpCode('OP_HASH160'),
+   outScript = b''.join([ getOpCode('OP_HASH160'),
                           scriptPushData(binStr20),
                           getOpCode('OP_EQUAL')])
    return outScript
@@ -2007,12 +1995,7 @@ class FiniteField(object):
       return (a*b) % self.prime
 
    def power(self,a,b):
-      result = 1
-      while(b>0):
-         b,x = divmod(b,2)
-         result = (result * (a if x else 1)) % self.prime
-         a = a*a % self.prime
-      return result
+      return pow(a, b, self.prime)
 
    def powinv(self,a):
       """ USE ONLY PRIME MODULUS """
@@ -2079,19 +2062,20 @@ class FiniteField(object):
 
 ################################################################################
 def SplitSecret(secret, needed, pieces, nbytes=None):
-   if not isinstance(secret, basestring):
+   from armoryengine.SecretSharing import ShamirEngine
+
+   if not isinstance(secret, (bytes, str)):
       secret = secret.toBinStr()
 
    if nbytes==None:
       nbytes = len(secret)
 
-   ff = FiniteField(nbytes)
-   fragments = []
+   engine = ShamirEngine(nbytes)
 
    # Convert secret to an integer
-   a = binary_to_int(SecureBinaryData(secret).toBinStr(),BIGENDIAN)
-   if not a<ff.prime:
-      LOGERROR('Secret must be less than %s', int_to_hex(ff.prime,endOut=BIGENDIAN))
+   a = binary_to_int(secret,BIGENDIAN)
+   if not a<engine.prime:
+      LOGERROR('Secret must be less than %s', int_to_hex(engine.prime,endOut=BIGENDIAN))
       LOGERROR('             You entered %s', int_to_hex(a,endOut=BIGENDIAN))
       raise FiniteFieldError
 
@@ -2099,27 +2083,17 @@ def SplitSecret(secret, needed, pieces, nbytes=None):
       LOGERROR('You must create more pieces than needed to reconstruct!')
       raise FiniteFieldError
 
-   if needed==1 or needed>8:
-      LOGERROR('Can split secrets into parts *requiring* at most 8 fragments')
-      LOGERROR('You can break it into as many optional fragments as you want')
+   if needed<2:
+      LOGERROR('Secrets must be split into parts requiring at least 2 fragments')
       raise FiniteFieldError
 
 
    # We use randomized coefficients so as to respect SSS security parameters
    othernum = []
-   for i in range(pieces+needed-1):
-      othernum.append(binary_to_int(SecureBinaryData().GenerateRandom(nbytes).toBinStr()))
-
-   def poly(x):
-      polyout = ff.mult(a, ff.power(x,needed-1))
-      for i,e in enumerate(range(needed-2,-1,-1)):
-         term = ff.mult(othernum[i], ff.power(x,e))
-         polyout = ff.add(polyout, term)
-      return polyout
+   for i in range(needed-1):
+      othernum.append(binary_to_int(os.urandom(nbytes)))
 
-   for i in range(pieces):
-      x = i+1
-      fragments.append( [x, poly(x)] )
+   fragments = engine.split(a, needed, pieces, othernum)
 
    secret,a = None,None
    fragments = [ [int_to_binary(p, nbytes, BIGENDIAN) for p in frag] for frag in fragments]
@@ -2128,28 +2102,19 @@ def SplitSecret(secret, needed, pieces, nbytes=None):
 
 ################################################################################
 def ReconstructSecret(fragments, needed, nbytes):
+   from armoryengine.SecretSharing import ShamirEngine
 
-   ff = FiniteField(nbytes)
-   pairs = fragments[:needed]
-   m = []
-   v = []
-   for x,y in pairs:
-      x = binary_to_int(x, BIGENDIAN)
-      y = binary_to_int(y, BIGENDIAN)
-      m.append([])
-      for i,e in enumerate(range(needed-1,-1,-1)):
-         m[-1].append( ff.power(x,e) )
-      v.append(y)
-
-   minv = ff.mtrxinv(m)
-   outvect = ff.mtrxmultvect(minv,v)
-   return int_to_binary(outvect[0], nbytes, BIGENDIAN)
+   engine = ShamirEngine(nbytes)
+   points = [(binary_to_int(x, BIGENDIAN), binary_to_int(y, BIGENDIAN)) \
+                                             for x,y in fragments[:needed]]
+   return int_to_binary(engine.reconstruct(points), nbytes, BIGENDIAN)
 
 
 ################################################################################
 def createTestingSubsets( fragIndices, M, maxTestCount=20):
    """
    Returns (IsRandomized, listOfTuplesOfSizeM)
+   Pass maxTestCount=None to always test every subset
    """
    numIdx = len(fragIndices)
 
@@ -2166,9 +2131,9 @@ def createTestingSubsets( fragIndices, M, maxTestCount=20):
       # Compute the number of possible subsets.  This is stable because we
       # shouldn't ever have more than 12 fragments
       fact = math.factorial
-      numCombo = fact(numIdx) / ( fact(M) * fact(numIdx-M) )
+      numCombo = fact(numIdx) // ( fact(M) * fact(numIdx-M) )
 
-      if numCombo <= maxTestCount:
+      if maxTestCount is None or numCombo <= maxTestCount:
          LOGINFO('Testing all %s combinations...' % numCombo)
          for x in range(2**numIdx):
             bits = int_to_bitset(x)
@@ -2196,18 +2161,24 @@ def testReconstructSecrets(fragMap, M, maxTestCount=20):
    # If fragMap has X elements, then it will test all X-choose-M subsets of
    # the fragMap and return the restored secret for each one.  If there's more
    # subsets than maxTestCount, then just do a random sampling of the possible
-   # subsets
-   fragKeys = [k for k in fragMap.iterkeys()]
+   # subsets.  maxTestCount=None tests all of them
+   from armoryengine.SecretSharing import ShamirEngine
+
+   fragKeys = list(fragMap.keys())
    isRandom, subs = createTestingSubsets(fragKeys, M, maxTestCount)
    nBytes = len(fragMap[fragKeys[0]][1])
    LOGINFO('Testing %d-byte fragments' % nBytes)
 
-   testResults = []
-   for subset in subs:
-      fragSubset = [fragMap[i][:] for i in subset]
+   # all subsets are solved in one batch, see SecretSharing
+   xyMap = {}
+   for k in fragKeys:
+      x, y = fragMap[k][:2]
+      xyMap[k] = (binary_to_int(x, BIGENDIAN), binary_to_int(y, BIGENDIAN))
 
-      recon = ReconstructSecret(fragSubset, M, nBytes)
-      testResults.append((subset, recon))
+   engine = ShamirEngine(nBytes)
+   testResults = []
+   for subset, recon in engine.reconstructSubsets(xyMap, subs):
+      testResults.append((subset, int_to_binary(recon, nBytes, BIGENDIAN)))
 
    return isRandom, testResults
 
@@ -2768,6 +2739,17 @@ class BlockComponent(object):
       return self.__class__().unserialize(self.serialize())
 
    def serialize(self):
+      # single pass into a buffer sized up front, components only have to
+      # implement getSerializedSize & serializeInto
+      from armoryengine.BinaryPacker import BufferPacker
+      binOut = BufferPacker(self.getSerializedSize())
+      self.serializeInto(binOut)
+      return binOut.getBinaryString()
+
+   def getSerializedSize(self):
+      raise NotImplementedError
+
+   def serializeInto(self, binOut):
       raise NotImplementedError
 
    def unserialize(self):
@@ -2789,6 +2771,11 @@ def send_email(send_from, server, password, send_to, subject, text):
    if len(server) > 1:
       serverPort = int(server[1])
 
+   from email.mime.multipart import MIMEMultipart
+   from email.mime.text import MIMEText
+   from email.utils import COMMASPACE, formatdate
+   import smtplib
+
    # Some of this may have to be modded to support non-TLS servers.
    msg = MIMEMultipart()
    msg['From'] = send_from
@@ -0,0 +1,356 @@
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+
+"""
+asyncio front end for the CppBridge protocol.
+
+This is the single threaded counterpart to CppBridge.BridgeSocket. The wire
+format is the same (BIP151 length prefixed frames, handshake packets in the
+clear until the channel is encrypted), but the read loop is an
+asyncio.Protocol, replies resolve asyncio.Future objects and callbacks are
+dispatched through the event loop instead of spawning a thread each.
+
+Typical use from a headless service:
+
+   bridge = AsyncBridgeSocket()
+   await bridge.start(stringArgs, notifyReadyLbd)
+
+   packet = BridgeProto_pb2.Request()
+   packet.service.get_node_status = True
+   reply = await bridge.request(packet)
+
+Thousands of calls can be in flight at once, just gather the coroutines.
+"""
+
+import os
+import asyncio
+import inspect
+
+from google.protobuf.message import DecodeError
+
+from armoryengine import BridgeProto_pb2
+from armoryengine.ArmoryUtils import LOGERROR, LOGWARN
+from armoryengine.BIP15x import \
+    BIP15xConnection, AEAD_THRESHOLD_BEGIN, AEAD_Error, \
+    CHACHA20POLY1305MAXPACKETSIZE, encryptFrames
+from armoryengine.CppBridge import BridgeError, BRIDGE_CLIENT_HEADER
+
+BRIDGE_LISTEN_PORT = 46122
+
+################################################################################
+class AsyncCallbackWrapper(object):
+   def __init__(self, callbackFunc, callbackArgs=[]):
+      self.callbackFunc = callbackFunc
+      self.callbackArgs = callbackArgs
+
+   def execute(self, loop, replyObj):
+      dispatchOnLoop(loop, self.callbackFunc, *self.callbackArgs, replyObj)
+
+################################################################################
+def dispatchOnLoop(loop, func, *args):
+   #coroutine functions get a task, plain callables are scheduled as is
+   if inspect.iscoroutinefunction(func):
+      loop.create_task(func(*args))
+   else:
+      loop.call_soon(func, *args)
+
+################################################################################
+class BridgeProtocol(asyncio.Protocol):
+   """
+   Frames the byte stream coming from the bridge and hands complete
+   cleartext packets to the owning AsyncBridgeSocket.
+   """
+
+   #############################################################################
+   def __init__(self, bridgeSocket):
+      self.bridgeSocket = bridgeSocket
+      self.bip15xConnection = bridgeSocket.bip15xConnection
+      self.transport = None
+      self.buffer = bytearray()
+      self.pendingSize = None
+
+   #############################################################################
+   def connection_made(self, transport):
+      self.transport = transport
+      self.bridgeSocket.connectionMade(self)
+
+   #############################################################################
+   def connection_lost(self, exc):
+      if exc is not None:
+         LOGERROR("Bridge connection lost: %s" % str(exc))
+      self.bridgeSocket.connectionLost()
+
+   #############################################################################
+   def data_received(self, data):
+      if self.transport.is_closing():
+         return
+      self.buffer += data
+
+      while True:
+         try:
+            packet = self.nextPacket()
+            if packet is None:
+               return
+            self.bridgeSocket.processPacket(packet)
+
+         except (AEAD_Error, BridgeError, DecodeError) as e:
+            #the stream can't be resynced past a bad frame, drop the
+            #connection, connection_lost fails the pending requests
+            self.abort("invalid bridge packet: %s" % str(e))
+            return
+
+   #############################################################################
+   def abort(self, reason):
+      LOGERROR(reason)
+      self.buffer = bytearray()
+      self.pendingSize = None
+      self.transport.close()
+
+   #############################################################################
+   def nextPacket(self):
+      #returns the next cleartext packet or None if the buffer
+      #doesn't hold a complete frame yet
+      if self.bip15xConnection.encrypted():
+         if len(self.buffer) < 4:
+            return None
+
+         #the length is decoded once per frame, keep it around
+         #while we wait for the rest of the data
+         if self.pendingSize is None:
+            payloadSize = self.bip15xConnection.decodeSize(bytes(self.buffer[:4]))
+            if payloadSize > CHACHA20POLY1305MAXPACKETSIZE:
+               raise AEAD_Error(
+                  "Invalid encrypted packet size: " + str(payloadSize))
+            self.pendingSize = payloadSize
+
+         frameLen = 4 + self.pendingSize + self.bip15xConnection.getMacLen()
+         if len(self.buffer) < frameLen:
+            return None
+
+         frame = bytes(self.buffer[:frameLen])
+         del self.buffer[:frameLen]
+
+         payloadSize = self.pendingSize
+         self.pendingSize = None
+         return self.bip15xConnection.decrypt(frame, payloadSize)
+
+      #handshake packets before the channel is encrypted have a fixed
+      #size per header type
+      if len(self.buffer) < 1:
+         return None
+
+      header = self.buffer[0]
+      if header <= AEAD_THRESHOLD_BEGIN[0]:
+         raise BridgeError("Received user data before AEAD is ready")
+
+      frameLen = 1 + self.bip15xConnection.getAEADPacketSize(header)
+      if len(self.buffer) < frameLen:
+         return None
+
+      packet = bytes(self.buffer[:frameLen])
+      del self.buffer[:frameLen]
+      return packet
+
+   #############################################################################
+   def write(self, data):
+      self.transport.write(data)
+
+################################################################################
+class AsyncBridgeSocket(object):
+
+   #############################################################################
+   ## setup
+   def __init__(self, loop=None):
+      self.loop = loop
+      self.idCounter = 0
+      self.responseDict = {}
+      self.callbackDict = {}
+      self.bip15xConnection = BIP15xConnection(self.sendToBridgeRaw)
+      self.run = False
+
+      self.protocol = None
+      self.server = None
+      self.process = None
+      self.connected = None
+      self.closed = None
+
+   ####
+   def setCallback(self, key, func):
+      self.callbackDict[key] = func
+
+   def unsetCallback(self, key):
+      del self.callbackDict[key]
+
+   #############################################################################
+   ## listen socket setup
+   async def start(self, stringArgs, notifyReadyLbd):
+      if self.loop is None:
+         self.loop = asyncio.get_running_loop()
+
+      self.bip15xConnection.setNotifyReadyLbd(notifyReadyLbd)
+      self.connected = self.loop.create_future()
+      self.closed = self.loop.create_future()
+      self.run = True
+
+      try:
+         #setup listener
+         self.server = await self.loop.create_server(
+            lambda: BridgeProtocol(self),
+            "127.0.0.1", BRIDGE_LISTEN_PORT, reuse_address=True)
+
+         #append gui pubkey to arg list and spawn bridge
+         os.environ['SERVER_PUBKEY'] = self.bip15xConnection.getPubkeyHex()
+         self.process = await asyncio.create_subprocess_exec(
+            "./build/CppBridge", stringArgs)
+
+         #wait on the bridge connection
+         await self.connected
+      except BaseException:
+         #no connection, nothing will ever resolve closed
+         self.run = False
+         self.setClosed()
+         raise
+
+      #initiate AEAD handshake (server has to start it)
+      self.bip15xConnection.serverStartHandshake()
+
+   ####
+   async def stop(self):
+      self.run = False
+
+      if self.protocol is not None:
+         self.protocol.transport.close()
+      else:
+         #never connected: unblock start() and don't wait on a connection
+         #that will never be lost
+         if self.connected is not None and not self.connected.done():
+            self.connected.cancel()
+         self.setClosed()
+
+      if self.server is not None:
+         self.server.close()
+         await self.server.wait_closed()
+
+      if self.closed is not None:
+         await self.closed
+
+   ####
+   def setClosed(self):
+      if self.closed is not None and not self.closed.done():
+         self.closed.set_result(True)
+
+   ####
+   def connectionMade(self, protocol):
+      if self.protocol is not None:
+         LOGWARN("ignoring extra connection to the bridge listen socket")
+         protocol.transport.close()
+         return
+
+      self.protocol = protocol
+      self.connected.set_result(True)
+
+   ####
+   def connectionLost(self):
+      self.run = False
+
+      #fail whoever is still waiting on a reply
+      for replyHandler in self.responseDict.values():
+         if isinstance(replyHandler, asyncio.Future) and \
+            not replyHandler.done():
+            replyHandler.set_exception(BridgeError("bridge connection lost"))
+      self.responseDict = {}
+      self.setClosed()
+
+   #############################################################################
+   ## socket write
+   def sendToBridgeProto(self, msg, needsReply=True,
+      callbackFunc=None, callbackArgs=[], msgType=BRIDGE_CLIENT_HEADER):
+      #must be called from the loop thread
+      if self.run == False:
+         return
+
+      msg.reference_id = self.idCounter
+      self.idCounter = self.idCounter + 1
+
+      clearText = bytes([msgType]) + msg.SerializeToString()
+      for p in encryptFrames(self.bip15xConnection, clearText):
+         self.protocol.write(p)
+
+      if callbackFunc != None:
+         self.responseDict[msg.reference_id] = \
+            AsyncCallbackWrapper(callbackFunc, callbackArgs)
+
+      elif needsReply:
+         fut = self.loop.create_future()
+         self.responseDict[msg.reference_id] = fut
+         return fut
+
+   ####
+   async def request(self, msg):
+      fut = self.sendToBridgeProto(msg)
+      if fut is None:
+         raise BridgeError("bridge socket is not running")
+      return await fut
+
+   ####
+   def send(self, msg, needsReply=True, callback=None, cbArgs=[],
+      msgType=BRIDGE_CLIENT_HEADER):
+      return self.sendToBridgeProto(msg,
+         needsReply, callback, cbArgs, msgType)
+
+   ####
+   def sendToBridgeRaw(self, msg):
+      self.protocol.write(msg)
+
+   #############################################################################
+   ## socket read
+   def processPacket(self, packet):
+      #check header
+      header = packet[0]
+      if header > AEAD_THRESHOLD_BEGIN[0]:
+         #handshake packets are not to be processed as user data
+         self.bip15xConnection.serverHandshake(header, packet[1:])
+         return
+
+      if not self.bip15xConnection.ready():
+         #non AEAD data is only tolerated after channels are setup
+         raise BridgeError("Received user data before AEAD is ready")
+
+      #deser protobuf reply
+      protoPayload = BridgeProto_pb2.Payload()
+      protoPayload.ParseFromString(packet[1:])
+
+      #payloads are either replies or callbacks
+      if protoPayload.HasField('reply'):
+         reply = protoPayload.reply
+         referenceId = reply.reference_id
+
+         replyHandler = self.responseDict.pop(referenceId, None)
+         if replyHandler is None:
+            LOGWARN(f"unknown reply referenceId: {referenceId}")
+            return
+
+         if isinstance(replyHandler, asyncio.Future):
+            if not replyHandler.cancelled():
+               replyHandler.set_result(reply)
+
+         elif isinstance(replyHandler, AsyncCallbackWrapper):
+            replyHandler.execute(self.loop, reply)
+
+      elif protoPayload.HasField('callback'):
+         callbackData = protoPayload.callback
+         callbackId = callbackData.callback_id
+
+         #find the callback listener
+         if callbackId not in self.callbackDict:
+            LOGWARN(f"ignoring callback id: {callbackId}")
+            return
+
+         #call it with the payload
+         callbackObj = self.callbackDict[callbackId]
+         dispatchOnLoop(self.loop, callbackObj.process, callbackData)
@@ -11,6 +11,7 @@ import os.path
 import random
 import threading
 import traceback
+from collections import OrderedDict
 
 from armoryengine.ArmoryUtils import *
 from armoryengine.Timer import TimeThisFunction
@@ -53,6 +54,13 @@ CPP_PROGRESS_NOTIF_ID = "progress"
 SETUP_STEP2 = 'setup_step1_done'
 SETUP_STEP3 = 'setup_step2_done'
 
+# Progress and refresh notifications received within this many seconds of
+# each other are collapsed into a single listener call. 0 disables it.
+NOTIFICATION_COALESCE_WINDOW = 0.1
+
+# coalescer key of refreshes without wallet ids
+FULL_REFRESH_KEY = 'full_refresh'
+
 def newTheBDM(isOffline=False):
    global TheBDM
    if TheBDM:
@@ -83,6 +91,97 @@ class BDMCallbackWrapper(ServerPush):
    def parseProtoPacket(self, protoPacket):
       self.callbackFunc(protoPacket)
 
+################################################################################
+class NotificationCoalescer(object):
+   """
+   Buffers listener notifications for a short window and delivers only the
+   latest state per key. Posting to a key that is already pending replaces
+   its args (or merges them, if a merge function is provided).
+   """
+
+   #############################################################################
+   def __init__(self, deliverFunc, window=NOTIFICATION_COALESCE_WINDOW):
+      self.deliverFunc = deliverFunc
+      self.window = window
+
+      self.lock = threading.Lock()
+      self.deliveryLock = threading.RLock()
+      self.pending = OrderedDict()
+      self.timer = None
+
+      self.postedCount = 0
+      self.deliveredCount = 0
+
+   #############################################################################
+   def post(self, key, act, args, mergeFunc=None):
+      if self.window <= 0:
+         self.deliverNow(act, args)
+         return
+
+      self.lock.acquire()
+      self.postedCount += 1
+      if key in self.pending:
+         prevArgs = self.pending.pop(key)[1]
+         if mergeFunc is not None:
+            args = mergeFunc(prevArgs, args)
+      self.pending[key] = (act, args)
+
+      if self.timer is None:
+         self.timer = threading.Timer(self.window, self.flush)
+         self.timer.daemon = True
+         self.timer.start()
+      self.lock.release()
+
+   #############################################################################
+   def flush(self):
+      self.deliveryLock.acquire()
+      try:
+         self.lock.acquire()
+         pending = self.pending
+         self.pending = OrderedDict()
+         if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+         self.lock.release()
+
+         for act, args in pending.values():
+            self.deliveredCount += 1
+            try:
+               self.deliverFunc(act, args)
+            except:
+               LOGEXCEPT('Error in notification listener')
+      finally:
+         self.deliveryLock.release()
+
+   #############################################################################
+   def deliverNow(self, act, args):
+      #pending notifications go out first, listeners see events in order
+      self.deliveryLock.acquire()
+      try:
+         self.flush()
+         self.deliverFunc(act, args)
+      finally:
+         self.deliveryLock.release()
+
+################################################################################
+def mergeRefreshIds(prevIds, newIds):
+   merged = list(prevIds)
+   for refreshId in newIds:
+      if refreshId not in merged:
+         merged.append(refreshId)
+   return merged
+
+################################################################################
+def postRefresh(coalescer, refreshIds):
+   #a refresh without ids (refresh everything) is kept apart from the per
+   #wallet ones: listeners act on each id they get, folding the ids into a
+   #full refresh would skip that work
+   if len(refreshIds) == 0:
+      coalescer.post(FULL_REFRESH_KEY, REFRESH_ACTION, [])
+   else:
+      coalescer.post(REFRESH_ACTION, REFRESH_ACTION, list(refreshIds),
+         mergeRefreshIds)
+
 ################################################################################
 class BlockDataManager(object):
 
@@ -128,11 +227,24 @@ class BlockDataManager(object):
 
       self.witness = False
 
+      self.notifCoalescer = NotificationCoalescer(self.notifyListeners)
+
    #############################################################################
    @ActLikeASingletonBDM
    def getListenerList(self):
       return self.cppNotificationListenerList
 
+   #############################################################################
+   @ActLikeASingletonBDM
+   def setNotificationCoalesceWindow(self, window):
+      self.notifCoalescer.flush()
+      self.notifCoalescer.window = window
+
+   #############################################################################
+   def notifyListeners(self, act, args):
+      for cppNotificationListener in self.getListenerList():
+         cppNotificationListener(act, *args)
+
    #############################################################################
    @ActLikeASingletonBDM
    def getTopBlockHeight(self):
@@ -254,6 +366,7 @@ class BlockDataManager(object):
          act = NEW_BLOCK_ACTION
          arglist.append(notifProto.new_block.height)
          TheBDM.topBlockHeight = notifProto.new_block.height
+         TheBridge.onNewBlock(notifProto.new_block.height)
 
       elif notifProto.HasField("refresh"):
          act = REFRESH_ACTION
@@ -277,9 +390,12 @@ class BlockDataManager(object):
       elif notifProto.HasField("registered"):
          act = SETUP_STEP3
 
-      listenerList = self.getListenerList()
-      for cppNotificationListener in listenerList:
-         cppNotificationListener(act, *arglist)
+      if act == REFRESH_ACTION:
+         #collapse refresh bursts into a single call with all the ids
+         postRefresh(self.notifCoalescer, arglist)
+         return
+
+      self.notifCoalescer.deliverNow(act, arglist)
 
    #############################################################################
    def reportProgress(self, notifProto):
@@ -298,12 +414,15 @@ class BlockDataManager(object):
 
             self.bdmState = BDM_SCANNING
 
-            for cppNotificationListener in self.getListenerList():
-               cppNotificationListener(BDM_SCAN_PROGRESS, [None, None])
+            #listeners read the progress from the BDM, only the
+            #notification itself needs collapsing
+            self.notifCoalescer.post(BDM_SCAN_PROGRESS,
+               BDM_SCAN_PROGRESS, [[None, None]])
          else:
+            #latest progress per wallet set and phase wins
             progInfo = [walletVec, prog, phase]
-            for cppNotificationListener in self.getListenerList():
-               cppNotificationListener(SCAN_ACTION, progInfo)
+            self.notifCoalescer.post((SCAN_ACTION, tuple(walletVec), phase),
+               SCAN_ACTION, [progInfo])
 
       except:
          LOGEXCEPT('Error in running progress callback')
@@ -300,7 +300,9 @@ class BIP15xConnection(object):
 
    #############################################################################
    def decodeSize(self, payload):
-      return lib.bip15x_get_length(self.inSession.channel, payload)
+      #payload can be any buffer (bytes, bytearray, memoryview)
+      return lib.bip15x_get_length(self.inSession.channel,
+         ffi.from_buffer("uint8_t[]", payload))
 
    #############################################################################
    def decrypt(self, payload, payloadSize):
@@ -313,6 +315,20 @@ class BIP15xConnection(object):
 
       return bytes(clearText)[4:]
 
+   #############################################################################
+   def decryptInPlace(self, frame, payloadSize):
+      #frame is a writable buffer holding the full packet (size prefix,
+      #cipher text and mac). The clear text overwrites the cipher text,
+      #returns a memoryview over it, nothing is copied
+      framePtr = ffi.from_buffer("uint8_t[]", frame, require_writable=True)
+
+      decryptionResult = lib.bip15x_decrypt(\
+         self.inSession.channel, framePtr, payloadSize, framePtr)
+      if decryptionResult != 0:
+         raise AEAD_Error("failed to decrypt payload: " + str(decryptionResult))
+
+      return memoryview(frame)[4:4 + payloadSize]
+
    #############################################################################
    def encrypt(self, payload, payloadSize):
       packetSize = payloadSize + 4 + self.macLen
@@ -340,3 +356,16 @@ class BIP15xConnection(object):
       self.outSession.bytesOnKey = 0
 
       return encryptedPayload
+
+################################################################################
+def encryptFrames(bip15xConnection, clearText):
+   """ Frames to write for clearText, led by a rekey frame when one is due """
+   if not bip15xConnection.encrypted():
+      raise AEAD_Error("channel is not encrypted")
+
+   cipherText = []
+   if bip15xConnection.needsRekey(len(clearText)):
+      cipherText.append(bip15xConnection.getRekeyPayload())
+   cipherText.append(bip15xConnection.encrypt(clearText, len(clearText)))
+
+   return cipherText
@@ -14,14 +14,46 @@ from __future__ import (absolute_import, division,
 # Orig Date:  20 November, 2011
 #
 ################################################################################
-from armoryengine.ArmoryUtils import LITTLEENDIAN, int_to_binary, packVarInt
+from armoryengine.ArmoryUtils import LITTLEENDIAN, BIGENDIAN, NETWORKENDIAN
 UINT8, UINT16, UINT32, UINT64, INT8, INT16, INT32, INT64, VAR_INT, VAR_STR, FLOAT, BINARY_CHUNK = range(12)
 from binascii import hexlify
 from io import BytesIO
-from struct import pack, unpack
+from struct import Struct
 
 class PackerError(Exception): pass
 
+# (varType, endianness) -> precompiled struct for all fixed width types.
+# BinaryUnpacker reads through the same table.
+FIXED_FORMATS = { UINT8: 'B', UINT16: 'H', UINT32: 'I', UINT64: 'Q',
+                  INT8:  'b', INT16:  'h', INT32:  'i', INT64:  'q',
+                  FLOAT: 'f' }
+STRUCT_TABLE = dict(((varType, E), Struct(E + fmt)) \
+   for varType, fmt in FIXED_FORMATS.items() \
+   for E in (LITTLEENDIAN, BIGENDIAN, NETWORKENDIAN))
+
+VARINT_UINT16 = Struct('<BH')
+VARINT_UINT32 = Struct('<BI')
+VARINT_UINT64 = Struct('<BQ')
+
+################################################################################
+def varIntSize(n):
+   if   n < 0xfd:  return 1
+   elif n < 1<<16: return 3
+   elif n < 1<<32: return 5
+   else:           return 9
+
+################################################################################
+def varIntToBinary(n):
+   if   n < 0xfd:  return bytes((n,))
+   elif n < 1<<16: return VARINT_UINT16.pack(0xfd, n)
+   elif n < 1<<32: return VARINT_UINT32.pack(0xfe, n)
+   else:           return VARINT_UINT64.pack(0xff, n)
+
+################################################################################
+def varStrSize(binStr):
+   return varIntSize(len(binStr)) + len(binStr)
+
+################################################################################
 class BinaryPacker(object):
 
    """
@@ -53,30 +85,9 @@ class BinaryPacker(object):
 
       Use width=X to include padding of BINARY_CHUNKs w/ 0x00 bytes
       """
-      E = endianness
-      if   varType == UINT8:
-         self.binaryConcat.write(int_to_binary(theData, 1, endianness))
-      elif varType == UINT16:
-         self.binaryConcat.write(int_to_binary(theData, 2, endianness))
-      elif varType == UINT32:
-         self.binaryConcat.write(int_to_binary(theData, 4, endianness))
-      elif varType == UINT64:
-         self.binaryConcat.write(int_to_binary(theData, 8, endianness))
-      elif varType == INT8:
-         self.binaryConcat.write(pack(E+'b', theData))
-      elif varType == INT16:
-         self.binaryConcat.write(pack(E+'h', theData))
-      elif varType == INT32:
-         self.binaryConcat.write(pack(E+'i', theData))
-      elif varType == INT64:
-         self.binaryConcat.write(pack(E+'q', theData))
-      elif varType == VAR_INT:
-         self.binaryConcat.write(packVarInt(theData))
-      elif varType == VAR_STR:
-         self.binaryConcat.write(packVarInt(len(theData)))
-         self.binaryConcat.write(theData)
-      elif varType == FLOAT:
-         self.binaryConcat.write(pack(E+'f', theData))
+      st = STRUCT_TABLE.get((varType, endianness))
+      if st is not None:
+         self.binaryConcat.write(st.pack(theData))
       elif varType == BINARY_CHUNK:
          if width==None:
             self.binaryConcat.write(theData)
@@ -84,7 +95,68 @@ class BinaryPacker(object):
             if len(theData)>width:
                raise PackerError('Too much data to fit into fixed width field')
             self.binaryConcat.write(theData.ljust(width, b'\x00'))
+      elif varType == VAR_INT:
+         self.binaryConcat.write(varIntToBinary(theData))
+      elif varType == VAR_STR:
+         self.binaryConcat.write(varIntToBinary(len(theData)))
+         self.binaryConcat.write(theData)
       else:
          raise PackerError("Var type not recognized!  VarType="+str(varType))
 
+################################################################################
+class BufferPacker(object):
+   """
+   Same interface as BinaryPacker, but fields are packed in place into a
+   bytearray allocated up front. Meant for objects that can compute their
+   serialized size (see getSerializedSize/serializeInto on PyTx & co), so
+   that a whole tx or block goes out in a single pass with a single copy.
+   """
+   def __init__(self, size):
+      self.buffer = bytearray(size)
+      self.pos = 0
+
+   def getSize(self):
+      return self.pos
+
+   def getBuffer(self):
+      return self.buffer
+
+   def getBinaryString(self):
+      if self.pos == len(self.buffer):
+         return bytes(self.buffer)
+      return bytes(memoryview(self.buffer)[:self.pos])
+
+   def __str__(self):
+      return hexlify(self.getBinaryString()).decode('ascii')
+
+   def putBinary(self, binStr, width=None):
+      sz = len(binStr)
+      if width is None:
+         width = sz
+      elif sz > width:
+         raise PackerError('Too much data to fit into fixed width field')
 
+      end = self.pos + width
+      if end > len(self.buffer):
+         raise PackerError('BufferPacker overflow')
+
+      # the buffer is zeroed, fixed width padding is just a skip
+      self.buffer[self.pos:self.pos+sz] = binStr
+      self.pos = end
+
+   def put(self, varType, theData, width=None, endianness=LITTLEENDIAN):
+      st = STRUCT_TABLE.get((varType, endianness))
+      if st is not None:
+         if self.pos + st.size > len(self.buffer):
+            raise PackerError('BufferPacker overflow')
+         st.pack_into(self.buffer, self.pos, theData)
+         self.pos += st.size
+      elif varType == BINARY_CHUNK:
+         self.putBinary(theData, width)
+      elif varType == VAR_INT:
+         self.putBinary(varIntToBinary(theData))
+      elif varType == VAR_STR:
+         self.putBinary(varIntToBinary(len(theData)))
+         self.putBinary(theData)
+      else:
+         raise PackerError("Var type not recognized!  VarType="+str(varType))
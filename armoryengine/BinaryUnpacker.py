@@ -23,12 +23,18 @@ from __future__ import (absolute_import, division,
 #  Classes for reading and writing large binary objects
 ################################################################################
 ################################################################################
-from struct import pack, unpack
-from armoryengine.BinaryPacker import UINT8, UINT16, UINT32, UINT64, INT8, INT16, INT32, INT64, VAR_INT, VAR_STR, FLOAT, BINARY_CHUNK
-from armoryengine.ArmoryUtils import LITTLEENDIAN, unpackVarInt, LOGERROR
+from struct import Struct
+from armoryengine.BinaryPacker import UINT8, UINT16, UINT32, UINT64, INT8, INT16, INT32, INT64, VAR_INT, VAR_STR, FLOAT, BINARY_CHUNK, \
+   STRUCT_TABLE
+from armoryengine.ArmoryUtils import LITTLEENDIAN, LOGERROR
 
 class UnpackerError(Exception): pass
 
+# how much to pull from a file-like source at a time
+STREAM_CHUNK_SIZE = 1024*1024
+
+VARINT_STRUCTS = { 0xfd: Struct('<H'), 0xfe: Struct('<I'), 0xff: Struct('<Q') }
+
 # Seed this object with binary data, then read in its pieces sequentially
 class BinaryUnpacker(object):
    """
@@ -38,93 +44,186 @@ class BinaryUnpacker(object):
       >> int64   = bup.get(VAR_INT)
       >> bytes10 = bup.get(BINARY_CHUNK, 10)
       >> ...etc...
+
+   Fields are read in place through a memoryview, only BINARY_CHUNK and
+   VAR_STR results are copied out (use getView for a zero-copy slice).
+
+   The source can also be a file-like object (anything with read()), in
+   which case data is pulled in chunks as it is consumed and only the unread
+   part is kept around. Positions are still absolute from where the stream
+   was when handed over, but you can't rewind into data already dropped.
    """
-   def __init__(self, binaryStr):
-      self.binaryStr = binaryStr
+   def __init__(self, binaryStr, chunkSize=STREAM_CHUNK_SIZE):
       self.pos = 0
+      self.base = 0
+      self.stream = None
+      self.streamSize = None
+
+      if hasattr(binaryStr, 'read'):
+         self.stream = binaryStr
+         self.chunkSize = chunkSize
+         self.streamSize = self.getStreamSize(binaryStr)
+         binaryStr = b''
+
+      self.setBuffer(binaryStr)
+
+   #############################################################################
+   def setBuffer(self, binaryStr):
+      self.binaryStr = binaryStr
+      self.view = memoryview(binaryStr)
+      self.viewLen = len(self.view)
+
+   #############################################################################
+   @staticmethod
+   def getStreamSize(stream):
+      # bytes left in a seekable stream, None if it can't tell
+      try:
+         cur = stream.tell()
+         end = stream.seek(0, 2)
+         stream.seek(cur)
+         return end - cur
+      except (AttributeError, OSError, ValueError):
+         return None
+
+   #############################################################################
+   def fill(self, sz):
+      """ Pull from the stream until sz bytes past pos are buffered """
+      off = self.pos - self.base
+      pieces = [self.view[off:]]
+      have = self.viewLen - off
+
+      # advance() may have skipped past the buffered data
+      skip = max(0, -have)
+      have = max(0, have)
+
+      while skip > 0:
+         data = self.stream.read(min(skip, self.chunkSize))
+         if not data:
+            break
+         skip -= len(data)
+
+      while have < sz:
+         data = self.stream.read(max(self.chunkSize, sz - have))
+         if not data:
+            break
+         pieces.append(data)
+         have += len(data)
+
+      self.base = self.pos
+      self.setBuffer(b''.join(pieces))
+      return have >= sz
+
+   #############################################################################
+   def sizeCheck(self, sz):
+      if self.pos - self.base + sz > self.viewLen:
+         if self.stream is None or not self.fill(sz):
+            raise UnpackerError
+
+   #############################################################################
+   def getSize(self):
+      if self.stream is None:
+         return self.viewLen
+      if self.streamSize is not None:
+         return self.streamSize
+      return self.base + self.viewLen
+
+   def getRemainingSize(self):
+      if self.stream is not None and self.streamSize is None:
+         # unknown length, make sure there is something buffered
+         if self.pos - self.base >= self.viewLen:
+            self.fill(1)
+      return self.getSize() - self.pos
 
-   def getSize(self): return len(self.binaryStr)
-   def getRemainingSize(self): return len(self.binaryStr) - self.pos
    def getBinaryString(self): return self.binaryStr
-   def getRemainingString(self): return self.binaryStr[self.pos:]
-   def append(self, binaryStr): self.binaryStr += binaryStr
+
+   def getRemainingString(self):
+      if self.stream is not None:
+         self.fill(0)
+         self.setBuffer(self.binaryStr + self.stream.read())
+      return self.view[self.pos - self.base:].tobytes()
+
+   def append(self, binaryStr):
+      if self.stream is not None:
+         raise UnpackerError('cannot append to a stream source')
+
+      if not isinstance(self.binaryStr, bytearray):
+         self.binaryStr = bytearray(self.binaryStr)
+      try:
+         self.view.release()
+         self.binaryStr += binaryStr
+      except BufferError:
+         # someone still holds a view into the buffer, grow a copy instead
+         self.binaryStr = self.binaryStr + binaryStr
+      self.setBuffer(self.binaryStr)
+
    def advance(self, bytesToAdvance): self.pos += bytesToAdvance
-   def rewind(self, bytesToRewind): self.pos -= bytesToRewind
-   def resetPosition(self, toPos=0): self.pos = toPos
+   def rewind(self, bytesToRewind): self.resetPosition(self.pos - bytesToRewind)
    def getPosition(self): return self.pos
 
+   def resetPosition(self, toPos=0):
+      if toPos < self.base:
+         raise UnpackerError('cannot rewind past the buffered stream data')
+      self.pos = toPos
+
+   #############################################################################
+   def getView(self, sz):
+      """ Zero-copy version of get(BINARY_CHUNK, sz) """
+      self.sizeCheck(sz)
+      off = self.pos - self.base
+      self.pos += sz
+      return self.view[off:off+sz]
+
+   #############################################################################
+   def getSpan(self, startPos, endPos):
+      """
+      Bytes between two absolute positions, None if they were already
+      dropped from a stream buffer. Used to keep the original encoding of
+      an object after unserializing it.
+      """
+      if startPos < self.base or endPos - self.base > self.viewLen:
+         return None
+      if startPos == 0 and endPos == self.viewLen and \
+         self.stream is None and isinstance(self.binaryStr, bytes):
+         return self.binaryStr
+      return self.view[startPos - self.base:endPos - self.base].tobytes()
+
+   #############################################################################
+   def getVarInt(self):
+      self.sizeCheck(1)
+      off = self.pos - self.base
+      code = self.view[off]
+      if code < 0xfd:
+         self.pos += 1
+         return code
+
+      st = VARINT_STRUCTS[code]
+      self.sizeCheck(1 + st.size)
+      value = st.unpack_from(self.view, self.pos - self.base + 1)[0]
+      self.pos += 1 + st.size
+      return value
+
+   #############################################################################
    def get(self, varType, sz=0, endianness=LITTLEENDIAN):
       """
       First argument is the data-type:  UINT32, VAR_INT, etc.
       If BINARY_CHUNK, need to supply a number of bytes to read, as well
       """
-      def sizeCheck(sz):
-         if self.getRemainingSize()<sz:
-            raise UnpackerError
+      st = STRUCT_TABLE.get((varType, endianness))
+      if st is not None:
+         size = st.size
+         off = self.pos - self.base
+         if off + size > self.viewLen:
+            self.sizeCheck(size)
+            off = self.pos - self.base
+         self.pos += size
+         return st.unpack_from(self.view, off)[0]
 
-      E = endianness
-      pos = self.pos
-      if varType == UINT32:
-         sizeCheck(4)
-         value = unpack(E+'I', self.binaryStr[pos:pos+4])[0]
-         self.advance(4)
-         return value
-      elif varType == UINT64:
-         sizeCheck(8)
-         value = unpack(E+'Q', self.binaryStr[pos:pos+8])[0]
-         self.advance(8)
-         return value
-      elif varType == UINT8:
-         sizeCheck(1)
-         value = unpack(E+'B', self.binaryStr[pos:pos+1])[0]
-         self.advance(1)
-         return value
-      elif varType == UINT16:
-         sizeCheck(2)
-         value = unpack(E+'H', self.binaryStr[pos:pos+2])[0]
-         self.advance(2)
-         return value
-      elif varType == INT32:
-         sizeCheck(4)
-         value = unpack(E+'i', self.binaryStr[pos:pos+4])[0]
-         self.advance(4)
-         return value
-      elif varType == INT64:
-         sizeCheck(8)
-         value = unpack(E+'q', self.binaryStr[pos:pos+8])[0]
-         self.advance(8)
-         return value
-      elif varType == INT8:
-         sizeCheck(1)
-         value = unpack(E+'b', self.binaryStr[pos:pos+1])[0]
-         self.advance(1)
-         return value
-      elif varType == INT16:
-         sizeCheck(2)
-         value = unpack(E+'h', self.binaryStr[pos:pos+2])[0]
-         self.advance(2)
-         return value
       elif varType == VAR_INT:
-         sizeCheck(1)
-         [value, nBytes] = unpackVarInt(self.binaryStr[pos:pos+9])
-         self.advance(nBytes)
-         return value
+         return self.getVarInt()
       elif varType == VAR_STR:
-         sizeCheck(1)
-         [value, nBytes] = unpackVarInt(self.binaryStr[pos:pos+9])
-         binOut = self.binaryStr[pos+nBytes:pos+nBytes+value]
-         self.advance(nBytes+value)
-         return binOut
-      elif varType == FLOAT:
-         sizeCheck(4)
-         value = unpack(E+'f', self.binaryStr[pos:pos+4])[0]
-         self.advance(4)
-         return value
+         return self.getView(self.getVarInt()).tobytes()
       elif varType == BINARY_CHUNK:
-         sizeCheck(sz)
-         binOut = self.binaryStr[pos:pos+sz]
-         self.advance(sz)
-         return binOut
+         return self.getView(sz).tobytes()
 
       LOGERROR('Var Type not recognized!  VarType = %d', varType)
       raise UnpackerError("Var type not recognized!  VarType="+str(varType))
@@ -13,11 +13,58 @@ from armoryengine.ArmoryUtils import UNINITIALIZED, BlockComponent, \
 from armoryengine.BDM import TheBDM
 from armoryengine.BinaryUnpacker import BinaryUnpacker
 from armoryengine.Transaction import PyTx
-from armoryengine.BinaryPacker import BinaryPacker, UINT32, BINARY_CHUNK, \
-   VAR_INT
+from armoryengine.BinaryPacker import BufferPacker, UINT32, BINARY_CHUNK, \
+   VAR_INT, varIntSize
 
 
 
+################################################################################
+class MerkleBuilder(object):
+   """
+   Computes a merkle root as tx hashes come in, keeping only one pending
+   node per tree level (log2(numTx) hashes) instead of the whole tree.
+   Odd nodes are paired with themselves, same as the full tree below.
+   """
+   def __init__(self):
+      self.count = 0
+      self.pending = []
+
+   def addHash(self, txHash):
+      self.count += 1
+      level = 0
+      node = txHash
+      while not self.count & (1 << level):
+         node = hash256(self.pending[level] + node)
+         level += 1
+
+      if level == len(self.pending):
+         self.pending.append(node)
+      else:
+         self.pending[level] = node
+
+   def getRoot(self):
+      if self.count == 0:
+         return None
+
+      # lowest level holding a pending node
+      count = self.count
+      level = 0
+      while not count & (1 << level):
+         level += 1
+      node = self.pending[level]
+
+      # pair it with itself until it reaches the top, folding in the
+      # pending left nodes on the way up
+      while count != (1 << level):
+         node = hash256(node + node)
+         count += (1 << level)
+         level += 1
+         while not count & (1 << level):
+            node = hash256(self.pending[level] + node)
+            level += 1
+      return node
+
+
 ################################################################################
 #  Block Information
 ################################################################################
@@ -41,17 +88,18 @@ class PyBlockHeader(BlockComponent):
       self.isMainChain  = False
       self.isOrphan     = True
 
-   def serialize(self):
+   def getSerializedSize(self):
       if self.version == UNINITIALIZED:
          raise UnitializedBlockDataError('PyBlockHeader object not initialized!')
-      binOut = BinaryPacker()
+      return 80
+
+   def serializeInto(self, binOut):
       binOut.put(UINT32, self.version)
       binOut.put(BINARY_CHUNK, self.prevBlkHash)
       binOut.put(BINARY_CHUNK, self.merkleRoot)
       binOut.put(UINT32, self.timestamp)
       binOut.put(BINARY_CHUNK, self.diffBits)
       binOut.put(UINT32, self.nonce)
-      return binOut.getBinaryString()
 
 
    def unserialize(self, toUnpack):
@@ -131,13 +179,22 @@ class PyBlockData(object):
       self.merkleRoot = UNINITIALIZED
 
 
-   def serialize(self):
+   def getSerializedSize(self):
       if self.numTx == UNINITIALIZED:
          raise UnitializedBlockDataError('PyBlockData object not initialized!')
-      binOut = BinaryPacker()
+      size = varIntSize(self.numTx)
+      for tx in self.txList:
+         size += tx.getSerializedSize()
+      return size
+
+   def serializeInto(self, binOut):
       binOut.put(VAR_INT, self.numTx)
       for tx in self.txList:
-         binOut.put(BINARY_CHUNK, tx.serialize())
+         tx.serializeInto(binOut)
+
+   def serialize(self):
+      binOut = BufferPacker(self.getSerializedSize())
+      self.serializeInto(binOut)
       return binOut.getBinaryString()
 
    def unserialize(self, toUnpack):
@@ -148,7 +205,7 @@ class PyBlockData(object):
 
       self.txList = []
       self.numTx  = blkData.get(VAR_INT)
-      for i in xrange(self.numTx):
+      for i in range(self.numTx):
          self.txList.append( PyTx().unserialize(blkData) )
       self.merkleTree = []
       self.merkleRoot = ''
@@ -170,11 +227,11 @@ class PyBlockData(object):
          while sz > 1:
             hashes = self.merkleTree[-sz:]
             mod2 = sz%2
-            for i in range(sz/2):
+            for i in range(sz//2):
                self.merkleTree.append( hash256(hashes[2*i] + hashes[2*i+1]) )
             if mod2==1:
                self.merkleTree.append( hash256(hashes[-1] + hashes[-1]) )
-            sz = (sz+1) / 2
+            sz = (sz+1) // 2
       self.merkleRoot = self.merkleTree[-1]
       return self.merkleRoot
 
@@ -210,11 +267,19 @@ class PyBlock(object):
       if txlist:
          self.setTxList(txlist)
 
-   def serialize(self):
+   def getSerializedSize(self):
       assert( not self.blockHeader == UNINITIALIZED )
-      binOut = BinaryPacker()
-      binOut.put(BINARY_CHUNK, self.blockHeader.serialize())
-      binOut.put(BINARY_CHUNK, self.blockData.serialize())
+      return self.blockHeader.getSerializedSize() + \
+         self.blockData.getSerializedSize()
+
+   def serializeInto(self, binOut):
+      self.blockHeader.serializeInto(binOut)
+      self.blockData.serializeInto(binOut)
+
+   def serialize(self):
+      # whole block in one buffer, no per tx intermediate strings
+      binOut = BufferPacker(self.getSerializedSize())
+      self.serializeInto(binOut)
       return binOut.getBinaryString()
 
    def unserialize(self, toUnpack):
@@ -232,7 +297,7 @@ class PyBlock(object):
       return len(self.blockData.txList)
 
    def getSize(self):
-      return len(self.serialize())
+      return self.getSerializedSize()
 
    # Not sure how useful these manual block-construction methods
    # are.  For now, I just need something with non-ridiculous vals
@@ -0,0 +1,450 @@
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+
+"""
+Streaming access to Bitcoin Core blkNNNNN.dat files.
+
+Files are mmap'ed, blocks are yielded one at a time with only their header
+parsed, tx offsets and hashes are found on demand by skipping over the raw
+bytes, and full PyTx/PyBlock objects are only built when asked for:
+
+   with BlockFileReader(path) as reader:
+      for blk in reader.iterBlocks():
+         print(blk.getHashHex(), blk.getNumTx(), blk.checkMerkleRoot())
+
+BlockFileIndex keeps an on-disk index over a whole blocks directory
+(block hash/height -> file/offset, txid -> file/offset) and only scans
+what was appended to the files since it was last saved.
+"""
+
+import os
+import mmap
+import hashlib
+from struct import Struct
+
+from armoryengine.ArmoryUtils import MAGIC_BYTES, BLKFILE_DIR, LOGWARN, \
+   LOGINFO, UnserializeError, binary_to_hex, BIGENDIAN
+from armoryengine.BinaryUnpacker import BinaryUnpacker
+from armoryengine.BinaryPacker import UINT8, UINT32, VAR_INT
+from armoryengine.Block import PyBlockHeader, PyBlock, MerkleBuilder
+from armoryengine.Transaction import PyTx
+
+BLKFILE_HEADER_SIZE = 8
+BLOCK_HEADER_SIZE = 80
+NULL_HASH = b'\x00'*32
+
+################################################################################
+def getBlockFilePath(fileNum, blkDir=None):
+   return os.path.join(blkDir or BLKFILE_DIR, 'blk%05d.dat' % fileNum)
+
+################################################################################
+def scanTx(unpacker, view):
+   """
+   Skips over the tx at the unpacker position, returns its txid. The hash
+   is fed straight from the buffer, leaving out the segwit marker/flag and
+   the witness data, no PyTx is built.
+   """
+   start = unpacker.getPosition()
+   unpacker.advance(4)
+   marker = unpacker.get(UINT8)
+   flag = unpacker.get(UINT8)
+   useWitness = (marker == 0 and flag == 1)
+   if not useWitness:
+      unpacker.rewind(2)
+   bodyStart = unpacker.getPosition()
+
+   numInputs = unpacker.get(VAR_INT)
+   for i in range(numInputs):
+      unpacker.advance(36)
+      unpacker.advance(unpacker.get(VAR_INT) + 4)
+
+   numOutputs = unpacker.get(VAR_INT)
+   for i in range(numOutputs):
+      unpacker.advance(8)
+      unpacker.advance(unpacker.get(VAR_INT))
+   bodyEnd = unpacker.getPosition()
+
+   if useWitness:
+      for i in range(numInputs):
+         for j in range(unpacker.get(VAR_INT)):
+            unpacker.advance(unpacker.get(VAR_INT))
+
+   lockTimePos = unpacker.getPosition()
+   unpacker.advance(4)
+
+   hasher = hashlib.sha256(view[start:start+4])
+   hasher.update(view[bodyStart:bodyEnd])
+   hasher.update(view[lockTimePos:lockTimePos+4])
+   return hashlib.sha256(hasher.digest()).digest()
+
+################################################################################
+class BlockFileEntry(object):
+   """
+   A block inside an mmap'ed blk file. Offsets are absolute in the file,
+   self.offset points at the 80 byte header (past magic and size).
+   """
+
+   #############################################################################
+   def __init__(self, reader, offset, size):
+      self.reader    = reader
+      self.fileNum   = reader.fileNum
+      self.offset    = offset
+      self.size      = size
+      self.header    = PyBlockHeader().unserialize( \
+         reader.view[offset:offset+BLOCK_HEADER_SIZE].tobytes())
+      self.numTx     = None
+      self.txOffsets = None
+      self.txHashes  = None
+
+   #############################################################################
+   def getHash(self):
+      return self.header.getHash()
+
+   def getHashHex(self, endian=BIGENDIAN):
+      return binary_to_hex(self.getHash(), endian)
+
+   def getPrevHash(self):
+      return self.header.prevBlkHash
+
+   #############################################################################
+   def scanTxs(self):
+      # one pass over the block body for tx offsets, sizes and hashes
+      if self.txOffsets is not None:
+         return
+
+      view = self.reader.view
+      unpacker = self.reader.unpacker
+      unpacker.resetPosition(self.offset + BLOCK_HEADER_SIZE)
+      numTx = unpacker.get(VAR_INT)
+
+      txOffsets = []
+      txHashes = []
+      for i in range(numTx):
+         txStart = unpacker.getPosition()
+         txHashes.append(scanTx(unpacker, view))
+         txOffsets.append((txStart, unpacker.getPosition() - txStart))
+
+      if unpacker.getPosition() != self.offset + self.size:
+         raise UnserializeError('block size mismatch in %s at offset %d' % \
+            (self.reader.filePath, self.offset))
+
+      self.numTx = numTx
+      self.txOffsets = txOffsets
+      self.txHashes = txHashes
+
+   #############################################################################
+   def getNumTx(self):
+      if self.numTx is None:
+         unpacker = self.reader.unpacker
+         unpacker.resetPosition(self.offset + BLOCK_HEADER_SIZE)
+         self.numTx = unpacker.get(VAR_INT)
+      return self.numTx
+
+   def getTxOffsets(self):
+      """ [(fileOffset, size)] for each tx """
+      self.scanTxs()
+      return self.txOffsets
+
+   def getTxHashes(self):
+      self.scanTxs()
+      return self.txHashes
+
+   #############################################################################
+   def getRawTx(self, txIndex):
+      if txIndex == 0 and self.txOffsets is None:
+         # coinbase only, no need to scan the rest of the block
+         unpacker = self.reader.unpacker
+         unpacker.resetPosition(self.offset + BLOCK_HEADER_SIZE)
+         unpacker.get(VAR_INT)
+         offset = unpacker.getPosition()
+         scanTx(unpacker, self.reader.view)
+         size = unpacker.getPosition() - offset
+      else:
+         offset, size = self.getTxOffsets()[txIndex]
+      return self.reader.view[offset:offset+size].tobytes()
+
+   def getTx(self, txIndex):
+      return PyTx().unserialize(self.getRawTx(txIndex))
+
+   def iterTx(self):
+      for i in range(len(self.getTxOffsets())):
+         yield self.getTx(i)
+
+   #############################################################################
+   def getRawBlock(self):
+      return self.reader.view[self.offset:self.offset+self.size].tobytes()
+
+   def getBlock(self):
+      return PyBlock().unserialize(self.getRawBlock())
+
+   #############################################################################
+   def getMerkleRoot(self):
+      merkle = MerkleBuilder()
+      for txHash in self.getTxHashes():
+         merkle.addHash(txHash)
+      return merkle.getRoot()
+
+   def checkMerkleRoot(self):
+      return self.getMerkleRoot() == self.header.merkleRoot
+
+
+################################################################################
+class BlockFileReader(object):
+   """
+   Iterates the blocks of a single blk file through a read-only mmap, so
+   the file is paged in by the OS as it is walked rather than read whole.
+   """
+
+   #############################################################################
+   def __init__(self, filePath, fileNum=0, magicBytes=None):
+      self.filePath   = filePath
+      self.fileNum    = fileNum
+      self.magicBytes = magicBytes or MAGIC_BYTES
+      self.fileObj    = None
+      self.mmapObj    = None
+      self.view       = memoryview(b'')
+      self.unpacker   = BinaryUnpacker(b'')
+
+   #############################################################################
+   def open(self):
+      if self.fileObj is not None:
+         return self
+
+      self.fileObj = open(self.filePath, 'rb')
+      if os.fstat(self.fileObj.fileno()).st_size > 0:
+         self.mmapObj = mmap.mmap(self.fileObj.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+         self.view = memoryview(self.mmapObj)
+      self.unpacker = BinaryUnpacker(self.view)
+      return self
+
+   def close(self):
+      # drop every view on the map first, or mmap refuses to close
+      self.unpacker = BinaryUnpacker(b'')
+      self.view.release()
+      self.view = memoryview(b'')
+      if self.mmapObj is not None:
+         self.mmapObj.close()
+         self.mmapObj = None
+      if self.fileObj is not None:
+         self.fileObj.close()
+         self.fileObj = None
+
+   def __enter__(self):
+      return self.open()
+
+   def __exit__(self, *args):
+      self.close()
+
+   #############################################################################
+   def getFileSize(self):
+      return len(self.view)
+
+   #############################################################################
+   def iterBlocks(self, startOffset=0):
+      """
+      Yields a BlockFileEntry per block, starting at the magic bytes at
+      startOffset. Stops at the zero padding Core preallocates, or at a
+      block that isn't fully written yet. After the loop, self.endOffset
+      is where the next block will go, resume from there.
+      """
+      self.open()
+      fileSize = len(self.view)
+      offset = startOffset
+      self.endOffset = offset
+
+      while offset + BLKFILE_HEADER_SIZE <= fileSize:
+         magic = self.view[offset:offset+4].tobytes()
+         if magic != self.magicBytes:
+            if magic != b'\x00'*4:
+               LOGWARN('Unexpected magic bytes in %s at offset %d' % \
+                  (self.filePath, offset))
+            break
+
+         blkSize = int.from_bytes(self.view[offset+4:offset+8], 'little')
+         blkStart = offset + BLKFILE_HEADER_SIZE
+         if blkSize < BLOCK_HEADER_SIZE or blkStart + blkSize > fileSize:
+            break
+
+         yield BlockFileEntry(self, blkStart, blkSize)
+         offset = blkStart + blkSize
+         self.endOffset = offset
+
+
+################################################################################
+class BlockFileIndex(object):
+   """
+   On-disk index over a blocks directory: block hash -> (file, offset, size),
+   height -> hash along the longest chain found, and optionally txid ->
+   (file, offset, size). update() only scans data appended since the last
+   run, save()/load() persist to a flat binary file.
+   """
+
+   INDEX_MAGIC   = b'ARMBIDX1'
+   FILE_STRUCT   = Struct('<IQ')
+   BLOCK_STRUCT  = Struct('<32s32sIQI')
+   TX_STRUCT     = Struct('<32sIQI')
+   COUNT_STRUCT  = Struct('<Q')
+
+   #############################################################################
+   def __init__(self, indexPath, blkDir=None, indexTxs=True, magicBytes=None):
+      self.indexPath  = indexPath
+      self.blkDir     = blkDir or BLKFILE_DIR
+      self.indexTxs   = indexTxs
+      self.magicBytes = magicBytes or MAGIC_BYTES
+
+      self.scannedMap = {}  # fileNum -> bytes scanned
+      self.blockMap   = {}  # hash -> (prevHash, fileNum, offset, size)
+      self.txMap      = {}  # txid -> (fileNum, offset, size)
+      self.heightMap  = {}  # hash -> height
+      self.mainChain  = []  # height -> hash
+
+   #############################################################################
+   def listBlockFiles(self):
+      fileNum = 0
+      while os.path.exists(getBlockFilePath(fileNum, self.blkDir)):
+         yield fileNum
+         fileNum += 1
+
+   #############################################################################
+   def update(self):
+      """ Scans new data in the blk files, returns the number of new blocks """
+      newBlocks = 0
+      for fileNum in self.listBlockFiles():
+         startOffset = self.scannedMap.get(fileNum, 0)
+         filePath = getBlockFilePath(fileNum, self.blkDir)
+         if startOffset >= os.path.getsize(filePath):
+            continue
+
+         with BlockFileReader(filePath, fileNum, self.magicBytes) as reader:
+            for blk in reader.iterBlocks(startOffset):
+               self.addBlock(blk)
+               newBlocks += 1
+            self.scannedMap[fileNum] = reader.endOffset
+
+      if newBlocks > 0:
+         LOGINFO('Indexed %d new blocks' % newBlocks)
+         self.computeHeights()
+      return newBlocks
+
+   #############################################################################
+   def addBlock(self, blk):
+      self.blockMap[blk.getHash()] = \
+         (blk.getPrevHash(), blk.fileNum, blk.offset, blk.size)
+      if self.indexTxs:
+         for txHash, (offset, size) in \
+            zip(blk.getTxHashes(), blk.getTxOffsets()):
+            self.txMap[txHash] = (blk.fileNum, offset, size)
+
+   #############################################################################
+   def computeHeights(self):
+      # blocks are not stored in height order (headers first sync), so
+      # link them up from genesis once everything is in
+      childMap = {}
+      for blkHash, (prevHash, _, _, _) in self.blockMap.items():
+         childMap.setdefault(prevHash, []).append(blkHash)
+
+      heightMap = {}
+      toVisit = [(h, 0) for h in childMap.get(NULL_HASH, [])]
+      while toVisit:
+         blkHash, height = toVisit.pop()
+         heightMap[blkHash] = height
+         for child in childMap.get(blkHash, []):
+            toVisit.append((child, height+1))
+      self.heightMap = heightMap
+
+      mainChain = []
+      if heightMap:
+         tipHash = max(heightMap, key=heightMap.get)
+         mainChain = [None] * (heightMap[tipHash] + 1)
+         while tipHash in heightMap:
+            mainChain[heightMap[tipHash]] = tipHash
+            tipHash = self.blockMap[tipHash][0]
+      self.mainChain = mainChain
+
+   #############################################################################
+   def getTopHeight(self):
+      return len(self.mainChain) - 1
+
+   def getHashByHeight(self, height):
+      if 0 <= height < len(self.mainChain):
+         return self.mainChain[height]
+      return None
+
+   def getBlockLocation(self, blkHash):
+      """ (fileNum, offset, size) or None """
+      loc = self.blockMap.get(blkHash)
+      return None if loc is None else loc[1:]
+
+   def getTxLocation(self, txHash):
+      return self.txMap.get(txHash)
+
+   #############################################################################
+   def readRaw(self, fileNum, offset, size):
+      # plain seek & read, no point mapping a whole file for one object
+      with open(getBlockFilePath(fileNum, self.blkDir), 'rb') as f:
+         f.seek(offset)
+         return f.read(size)
+
+   def getBlock(self, blkHash):
+      loc = self.getBlockLocation(blkHash)
+      return None if loc is None else PyBlock().unserialize(self.readRaw(*loc))
+
+   def getBlockByHeight(self, height):
+      blkHash = self.getHashByHeight(height)
+      return None if blkHash is None else self.getBlock(blkHash)
+
+   def getTx(self, txHash):
+      loc = self.getTxLocation(txHash)
+      return None if loc is None else PyTx().unserialize(self.readRaw(*loc))
+
+   #############################################################################
+   def save(self):
+      tmpPath = self.indexPath + '.tmp'
+      with open(tmpPath, 'wb') as f:
+         f.write(self.INDEX_MAGIC)
+         f.write(self.COUNT_STRUCT.pack(len(self.scannedMap)))
+         for fileNum, scanned in sorted(self.scannedMap.items()):
+            f.write(self.FILE_STRUCT.pack(fileNum, scanned))
+
+         f.write(self.COUNT_STRUCT.pack(len(self.blockMap)))
+         for blkHash, (prevHash, fileNum, offset, size) in \
+            self.blockMap.items():
+            f.write(self.BLOCK_STRUCT.pack( \
+               blkHash, prevHash, fileNum, offset, size))
+
+         f.write(self.COUNT_STRUCT.pack(len(self.txMap)))
+         for txHash, (fileNum, offset, size) in self.txMap.items():
+            f.write(self.TX_STRUCT.pack(txHash, fileNum, offset, size))
+      os.replace(tmpPath, self.indexPath)
+
+   #############################################################################
+   def load(self):
+      """ Returns False if there is no index file yet """
+      if not os.path.exists(self.indexPath):
+         return False
+
+      with open(self.indexPath, 'rb') as f:
+         if f.read(len(self.INDEX_MAGIC)) != self.INDEX_MAGIC:
+            raise UnserializeError('not a block file index: ' + self.indexPath)
+
+         def readRecords(recStruct):
+            count = self.COUNT_STRUCT.unpack(f.read(8))[0]
+            data = f.read(count * recStruct.size)
+            if len(data) != count * recStruct.size:
+               raise UnserializeError('truncated block file index')
+            return recStruct.iter_unpack(data)
+
+         self.scannedMap = dict(readRecords(self.FILE_STRUCT))
+         self.blockMap = dict((rec[0], rec[1:]) \
+            for rec in readRecords(self.BLOCK_STRUCT))
+         self.txMap = dict((rec[0], rec[1:]) \
+            for rec in readRecords(self.TX_STRUCT))
+
+      self.computeHeights()
+      return True
@@ -57,6 +57,10 @@ from __future__ import (absolute_import, division,
 #   list looks like, some of these algorithms could produce perfect results,
 #   and in other instances *terrible* results.
 #
+#   PySelectCoins now hands off to CoinSelectionEngine (branch and bound,
+#   then single random draw, ranked by waste). The heuristics below are
+#   kept for extras/coinSelectionBenchmark.py to compare against.
+#
 ################################################################################
 ################################################################################
 import math
@@ -67,64 +71,17 @@ from armoryengine.ArmoryUtils import binary_to_hex, coin2str, \
 from armoryengine.AddressUtils import CheckHash160, hash160_to_addrStr, \
    scrAddr_to_script
 from armoryengine.Timer import TimeThisFunction
+from armoryengine.CoinSelectionEngine import CoinSelectionEngine
 from armoryengine.Transaction import *
 from armoryengine.BDM import TheBDM
 
 ################################################################################
-# These would normally be defined by C++ and fed in, but I've recreated
-# the C++ class here... it's really just a container, anyway
-#
-# TODO:  LevelDB upgrade: had to upgrade this class to use arbitrary 
-#        ScrAddress "notation", even though everything else on the python
-#        side expects pure hash160 values.  For now, it looks like it can
-#        handle arbitrary scripts, but the CheckHash160() calls will 
-#        (correctly) throw errors if you don't.  We can upgrade this in
-#        the future.
-class PyUnspentTxOut(object):
-   def __init__(self, scrAddr=None, txHash=None, txoIdx=None, val=None,
-      numConf=None, fullScript=None):
-
-      self.initialize(scrAddr, txHash, None, None, None,
-         txoIdx, val, numConf, fullScript)
-
-
-   #############################################################################
-   def createFromBridgeUtxo(self, bridgeUtxo):
-      scrAddr= bridgeUtxo.scraddr
-      val    = bridgeUtxo.value
-      conf   = TheBDM.getTopBlockHeight() - bridgeUtxo.tx_height + 1
-      txHash = bridgeUtxo.tx_hash
-      txHashStr = binary_to_hex(bridgeUtxo.tx_hash)
-      txoIdx = bridgeUtxo.txout_index
-      script = bridgeUtxo.script
-      txHeight = bridgeUtxo.tx_height
-      txIndex = bridgeUtxo.tx_index
-      sequence = 2**32-1
-
-      self.initialize(scrAddr, txHash, txHashStr, txHeight, txIndex, 
-                      txoIdx, val, conf, script, sequence)
-      return self
-
-   #############################################################################
-   def initialize(self, scrAddr, txHash, txHashStr, txHeight, txIndex, 
-                  txoIdx, val, numConf=None, fullScript=None, 
-                  sequence=2**32-1):
-      self.scrAddr    = scrAddr
-      self.txHash     = txHash
-      self.txHashStr  = txHashStr
-      self.txOutIndex = txoIdx
-      self.val        = val
-      self.conf       = numConf
-      self.txHeight   = txHeight
-      self.txIndex    = txIndex
-      self.sequence   = sequence
-
-      if self.scrAddr and fullScript is None:
-         self.binScript = scrAddr_to_script(self.scrAddr)
-      else:
-         self.binScript = fullScript
-         
-      self.checked = True
+class UnspentTxOutBase(object):
+   """
+   Accessors of PyUnspentTxOut. No instance dict here, subclasses that keep
+   their fields elsewhere (UtxoSet row views) can go without one
+   """
+   __slots__ = ()
 
    def getTxHash(self):
       return self.txHash
@@ -194,6 +151,62 @@ class PyUnspentTxOut(object):
 
       return bridgeUtxo
 
+################################################################################
+# These would normally be defined by C++ and fed in, but I've recreated
+# the C++ class here... it's really just a container, anyway
+#
+# TODO:  LevelDB upgrade: had to upgrade this class to use arbitrary 
+#        ScrAddress "notation", even though everything else on the python
+#        side expects pure hash160 values.  For now, it looks like it can
+#        handle arbitrary scripts, but the CheckHash160() calls will 
+#        (correctly) throw errors if you don't.  We can upgrade this in
+#        the future.
+class PyUnspentTxOut(UnspentTxOutBase):
+   def __init__(self, scrAddr=None, txHash=None, txoIdx=None, val=None,
+      numConf=None, fullScript=None):
+
+      self.initialize(scrAddr, txHash, None, None, None,
+         txoIdx, val, numConf, fullScript)
+
+
+   #############################################################################
+   def createFromBridgeUtxo(self, bridgeUtxo):
+      scrAddr= bridgeUtxo.scraddr
+      val    = bridgeUtxo.value
+      conf   = TheBDM.getTopBlockHeight() - bridgeUtxo.tx_height + 1
+      txHash = bridgeUtxo.tx_hash
+      txHashStr = binary_to_hex(bridgeUtxo.tx_hash)
+      txoIdx = bridgeUtxo.txout_index
+      script = bridgeUtxo.script
+      txHeight = bridgeUtxo.tx_height
+      txIndex = bridgeUtxo.tx_index
+      sequence = 2**32-1
+
+      self.initialize(scrAddr, txHash, txHashStr, txHeight, txIndex, 
+                      txoIdx, val, conf, script, sequence)
+      return self
+
+   #############################################################################
+   def initialize(self, scrAddr, txHash, txHashStr, txHeight, txIndex, 
+                  txoIdx, val, numConf=None, fullScript=None, 
+                  sequence=2**32-1):
+      self.scrAddr    = scrAddr
+      self.txHash     = txHash
+      self.txHashStr  = txHashStr
+      self.txOutIndex = txoIdx
+      self.val        = val
+      self.conf       = numConf
+      self.txHeight   = txHeight
+      self.txIndex    = txIndex
+      self.sequence   = sequence
+
+      if self.scrAddr and fullScript is None:
+         self.binScript = scrAddr_to_script(self.scrAddr)
+      else:
+         self.binScript = fullScript
+         
+      self.checked = True
+
 ################################################################################
 def sumTxOutList(txoutList):
    return sum([u.getValue() for u in txoutList])
@@ -248,7 +261,7 @@ def PySelectCoins_SingleInput_SingleValue( \
       for utxo in unspentTxOutInfo:
          if target+CENT < utxo.getValue() < try2Val:
             try2Val = utxo.getValue()
-            try2Val = utxo
+            try2Utxo = utxo
       if not try2Utxo==None:
          bestMatchUtxo = try2Utxo
 
@@ -297,9 +310,9 @@ def PySelectCoins_SingleInput_DoubleValue( \
    idealTarget    = 2*targetOutVal + minFee
 
    # check to make sure we're accumulating enough
-   minTarget   = long(0.75 * idealTarget)
+   minTarget   = int(0.75 * idealTarget)
    minTarget   = max(minTarget, targetOutVal+minFee)
-   maxTarget   = long(1.25 * idealTarget)
+   maxTarget   = int(1.25 * idealTarget)
 
    if sum([u.getValue() for u in unspentTxOutInfo]) < minTarget:
       return []
@@ -322,7 +335,7 @@ def PySelectCoins_MultiInput_DoubleValue( \
                                     unspentTxOutInfo, targetOutVal, minFee=0):
 
    idealTarget = 2.0 * targetOutVal
-   minTarget   = long(0.80 * idealTarget)
+   minTarget   = int(0.80 * idealTarget)
    minTarget   = max(minTarget, targetOutVal+minFee)
    if sum([u.getValue() for u in unspentTxOutInfo]) < minTarget:
       return []
@@ -403,109 +416,24 @@ def PyEvalCoinSelect(utxoSelectList, targetOutVal, minFee, weights=WEIGHTS):
 
 
 ################################################################################
-# https://bitcointalk.org/index.php?topic=92496.msg1126310#msg1126310 contains a
-# description (possibly out-of-date?) of how this function works.
 @TimeThisFunction
 def PySelectCoins(unspentTxOutInfo, targetOutVal, minFee=0, numRand=10, margin=CENT):
    """
-   Intense algorithm for coin selection:  computes about 30 different ways to
-   select coins based on the desired target output and the min tx fee.  Then
-   ranks the various solutions and picks the best one
-   """
+   Picks the inputs to fund targetOutVal + minFee, see CoinSelectionEngine.
+   An exact match (no change) is preferred, otherwise a random draw that
+   leaves at least margin in change. The fee is the flat minFee passed in,
+   so selection itself is done at a zero fee rate.
 
+   numRand is unused, it was the number of random shuffles of the old
+   sort-and-score search.
+   """
    if sum([u.getValue() for u in unspentTxOutInfo]) < targetOutVal:
       return []
 
-   targExact  = targetOutVal
-   targMargin = targetOutVal+margin
-
-   selectLists = []
-
-   # Start with the intelligent solutions with different sortings
-   for sortMethod in range(8):
-      diffSortList = PySortCoins(unspentTxOutInfo, sortMethod)
-      selectLists.append(PySelectCoins_SingleInput_SingleValue( diffSortList, targExact,  minFee ))
-      selectLists.append(PySelectCoins_MultiInput_SingleValue(  diffSortList, targExact,  minFee ))
-      selectLists.append(PySelectCoins_SingleInput_SingleValue( diffSortList, targMargin, minFee ))
-      selectLists.append(PySelectCoins_MultiInput_SingleValue(  diffSortList, targMargin, minFee ))
-      selectLists.append(PySelectCoins_SingleInput_DoubleValue( diffSortList, targExact,  minFee ))
-      selectLists.append(PySelectCoins_MultiInput_DoubleValue(  diffSortList, targExact,  minFee ))
-      selectLists.append(PySelectCoins_SingleInput_DoubleValue( diffSortList, targMargin, minFee ))
-      selectLists.append(PySelectCoins_MultiInput_DoubleValue(  diffSortList, targMargin, minFee ))
-
-   # Throw in a couple random solutions, maybe we get lucky
-   # But first, make a copy before in-place shuffling
-   # NOTE:  using list[:] like below, really causes a swig::vector<type> to freak out!
-   #utxos = unspentTxOutInfo[:]
-   #utxos = list(unspentTxOutInfo)
-   for method in range(8,10):
-      for i in range(numRand):
-         utxos = PySortCoins(unspentTxOutInfo, method)
-         selectLists.append(PySelectCoins_MultiInput_SingleValue(utxos, targExact,  minFee))
-         selectLists.append(PySelectCoins_MultiInput_DoubleValue(utxos, targExact,  minFee))
-         selectLists.append(PySelectCoins_MultiInput_SingleValue(utxos, targMargin, minFee))
-         selectLists.append(PySelectCoins_MultiInput_DoubleValue(utxos, targMargin, minFee))
-
-   # Now we define PyEvalCoinSelect as our sorting metric, and find the best solution
-   scoreFunc = lambda ulist: PyEvalCoinSelect(ulist, targetOutVal, minFee)
-   finalSelection = max(selectLists, key=scoreFunc)
-   SCORES = getSelectCoinsScores(finalSelection, targetOutVal, minFee)
-   if len(finalSelection)==0:
-      return []
-
-   # If we selected a list that has only one or two inputs, and we have
-   # other, tiny, unspent outputs from the same addresses, we should
-   # throw one or two of them in to help clear them out.  However, we
-   # only do so if a plethora of conditions exist:
-   #
-   # First, we only consider doing this if the tx has <5 inputs already.
-   # Also, we skip this process if the current tx doesn't have excessive
-   # priority already -- we don't want to risk de-prioritizing a tx for
-   # this purpose.
-   #
-   # Next we sort by LOWEST value, because we really benefit from this most
-   # by clearing out tiny outputs.  Along those lines, we don't even do
-   # unless it has low priority -- don't want to take a high-priority utxo
-   # and convert it to one that will be low-priority to start.
-   #
-   # Finally, we shouldn't do this if a high score was assigned to output
-   # anonymity: this extra output may cause a tx with good output anonymity
-   # to no longer possess this property
-   IDEAL_NUM_INPUTS = 5
-   if len(finalSelection) < IDEAL_NUM_INPUTS and \
-          SCORES[IDX_OUTANONYM] == 0:
-
-      utxoToScrAddr = lambda a: a.getRecipientScrAddr()
-      getPriority   = lambda a: a.getValue() * a.getNumConfirm()
-      getUtxoID     = lambda a: a.getTxHash() + int_to_binary(a.getTxOutIndex())
-
-      alreadyUsedAddr = set( [utxoToScrAddr(utxo) for utxo in finalSelection] )
-      utxoSmallToLarge = sorted(unspentTxOutInfo, key=getPriority)
-      utxoSmToLgIDs = [getUtxoID(utxo) for utxo in utxoSmallToLarge]
-      finalSelectIDs = [getUtxoID(utxo) for utxo in finalSelection]
-      
-      for other in utxoSmallToLarge:
-         
-         # Skip it if it is already selected
-         if getUtxoID(other) in finalSelectIDs:
-            continue
-
-         # We only consider UTXOs that won't link any new addresses together
-         if not utxoToScrAddr(other) in alreadyUsedAddr:
-            continue
-         
-         # Avoid zero-conf inputs altogether
-         if other.getNumConfirm() == 0:
-            continue
-
-         # Don't consider any inputs that are high priority already
-         if getPriority(other) > ONE_BTC*144:
-            continue
-
-         finalSelection.append(other) 
-         if len(finalSelection)>=IDEAL_NUM_INPUTS:
-            break
-   return finalSelection
+   engine = CoinSelectionEngine.fromUtxoList(unspentTxOutInfo)
+   result = engine.select(targetOutVal, feeRate=0, numRecipients=0,
+                          fixedFee=minFee, minChange=margin)
+   return engine.getUtxos(result)
 
 NBLOCKS_TO_CONFIRM = 3
 FEEBYTE_CONSERVATIVE = "CONSERVATIVE"
@@ -0,0 +1,305 @@
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+
+"""
+Waste-driven coin selection over array-backed UTXO values.
+
+Two algorithms are run, and the candidate with the lowest waste wins:
+
+   - branch and bound: depth first search for an input set whose effective
+     value lands in [target, target + costOfChange], so no change output is
+     needed. Bounded by an iteration count and a wall clock budget.
+   - single random draw: shuffle, then add inputs until there's enough to
+     cover the target plus a change output. Always finds a solution when
+     the wallet has the funds.
+
+Waste is what a selection costs over spending the same inputs later at the
+long term fee rate, plus either the cost of making (and later spending) the
+change output, or the excess given up to fees when there is no change.
+
+The engine sorts the values once, so a wallet with a large UTXO set can
+keep one around and run many selections against it:
+
+   engine = CoinSelectionEngine.fromUtxoList(utxoList)
+   result = engine.select(targetVal, feeRate)
+   selectedUtxos = engine.getUtxos(result)
+"""
+
+import random
+import time
+from array import array
+
+from armoryengine.ArmoryUtils import MIN_RELAY_TX_FEE
+
+# Same size estimates calcMinSuggestedFees works with
+TX_BASE_SIZE_ESTIMATE   = 10
+TXIN_SIZE_ESTIMATE      = 180
+TXOUT_SIZE_ESTIMATE     = 35
+
+BNB_MAX_TRIES           = 100000
+BNB_TIME_LIMIT          = 0.25
+
+# smallest change output SRD aims to leave
+SRD_MIN_CHANGE          = 50000
+
+# fee rate used to price change when the caller works with flat fees
+DEFAULT_FEE_RATE        = MIN_RELAY_TX_FEE // 1000
+
+# what we expect to pay to spend an output some time later, in sat/B. Above
+# it, selections with fewer inputs are favored, below it more inputs are
+# consolidated
+LONG_TERM_FEE_RATE      = 10
+
+################################################################################
+def getSelectionWaste(feeDiff, excessOrChangeCost):
+   """
+   feeDiff is sum(fee - longTermFee) over the inputs, the second arg is
+   either the excess dropped to fees or the cost of the change output
+   """
+   return feeDiff + excessOrChangeCost
+
+################################################################################
+def selectCoinsBnB(effValues, feeDiffs, target, costOfChange,
+                   maxTries=BNB_MAX_TRIES, timeLimit=BNB_TIME_LIMIT):
+   """
+   effValues must be sorted largest first, feeDiffs is the per input
+   fee - longTermFee in the same order. Returns the list of positions of
+   the lowest waste changeless selection, or None.
+
+   Port of the search in Bitcoin Core's SelectCoinsBnB.
+   """
+   nUtxos = len(effValues)
+   currAvail = sum(effValues)
+   if currAvail < target:
+      return None
+
+   isFeeRising = nUtxos > 0 and feeDiffs[0] > 0
+   currValue = 0
+   currWaste = 0
+   currSel = []
+   bestSel = None
+   bestWaste = None
+
+   deadline = time.time() + timeLimit if timeLimit else None
+   pos = 0
+   for tries in range(maxTries):
+      if deadline and tries & 0x3ff == 0 and time.time() > deadline:
+         break
+
+      backtrack = False
+      if currValue + currAvail < target or \
+         currValue > target + costOfChange or \
+         (isFeeRising and bestWaste is not None and currWaste > bestWaste):
+         backtrack = True
+      elif currValue >= target:
+         # in the window, record it if it's the best so far
+         waste = currWaste + currValue - target
+         if bestWaste is None or waste <= bestWaste:
+            bestSel = list(currSel)
+            bestWaste = waste
+         backtrack = True
+
+      if backtrack:
+         if not currSel:
+            break
+
+         # put the omitted utxos back in the lookahead, then take the
+         # omission branch of the last included one
+         pos -= 1
+         while pos > currSel[-1]:
+            currAvail += effValues[pos]
+            pos -= 1
+
+         currValue -= effValues[pos]
+         currWaste -= feeDiffs[pos]
+         currSel.pop()
+      else:
+         currAvail -= effValues[pos]
+
+         # including this one when an equivalent utxo right before it was
+         # just omitted would only repeat that search
+         if not currSel or currSel[-1] == pos-1 or \
+            effValues[pos] != effValues[pos-1] or \
+            feeDiffs[pos] != feeDiffs[pos-1]:
+            currSel.append(pos)
+            currValue += effValues[pos]
+            currWaste += feeDiffs[pos]
+
+      pos += 1
+
+   return bestSel
+
+################################################################################
+def selectCoinsSRD(effValues, target, rng):
+   """
+   Single random draw, returns positions of the drawn utxos or None if
+   there isn't enough to reach the target
+   """
+   # lazy Fisher-Yates, only the part of the pool we draw gets shuffled
+   nUtxos = len(effValues)
+   order = list(range(nUtxos))
+
+   selected = []
+   currValue = 0
+   for k in range(nUtxos):
+      j = rng.randrange(k, nUtxos)
+      order[k], order[j] = order[j], order[k]
+      pos = order[k]
+      if effValues[pos] <= 0:
+         continue
+      selected.append(pos)
+      currValue += effValues[pos]
+      if currValue >= target:
+         return selected
+   return None
+
+
+################################################################################
+class CoinSelectionResult(object):
+   def __init__(self, indices, algo, inputValue, fee, change, waste):
+      self.indices    = indices
+      self.algo       = algo
+      self.inputValue = inputValue
+      self.fee        = fee
+      self.change     = change
+      self.waste      = waste
+
+   def __repr__(self):
+      return '<CoinSelectionResult %s: %d inputs, fee %d, change %d, ' \
+         'waste %d>' % (self.algo, len(self.indices), self.fee, self.change,
+                        self.waste)
+
+
+################################################################################
+class CoinSelectionEngine(object):
+   """
+   Holds the values (and estimated input sizes) of a UTXO set in arrays,
+   sorted once, for repeated selections. Indices in results refer to the
+   order the values were passed in.
+   """
+
+   #############################################################################
+   def __init__(self, values, inputSizes=None, utxoList=None,
+                maxTries=BNB_MAX_TRIES, timeLimit=BNB_TIME_LIMIT, seed=None):
+      self.values = array('q', values)
+      if inputSizes is None:
+         inputSizes = [TXIN_SIZE_ESTIMATE] * len(self.values)
+      self.inputSizes = array('l', inputSizes)
+      self.utxoList = utxoList
+
+      self.maxTries = maxTries
+      self.timeLimit = timeLimit
+      self.rng = random.Random(seed)
+
+      # largest first, the order BnB wants its inputs in
+      self.order = array('l', sorted(range(len(self.values)),
+                                     key=self.values.__getitem__,
+                                     reverse=True))
+      self.total = sum(self.values)
+
+   #############################################################################
+   @classmethod
+   def fromUtxoList(cls, utxoList, **kwargs):
+      # a UtxoSet already has its values in a column
+      values = getattr(utxoList, 'values', None)
+      if not isinstance(values, array):
+         values = [utxo.getValue() for utxo in utxoList]
+      return cls(values, utxoList=utxoList, **kwargs)
+
+   #############################################################################
+   def getUtxos(self, result):
+      if result is None:
+         return []
+      return [self.utxoList[i] for i in result.indices]
+
+   #############################################################################
+   def select(self, targetVal, feeRate=DEFAULT_FEE_RATE,
+              longTermFeeRate=None, numRecipients=1, changeSize=None,
+              changeSpendSize=None, fixedFee=0, minChange=SRD_MIN_CHANGE):
+      """
+      targetVal is the sum of the recipient outputs, fixedFee anything the
+      caller wants paid on top of the size based fee. Rates are in
+      satoshi per byte. Returns a CoinSelectionResult or None when the
+      wallet can't fund the target.
+      """
+      if longTermFeeRate is None:
+         longTermFeeRate = min(feeRate, LONG_TERM_FEE_RATE)
+      changeSize = changeSize or TXOUT_SIZE_ESTIMATE
+      changeSpendSize = changeSpendSize or TXIN_SIZE_ESTIMATE
+
+      baseFee = fixedFee + feeRate * \
+         (TX_BASE_SIZE_ESTIMATE + numRecipients*TXOUT_SIZE_ESTIMATE)
+      target = targetVal + baseFee
+      if self.total < target:
+         return None
+
+      changeFee = changeSize * feeRate
+      costOfChange = changeFee + changeSpendSize * longTermFeeRate
+
+      # effective values and fee deltas, in BnB (largest first) order
+      values, sizes = self.values, self.inputSizes
+      effValues = array('q')
+      feeDiffs = array('q')
+      for i in self.order:
+         effValues.append(values[i] - sizes[i]*feeRate)
+         feeDiffs.append(sizes[i] * (feeRate - longTermFeeRate))
+
+      candidates = []
+
+      # BnB only makes sense over positive effective values, and those
+      # are a prefix of the sorted arrays
+      nPositive = 0
+      while nPositive < len(effValues) and effValues[nPositive] > 0:
+         nPositive += 1
+
+      bnbSel = selectCoinsBnB(effValues[:nPositive], feeDiffs[:nPositive],
+                              target, costOfChange,
+                              self.maxTries, self.timeLimit)
+      if bnbSel is not None:
+         candidates.append(self.makeResult(
+            'bnb', bnbSel, effValues, feeDiffs, target, targetVal, None))
+
+      srdSel = selectCoinsSRD(effValues,
+                              target + changeFee + minChange, self.rng)
+      if srdSel is not None:
+         candidates.append(self.makeResult(
+            'srd', srdSel, effValues, feeDiffs, target + changeFee,
+            targetVal, costOfChange))
+
+      if not candidates:
+         # spend everything with a positive effective value, no change
+         # unless there's enough left to pay for it
+         allSel = list(range(nPositive))
+         if sum(effValues[:nPositive]) < target:
+            return None
+         return self.makeResult(
+            'all', allSel, effValues, feeDiffs, target, targetVal, None)
+
+      return min(candidates, key=lambda r: (r.waste, len(r.indices)))
+
+   #############################################################################
+   def makeResult(self, algo, positions, effValues, feeDiffs, target,
+                  targetVal, costOfChange):
+      # positions index the sorted arrays, map back to caller indices
+      indices = [self.order[pos] for pos in positions]
+      inputValue = sum(self.values[i] for i in indices)
+      effValue = sum(effValues[pos] for pos in positions)
+      feeDiff = sum(feeDiffs[pos] for pos in positions)
+      excess = effValue - target
+
+      if costOfChange is None:
+         # changeless, the excess goes to the miner
+         change = 0
+         waste = getSelectionWaste(feeDiff, excess)
+      else:
+         change = excess
+         waste = getSelectionWaste(feeDiff, costOfChange)
+
+      return CoinSelectionResult(indices, algo, inputValue,
+                                 inputValue - targetVal - change,
+                                 change, waste)
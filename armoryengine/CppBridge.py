@@ -12,7 +12,8 @@ import os
 import errno
 import socket
 from armoryengine import BridgeProto_pb2
-from armoryengine.ArmoryUtils import LOGDEBUG, LOGERROR, hash256
+from armoryengine.ArmoryUtils import LOGDEBUG, LOGERROR, LOGWARN, \
+   LOGEXCEPT, hash256, UINT32_MAX
 from armoryengine.BinaryPacker import BinaryPacker, \
    UINT32, UINT8, BINARY_CHUNK, VAR_INT
 from struct import unpack
@@ -20,15 +21,36 @@ import atexit
 import threading
 import base64
 import subprocess
+import time
+import queue
+from collections import deque, OrderedDict
 
 from concurrent.futures import ThreadPoolExecutor
 
 from armoryengine.ArmoryUtils import PassphraseError
 from armoryengine.BIP15x import \
     BIP15xConnection, AEAD_THRESHOLD_BEGIN, AEAD_Error, \
-    CHACHA20POLY1305MAXPACKETSIZE
+    CHACHA20POLY1305MAXPACKETSIZE, encryptFrames
+from armoryengine.Timer import PeriodicStatsDump
 BRIDGE_CLIENT_HEADER = 1
 
+#the receive buffer is reused across frames, it grows to fit the largest
+#frame seen and is reset once it exceeds the shrink threshold
+RECV_BUFFER_INITIAL_SIZE = 1024 * 1024
+RECV_BUFFER_SHRINK_SIZE  = 64 * 1024 * 1024
+
+#callbacks and push notifications are run by this many worker threads
+CALLBACK_WORKER_COUNT = 4
+BDM_NOTIFICATION_KEY = "bdm_notification"
+
+#how many reply latencies are kept per method for the percentiles
+STATS_LATENCY_SAMPLES = 1024
+
+#cached answers tied to a block height within this many blocks of the top
+#are dropped on new blocks, in case they were reorged out
+BRIDGE_CACHE_REORG_DEPTH = 6
+BLOCK_TIME_INVALID = UINT32_MAX
+
 ################################################################################
 ##
 #### Exceptions
@@ -49,12 +71,17 @@ class BridgeSignerError(Exception):
 class PyPromFut(object):
 
    #############################################################################
-   def __init__(self):
+   def __init__(self, onTimeout=None):
 
       self.data = None
+      self.error = None
       self.has = False
       self.cv = threading.Condition()
 
+      #called when getVal gives up waiting, lets the socket forget the
+      #request
+      self.onTimeout = onTimeout
+
    #############################################################################
    def setVal(self, val):
       self.cv.acquire()
@@ -64,13 +91,508 @@ class PyPromFut(object):
       self.cv.release()
 
    #############################################################################
-   def getVal(self):
+   def setException(self, error):
+      #getVal raises this instead of returning
       self.cv.acquire()
-      while self.has is False:
-         self.cv.wait()
+      self.error = error
+      self.has = True
+      self.cv.notify()
       self.cv.release()
+
+   #############################################################################
+   def getVal(self, timeout=None):
+      self.cv.acquire()
+      ready = self.cv.wait_for(lambda: self.has, timeout)
+      self.cv.release()
+
+      if not ready:
+         if self.onTimeout is not None:
+            self.onTimeout()
+         raise BridgeError("timed out waiting on bridge reply")
+
+      if self.error is not None:
+         raise self.error
       return self.data
 
+################################################################################
+def getFailedFuture(reason):
+   fut = PyPromFut()
+   fut.setException(BridgeError(reason))
+   return fut
+
+################################################################################
+class BatchResult(object):
+   """
+   Placeholder for the reply to a request queued in a BridgeBatch. Resolves
+   to the reply (or to parseReply(reply) if a parser was provided) once the
+   batch has been flushed and the bridge answered.
+   """
+
+   #############################################################################
+   def __init__(self, parseReply=None):
+      self.parseReply = parseReply
+      self.fut = None
+
+   #############################################################################
+   def setFuture(self, fut):
+      self.fut = fut
+
+   #############################################################################
+   def getVal(self):
+      if self.fut is None:
+         raise BridgeError("batch result read before the batch was flushed")
+
+      reply = self.fut.getVal()
+      if self.parseReply is None:
+         return reply
+      return self.parseReply(reply)
+
+################################################################################
+class BridgeBatch(object):
+   """
+   Queues requests and ships them to the bridge in a single socket write.
+   Replies stream back independently: each queued request gets a BatchResult
+   that resolves as soon as its own reply is in.
+
+   Can be used as a context manager, the batch is flushed on exit:
+
+      with TheBridge.newBatch() as batch:
+         balance = wltObj.getBalanceAndCount(batch)
+         addrList = wltObj.getAddrCombinedList(batch)
+      balance.getVal()
+   """
+
+   #############################################################################
+   def __init__(self, bridgeSocket):
+      self.bridgeSocket = bridgeSocket
+      self.packets = []
+      self.results = []
+
+   #############################################################################
+   def __len__(self):
+      return len(self.packets)
+
+   #############################################################################
+   def __enter__(self):
+      return self
+
+   #############################################################################
+   def __exit__(self, excType, excVal, excTb):
+      if excType is None:
+         self.flush()
+      return False
+
+   #############################################################################
+   def queue(self, msg, parseReply=None):
+      result = BatchResult(parseReply)
+      self.packets.append(msg)
+      self.results.append(result)
+      return result
+
+   #############################################################################
+   def flush(self):
+      if len(self.packets) == 0:
+         return []
+
+      futs = self.bridgeSocket.sendToBridgeBatch(self.packets)
+      results = self.results
+      for result, fut in zip(results, futs):
+         result.setFuture(fut)
+
+      self.packets = []
+      self.results = []
+      return results
+
+################################################################################
+class CallbackDispatcher(object):
+   """
+   Runs bridge callbacks and push notifications on a fixed pool of worker
+   threads. Tasks are queued per key: tasks sharing a key run one at a time,
+   in the order they were submitted, while distinct keys run in parallel.
+
+   Keeps per key metrics (see getMetrics) on queue depth, time spent waiting
+   in the queue and time spent in the handler.
+   """
+
+   #############################################################################
+   def __init__(self, workerCount=CALLBACK_WORKER_COUNT):
+      self.workerCount = workerCount
+      self.lock = threading.Lock()
+
+      #key: deque of pending tasks. A key is present for as long as it is
+      #either waiting in readyQueue or being processed by a worker
+      self.taskQueues = {}
+      self.readyQueue = queue.Queue()
+      self.workers = []
+
+      #key: [count, cumulWait, cumulRun, maxRun]
+      self.statsMap = {}
+      self.pending = 0
+      self.maxPending = 0
+
+   #############################################################################
+   def start(self):
+      for i in range(self.workerCount):
+         worker = threading.Thread(group=None, target=self.workerLoop,
+            name="BridgeCallback-%d" % i, daemon=True)
+         worker.start()
+         self.workers.append(worker)
+
+   #############################################################################
+   def stop(self):
+      for worker in self.workers:
+         self.readyQueue.put(None)
+
+      for worker in self.workers:
+         if worker is not threading.current_thread():
+            worker.join()
+      self.workers = []
+
+   #############################################################################
+   def submit(self, key, func, *args):
+      task = (func, args, time.time())
+
+      self.lock.acquire()
+      if key in self.taskQueues:
+         #key is already scheduled, the worker will pick this up after
+         #the tasks ahead of it
+         self.taskQueues[key].append(task)
+      else:
+         self.taskQueues[key] = deque([task])
+         self.readyQueue.put(key)
+
+      self.pending += 1
+      self.maxPending = max(self.maxPending, self.pending)
+      self.lock.release()
+
+   #############################################################################
+   def workerLoop(self):
+      while True:
+         key = self.readyQueue.get()
+         if key is None:
+            return
+
+         self.lock.acquire()
+         func, args, queuedAt = self.taskQueues[key].popleft()
+         self.lock.release()
+
+         startTime = time.time()
+         try:
+            func(*args)
+         except:
+            LOGEXCEPT('Error in bridge callback (%s)' % str(key))
+         endTime = time.time()
+
+         self.lock.acquire()
+         if key not in self.statsMap:
+            self.statsMap[key] = [0, 0, 0, 0]
+         stats = self.statsMap[key]
+         stats[0] += 1
+         stats[1] += startTime - queuedAt
+         stats[2] += endTime - startTime
+         stats[3] = max(stats[3], endTime - startTime)
+
+         self.pending -= 1
+         if len(self.taskQueues[key]) == 0:
+            del self.taskQueues[key]
+         else:
+            self.readyQueue.put(key)
+         self.lock.release()
+
+   #############################################################################
+   def getMetrics(self):
+      self.lock.acquire()
+      handlers = {}
+      for key, stats in self.statsMap.items():
+         count = stats[0]
+         handlers[key] = {
+            'count'      : count,
+            'depth'      : len(self.taskQueues.get(key, [])),
+            'avgWait'    : stats[1] / count,
+            'avgLatency' : stats[2] / count,
+            'maxLatency' : stats[3] }
+
+      metrics = {
+         'workers'    : len(self.workers),
+         'pending'    : self.pending,
+         'maxPending' : self.maxPending,
+         'handlers'   : handlers }
+      self.lock.release()
+      return metrics
+
+################################################################################
+def getRequestMethodName(msg):
+   #"service.get_node_status", "wallet.get_balance_and_count", ...
+   category = msg.WhichOneof('method')
+   if category is None:
+      return "unknown"
+
+   try:
+      method = getattr(msg, category).WhichOneof('method')
+   except ValueError:
+      method = None
+
+   if method is None:
+      return category
+   return category + "." + method
+
+################################################################################
+def percentile(sortedVals, pct):
+   if len(sortedVals) == 0:
+      return 0
+   index = int(round(pct / 100.0 * (len(sortedVals) - 1)))
+   return sortedVals[index]
+
+################################################################################
+class BridgeStats(object):
+   """
+   Per method instrumentation of the bridge traffic: request count, bytes
+   in/out, time spent in AEAD and protobuf parsing, time to reply and the
+   number of requests still waiting on a reply.
+
+   Replies are attributed to their request through the reference id, push
+   notifications are tracked as "push.<callback id>".
+   """
+
+   #############################################################################
+   def __init__(self):
+      self.lock = threading.Lock()
+      self.reset()
+
+   #############################################################################
+   def reset(self):
+      self.lock.acquire()
+
+      #method: [count, bytesOut, bytesIn, encryptTime, decryptTime,
+      #   parseTime, replyCount, latencies]
+      self.methodMap = {}
+
+      #reference id: [method, sendTime]
+      self.inFlight = {}
+      self.methodByRefId = {}
+      self.lock.release()
+
+   #############################################################################
+   def getEntry(self, method):
+      if method not in self.methodMap:
+         self.methodMap[method] = [0, 0, 0, 0, 0, 0, 0,
+            deque(maxlen=STATS_LATENCY_SAMPLES)]
+      return self.methodMap[method]
+
+   #############################################################################
+   def tagRequest(self, refId, method):
+      self.lock.acquire()
+      self.methodByRefId[refId] = method
+      self.lock.release()
+
+   #############################################################################
+   def recordSend(self, refId, byteCount, encryptTime, expectsReply):
+      self.lock.acquire()
+      method = self.methodByRefId.pop(refId, "unknown")
+      entry = self.getEntry(method)
+      entry[0] += 1
+      entry[1] += byteCount
+      entry[3] += encryptTime
+
+      if expectsReply:
+         self.inFlight[refId] = [method, time.perf_counter()]
+      self.lock.release()
+
+   #############################################################################
+   def dropRequest(self, refId):
+      #request failed or timed out, no reply will be recorded for it
+      self.lock.acquire()
+      self.methodByRefId.pop(refId, None)
+      self.inFlight.pop(refId, None)
+      self.lock.release()
+
+   #############################################################################
+   def recordReply(self, refId, byteCount, decryptTime, parseTime):
+      now = time.perf_counter()
+
+      self.lock.acquire()
+      self.methodByRefId.pop(refId, None)
+      request = self.inFlight.pop(refId, None)
+      method = "unknown" if request is None else request[0]
+
+      entry = self.getEntry(method)
+      entry[2] += byteCount
+      entry[4] += decryptTime
+      entry[5] += parseTime
+      entry[6] += 1
+      if request is not None:
+         entry[7].append(now - request[1])
+      self.lock.release()
+
+   #############################################################################
+   def recordPush(self, callbackId, byteCount, decryptTime, parseTime):
+      self.lock.acquire()
+      entry = self.getEntry("push." + str(callbackId))
+      entry[2] += byteCount
+      entry[4] += decryptTime
+      entry[5] += parseTime
+      entry[6] += 1
+      self.lock.release()
+
+   #############################################################################
+   def snapshot(self):
+      self.lock.acquire()
+      inFlightByMethod = {}
+      for method, sendTime in self.inFlight.values():
+         inFlightByMethod[method] = inFlightByMethod.get(method, 0) + 1
+
+      methods = {}
+      for method, entry in self.methodMap.items():
+         latencies = sorted(entry[7])
+         methods[method] = {
+            'count'       : entry[0],
+            'bytesOut'    : entry[1],
+            'bytesIn'     : entry[2],
+            'encryptTime' : entry[3],
+            'decryptTime' : entry[4],
+            'parseTime'   : entry[5],
+            'replies'     : entry[6],
+            'inFlight'    : inFlightByMethod.get(method, 0),
+            'p50'         : percentile(latencies, 50),
+            'p90'         : percentile(latencies, 90),
+            'p99'         : percentile(latencies, 99),
+            'max'         : latencies[-1] if len(latencies) > 0 else 0 }
+
+      inFlight = len(self.inFlight)
+      self.lock.release()
+      return { 'inFlight' : inFlight, 'methods' : methods }
+
+   #############################################################################
+   def snapshotRows(self):
+      #flat version of snapshot(), one row per method
+      rows = []
+      methods = self.snapshot()['methods']
+      for method in sorted(methods):
+         row = { 'method' : method }
+         row.update(methods[method])
+         rows.append(row)
+      return rows
+
+################################################################################
+class BridgeCache(object):
+   """
+   LRU cache for bridge answers that do not change once known (mined txs,
+   headers, script/address conversions). Bounded by entry count and
+   optionally by total size (sizeFunc gives the size of a value).
+
+   Entries can be tagged with a block height, invalidateFrom() drops the
+   ones at or above a given height to handle reorgs.
+   """
+   MISS = object()
+
+   #############################################################################
+   def __init__(self, name, maxEntries, maxBytes=0, sizeFunc=None):
+      self.name = name
+      self.maxEntries = maxEntries
+      self.maxBytes = maxBytes
+      self.sizeFunc = sizeFunc
+
+      self.lock = threading.Lock()
+      self.entries = OrderedDict()
+      self.totalBytes = 0
+
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+      self.invalidations = 0
+
+   #############################################################################
+   def get(self, key):
+      self.lock.acquire()
+      entry = self.entries.get(key, None)
+      if entry is None:
+         self.misses += 1
+         self.lock.release()
+         return BridgeCache.MISS
+
+      self.entries.move_to_end(key)
+      self.hits += 1
+      self.lock.release()
+      return entry[0]
+
+   #############################################################################
+   def put(self, key, value, height=None):
+      size = 0
+      if self.sizeFunc is not None:
+         size = self.sizeFunc(value)
+         if self.maxBytes > 0 and size > self.maxBytes:
+            return
+
+      self.lock.acquire()
+      if key in self.entries:
+         self.totalBytes -= self.entries.pop(key)[2]
+
+      self.entries[key] = (value, height, size)
+      self.totalBytes += size
+
+      while len(self.entries) > self.maxEntries or \
+         (self.maxBytes > 0 and self.totalBytes > self.maxBytes):
+         evicted = self.entries.popitem(last=False)[1]
+         self.totalBytes -= evicted[2]
+         self.evictions += 1
+      self.lock.release()
+
+   #############################################################################
+   def invalidateFrom(self, height):
+      self.lock.acquire()
+      staleKeys = [key for key, entry in self.entries.items() \
+         if entry[1] is not None and entry[1] >= height]
+      for key in staleKeys:
+         self.totalBytes -= self.entries.pop(key)[2]
+      self.invalidations += len(staleKeys)
+      self.lock.release()
+
+   #############################################################################
+   def clear(self):
+      self.lock.acquire()
+      self.entries = OrderedDict()
+      self.totalBytes = 0
+      self.lock.release()
+
+   #############################################################################
+   def getStats(self):
+      self.lock.acquire()
+      stats = {
+         'entries'       : len(self.entries),
+         'bytes'         : self.totalBytes,
+         'hits'          : self.hits,
+         'misses'        : self.misses,
+         'evictions'     : self.evictions,
+         'invalidations' : self.invalidations }
+      self.lock.release()
+      return stats
+
+################################################################################
+class BridgeCacheSet(object):
+   def __init__(self):
+      self.tx        = BridgeCache("tx", 4096, 32 * 1024 * 1024,
+         lambda tx: len(tx.raw))
+      self.header    = BridgeCache("header", 4096)
+      self.blockTime = BridgeCache("blockTime", 65536)
+      self.script    = BridgeCache("script", 65536)
+
+   def all(self):
+      return [self.tx, self.header, self.blockTime, self.script]
+
+   def onNewBlock(self, height):
+      #script conversions do not depend on the chain
+      reorgHeight = max(0, height - BRIDGE_CACHE_REORG_DEPTH)
+      self.tx.invalidateFrom(reorgHeight)
+      self.header.invalidateFrom(reorgHeight)
+      self.blockTime.invalidateFrom(reorgHeight)
+
+   def clear(self):
+      for cache in self.all():
+         cache.clear()
+
+   def getStats(self):
+      return { cache.name : cache.getStats() for cache in self.all() }
+
 
 ################################################################################
 ##
@@ -86,9 +608,28 @@ class BridgeSocket(object):
       self.idCounter = 0
       self.responseDict = {}
       self.callbackDict = {}
-      self.bip15xConnection = BIP15xConnection(self.sendToBridgeRaw)
+      self.bip15xConn = None
+      self.bip15xLock = threading.Lock()
       self.run = False
       self.rwLock = None
+      self.dispatcher = CallbackDispatcher()
+      self.stats = BridgeStats()
+      self.statsDump = None
+
+      self.recvBuffer = bytearray(RECV_BUFFER_INITIAL_SIZE)
+      self.recvView = memoryview(self.recvBuffer)
+
+   ####
+   @property
+   def bip15xConnection(self):
+      #the AEAD keypair is only generated once the bridge is used, so
+      #importing CppBridge (and creating TheBridge) stays cheap. The reader
+      #thread and callers can race to it, only one keypair may ever exist
+      if self.bip15xConn is None:
+         with self.bip15xLock:
+            if self.bip15xConn is None:
+               self.bip15xConn = BIP15xConnection(self.sendToBridgeRaw)
+      return self.bip15xConn
 
    ####
    def setCallback(self, key, func):
@@ -104,6 +645,7 @@ class BridgeSocket(object):
 
       self.run = True
       self.rwLock = threading.Lock()
+      self.dispatcher.start()
 
       self.executor = ThreadPoolExecutor(max_workers=2)
       listenFut = self.executor.submit(self.listenOnBridge)
@@ -121,8 +663,30 @@ class BridgeSocket(object):
       #initiate AEAD handshake (server has to start it)
       self.bip15xConnection.serverStartHandshake()
 
+   ####
+   def getStats(self):
+      stats = self.stats.snapshot()
+      stats['responseDict'] = len(self.responseDict)
+      stats['dispatcher'] = self.dispatcher.getMetrics()
+      return stats
+
+   ####
+   def startStatsDump(self, interval, csvPath=None):
+      #periodically write the per method stats to the log or a csv file
+      self.stopStatsDump()
+      self.statsDump = PeriodicStatsDump(
+         self.stats.snapshotRows, interval, csvPath, 'bridge')
+      self.statsDump.start()
+
+   ####
+   def stopStatsDump(self):
+      if self.statsDump is not None:
+         self.statsDump.stop()
+         self.statsDump = None
+
    ####
    def stop(self):
+      self.stopStatsDump()
       self.rwLock.acquire(True)
 
       self.run = False
@@ -131,6 +695,7 @@ class BridgeSocket(object):
 
       self.rwLock.release()
       self.clientFut.result()
+      self.dispatcher.stop()
 
    #############################################################################
    ## bridge management
@@ -152,19 +717,6 @@ class BridgeSocket(object):
 
    #############################################################################
    ## socket write
-   def encryptPayload(self, clearText):
-      if not self.bip15xConnection.encrypted():
-         raise AEAD_Error("channel is not encrypted")
-
-      cipherText = []
-      if self.bip15xConnection.needsRekey(len(clearText)):
-         cipherText.append(self.bip15xConnection.getRekeyPayload())
-      cipherText.append(\
-         self.bip15xConnection.encrypt(clearText, len(clearText)))
-
-      return cipherText
-
-   ####
    def sendToBridgeProto(self, msg, needsReply,
       callbackFunc, callbackArgs, msgType):
 
@@ -172,6 +724,7 @@ class BridgeSocket(object):
       self.idCounter = self.idCounter + 1
 
       payload = msg.SerializeToString()
+      self.stats.tagRequest(msg.reference_id, getRequestMethodName(msg))
       result = self.sendToBridgeBinary(payload, msg.reference_id,
          needsReply, callbackFunc, callbackArgs, msgType)
 
@@ -183,44 +736,128 @@ class BridgeSocket(object):
       needsReply=True, callback=None, cbArgs=[],
       msgType = BRIDGE_CLIENT_HEADER):
 
-      #grab id from msg counter
+      #the reply would never come, fail the request right away
       if self.run == False:
+         LOGWARN("bridge socket is not running, dropping request")
+         self.stats.dropRequest(payloadId)
+         if callback == None and needsReply:
+            return getFailedFuture("bridge socket is not running")
          return
 
       #serialize payload
-      bp = BinaryPacker()
-
-      #payload type header
-      bp.put(UINT8, msgType)
-
-      #serialized protobuf message
-      bp.put(BINARY_CHUNK, payload)
+      clearText = self.packPayload(payload, msgType)
 
       #grab read write lock
       self.rwLock.acquire(True)
+      try:
+         #the read loop may have died since we checked
+         if self.run == False:
+            raise BridgeError("bridge socket is not running")
+
+         #encrypt
+         encryptStart = time.perf_counter()
+         encryptedPayloads = encryptFrames(self.bip15xConnection, clearText)
+         encryptTime = time.perf_counter() - encryptStart
+
+         if callback != None:
+            #set callable in response dict
+            wrapper = CallbackWrapper(callback, cbArgs)
+            self.responseDict[payloadId] = wrapper
+
+         elif needsReply:
+            #instantiate prom/future object and set in response dict
+            fut = PyPromFut(lambda: self.dropReply(payloadId))
+            self.responseDict[payloadId] = fut
+
+         #track it before it goes out, the reply can beat us otherwise
+         self.stats.recordSend(payloadId,
+            sum(len(p) for p in encryptedPayloads), encryptTime,
+            callback != None or needsReply)
+
+         #send over the wire, may have 2 payloads if we triggered a rekey
+         for p in encryptedPayloads:
+            self.clientSocket.sendall(p)
+
+      except (socket.error, AEAD_Error, BridgeError) as e:
+         LOGERROR("failed to send to bridge: %s" % str(e))
+         self.responseDict.pop(payloadId, None)
+         self.stats.dropRequest(payloadId)
+         if callback == None and needsReply:
+            return getFailedFuture("failed to send to bridge")
+         return
 
-      #encrypt
-      encryptedPayloads = self.encryptPayload(bp.getBinaryString())
+      finally:
+         self.rwLock.release()
 
-      if callback != None:
-         #set callable in response dict
-         wrapper = CallbackWrapper(callback, cbArgs)
-         self.responseDict[payloadId] = wrapper
+      #return future to caller
+      if callback == None and needsReply:
+         return fut
 
-      elif needsReply:
-         #instantiate prom/future object and set in response dict
-         fut = PyPromFut()
-         self.responseDict[payloadId] = fut
+   ####
+   def sendToBridgeBatch(self, msgList, msgType=BRIDGE_CLIENT_HEADER):
+      #pipelined version of sendToBridgeProto: every message gets its own
+      #AEAD frame but all frames go out in a single write. The bridge
+      #processes concatenated frames in order. Returns a future per message.
+      if self.run == False:
+         LOGWARN("bridge socket is not running, dropping batch")
+         return [getFailedFuture("bridge socket is not running") \
+            for msg in msgList]
+
+      clearTexts = []
+      for msg in msgList:
+         msg.reference_id = self.idCounter
+         self.idCounter = self.idCounter + 1
+         clearTexts.append((msg.reference_id,
+            self.packPayload(msg.SerializeToString(), msgType)))
+         self.stats.tagRequest(msg.reference_id, getRequestMethodName(msg))
+
+      futs = []
+      cipherText = []
 
-      #send over the wire, may have 2 payloads if we triggered a rekey
-      for p in encryptedPayloads:
-         self.clientSocket.sendall(p)
+      self.rwLock.acquire(True)
+      try:
+         if self.run == False:
+            raise BridgeError("bridge socket is not running")
+
+         for payloadId, clearText in clearTexts:
+            #encrypt, rekeys are interleaved as needed
+            encryptStart = time.perf_counter()
+            frames = encryptFrames(self.bip15xConnection, clearText)
+            self.stats.recordSend(payloadId, sum(len(p) for p in frames),
+               time.perf_counter() - encryptStart, True)
+            cipherText.extend(frames)
+
+            fut = PyPromFut(
+               lambda payloadId=payloadId: self.dropReply(payloadId))
+            self.responseDict[payloadId] = fut
+            futs.append(fut)
+
+         #send over the wire in one go
+         self.clientSocket.sendall(b''.join(cipherText))
+
+      except (socket.error, AEAD_Error, BridgeError) as e:
+         LOGERROR("failed to send batch to bridge: %s" % str(e))
+         for payloadId, clearText in clearTexts:
+            self.responseDict.pop(payloadId, None)
+            self.stats.dropRequest(payloadId)
+         return [getFailedFuture("failed to send to bridge") \
+            for msg in msgList]
+
+      finally:
+         self.rwLock.release()
+
+      return futs
 
-      #return future to caller
-      self.rwLock.release()
+   ####
+   def packPayload(self, payload, msgType):
+      bp = BinaryPacker()
 
-      if callback == None and needsReply:
-         return fut
+      #payload type header
+      bp.put(UINT8, msgType)
+
+      #serialized protobuf message
+      bp.put(BINARY_CHUNK, payload)
+      return bp.getBinaryString()
 
    ####
    def sendToBridgeRaw(self, msg):
@@ -230,13 +867,37 @@ class BridgeSocket(object):
 
    #############################################################################
    ## socket read
-   def pollRecv(self, payloadSize):
-      payload = bytearray()
-      fullSize = payloadSize
-      while len(payload) < fullSize:
+   def reserveRecvBuffer(self, size, keep):
+      #make room for a frame of this size, preserves the first keep bytes
+      if size <= len(self.recvBuffer):
+         return
+
+      newSize = len(self.recvBuffer)
+      while newSize < size:
+         newSize *= 2
+
+      newBuffer = bytearray(newSize)
+      newBuffer[:keep] = self.recvView[:keep]
+
+      self.recvBuffer = newBuffer
+      self.recvView = memoryview(self.recvBuffer)
+
+   ####
+   def shrinkRecvBuffer(self):
+      if len(self.recvBuffer) <= RECV_BUFFER_SHRINK_SIZE:
+         return
+
+      self.recvBuffer = bytearray(RECV_BUFFER_INITIAL_SIZE)
+      self.recvView = memoryview(self.recvBuffer)
+
+   ####
+   def pollRecvInto(self, offset, size):
+      #fill recvBuffer[offset:offset+size] straight from the socket
+      end = offset + size
+      while offset < end:
          try:
-            payload += self.clientSocket.recv(payloadSize)
-            payloadSize = fullSize - len(payload)
+            count = self.clientSocket.recv_into(
+               self.recvView[offset:end], end - offset)
          except socket.error as e:
             err = e.args[0]
             if err == errno.EAGAIN or err == errno.EWOULDBLOCK:
@@ -244,56 +905,91 @@ class BridgeSocket(object):
                continue
             else:
                LOGERROR("Socket error: %s" % str(e))
-               break
+               return False
+
+         if count == 0:
+            #socket was closed
+            return False
+         offset += count
+
+      return True
+
+   ####
+   def failPendingReplies(self, reason):
+      #nothing will answer these anymore, wake up whoever is waiting
+      self.rwLock.acquire(True)
+      pending = self.responseDict
+      self.responseDict = {}
+      self.rwLock.release()
 
-      return payload
+      for refId, replyHandler in pending.items():
+         self.stats.dropRequest(refId)
+         if isinstance(replyHandler, PyPromFut):
+            replyHandler.setException(BridgeError(reason))
+
+   ####
+   def dropReply(self, refId):
+      #the caller stopped waiting, a late reply will be logged and ignored
+      self.rwLock.acquire(True)
+      self.responseDict.pop(refId, None)
+      self.rwLock.release()
+      self.stats.dropRequest(refId)
 
    ####
    def readBridgeSocket(self):
+      try:
+         self.readBridgeLoop()
+      finally:
+         #no more replies past this point, new requests fail right away
+         self.run = False
+         self.failPendingReplies("bridge connection closed")
+
+   ####
+   def readBridgeLoop(self):
       while self.run is True:
          #wait for data on the socket
-         try:
-            response = self.clientSocket.recv(self.recvLen)
-
-            if len(response) < self.recvLen:
-               break
-         except socket.error as e:
-            err = e.args[0]
-            if err == errno.EAGAIN or err == errno.EWOULDBLOCK:
-               LOGDEBUG('No data available from socket.')
-               continue
-            else:
-               LOGERROR("Socket error: %s" % str(e))
-               self.run = False
-               break
+         if not self.pollRecvInto(0, self.recvLen):
+            break
+         response = self.recvView[:self.recvLen]
+         frameLen = self.recvLen
+         decryptTime = 0
 
          #if channel is established, incoming data is encrypted
          if self.bip15xConnection.encrypted():
-            payloadSize = self.bip15xConnection.decodeSize(response[:4])
+            payloadSize = self.bip15xConnection.decodeSize(response)
             if payloadSize > CHACHA20POLY1305MAXPACKETSIZE:
                LOGERROR("Invalid encrypted packet size: " + str(payloadSize))
                self.run = False
                break
 
             #grab the payload
-            payload = response
-            payload += self.pollRecv(\
-                payloadSize + self.bip15xConnection.getMacLen())
-
-            #decrypt it
-            response = self.bip15xConnection.decrypt(\
-               payload, payloadSize)
+            frameLen = self.recvLen + payloadSize + \
+               self.bip15xConnection.getMacLen()
+            self.reserveRecvBuffer(frameLen, self.recvLen)
+            if not self.pollRecvInto(self.recvLen, frameLen - self.recvLen):
+               break
 
+            #decrypt it, in place
+            decryptStart = time.perf_counter()
+            response = self.bip15xConnection.decryptInPlace(\
+               self.recvView[:frameLen], payloadSize)
+            decryptTime = time.perf_counter() - decryptStart
 
          #check header
-         header = unpack('<B', response[:1])[0]
+         header = response[0]
          if header > AEAD_THRESHOLD_BEGIN[0]:
             #get expected packet size for this payload from the socket
             payloadSize = self.bip15xConnection.getAEADPacketSize(header)
 
-            payload = response[1:]
-            if len(payload) < payloadSize:
-                payload += self.pollRecv(payloadSize - len(payload))
+            if len(response) < payloadSize + 1:
+               #clear text handshake packet, the rest is still on the socket
+               self.reserveRecvBuffer(payloadSize + 1, len(response))
+               if not self.pollRecvInto(
+                  len(response), payloadSize + 1 - len(response)):
+                  break
+               response = self.recvView[:payloadSize + 1]
+
+            payload = bytes(response[1:])
 
             try:
                self.bip15xConnection.serverHandshake(header, payload)
@@ -308,18 +1004,22 @@ class BridgeSocket(object):
             #non AEAD data is only tolerated after channels are setup
             raise BridgeError("Received user data before AEAD is ready")
 
-         #grab packet id
-         fullPacket = response[1:]
-
-         #deser protobuf reply
+         #deser protobuf reply straight from the receive buffer
+         parseStart = time.perf_counter()
          protoPayload = BridgeProto_pb2.Payload()
-         if not protoPayload.ParseFromString(fullPacket):
+         if not protoPayload.ParseFromString(response[1:]):
             raise BridgeError("failed to parse proto payload")
+         parseTime = time.perf_counter() - parseStart
+
+         #release memory held by an oversized frame
+         self.shrinkRecvBuffer()
 
          #payloads are either replies or callbacks
          if protoPayload.HasField('reply'):
             reply = protoPayload.reply
             referenceId = reply.reference_id
+            self.stats.recordReply(
+               referenceId, frameLen, decryptTime, parseTime)
 
             #lock and look for future object in response dict
             self.rwLock.acquire(True)
@@ -341,11 +1041,13 @@ class BridgeSocket(object):
                replyHandler.setVal(reply)
 
             elif isinstance(replyHandler, CallbackWrapper):
-               replyHandler.execute(reply)
+               replyHandler.execute(self.dispatcher, reply)
 
          elif protoPayload.HasField('callback'):
             callbackData = protoPayload.callback
             callbackId = callbackData.callback_id
+            self.stats.recordPush(
+               callbackId, frameLen, decryptTime, parseTime)
 
             #find the callback listener
             self.rwLock.acquire(True)
@@ -354,10 +1056,12 @@ class BridgeSocket(object):
                self.rwLock.release()
                continue
 
-            #call it with the payload
+            #queue it with the payload, callbacks sharing an id
+            #are processed in order
             callbackFunc = self.callbackDict[callbackId]
             self.rwLock.release()
-            callbackFunc.process(callbackData)
+            self.dispatcher.submit(
+               callbackId, callbackFunc.process, callbackData)
 
 ################################################################################
 ##
@@ -375,12 +1079,22 @@ class ProtoWrapper(object):
       return self.bridgeSocket.sendToBridgeProto(msg,
          needsReply, callback, cbArgs, msgType)
 
+   ##
+   def sendOrQueue(self, msg, batch, parseReply):
+      #queue in the batch if there is one, otherwise block on the reply
+      if batch is not None:
+         return batch.queue(msg, parseReply)
+
+      fut = self.send(msg)
+      return parseReply(fut.getVal())
+
 ################################################################################
 class BlockchainService(ProtoWrapper):
    #############################################################################
    ## setup ##
-   def __init__(self, bridgeSocket):
+   def __init__(self, bridgeSocket, caches):
       super().__init__(bridgeSocket)
+      self.caches = caches
 
    #############################################################################
    ## commands ##
@@ -466,6 +1180,10 @@ class BlockchainService(ProtoWrapper):
 
    ####
    def getTxByHash(self, hashVal):
+      tx = self.caches.tx.get(hashVal)
+      if tx is not BridgeCache.MISS:
+         return tx
+
       packet = BridgeProto_pb2.Request()
       packet.service.get_tx_by_hash.tx_hash = hashVal
 
@@ -473,16 +1191,47 @@ class BlockchainService(ProtoWrapper):
       reply = fut.getVal()
       if reply.success == False:
          return None
-      return reply.service.tx
+
+      #only mined txs are immutable
+      tx = reply.service.tx
+      if tx.HasField('height') and tx.height != UINT32_MAX:
+         self.caches.tx.put(hashVal, tx, tx.height)
+      return tx
 
    ####
    def getHeaderByHeight(self, height):
+      headerData = self.caches.header.get(height)
+      if headerData is not BridgeCache.MISS:
+         return headerData
+
       packet = BridgeProto_pb2.Request()
       method = packet.service.get_header_by_height.height = height
 
       fut = self.send(packet)
       reply = fut.getVal()
-      return reply.service.header_data
+      headerData = reply.service.header_data
+      if reply.success and len(headerData) > 0:
+         self.caches.header.put(height, headerData, height)
+      return headerData
+
+   ####
+   def getBlockTimeByHeight(self, height):
+      blockTime = self.caches.blockTime.get(height)
+      if blockTime is not BridgeCache.MISS:
+         return blockTime
+
+      packet = BridgeProto_pb2.Request()
+      packet.service.get_block_time_by_height.height = height
+
+      fut = self.send(packet)
+      reply = fut.getVal()
+      blockTime = reply.service.block_time
+
+      if blockTime == BLOCK_TIME_INVALID:
+         raise BridgeError("invalid block time")
+
+      self.caches.blockTime.put(height, blockTime, height)
+      return blockTime
 
    ####
    def estimateFee(self, blocks, strat):
@@ -599,45 +1348,37 @@ class BridgeWalletWrapper(ProtoWrapper):
 
    #############################################################################
    ## commands ##
-   def getBalanceAndCount(self):
+   def getBalanceAndCount(self, batch=None):
       packet = self.getPacket()
       packet.wallet.get_balance_and_count = True
 
-      fut = self.send(packet)
-      reply = fut.getVal()
-      return reply.wallet.balance_and_count
+      return self.sendOrQueue(packet, batch,
+         lambda reply: reply.wallet.balance_and_count)
 
    ####
-   def getAddrCombinedList(self):
+   def getAddrCombinedList(self, batch=None):
       packet = self.getPacket()
       packet.wallet.get_addr_combined_list = True
 
-      fut = self.send(packet)
-      reply = fut.getVal()
-      return reply.wallet.address_and_balance_data
+      return self.sendOrQueue(packet, batch,
+         lambda reply: reply.wallet.address_and_balance_data)
 
    ####
-   def getHighestUsedIndex(self):
+   def getHighestUsedIndex(self, batch=None):
       packet = self.getPacket()
       packet.wallet.get_highest_used_index = True
 
-      fut = self.send(packet)
-      reply = fut.getVal()
-      return reply.wallet.highest_used_index
+      return self.sendOrQueue(packet, batch,
+         lambda reply: reply.wallet.highest_used_index)
 
    ####
    def extendAddressPool(self, progressId, count, callback):
-      def finishExtension(reply, args):
-         callbackThread = threading.Thread(
-            group=None, target=args[0],
-            name=None, args=[reply], kwargs={})
-         callbackThread.start()
-
+      #reply callbacks run on the dispatcher, no need for a thread here
       packet = self.getPacket()
       method = packet.wallet.extend_address_pool
       method.count = count
       method.callback_id = progressId
-      self.send(packet, False, finishExtension, [callback])
+      self.send(packet, False, callback)
 
    ####
    def createBackupStringForWallet(self,
@@ -767,13 +1508,12 @@ class BridgeWalletWrapper(ProtoWrapper):
       return reply.success
 
    ####
-   def getLedgerDelegateIdForScrAddr(self, scrAddr):
+   def getLedgerDelegateIdForScrAddr(self, scrAddr, batch=None):
       packet = self.getPacket()
       packet.wallet.get_ledger_delegate_id_for_scraddr.hash = scrAddr
 
-      fut = self.send(packet)
-      reply = fut.getVal()
-      return reply.wallet.ledger_delegate_id
+      return self.sendOrQueue(packet, batch,
+         lambda reply: reply.wallet.ledger_delegate_id)
 
 ################################################################################
 class BridgeCoinSelectionWrapper(ProtoWrapper):
@@ -914,8 +1654,9 @@ class BridgeCoinSelectionWrapper(ProtoWrapper):
 class ScriptUtils(ProtoWrapper):
    #############################################################################
    ## setup ##
-   def __init__(self, bridgeSocket):
+   def __init__(self, bridgeSocket, caches):
       super().__init__(bridgeSocket)
+      self.caches = caches
 
    ####
    def getPacket(self, script):
@@ -962,15 +1703,28 @@ class ScriptUtils(ProtoWrapper):
 
    ####
    def getScrAddrForScript(self, script):
+      cacheKey = ('scraddr', script)
+      scrAddr = self.caches.script.get(cacheKey)
+      if scrAddr is not BridgeCache.MISS:
+         return scrAddr
+
       packet = self.getPacket(script)
       packet.script_utils.get_scraddr_for_script = True
 
       fut = self.send(packet)
       reply = fut.getVal()
-      return reply.script_utils.scraddr
+      scrAddr = reply.script_utils.scraddr
+      if reply.success:
+         self.caches.script.put(cacheKey, scrAddr)
+      return scrAddr
 
    ####
    def getAddrStrForScrAddr(self, scrAddr):
+      cacheKey = ('addrstr', scrAddr)
+      addrStr = self.caches.script.get(cacheKey)
+      if addrStr is not BridgeCache.MISS:
+         return addrStr
+
       packet = self.getPacket(scrAddr)
       packet.script_utils.get_addrstr_for_scraddr = True
 
@@ -979,8 +1733,10 @@ class ScriptUtils(ProtoWrapper):
 
       if reply.success == False:
          raise BridgeError(f"error in getAddrStrForScrAddr: {reply.error}")
-      else:
-         return reply.script_utils.address_string
+
+      addrStr = reply.script_utils.address_string
+      self.caches.script.put(cacheKey, addrStr)
+      return addrStr
 
 ################################################################################
 class BridgeSigner(ProtoWrapper):
@@ -1190,12 +1946,12 @@ class ArmoryBridge(object):
 
    #############################################################################
    def __init__(self):
-      self.blockTimeByHeightCache = {}
       self.bridgeSocket = BridgeSocket()
+      self.caches = BridgeCacheSet()
 
-      self.service      = BlockchainService(self.bridgeSocket)
+      self.service      = BlockchainService(self.bridgeSocket, self.caches)
       self.utils        = BlockchainUtils(self.bridgeSocket)
-      self.scriptUtils  = ScriptUtils(self.bridgeSocket)
+      self.scriptUtils  = ScriptUtils(self.bridgeSocket, self.caches)
 
    #############################################################################
    def start(self, stringArgs, notifyReadyLbd):
@@ -1207,12 +1963,18 @@ class ArmoryBridge(object):
       self.bridgeSocket.sendToBridgeProto(msg,
          needsReply, callback, cbArgs, msgType)
 
+   #############################################################################
+   def newBatch(self):
+      return BridgeBatch(self.bridgeSocket)
+
+   #############################################################################
+   def getStats(self):
+      return self.bridgeSocket.getStats()
+
    #############################################################################
    def pushNotification(self, callbackData):
-      notifThread = threading.Thread(\
-         group=None, target=TheBDM.pushNotification, \
-         name=None, args=[callbackData], kwargs={})
-      notifThread.start()
+      self.bridgeSocket.dispatcher.submit(BDM_NOTIFICATION_KEY,
+         TheBDM.pushNotification, callbackData)
 
    #############################################################################
    def pushProgressNotification(self, data):
@@ -1223,26 +1985,15 @@ class ArmoryBridge(object):
 
    #############################################################################
    def getBlockTimeByHeight(self, height):
-      if height in self.blockTimeByHeightCache:
-         return self.blockTimeByHeightCache[height]
-
-      packet = BridgeProto_pb2.Request()
-      packet.method = BridgeProto_pb2.getBlockTimeByHeight
-      packet.intArgs.append(height)
-
-      fut = self.sendToBridgeProto(packet)
-      socketResponse = fut.getVal()
-
-      response = BridgeProto_pb2.ReplyNumbers()
-      response.ParseFromString(socketResponse)
-
-      blockTime = response.ints[0]
+      return self.service.getBlockTimeByHeight(height)
 
-      if blockTime == 2**32 - 1:
-         raise BridgeError("invalid block time")
+   #############################################################################
+   def onNewBlock(self, height):
+      self.caches.onNewBlock(height)
 
-      self.blockTimeByHeightCache[height] = blockTime
-      return blockTime
+   #############################################################################
+   def getCacheStats(self):
+      return self.caches.getStats()
 
    #############################################################################
    def restoreWallet(self, root, chaincode, sppass, callbackId):
@@ -1282,11 +2033,17 @@ class CallbackWrapper(object):
       self.callbackFunc = callbackFunc
       self.callbackArgs = callbackArgs
 
-   def execute(self, replyObj):
-      callbackThread = threading.Thread(
-         group=None, target=self.callbackFunc,
-         name=None, args=[*self.callbackArgs, replyObj], kwargs={})
-      callbackThread.start()
+   def getOrderingKey(self):
+      #replies to the same handler are processed in order. For methods that
+      #is per instance, two dialogs' fetchCallback do not wait on each other
+      func = getattr(self.callbackFunc, '__func__', self.callbackFunc)
+      owner = getattr(self.callbackFunc, '__self__', None)
+      name = getattr(func, '__qualname__', repr(func))
+      return (name, id(func) if owner is None else id(owner))
+
+   def execute(self, dispatcher, replyObj):
+      dispatcher.submit(self.getOrderingKey(), self.callbackFunc,
+         *self.callbackArgs, replyObj)
 
 ################################################################################
 class ServerPush(ProtoWrapper):
@@ -16,7 +16,7 @@ import shutil
 
 from armoryengine.ArmoryUtils import UINT32_MAX, emptyFunc, \
    PYBTCWALLET_VERSION, USE_TESTNET, USE_REGTEST, CLI_OPTIONS, \
-   LOGINFO, LOGEXCEPT, LOGWARN, LOGERROR
+   LOGINFO, LOGEXCEPT, LOGWARN, LOGERROR, int_to_binary
 from armoryengine.BinaryPacker import *
 from armoryengine.BinaryUnpacker import *
 from armoryengine.Timer import Timer, TimeThisFunction
@@ -268,6 +268,7 @@ class PyBtcWallet(object):
       self.txnCount = 0
 
       self.bridgeWalletObj = None
+      self.utxoCache = None
       if uniqueId != None:
          self.bridgeWalletObj = BridgeWalletWrapper(uniqueId)
       elif proto != None:
@@ -367,7 +368,10 @@ class PyBtcWallet(object):
 
    #############################################################################  
    def updateBalancesAndCount(self):
-      result = self.bridgeWalletObj.getBalanceAndCount()
+      self.setBalancesAndCount(self.bridgeWalletObj.getBalanceAndCount())
+
+   #############################################################################
+   def setBalancesAndCount(self, result):
       self.balance_full = result.full
       self.balance_spendable = result.spendable
       self.balance_unconfirmed = result.unconfirmed
@@ -400,6 +404,32 @@ class PyBtcWallet(object):
       ledg.extend(ledgBlkChain)
       return ledg
 
+   #############################################################################
+   def getUtxoCache(self):
+      """
+      UTXO cache for this wallet, built on first use and kept current by
+      BDM notifications from then on
+      """
+      if self.utxoCache is None:
+         from armoryengine.BDM import TheBDM
+         from armoryengine.UtxoCache import WalletUtxoCache
+         self.utxoCache = WalletUtxoCache(
+            self.bridgeWalletObj, self.uniqueIDB58)
+         TheBDM.registerCppNotification(self.utxoCache.onNotification)
+      return self.utxoCache
+
+   #############################################################################
+   def releaseUtxoCache(self):
+      """
+      Unhooks the UTXO cache from BDM notifications, the BDM would otherwise
+      keep it (and this wallet) alive. Call when dropping the wallet.
+      """
+      if self.utxoCache is None:
+         return
+      from armoryengine.BDM import TheBDM
+      TheBDM.unregisterCppNotification(self.utxoCache.onNotification)
+      self.utxoCache = None
+
    #############################################################################
    @CheckWalletRegistration
    def getUTXOListForSpendVal(self, valToSpend = 2**64 - 1):
@@ -408,12 +438,7 @@ class PyBtcWallet(object):
       """
 
       if not self.doBlockchainSync==BLOCKCHAIN_DONOTUSE:
-         from armoryengine.CoinSelection import PyUnspentTxOut
-         utxos = self.bridgeWalletObj.getUtxosForValue(self.uniqueIDB58, valToSpend)
-         utxoList = []
-         for i in range(len(utxos)):
-            utxoList.append(PyUnspentTxOut().createFromBridgeUtxo(utxos[i]))
-         return utxoList
+         return self.getUtxoCache().getUtxosForValue(valToSpend)
       else:
          LOGERROR('***Blockchain is not available for accessing wallet-tx data')
          return []
@@ -433,13 +458,8 @@ class PyBtcWallet(object):
 
       #return full set of unspent TxOuts
       if not self.doBlockchainSync==BLOCKCHAIN_DONOTUSE:
-         #calling this with no value argument will return the full UTXO list
-         from armoryengine.CoinSelection import PyUnspentTxOut
-         utxos = self.bridgeWalletObj.getUtxosForValue(2**64 - 1)
-         utxoList = []
-         for i in range(len(utxos.utxo)):
-            utxoList.append(PyUnspentTxOut().createFromBridgeUtxo(utxos.utxo[i]))
-         return utxoList
+         #the set is columnar, rows are only materialized when accessed
+         return self.getUtxoCache().getUtxoSet()
       else:
          LOGERROR('***Blockchain is not available for accessing wallet-tx data')
          return []
@@ -449,12 +469,7 @@ class PyBtcWallet(object):
    def getZCUTXOList(self):
       #return full set of unspent ZC outputs
       if not self.doBlockchainSync==BLOCKCHAIN_DONOTUSE:
-         from armoryengine.CoinSelection import PyUnspentTxOut
-         utxos = self.bridgeWalletObj.getSpendableZCList()
-         utxoList = []
-         for i in range(len(utxos.utxo)):
-            utxoList.append(PyUnspentTxOut().createFromBridgeUtxo(utxos.utxo[i]))
-         return utxoList
+         return self.getUtxoCache().getZCUtxoSet()
       else:
          LOGERROR('***Blockchain is not available for accessing wallet-tx data')
          return []
@@ -464,12 +479,7 @@ class PyBtcWallet(object):
    def getRBFTxOutList(self):
       #return full set of unspent ZC outputs
       if not self.doBlockchainSync==BLOCKCHAIN_DONOTUSE:
-         from armoryengine.CoinSelection import PyUnspentTxOut
-         utxos = self.bridgeWalletObj.getRBFTxOutList()
-         utxoList = []
-         for i in range(len(utxos.utxo)):
-            utxoList.append(PyUnspentTxOut().createFromBridgeUtxo(utxos.utxo[i]))
-         return utxoList
+         return self.getUtxoCache().getRBFUtxoSet()
       else:
          LOGERROR('***Blockchain is not available for accessing wallet-tx data')
          return []
@@ -1397,8 +1407,22 @@ class PyBtcWallet(object):
 
    ###############################################################################
    def getAddrDataFromDB(self):
-      result = self.bridgeWalletObj.getAddrCombinedList()
+      self.setAddrData(self.bridgeWalletObj.getAddrCombinedList())
 
+   ###############################################################################
+   def queueWalletDataUpdate(self, batch):
+      #queue the balance and address data requests in a bridge batch,
+      #returns a lambda that applies the replies once the batch is flushed
+      balanceResult = self.bridgeWalletObj.getBalanceAndCount(batch)
+      addrDataResult = self.bridgeWalletObj.getAddrCombinedList(batch)
+
+      def applyReplies():
+         self.setBalancesAndCount(balanceResult.getVal())
+         self.setAddrData(addrDataResult.getVal())
+      return applyReplies
+
+   ###############################################################################
+   def setAddrData(self, result):
       #update addr map
       for addrProto in result.updated_asset:
          addrObj = PyBtcAddress()
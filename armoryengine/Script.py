@@ -12,8 +12,9 @@ from __future__ import (absolute_import, division,
 # SCRIPTING!
 #
 ################################################################################
-from armoryengine.BinaryPacker import UINT8, BINARY_CHUNK, UINT16, UINT32
-from armoryengine.BinaryUnpacker import BinaryUnpacker
+from armoryengine.ArmoryUtils import LOGERROR, LOGWARN, VerifyScriptError, \
+   InvalidScriptError, int_to_binary, binary_to_int, indent, ripemd160, \
+   sha1, sha256, hash160, hash256
 from armoryengine.Timer import TimeThisFunction
 
 ################################################################################
@@ -405,6 +406,60 @@ SCRIPT_STACK_SIZE_ERROR = 3
 SCRIPT_ERROR = 4
 SCRIPT_NO_ERROR = 5
 
+# Ops that fail the script even inside a branch that isn't executed
+DISABLED_OPCODES = frozenset([OP_CAT, OP_SUBSTR, OP_LEFT, OP_RIGHT, OP_INVERT,
+   OP_AND, OP_OR, OP_XOR, OP_2MUL, OP_2DIV, OP_MUL, OP_DIV, OP_MOD,
+   OP_LSHIFT, OP_RSHIFT])
+
+PUSHDATA_WIDTH = {OP_PUSHDATA1: 1, OP_PUSHDATA2: 2, OP_PUSHDATA4: 4}
+
+SCRIPT_PARSE_CACHE_SIZE = 4096
+scriptParseCache = {}
+
+################################################################################
+def parseScript(binScript):
+   """
+   Splits a script into a tuple of (opcode, pushData, endPos) instructions.
+   pushData is None for anything that isn't a data push, endPos is the
+   offset right after the instruction. Returns None if a push runs past
+   the end of the script.
+
+   Parsed scripts are cached on the script bytes, so the same txout script
+   is only walked once no matter how many inputs spend it.
+   """
+   binScript = bytes(binScript)
+   if binScript in scriptParseCache:
+      return scriptParseCache[binScript]
+
+   instrList = []
+   pos = 0
+   sz = len(binScript)
+   while pos < sz:
+      opcode = binScript[pos]
+      pos += 1
+      pushData = None
+      if 0 < opcode <= OP_PUSHDATA4:
+         nBytes = opcode
+         if opcode >= OP_PUSHDATA1:
+            width = PUSHDATA_WIDTH[opcode]
+            nBytes = int.from_bytes(binScript[pos:pos+width], 'little')
+            pos += width
+         if pos + nBytes > sz:
+            instrList = None
+            break
+         pushData = binScript[pos:pos+nBytes]
+         pos += nBytes
+      instrList.append((opcode, pushData, pos))
+
+   if instrList is not None:
+      instrList = tuple(instrList)
+
+   if len(scriptParseCache) >= SCRIPT_PARSE_CACHE_SIZE:
+      scriptParseCache.clear()
+   scriptParseCache[binScript] = instrList
+   return instrList
+
+
 
 class PyScriptProcessor(object):
    """
@@ -425,6 +480,8 @@ class PyScriptProcessor(object):
       self.txNew   = None
       self.script1 = None
       self.script2 = None
+      self.sigHashTx = None
+      self.sigHashEngine = None
       if txOldData and txNew and not txInIndex==None:
          self.setTxObjects(txOldData, txNew, txInIndex)
 
@@ -439,8 +496,9 @@ class PyScriptProcessor(object):
       It is acceptable to pass in the full TxOut or the tx of the
       TxOut instead of just the script itself.
       """
+      from armoryengine.Transaction import PyTx, PyTxOut
       self.txNew = PyTx().unserialize(txNew.serialize())
-      self.script1 = str(txNew.inputs[txInIndex].binScript) # copy
+      self.script1 = bytes(txNew.inputs[txInIndex].binScript) # copy
       self.txInIndex  = txInIndex
       self.txOutIndex = txNew.inputs[txInIndex].outpoint.txOutIndex
       self.txHash  = txNew.inputs[txInIndex].outpoint.txHash
@@ -448,11 +506,11 @@ class PyScriptProcessor(object):
       if isinstance(txOldData, PyTx):
          if not self.txHash == hash256(txOldData.serialize()):
             LOGERROR('*** Supplied incorrect pair of transactions!')
-         self.script2 = str(txOldData.outputs[self.txOutIndex].binScript)
+         self.script2 = bytes(txOldData.outputs[self.txOutIndex].binScript)
       elif isinstance(txOldData, PyTxOut):
-         self.script2 = str(txOldData.binScript)
-      elif isinstance(txOldData, str):
-         self.script2 = str(txOldData)
+         self.script2 = bytes(txOldData.binScript)
+      elif isinstance(txOldData, bytes):
+         self.script2 = txOldData
 
    @TimeThisFunction
    def verifyTransactionValid(self, txOldData=None, txNew=None, txInIndex=-1):
@@ -481,26 +539,72 @@ class PyScriptProcessor(object):
       return self.stack[-1]==1
 
 
-   def executeScript(self, binaryScript, stack=[]):
-      self.stack = stack
+   def executeScript(self, binaryScript, stack=None):
+      """
+      Runs a script against the stack. The script is parsed once (and
+      cached), then each instruction goes through the handler table.
+      execFlags holds one entry per open OP_IF/OP_NOTIF, instructions only
+      run while all of them are True.
+      """
+      self.stack = [] if stack is None else stack
       self.stackAlt  = []
-      scriptData = BinaryUnpacker(binaryScript)
       self.lastOpCodeSepPos = None
+      self.curScript = binaryScript
+
+      instrList = parseScript(binaryScript)
+      if instrList is None:
+         LOGERROR('***ERROR: Script ends in the middle of a data push')
+         return SCRIPT_ERROR
 
-      while scriptData.getRemainingSize() > 0:
-         opcode = scriptData.get(UINT8)
-         exitCode = self.executeOpCode(opcode, scriptData, self.stack, self.stackAlt)
-         if not exitCode == SCRIPT_NO_ERROR:
-            if exitCode==OP_NOT_IMPLEMENTED:
-               LOGERROR('***ERROR: OpCodes OP_IF, OP_NOTIF, OP_ELSE, OP_ENDIF,')
-               LOGERROR('          have not been implemented, yet.  This script')
-               LOGERROR('          could not be evaluated.')
+      stack = self.stack
+      stackAlt = self.stackAlt
+      execFlags = []
+      nFalse = 0
+      for opcode, pushData, endPos in instrList:
+         try:
+            if OP_IF <= opcode <= OP_ENDIF:
+               if opcode == OP_IF or opcode == OP_NOTIF:
+                  flag = False
+                  if nFalse == 0:
+                     flag = self.castToBool(stack.pop())
+                     if opcode == OP_NOTIF:
+                        flag = not flag
+                  execFlags.append(flag)
+               elif opcode == OP_ELSE and execFlags:
+                  execFlags[-1] = not execFlags[-1]
+               elif opcode == OP_ENDIF and execFlags:
+                  execFlags.pop()
+               else:
+                  # OP_VERIF, OP_VERNOTIF or an unbalanced ELSE/ENDIF
+                  return SCRIPT_ERROR
+               nFalse = execFlags.count(False)
+               continue
+
+            if nFalse > 0:
+               if opcode in DISABLED_OPCODES:
+                  return OP_DISABLED
+               continue
+
+            if pushData is not None:
+               stack.append(pushData)
+               continue
+
+            self.curPos = endPos
+            exitCode = self.opHandlers[opcode](self, opcode, stack, stackAlt)
+         except IndexError:
+            exitCode = SCRIPT_STACK_SIZE_ERROR
+
+         if exitCode is not None:
             if exitCode==OP_DISABLED:
                LOGERROR('***ERROR: This script included an op code that has been')
                LOGERROR('          disabled for security reasons.  Script eval')
                LOGERROR('          failed.')
             return exitCode
 
+      if execFlags:
+         LOGERROR('***ERROR: Script has an OP_IF without OP_ENDIF')
+         return SCRIPT_ERROR
+
       return SCRIPT_NO_ERROR
 
 
@@ -535,438 +639,346 @@ class PyScriptProcessor(object):
       # 3. Signature is deleted from subscript
       #    I'm not sure why this line is necessary - maybe for non-standard scripts?
       lengthInBinary = int_to_binary(len(binSig))
-      subscript = subscript.replace( lengthInBinary + binSig, "")
+      subscript = subscript.replace( lengthInBinary + binSig, b"")
 
       # 4. Hashtype is popped and stored
-      hashtype = binary_to_int(binSig[-1])
+      hashtype = binSig[-1]
       justSig = binSig[:-1]
 
-      if not hashtype == 1:
-         LOGERROR('Non-unity hashtypes not implemented yet! (hashtype = %d)', hashtype)
-         assert(False)
-
-      # 5. Make a copy of the transaction -- we will be hashing a modified version
-      txCopy = PyTx().unserialize( txInTx.serialize() )
-
-      # 6. Remove all OP_CODESEPARATORs
-      subscript.replace( int_to_binary(OP_CODESEPARATOR), '')
-
-      # 7. All the TxIn scripts in the copy are blanked (set to empty string)
-      for txin in txCopy.inputs:
-         txin.binScript = ''
-
-      # 8. Script for the current input in the copy is set to subscript
-      txCopy.inputs[txInIndex].binScript = subscript
+      # 5-8. Blank all TxIn scripts but this one, set that one to the
+      #      subscript and drop inputs/outputs according to the hashtype.
+      #      The engine keeps the parts shared by all inputs, so it is only
+      #      built once per tx
+      if self.sigHashTx is not txInTx:
+         from armoryengine.Transaction import SigHashEngine
+         self.sigHashEngine = SigHashEngine(txInTx)
+         self.sigHashTx = txInTx
 
       # 9. Prepare the signature and public key
-      senderAddr = PyBtcAddress().createFromPublicKey(binPubKey)
-      binHashCode = int_to_binary(hashtype, widthBytes=4)
-      toHash = txCopy.serialize() + binHashCode
+      toHash = self.sigHashEngine.getLegacyPreimage( \
+         txInIndex, subscript, hashtype)
+      if toHash is None:
+         # SIGHASH_SINGLE with no matching output, nothing sane was signed
+         LOGERROR('SIGHASH_SINGLE without a matching output, rejecting sig')
+         return False
 
-      # Hashes are computed as part of CppBlockUtils::CryptoECDSA methods
-      ##hashToVerify = hash256(toHash)
-      ##hashToVerify = binary_switchEndian(hashToVerify)
+      # 10. Apply ECDSA signature verification, results are memoized so
+      #     multisig scripts don't check the same pair twice
+      from armoryengine.SignatureVerifier import TheSigVerifier
+      return TheSigVerifier.verify(hash256(toHash), binPubKey, justSig)
 
-      # 10. Apply ECDSA signature verification
-      if senderAddr.verifyDERSignature(toHash, justSig):
-         return True
-      else:
-         return False
 
 
 
+   #############################################################################
+   # Opcode handlers. Each one gets the opcode and both stacks, and returns
+   # None if the script can carry on, or the exit code to stop with. Popping
+   # an empty stack is reported as SCRIPT_STACK_SIZE_ERROR by executeScript.
+   #############################################################################
+   def opUnknown(self, opcode, stack, stackAlt):
+      return SCRIPT_ERROR
 
-   def executeOpCode(self, opcode, scriptUnpacker, stack, stackAlt):
-      """
-      Executes the next OP_CODE given the current state of the stack(s)
-      """
+   def opDisabled(self, opcode, stack, stackAlt):
+      return OP_DISABLED
+
+   def opNop(self, opcode, stack, stackAlt):
+      pass
 
-      # TODO: Gavin clarified the effects of OP_0, and OP_1-OP_16.
-      #       OP_0 puts an empty string onto the stack, which evaluates to
-      #            false and is plugged into HASH160 as ''
-      #       OP_X puts a single byte onto the stack, 0x01 to 0x10
-      #
-      #       I haven't implemented it this way yet, because I'm still missing
-      #       some details.  Since this "works" for available scripts, I'm going
-      #       to leave it alone for now.
-
-      ##########################################################################
-      ##########################################################################
-      ### This block produces very nice debugging output for script eval!
-      #def pr(s):
-         #if isinstance(s,int):
-            #return str(s)
-         #elif isinstance(s,str):
-            #if len(s)>8:
-               #return binary_to_hex(s)[:8]
-            #else:
-               #return binary_to_hex(s)
-
-      #print '  '.join([pr(i) for i in stack])
-      #print opnames[opcode][:12].ljust(12,' ') + ':',
-      ##########################################################################
-      ##########################################################################
-
-
-      stackSizeAtLeast = lambda n: (len(self.stack) >= n)
-
-      if   opcode == OP_FALSE:
+   # TODO: Gavin clarified the effects of OP_0, and OP_1-OP_16.
+   #       OP_0 puts an empty string onto the stack, which evaluates to
+   #            false and is plugged into HASH160 as ''
+   #       OP_X puts a single byte onto the stack, 0x01 to 0x10
+   #
+   #       Small numbers are still pushed as ints here, the ops below
+   #       handle both.
+   def opPushNum(self, opcode, stack, stackAlt):
+      if opcode == OP_FALSE:
          stack.append(0)
-      elif 0 < opcode < 76:
-         stack.append(scriptUnpacker.get(BINARY_CHUNK, opcode))
-      elif opcode == OP_PUSHDATA1:
-         nBytes = scriptUnpacker.get(UINT8)
-         stack.append(scriptUnpacker.get(BINARY_CHUNK, nBytes))
-      elif opcode == OP_PUSHDATA2:
-         nBytes = scriptUnpacker.get(UINT16)
-         stack.append(scriptUnpacker.get(BINARY_CHUNK, nBytes))
-      elif opcode == OP_PUSHDATA4:
-         nBytes = scriptUnpacker.get(UINT32)
-         stack.append(scriptUnpacker.get(BINARY_CHUNK, nBytes))
       elif opcode == OP_1NEGATE:
          stack.append(-1)
-      elif opcode == OP_TRUE:
-         stack.append(1)
-      elif 81 < opcode < 97:
-         stack.append(opcode-80)
-      elif opcode == OP_NOP:
-         pass
-
-      # TODO: figure out the conditional op codes...
-      elif opcode == OP_IF:
-         return OP_NOT_IMPLEMENTED
-      elif opcode == OP_NOTIF:
-         return OP_NOT_IMPLEMENTED
-      elif opcode == OP_ELSE:
-         return OP_NOT_IMPLEMENTED
-      elif opcode == OP_ENDIF:
-         return OP_NOT_IMPLEMENTED
-
-      elif opcode == OP_VERIFY:
-         if not self.castToBool(stack.pop()):
-            stack.append(0)
-            return TX_INVALID
-      elif opcode == OP_RETURN:
+      else:
+         stack.append(opcode - 80)
+
+   def opVerify(self, opcode, stack, stackAlt):
+      if not self.castToBool(stack.pop()):
+         stack.append(0)
          return TX_INVALID
-      elif opcode == OP_TOALTSTACK:
-         stackAlt.append( stack.pop() )
-      elif opcode == OP_FROMALTSTACK:
-         stack.append( stackAlt.pop() )
-
-      elif opcode == OP_IFDUP:
-         # Looks like this method duplicates the top item if it's not zero
-         if not stackSizeAtLeast(1): return SCRIPT_STACK_SIZE_ERROR
-         if self.castToBool(stack[-1]):
-            stack.append(stack[-1]);
-
-      elif opcode == OP_DEPTH:
-         stack.append( len(stack) )
-      elif opcode == OP_DROP:
-         stack.pop()
-      elif opcode == OP_DUP:
-         stack.append( stack[-1] )
-      elif opcode == OP_NIP:
-         if not stackSizeAtLeast(2): return SCRIPT_STACK_SIZE_ERROR
-         del stack[-2]
-      elif opcode == OP_OVER:
-         if not stackSizeAtLeast(2): return SCRIPT_STACK_SIZE_ERROR
-         stack.append(stack[-2])
-      elif opcode == OP_PICK:
-         n = stack.pop()
-         if not stackSizeAtLeast(n): return SCRIPT_STACK_SIZE_ERROR
-         stack.append(stack[-n])
-      elif opcode == OP_ROLL:
-         n = stack.pop()
-         if not stackSizeAtLeast(n): return SCRIPT_STACK_SIZE_ERROR
-         stack.append(stack[-(n+1)])
-         del stack[-(n+2)]
-      elif opcode == OP_ROT:
-         if not stackSizeAtLeast(3): return SCRIPT_STACK_SIZE_ERROR
-         stack.append( stack[-3] )
-         del stack[-4]
-      elif opcode == OP_SWAP:
-         if not stackSizeAtLeast(2): return SCRIPT_STACK_SIZE_ERROR
-         x2 = stack.pop()
-         x1 = stack.pop()
-         stack.extend([x2, x1])
-      elif opcode == OP_TUCK:
-         if not stackSizeAtLeast(2): return SCRIPT_STACK_SIZE_ERROR
-         x2 = stack.pop()
-         x1 = stack.pop()
-         stack.extend([x2, x1, x2])
-      elif opcode == OP_2DROP:
-         if not stackSizeAtLeast(2): return SCRIPT_STACK_SIZE_ERROR
-         stack.pop()
-         stack.pop()
-      elif opcode == OP_2DUP:
-         if not stackSizeAtLeast(2): return SCRIPT_STACK_SIZE_ERROR
-         stack.append( stack[-2] )
-         stack.append( stack[-2] )
-      elif opcode == OP_3DUP:
-         if not stackSizeAtLeast(3): return SCRIPT_STACK_SIZE_ERROR
-         stack.append( stack[-3] )
-         stack.append( stack[-3] )
-         stack.append( stack[-3] )
-      elif opcode == OP_2OVER:
-         if not stackSizeAtLeast(4): return SCRIPT_STACK_SIZE_ERROR
-         stack.append( stack[-4] )
-         stack.append( stack[-4] )
-      elif opcode == OP_2ROT:
-         if not stackSizeAtLeast(6): return SCRIPT_STACK_SIZE_ERROR
-         stack.append( stack[-6] )
-         stack.append( stack[-6] )
-      elif opcode == OP_2SWAP:
-         if not stackSizeAtLeast(4): return SCRIPT_STACK_SIZE_ERROR
-         x4 = stack.pop()
-         x3 = stack.pop()
-         x2 = stack.pop()
-         x1 = stack.pop()
-         stack.extend( [x3, x4, x1, x2] )
-      elif opcode == OP_CAT:
-         return OP_DISABLED
-      elif opcode == OP_SUBSTR:
-         return OP_DISABLED
-      elif opcode == OP_LEFT:
-         return OP_DISABLED
-      elif opcode == OP_RIGHT:
-         return OP_DISABLED
-      elif opcode == OP_SIZE:
-         if isinstance(stack[-1], int):
-            stack.append(0)
-         else:
-            stack.append( len(stack[-1]) )
-      elif opcode == OP_INVERT:
-         return OP_DISABLED
-      elif opcode == OP_AND:
-         return OP_DISABLED
-      elif opcode == OP_OR:
-         return OP_DISABLED
-      elif opcode == OP_XOR:
-         return OP_DISABLED
-      elif opcode == OP_EQUAL:
-         x1 = stack.pop()
-         x2 = stack.pop()
-         stack.append( 1 if x1==x2 else 0  )
-      elif opcode == OP_EQUALVERIFY:
-         x1 = stack.pop()
-         x2 = stack.pop()
-         if not x1==x2:
-            stack.append(0)
-            return TX_INVALID
-
-
-      elif opcode == OP_1ADD:
-         stack[-1] += 1
-      elif opcode == OP_1SUB:
-         stack[-1] -= 1
-      elif opcode == OP_2MUL:
-         stack[-1] *= 2
-         return OP_DISABLED
-      elif opcode == OP_2DIV:
-         stack[-1] /= 2
-         return OP_DISABLED
-      elif opcode == OP_NEGATE:
-         stack[-1] *= -1
-      elif opcode == OP_ABS:
-         stack[-1] = abs(stack[-1])
-      elif opcode == OP_NOT:
-         top = stack.pop()
-         if top==0:
-            stack.append(1)
-         else:
-            stack.append(0)
-      elif opcode == OP_0NOTEQUAL:
-         top = stack.pop()
-         if top==0:
-            stack.append(0)
-         else:
-            stack.append(1)
-         top = stack.pop()
-         if top==0:
-            stack.append(1)
-         else:
-            stack.append(0)
-      elif opcode == OP_ADD:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append(a+b)
-      elif opcode == OP_SUB:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append(a-b)
-      elif opcode == OP_MUL:
-         return OP_DISABLED
-      elif opcode == OP_DIV:
-         return OP_DISABLED
-      elif opcode == OP_MOD:
-         return OP_DISABLED
-      elif opcode == OP_LSHIFT:
-         return OP_DISABLED
-      elif opcode == OP_RSHIFT:
-         return OP_DISABLED
-      elif opcode == OP_BOOLAND:
-         b = stack.pop()
-         a = stack.pop()
-         if (not a==0) and (not b==0):
-            stack.append(1)
-         else:
-            stack.append(0)
-      elif opcode == OP_BOOLOR:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append( 1 if (self.castToBool(a) or self.castToBool(b)) else 0 )
-      elif opcode == OP_NUMEQUAL:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append( 1 if a==b else 0 )
-      elif opcode == OP_NUMEQUALVERIFY:
-         b = stack.pop()
-         a = stack.pop()
-         if not a==b:
-            stack.append(0)
-            return TX_INVALID
-      elif opcode == OP_NUMNOTEQUAL:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append( 1 if not a==b else 0 )
-      elif opcode == OP_LESSTHAN:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append( 1 if a<b else 0)
-      elif opcode == OP_GREATERTHAN:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append( 1 if a>b else 0)
-      elif opcode == OP_LESSTHANOREQUAL:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append( 1 if a<=b else 0)
-      elif opcode == OP_GREATERTHANOREQUAL:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append( 1 if a>=b else 0)
-      elif opcode == OP_MIN:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append( min(a,b) )
-      elif opcode == OP_MAX:
-         b = stack.pop()
-         a = stack.pop()
-         stack.append( max(a,b) )
-      elif opcode == OP_WITHIN:
-         xmax = stack.pop()
-         xmin = stack.pop()
-         x    = stack.pop()
-         stack.append( 1 if (xmin <= x < xmax) else 0 )
-
-      elif opcode == OP_RIPEMD160:
-         bits = stack.pop()
-         stack.append( ripemd160(bits) )
-      elif opcode == OP_SHA1:
-         bits = stack.pop()
-         stack.append( sha1(bits) )
-      elif opcode == OP_SHA256:
-         bits = stack.pop()
-         stack.append( sha256(bits) )
-      elif opcode == OP_HASH160:
-         bits = stack.pop()
-         if isinstance(bits, int):
-            bits = ''
-         stack.append( hash160(bits) )
-      elif opcode == OP_HASH256:
-         bits = stack.pop()
-         if isinstance(bits, int):
-            bits = ''
-         stack.append( sha256(sha256(bits) ) )
-      elif opcode == OP_CODESEPARATOR:
-         self.lastOpCodeSepPos = scriptUnpacker.getPosition()
-      elif opcode == OP_CHECKSIG or opcode == OP_CHECKSIGVERIFY:
-
-         # 1. Pop key and sig from the stack
-         binPubKey = stack.pop()
-         binSig    = stack.pop()
-
-         # 2-10. encapsulated in sep method so CheckMultiSig can use it too
-         txIsValid = self.checkSig(  binSig, \
-                                     binPubKey, \
-                                     scriptUnpacker.getBinaryString(), \
-                                     self.txNew, \
-                                     self.txInIndex, \
-                                     self.lastOpCodeSepPos)
-         stack.append(1 if txIsValid else 0)
-         if opcode==OP_CHECKSIGVERIFY:
-            verifyCode = self.executeOpCode(OP_VERIFY)
-            if verifyCode == TX_INVALID:
-               return TX_INVALID
-
-      elif opcode == OP_CHECKMULTISIG or opcode == OP_CHECKMULTISIGVERIFY:
-         # OP_CHECKMULTISIG procedure ported directly from Satoshi client code
-         # Location:  bitcoin-0.4.0-linux/src/src/script.cpp:775
-         i=1
-         if len(stack) < i:
-            return TX_INVALID
-
-         nKeys = int(stack[-i])
-         if nKeys < 0 or nKeys > 20:
-            return TX_INVALID
 
-         i += 1
-         iKey = i
-         i += nKeys
-         if len(stack) < i:
-            return TX_INVALID
+   def opReturn(self, opcode, stack, stackAlt):
+      return TX_INVALID
 
-         nSigs = int(stack[-i])
-         if nSigs < 0 or nSigs > nKeys:
-            return TX_INVALID
+   def opToAltStack(self, opcode, stack, stackAlt):
+      stackAlt.append( stack.pop() )
 
-         iSig = i
-         i += 1
-         i += nSigs
-         if len(stack) < i:
-            return TX_INVALID
+   def opFromAltStack(self, opcode, stack, stackAlt):
+      stack.append( stackAlt.pop() )
 
-         stack.pop()
+   def opIfDup(self, opcode, stack, stackAlt):
+      # duplicates the top item if it's not zero
+      if self.castToBool(stack[-1]):
+         stack.append(stack[-1])
+
+   def opDepth(self, opcode, stack, stackAlt):
+      stack.append( len(stack) )
 
-         # Apply the ECDSA verification to each of the supplied Sig-Key-pairs
-         enoughSigsMatch = True
-         while enoughSigsMatch and nSigs > 0:
-            binSig = stack[-iSig]
-            binKey = stack[-iKey]
+   def opDrop(self, opcode, stack, stackAlt):
+      stack.pop()
 
-            if( self.checkSig(binSig, \
-                              binKey, \
-                              scriptUnpacker.getBinaryString(), \
-                              self.txNew, \
-                              self.txInIndex, \
-                              self.lastOpCodeSepPos) ):
-               iSig  += 1
-               nSigs -= 1
+   def opDup(self, opcode, stack, stackAlt):
+      stack.append( stack[-1] )
 
-            iKey +=1
-            nKeys -=1
+   def opNip(self, opcode, stack, stackAlt):
+      if len(stack) < 2: return SCRIPT_STACK_SIZE_ERROR
+      del stack[-2]
 
-            if(nSigs > nKeys):
-               enoughSigsMatch = False
+   def opOver(self, opcode, stack, stackAlt):
+      if len(stack) < 2: return SCRIPT_STACK_SIZE_ERROR
+      stack.append(stack[-2])
+
+   def opPickRoll(self, opcode, stack, stackAlt):
+      n = stack.pop()
+      if not 0 <= n < len(stack): return SCRIPT_STACK_SIZE_ERROR
+      stack.append(stack[-(n+1)])
+      if opcode == OP_ROLL:
+         del stack[-(n+2)]
 
-         # Now pop the things off the stack, we only accessed in-place before
-         while i > 1:
-            i -= 1
-            stack.pop()
+   def opRot(self, opcode, stack, stackAlt):
+      if len(stack) < 3: return SCRIPT_STACK_SIZE_ERROR
+      stack.append( stack[-3] )
+      del stack[-4]
 
+   def opSwap(self, opcode, stack, stackAlt):
+      if len(stack) < 2: return SCRIPT_STACK_SIZE_ERROR
+      stack[-2], stack[-1] = stack[-1], stack[-2]
 
-         stack.append(1 if enoughSigsMatch else 0)
+   def opTuck(self, opcode, stack, stackAlt):
+      if len(stack) < 2: return SCRIPT_STACK_SIZE_ERROR
+      stack.insert(-2, stack[-1])
 
-         if opcode==OP_CHECKMULTISIGVERIFY:
-            verifyCode = self.executeOpCode(OP_VERIFY)
-            if verifyCode == TX_INVALID:
-               return TX_INVALID
+   def op2Drop(self, opcode, stack, stackAlt):
+      if len(stack) < 2: return SCRIPT_STACK_SIZE_ERROR
+      del stack[-2:]
 
+   def op2Dup(self, opcode, stack, stackAlt):
+      if len(stack) < 2: return SCRIPT_STACK_SIZE_ERROR
+      stack.extend( stack[-2:] )
+
+   def op3Dup(self, opcode, stack, stackAlt):
+      if len(stack) < 3: return SCRIPT_STACK_SIZE_ERROR
+      stack.extend( stack[-3:] )
+
+   def op2Over(self, opcode, stack, stackAlt):
+      if len(stack) < 4: return SCRIPT_STACK_SIZE_ERROR
+      stack.extend( stack[-4:-2] )
+
+   def op2Rot(self, opcode, stack, stackAlt):
+      if len(stack) < 6: return SCRIPT_STACK_SIZE_ERROR
+      stack.extend( stack[-6:-4] )
+      del stack[-8:-6]
+
+   def op2Swap(self, opcode, stack, stackAlt):
+      if len(stack) < 4: return SCRIPT_STACK_SIZE_ERROR
+      stack[-4:] = stack[-2:] + stack[-4:-2]
+
+   def opSize(self, opcode, stack, stackAlt):
+      if isinstance(stack[-1], int):
+         stack.append(0)
       else:
-         return SCRIPT_ERROR
+         stack.append( len(stack[-1]) )
+
+   def opEqual(self, opcode, stack, stackAlt):
+      x1 = stack.pop()
+      x2 = stack.pop()
+      stack.append( 1 if x1==x2 else 0  )
+      if opcode == OP_EQUALVERIFY:
+         return self.opVerify(OP_VERIFY, stack, stackAlt)
+
+   def opNumUnary(self, opcode, stack, stackAlt):
+      stack.append( NUM_UNARY_OPS[opcode](stack.pop()) )
+
+   def opNumBinary(self, opcode, stack, stackAlt):
+      b = stack.pop()
+      a = stack.pop()
+      stack.append( NUM_BINARY_OPS[opcode](a, b) )
+      if opcode == OP_NUMEQUALVERIFY:
+         return self.opVerify(OP_VERIFY, stack, stackAlt)
+
+   def opBoolOr(self, opcode, stack, stackAlt):
+      b = stack.pop()
+      a = stack.pop()
+      stack.append( 1 if (self.castToBool(a) or self.castToBool(b)) else 0 )
+
+   def opWithin(self, opcode, stack, stackAlt):
+      xmax = stack.pop()
+      xmin = stack.pop()
+      x    = stack.pop()
+      stack.append( 1 if (xmin <= x < xmax) else 0 )
+
+   def opHash(self, opcode, stack, stackAlt):
+      bits = stack.pop()
+      if isinstance(bits, int):
+         bits = b''
+      stack.append( HASH_OPS[opcode](bits) )
+
+   def opCodeSeparator(self, opcode, stack, stackAlt):
+      self.lastOpCodeSepPos = self.curPos
+
+   def opCheckSig(self, opcode, stack, stackAlt):
+      # 1. Pop key and sig from the stack
+      binPubKey = stack.pop()
+      binSig    = stack.pop()
+
+      # 2-10. encapsulated in sep method so CheckMultiSig can use it too
+      txIsValid = self.checkSig(  binSig, \
+                                  binPubKey, \
+                                  self.curScript, \
+                                  self.txNew, \
+                                  self.txInIndex, \
+                                  self.lastOpCodeSepPos)
+      stack.append(1 if txIsValid else 0)
+      if opcode==OP_CHECKSIGVERIFY:
+         return self.opVerify(OP_VERIFY, stack, stackAlt)
+
+   def opCheckMultiSig(self, opcode, stack, stackAlt):
+      # OP_CHECKMULTISIG procedure ported directly from Satoshi client code
+      # Location:  bitcoin-0.4.0-linux/src/src/script.cpp:775
+      i=1
+      if len(stack) < i:
+         return TX_INVALID
 
-      return SCRIPT_NO_ERROR
+      nKeys = int(stack[-i])
+      if nKeys < 0 or nKeys > 20:
+         return TX_INVALID
+
+      i += 1
+      iKey = i
+      i += nKeys
+      if len(stack) < i:
+         return TX_INVALID
+
+      nSigs = int(stack[-i])
+      if nSigs < 0 or nSigs > nKeys:
+         return TX_INVALID
+
+      iSig = i
+      i += 1
+      i += nSigs
+      if len(stack) < i:
+         return TX_INVALID
+
+      stack.pop()
 
+      # Apply the ECDSA verification to each of the supplied Sig-Key-pairs
+      enoughSigsMatch = True
+      while enoughSigsMatch and nSigs > 0:
+         binSig = stack[-iSig]
+         binKey = stack[-iKey]
+
+         if( self.checkSig(binSig, \
+                           binKey, \
+                           self.curScript, \
+                           self.txNew, \
+                           self.txInIndex, \
+                           self.lastOpCodeSepPos) ):
+            iSig  += 1
+            nSigs -= 1
+
+         iKey +=1
+         nKeys -=1
+
+         if(nSigs > nKeys):
+            enoughSigsMatch = False
+
+      # Now pop the things off the stack, we only accessed in-place before
+      while i > 1:
+         i -= 1
+         stack.pop()
+
+      stack.append(1 if enoughSigsMatch else 0)
+
+      if opcode==OP_CHECKMULTISIGVERIFY:
+         return self.opVerify(OP_VERIFY, stack, stackAlt)
+
+
+NUM_UNARY_OPS = {
+   OP_1ADD:       lambda a: a+1,
+   OP_1SUB:       lambda a: a-1,
+   OP_NEGATE:     lambda a: -a,
+   OP_ABS:        lambda a: abs(a),
+   OP_NOT:        lambda a: 1 if a==0 else 0,
+   OP_0NOTEQUAL:  lambda a: 0 if a==0 else 1 }
+
+NUM_BINARY_OPS = {
+   OP_ADD:                lambda a,b: a+b,
+   OP_SUB:                lambda a,b: a-b,
+   OP_BOOLAND:            lambda a,b: 1 if (a!=0 and b!=0) else 0,
+   OP_NUMEQUAL:           lambda a,b: 1 if a==b else 0,
+   OP_NUMEQUALVERIFY:     lambda a,b: 1 if a==b else 0,
+   OP_NUMNOTEQUAL:        lambda a,b: 1 if a!=b else 0,
+   OP_LESSTHAN:           lambda a,b: 1 if a<b else 0,
+   OP_GREATERTHAN:        lambda a,b: 1 if a>b else 0,
+   OP_LESSTHANOREQUAL:    lambda a,b: 1 if a<=b else 0,
+   OP_GREATERTHANOREQUAL: lambda a,b: 1 if a>=b else 0,
+   OP_MIN:                lambda a,b: min(a,b),
+   OP_MAX:                lambda a,b: max(a,b) }
+
+HASH_OPS = {
+   OP_RIPEMD160: ripemd160,
+   OP_SHA1:      sha1,
+   OP_SHA256:    sha256,
+   OP_HASH160:   hash160,
+   OP_HASH256:   hash256 }
+
+################################################################################
+def buildOpHandlerTable():
+   """ 256 entry opcode -> handler list used by PyScriptProcessor """
+   P = PyScriptProcessor
+   table = [P.opUnknown]*256
+
+   for opcode in [OP_FALSE, OP_1NEGATE] + list(range(OP_1, OP_16+1)):
+      table[opcode] = P.opPushNum
+   for opcode in DISABLED_OPCODES:
+      table[opcode] = P.opDisabled
+   for opcode in NUM_UNARY_OPS:
+      table[opcode] = P.opNumUnary
+   for opcode in NUM_BINARY_OPS:
+      table[opcode] = P.opNumBinary
+   for opcode in HASH_OPS:
+      table[opcode] = P.opHash
+
+   table[OP_NOP]                 = P.opNop
+   table[OP_VERIFY]              = P.opVerify
+   table[OP_RETURN]              = P.opReturn
+   table[OP_TOALTSTACK]          = P.opToAltStack
+   table[OP_FROMALTSTACK]        = P.opFromAltStack
+   table[OP_IFDUP]               = P.opIfDup
+   table[OP_DEPTH]               = P.opDepth
+   table[OP_DROP]                = P.opDrop
+   table[OP_DUP]                 = P.opDup
+   table[OP_NIP]                 = P.opNip
+   table[OP_OVER]                = P.opOver
+   table[OP_PICK]                = P.opPickRoll
+   table[OP_ROLL]                = P.opPickRoll
+   table[OP_ROT]                 = P.opRot
+   table[OP_SWAP]                = P.opSwap
+   table[OP_TUCK]                = P.opTuck
+   table[OP_2DROP]               = P.op2Drop
+   table[OP_2DUP]                = P.op2Dup
+   table[OP_3DUP]                = P.op3Dup
+   table[OP_2OVER]               = P.op2Over
+   table[OP_2ROT]                = P.op2Rot
+   table[OP_2SWAP]               = P.op2Swap
+   table[OP_SIZE]                = P.opSize
+   table[OP_EQUAL]               = P.opEqual
+   table[OP_EQUALVERIFY]         = P.opEqual
+   table[OP_BOOLOR]              = P.opBoolOr
+   table[OP_WITHIN]              = P.opWithin
+   table[OP_CODESEPARATOR]       = P.opCodeSeparator
+   table[OP_CHECKSIG]            = P.opCheckSig
+   table[OP_CHECKSIGVERIFY]      = P.opCheckSig
+   table[OP_CHECKMULTISIG]       = P.opCheckMultiSig
+   table[OP_CHECKMULTISIGVERIFY] = P.opCheckMultiSig
+   return table
+
+PyScriptProcessor.opHandlers = buildOpHandlerTable()
 
-# Putting this at the end because of the circular dependency
-from armoryengine.PyBtcAddress import PyBtcAddress
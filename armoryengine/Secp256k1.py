@@ -0,0 +1,461 @@
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+
+"""
+secp256k1 arithmetic for message signing and signature checks.
+
+The default backend works in Jacobian coordinates, so point additions and
+doublings don't need a modular inverse, only converting the result back
+to affine does. Scalar multiplication uses:
+
+   - k*G: a table of multiples of G for every 4 bit window of the scalar,
+     built on first use. k*G is then at most 64 additions, no doublings.
+   - k*Q: width 5 wNAF, with Q's odd multiples precomputed.
+
+Verification does not convert back to affine at all: x(R) == r is checked
+as X == r*Z^2 (mod p).
+
+Batches share their inverses. Pubkey tables are all made affine with one
+inversion, recoveries share the inverse of r mod n and the final affine
+conversion. A pubkey that shows up several times in a batch (an
+announcement file, many messages signed by one address) gets one table.
+
+Points are (x, y) int tuples, None is the point at infinity. The original
+affine code from jasvet stays available as AffineBackend:
+
+   setECBackend(AffineBackend())
+"""
+
+P  = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F
+N  = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+B  = 7
+GX = 0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798
+GY = 0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8
+G  = (GX, GY)
+
+GEN_WINDOW_BITS = 4
+WNAF_WIDTH      = 5
+
+JACOBIAN_INFINITY = (1, 1, 0)
+
+################################################################################
+def isOnCurve(point):
+   if point is None:
+      return False
+   x, y = point
+   return 0 <= x < P and 0 <= y < P and (y*y - x*x*x - B) % P == 0
+
+################################################################################
+def liftX(x, odd):
+   """ Curve point with the given x and y parity, None if there isn't one """
+   if not 0 <= x < P:
+      return None
+   y2 = (x*x*x + B) % P
+   y = pow(y2, (P+1)//4, P)
+   if y*y % P != y2:
+      return None
+   if (y & 1) != odd:
+      y = P - y
+   return (x, y)
+
+################################################################################
+def batchInverse(vals, mod):
+   """ Inverses of all (non zero) vals, one modular inversion for the lot """
+   prefix = []
+   acc = 1
+   for v in vals:
+      prefix.append(acc)
+      acc = acc * v % mod
+
+   inv = pow(acc, -1, mod)
+   out = [0] * len(vals)
+   for i in range(len(vals)-1, -1, -1):
+      out[i] = inv * prefix[i] % mod
+      inv = inv * vals[i] % mod
+   return out
+
+################################################################################
+def jacobianDouble(pt):
+   X, Y, Z = pt
+   if Z == 0 or Y == 0:
+      return JACOBIAN_INFINITY
+
+   # dbl-2009-l, a = 0
+   A = X*X % P
+   BB = Y*Y % P
+   C = BB*BB % P
+   D = 2*((X + BB)*(X + BB) - A - C) % P
+   E = 3*A
+   X3 = (E*E - 2*D) % P
+   Y3 = (E*(D - X3) - 8*C) % P
+   Z3 = 2*Y*Z % P
+   return (X3, Y3, Z3)
+
+################################################################################
+def jacobianAddAffine(pt, aff):
+   """ Mixed addition, aff is an affine point """
+   if aff is None:
+      return pt
+   X1, Y1, Z1 = pt
+   x2, y2 = aff
+   if Z1 == 0:
+      return (x2, y2, 1)
+
+   # madd-2007-bl
+   Z1Z1 = Z1*Z1 % P
+   U2 = x2*Z1Z1 % P
+   S2 = y2*Z1*Z1Z1 % P
+   H = (U2 - X1) % P
+   R = (S2 - Y1) % P
+   if H == 0:
+      if R == 0:
+         return jacobianDouble(pt)
+      return JACOBIAN_INFINITY
+
+   HH = H*H % P
+   HHH = H*HH % P
+   V = X1*HH % P
+   X3 = (R*R - HHH - 2*V) % P
+   Y3 = (R*(V - X3) - Y1*HHH) % P
+   Z3 = Z1*H % P
+   return (X3, Y3, Z3)
+
+################################################################################
+def jacobianAdd(p1, p2):
+   X1, Y1, Z1 = p1
+   X2, Y2, Z2 = p2
+   if Z1 == 0:
+      return p2
+   if Z2 == 0:
+      return p1
+
+   # add-2007-bl
+   Z1Z1 = Z1*Z1 % P
+   Z2Z2 = Z2*Z2 % P
+   U1 = X1*Z2Z2 % P
+   U2 = X2*Z1Z1 % P
+   S1 = Y1*Z2*Z2Z2 % P
+   S2 = Y2*Z1*Z1Z1 % P
+   H = (U2 - U1) % P
+   R = (S2 - S1) % P
+   if H == 0:
+      if R == 0:
+         return jacobianDouble(p1)
+      return JACOBIAN_INFINITY
+
+   HH = H*H % P
+   HHH = H*HH % P
+   V = U1*HH % P
+   X3 = (R*R - HHH - 2*V) % P
+   Y3 = (R*(V - X3) - S1*HHH) % P
+   Z3 = Z1*Z2*H % P
+   return (X3, Y3, Z3)
+
+################################################################################
+def jacobianNegate(pt):
+   return (pt[0], (P - pt[1]) % P, pt[2])
+
+################################################################################
+def toAffine(pt):
+   if pt[2] == 0:
+      return None
+   zInv = pow(pt[2], -1, P)
+   zInv2 = zInv*zInv % P
+   return (pt[0]*zInv2 % P, pt[1]*zInv2*zInv % P)
+
+################################################################################
+def toAffineBatch(pts):
+   out = [None] * len(pts)
+   live = [i for i in range(len(pts)) if pts[i][2] != 0]
+   if not live:
+      return out
+
+   zInvs = batchInverse([pts[i][2] for i in live], P)
+   for i, zInv in zip(live, zInvs):
+      zInv2 = zInv*zInv % P
+      out[i] = (pts[i][0]*zInv2 % P, pts[i][1]*zInv2*zInv % P)
+   return out
+
+################################################################################
+def getWNAF(k, width=WNAF_WIDTH):
+   """ Signed digits of k, least significant first, all odd or 0 """
+   digits = []
+   full = 1 << width
+   half = full >> 1
+   while k > 0:
+      if k & 1:
+         d = k & (full - 1)
+         if d >= half:
+            d -= full
+         k -= d
+      else:
+         d = 0
+      digits.append(d)
+      k >>= 1
+   return digits
+
+################################################################################
+def getOddMultiplesJacobian(point, width=WNAF_WIDTH):
+   """ point, 3*point, ..., (2^(width-1) - 1)*point, in Jacobian form """
+   first = (point[0], point[1], 1)
+   twice = jacobianDouble(first)
+   mults = [first]
+   for i in range((1 << (width-2)) - 1):
+      mults.append(jacobianAdd(mults[-1], twice))
+   return mults
+
+################################################################################
+def mulWNAF(k, oddMults, width=WNAF_WIDTH):
+   """ k times the point oddMults (affine, from getOddMultiples) is for """
+   acc = JACOBIAN_INFINITY
+   for d in reversed(getWNAF(k, width)):
+      acc = jacobianDouble(acc)
+      if d > 0:
+         acc = jacobianAddAffine(acc, oddMults[d >> 1])
+      elif d < 0:
+         x, y = oddMults[(-d) >> 1]
+         acc = jacobianAddAffine(acc, (x, P - y))
+   return acc
+
+
+################################################################################
+class GeneratorTable(object):
+   """
+   table[i][j] is (j+1) * 2^(bits*i) * G, affine. Then
+   k*G = sum_i table[i][window_i(k) - 1], additions only.
+   """
+
+   #############################################################################
+   def __init__(self, bits=GEN_WINDOW_BITS):
+      self.bits = bits
+      self.mask = (1 << bits) - 1
+      nWindows = (256 + bits - 1) // bits
+
+      jacPts = []
+      base = (GX, GY, 1)
+      for i in range(nWindows):
+         pt = base
+         for j in range(self.mask):
+            jacPts.append(pt)
+            pt = jacobianAdd(pt, base)
+         base = pt
+
+      affPts = toAffineBatch(jacPts)
+      self.table = [affPts[i*self.mask:(i+1)*self.mask] \
+                                                for i in range(nWindows)]
+
+   #############################################################################
+   def mul(self, k):
+      acc = JACOBIAN_INFINITY
+      i = 0
+      while k > 0:
+         d = k & self.mask
+         if d:
+            acc = jacobianAddAffine(acc, self.table[i][d-1])
+         k >>= self.bits
+         i += 1
+      return acc
+
+
+################################################################################
+class ECBackend(object):
+   """
+   Interface of the EC backends. Scalars and hashes are ints, points are
+   affine (x, y) tuples. The batch calls default to looping over the
+   single ones.
+   """
+   name = None
+
+   def mulG(self, k):
+      raise NotImplementedError
+
+   def verify(self, e, r, s, point):
+      raise NotImplementedError
+
+   def recover(self, e, r, s, recid):
+      raise NotImplementedError
+
+   #############################################################################
+   def sign(self, e, secret, k):
+      """ (r, s, recid), recid being the one recover() needs """
+      k = k % N
+      R = self.mulG(k)
+      if R is None:
+         raise ValueError('bad nonce')
+      r = R[0] % N
+      if r == 0:
+         raise ValueError('bad nonce')
+      s = pow(k, -1, N) * (e + secret*r) % N
+      if s == 0:
+         raise ValueError('bad nonce')
+      recid = (R[1] & 1) | (2 if R[0] >= N else 0)
+      return r, s, recid
+
+   #############################################################################
+   def verifyBatch(self, checks):
+      """ checks are (e, r, s, point) """
+      return [self.verify(*check) for check in checks]
+
+   def recoverBatch(self, items):
+      """ items are (e, r, s, recid), None for the ones that fail """
+      return [self.recover(*item) for item in items]
+
+
+################################################################################
+class JacobianBackend(ECBackend):
+   name = 'jacobian'
+
+   #############################################################################
+   def __init__(self, genWindowBits=GEN_WINDOW_BITS, wnafWidth=WNAF_WIDTH):
+      self.genWindowBits = genWindowBits
+      self.wnafWidth = wnafWidth
+      self.genTable = None
+
+   #############################################################################
+   def getGenTable(self):
+      # built on first use, ~10ms
+      if self.genTable is None:
+         self.genTable = GeneratorTable(self.genWindowBits)
+      return self.genTable
+
+   #############################################################################
+   def getOddMultiples(self, points):
+      """ Affine odd multiple tables for several points, one inversion """
+      jacTables = [getOddMultiplesJacobian(pt, self.wnafWidth) \
+                                                         for pt in points]
+      flat = toAffineBatch([pt for table in jacTables for pt in table])
+      size = 1 << (self.wnafWidth - 2)
+      return [flat[i*size:(i+1)*size] for i in range(len(points))]
+
+   #############################################################################
+   def mulG(self, k):
+      return toAffine(self.getGenTable().mul(k % N))
+
+   #############################################################################
+   def mulAdd(self, u1, u2, oddMults):
+      """ u1*G + u2*Q, Jacobian, oddMults being Q's table """
+      return jacobianAdd(self.getGenTable().mul(u1),
+                         mulWNAF(u2, oddMults, self.wnafWidth))
+
+   #############################################################################
+   def checkR(self, pt, r):
+      # x(pt) mod n == r without leaving Jacobian coordinates: X == x*Z^2
+      # for x = r, or r + n if that still fits under p
+      X, Y, Z = pt
+      if Z == 0:
+         return False
+      zz = Z*Z % P
+      if r*zz % P == X:
+         return True
+      return r + N < P and (r + N)*zz % P == X
+
+   #############################################################################
+   def verify(self, e, r, s, point):
+      return self.verifyBatch([(e, r, s, point)])[0]
+
+   #############################################################################
+   def verifyBatch(self, checks):
+      results = [False] * len(checks)
+      valid = []
+      for i, (e, r, s, point) in enumerate(checks):
+         if 0 < r < N and 0 < s < N and isOnCurve(point):
+            valid.append(i)
+      if not valid:
+         return results
+
+      # one table per distinct pubkey, all made affine together
+      points = list(set([checks[i][3] for i in valid]))
+      tableMap = dict(zip(points, self.getOddMultiples(points)))
+      sInvs = batchInverse([checks[i][2] for i in valid], N)
+
+      for i, sInv in zip(valid, sInvs):
+         e, r, s, point = checks[i]
+         pt = self.mulAdd(e*sInv % N, r*sInv % N, tableMap[point])
+         results[i] = self.checkR(pt, r)
+      return results
+
+   #############################################################################
+   def recover(self, e, r, s, recid):
+      return self.recoverBatch([(e, r, s, recid)])[0]
+
+   #############################################################################
+   def recoverBatch(self, items):
+      # Q = r^-1 * (s*R - e*G), R being the point with x = r (+n)
+      results = [None] * len(items)
+      valid = []
+      Rs = []
+      for i, (e, r, s, recid) in enumerate(items):
+         if not (0 < r < N and 0 < s < N and 0 <= recid < 4):
+            continue
+         R = liftX(r + (recid >> 1) * N, recid & 1)
+         if R is None:
+            continue
+         valid.append(i)
+         Rs.append(R)
+      if not valid:
+         return results
+
+      tables = self.getOddMultiples(Rs)
+      rInvs = batchInverse([items[i][1] for i in valid], N)
+      jacQs = []
+      for i, rInv, table in zip(valid, rInvs, tables):
+         e, r, s, recid = items[i]
+         jacQs.append(self.mulAdd(-e*rInv % N, s*rInv % N, table))
+
+      for i, Q in zip(valid, toAffineBatch(jacQs)):
+         results[i] = Q
+      return results
+
+
+################################################################################
+class AffineBackend(ECBackend):
+   """ jasvet's original Point arithmetic, one inversion per operation """
+   name = 'affine'
+
+   #############################################################################
+   def mulG(self, k):
+      from jasvet import generator_secp256k1, INFINITY
+      pt = generator_secp256k1 * k
+      return None if pt == INFINITY else (pt.x(), pt.y())
+
+   #############################################################################
+   def verify(self, e, r, s, point):
+      from jasvet import curve_secp256k1, generator_secp256k1, Point, \
+         INFINITY
+      if not (0 < r < N and 0 < s < N and isOnCurve(point)):
+         return False
+      c = pow(s, -1, N)
+      xy = (e*c % N) * generator_secp256k1 + \
+           (r*c % N) * Point(curve_secp256k1, point[0], point[1])
+      return xy != INFINITY and xy.x() % N == r
+
+   #############################################################################
+   def recover(self, e, r, s, recid):
+      from jasvet import curve_secp256k1, generator_secp256k1, Point, \
+         INFINITY
+      if not (0 < r < N and 0 < s < N and 0 <= recid < 4):
+         return None
+      R = liftX(r + (recid >> 1) * N, recid & 1)
+      if R is None:
+         return None
+      rInv = pow(r, -1, N)
+      Q = (s*rInv % N) * Point(curve_secp256k1, R[0], R[1]) + \
+          (-e*rInv % N) * generator_secp256k1
+      return None if Q == INFINITY else (Q.x(), Q.y())
+
+
+TheECBackend = JacobianBackend()
+
+################################################################################
+def getECBackend():
+   return TheECBackend
+
+################################################################################
+def setECBackend(backend):
+   global TheECBackend
+   TheECBackend = backend
@@ -0,0 +1,144 @@
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+
+"""
+Shamir secret sharing by Lagrange interpolation.
+
+SplitSecret puts the secret in the leading coefficient of a random
+polynomial of degree M-1 over a FiniteField prime, and hands out its values
+at x=1..N. Any M of those points define the polynomial, and its leading
+coefficient is
+
+   secret = sum_i( y_i * w_i ),   w_i = 1 / prod_{j!=i}(x_i - x_j)
+
+The weights only depend on which fragments are used, not on their values.
+That is O(M^2) per subset where inverting the Vandermonde matrix by
+cofactors was O(M!), so there is no practical limit on M anymore.
+
+When testing a fragment set, the x differences are computed once for the
+whole set and the weights of every subset share a single modular inverse:
+
+   engine = ShamirEngine(64)
+   for subset, secret in engine.reconstructSubsets(xyMap, subsets):
+      ...
+"""
+
+from armoryengine.ArmoryUtils import FiniteField, FiniteFieldError, LOGERROR
+
+################################################################################
+def batchInverse(vals, prime):
+   """
+   Inverses of all vals mod prime, for the price of one modular inverse
+   (Montgomery's trick). Raises FiniteFieldError if any of them is 0.
+   """
+   prefix = []
+   acc = 1
+   for v in vals:
+      if v % prime == 0:
+         LOGERROR('Duplicate fragment x values, cannot interpolate')
+         raise FiniteFieldError
+      prefix.append(acc)
+      acc = acc * v % prime
+
+   inv = pow(acc, prime-2, prime)
+   out = [0] * len(vals)
+   for i in range(len(vals)-1, -1, -1):
+      out[i] = inv * prefix[i] % prime
+      inv = inv * vals[i] % prime
+   return out
+
+
+################################################################################
+class ShamirEngine(object):
+   """ Split/reconstruct on ints, the callers deal with byte encoding """
+
+   #############################################################################
+   def __init__(self, nbytes):
+      self.ff = FiniteField(nbytes)
+      self.prime = self.ff.prime
+      self.nbytes = nbytes
+
+   #############################################################################
+   def evalPoly(self, coeffs, x):
+      """ coeffs highest degree first, Horner's rule """
+      y = 0
+      for c in coeffs:
+         y = (y*x + c) % self.prime
+      return y
+
+   #############################################################################
+   def split(self, secret, needed, pieces, randCoeffs):
+      """ randCoeffs are the needed-1 lower order coefficients """
+      coeffs = [secret] + list(randCoeffs[:needed-1])
+      return [(x, self.evalPoly(coeffs, x)) for x in range(1, pieces+1)]
+
+   #############################################################################
+   def getDenominators(self, xs, diffs=None):
+      p = self.prime
+      dens = []
+      for i in range(len(xs)):
+         d = 1
+         for j in range(len(xs)):
+            if i != j:
+               if diffs is None:
+                  d = d * (xs[i] - xs[j]) % p
+               else:
+                  d = d * diffs[(xs[i], xs[j])] % p
+         dens.append(d)
+      return dens
+
+   #############################################################################
+   def getWeights(self, xs):
+      return batchInverse(self.getDenominators(xs), self.prime)
+
+   #############################################################################
+   def getWeightsBatch(self, xSubsets):
+      """ Weights of several subsets of the same x values, one inverse """
+      allXs = set()
+      for xs in xSubsets:
+         allXs.update(xs)
+
+      p = self.prime
+      diffs = dict(((a, b), (a - b) % p) for a in allXs for b in allXs)
+
+      dens = []
+      for xs in xSubsets:
+         dens.extend(self.getDenominators(xs, diffs))
+      invs = batchInverse(dens, p)
+
+      weights = []
+      pos = 0
+      for xs in xSubsets:
+         weights.append(invs[pos:pos+len(xs)])
+         pos += len(xs)
+      return weights
+
+   #############################################################################
+   def combine(self, ys, weights):
+      return sum([y*w for y,w in zip(ys, weights)]) % self.prime
+
+   #############################################################################
+   def reconstruct(self, points):
+      """ points is a list of (x, y), exactly as many as needed """
+      xs = [x for x,y in points]
+      return self.combine([y for x,y in points], self.getWeights(xs))
+
+   #############################################################################
+   def reconstructSubsets(self, xyMap, subsets):
+      """
+      xyMap maps fragment keys to (x, y), subsets are tuples of keys.
+      Returns [(subset, secret), ...] in the order of subsets.
+      """
+      xSubsets = [[xyMap[k][0] for k in subset] for subset in subsets]
+      weights = self.getWeightsBatch(xSubsets)
+
+      results = []
+      for subset, subWeights in zip(subsets, weights):
+         ys = [xyMap[k][1] for k in subset]
+         results.append((subset, self.combine(ys, subWeights)))
+      return results
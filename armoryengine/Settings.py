@@ -9,14 +9,27 @@
 #  See LICENSE-MIT or https://opensource.org/licenses/MIT                    #
 #                                                                            #
 ##############################################################################
+import atexit
+import json
 import os
 import sys
+import threading
+from contextlib import contextmanager
 
 from armoryengine.ArmoryUtils import ARMORY_HOME_DIR, LOGINFO, \
-   LOGERROR, LOGEXCEPT, CLI_OPTIONS, SETTINGS_PATH, toUnicode
+   LOGERROR, LOGEXCEPT, CLI_OPTIONS, SETTINGS_PATH, TheLogPipeline, \
+   toUnicode
 
 
 LANGUAGES = ["da", "de", "en", "es", "el", "fr", "he", "hr", "id", "ru", "sv"]
+
+# changes are written out at most this long after the first one lands,
+# whatever else gets set in the meantime goes in the same write
+SETTINGS_FLUSH_DELAY = 0.5
+
+SETTINGS_FORMAT_TEXT = 'text'
+SETTINGS_FORMAT_JSON = 'json'
+
 ################################################################################
 class SettingsFile(object):
    """
@@ -33,18 +46,51 @@ class SettingsFile(object):
          SingleValueSetting2 | this is a string
          Tuple Or List Obj 1 | 12 $ 43 $ 13 $ 33
          Tuple Or List Obj 2 | str1 $ another str
+
+   A settings path ending in .json is stored as a JSON object instead,
+   which keeps value types as they are and loads faster.
+
+   Changes are kept in memory and written out in batches, see flush().
+   Several keys can be changed as one unit:
+
+      with TheSettings.transaction():
+         TheSettings.set('MainGeometry', geom)
+         TheSettings.set('MainWalletCols', cols)
    """
 
    #############################################################################
-   def __init__(self, path=None):
+   def __init__(self, path=None, flushDelay=SETTINGS_FLUSH_DELAY):
       self.settingsPath = path
-      self.settingsMap = {}
+      self.loadedMap = None
       if not path:
          self.settingsPath = os.path.join(ARMORY_HOME_DIR, 'ArmorySettings.txt')
 
-      LOGINFO('Using settings file: %s', self.settingsPath)
-      if os.path.exists(self.settingsPath):
-         self.loadSettingsFile(path)
+      self.settingsFormat = SETTINGS_FORMAT_TEXT
+      if self.settingsPath.lower().endswith('.json'):
+         self.settingsFormat = SETTINGS_FORMAT_JSON
+
+      # guards the map, the dirty state and the file itself. Writes happen
+      # under it too, so they land in the order the changes were made
+      self.lock = threading.RLock()
+      self.flushDelay = flushDelay
+      self.flushTimer = None
+      self.dirty = False
+      self.txnDepth = 0
+      self.txnSnapshot = None
+      self.writeCount = 0
+      atexit.register(self.flush)
+
+   #############################################################################
+   @property
+   def settingsMap(self):
+      # the file is read on first use rather than at import, tools that
+      # never touch a setting don't pay for it
+      if self.loadedMap is None:
+         self.loadedMap = {}
+         LOGINFO('Using settings file: %s', self.settingsPath)
+         if os.path.exists(self.settingsPath):
+            self.loadSettingsFile()
+      return self.loadedMap
 
    #############################################################################
    def pprint(self, nIndent=0):
@@ -59,28 +105,30 @@ class SettingsFile(object):
 
    #############################################################################
    def set(self, name, value):
-      if isinstance(value, tuple):
-         self.settingsMap[name] = list(value)
-      else:
-         self.settingsMap[name] = value
-      self.writeSettingsFile()
+      with self.lock:
+         if isinstance(value, tuple):
+            self.settingsMap[name] = list(value)
+         else:
+            self.settingsMap[name] = value
+         self.markDirty()
 
    #############################################################################
    def extend(self, name, value):
       """ Adds/converts setting to list, appends value to the end of it """
-      if name not in self.settingsMap:
-         if isinstance(value, list):
-            self.set(name, value)
-         else:
-            self.set(name, [value])
-      else:
-         origVal = self.get(name, expectList=True)
-         if isinstance(value, list):
-            origVal.extend(value)
+      with self.lock:
+         if name not in self.settingsMap:
+            if isinstance(value, list):
+               self.set(name, value)
+            else:
+               self.set(name, [value])
          else:
-            origVal.append(value)
-         self.settingsMap[name] = origVal
-      self.writeSettingsFile()
+            origVal = self.get(name, expectList=True)
+            if isinstance(value, list):
+               origVal.extend(value)
+            else:
+               origVal.append(value)
+            self.settingsMap[name] = origVal
+            self.markDirty()
 
    #############################################################################
    def get(self, name, expectList=False):
@@ -112,42 +160,130 @@ class SettingsFile(object):
 
    #############################################################################
    def delete(self, name):
-      if self.hasSetting(name):
-         del self.settingsMap[name]
-      self.writeSettingsFile()
+      with self.lock:
+         if self.hasSetting(name):
+            del self.settingsMap[name]
+            self.markDirty()
+
+   #############################################################################
+   def markDirty(self):
+      """ Call with lock held. Schedules a write unless in a transaction """
+      self.dirty = True
+      if self.txnDepth > 0:
+         return
+
+      if self.flushDelay <= 0:
+         self.flush()
+      elif self.flushTimer is None:
+         self.flushTimer = threading.Timer(self.flushDelay, self.flush)
+         self.flushTimer.daemon = True
+         self.flushTimer.start()
+
+   #############################################################################
+   @contextmanager
+   def transaction(self):
+      """
+      Changes made in the block reach the file together, in one write when
+      the block exits. If it raises, the settings are rolled back. Other
+      threads wait on the block to touch the settings.
+      """
+      with self.lock:
+         if self.txnDepth == 0:
+            # lists are the only mutable values, copy those too
+            self.txnSnapshot = (self.dirty, dict((k, list(v) \
+               if isinstance(v, list) else v) \
+               for k,v in self.settingsMap.items()))
+         self.txnDepth += 1
+         try:
+            yield self
+         except:
+            if self.txnDepth == 1:
+               self.dirty, self.loadedMap = self.txnSnapshot
+            raise
+         finally:
+            self.txnDepth -= 1
+            if self.txnDepth == 0:
+               self.txnSnapshot = None
+
+         if self.txnDepth == 0 and self.dirty:
+            self.flush()
+
+   #############################################################################
+   def flush(self):
+      """ Writes pending changes to disk, if there are any """
+      with self.lock:
+         if self.flushTimer is not None:
+            self.flushTimer.cancel()
+            self.flushTimer = None
+         if not self.dirty or self.txnDepth > 0:
+            return
+
+         try:
+            self.writeAtomic(self.settingsPath, self.serializeSettings())
+            self.dirty = False
+         except:
+            LOGEXCEPT('Failed to write settings file %s', self.settingsPath)
 
    #############################################################################
    def writeSettingsFile(self, path=None):
+      """ Writes all settings now, pending changes or not """
       if not path:
          path = self.settingsPath
-      f = open(path, 'wb')
+      with self.lock:
+         self.writeAtomic(path, self.serializeSettings())
+         if path == self.settingsPath:
+            self.dirty = False
+
+   #############################################################################
+   def writeAtomic(self, path, data):
+      # readers see either the old file or the new one, never half of it
+      tmpPath = path + '.tmp'
+      with open(tmpPath, 'wb') as f:
+         f.write(data)
+         f.flush()
+         os.fsync(f.fileno())
+      os.replace(tmpPath, path)
+      self.writeCount += 1
+
+   #############################################################################
+   def serializeSettings(self):
+      try:
+         from PySide2.QtCore import QByteArray
+      except ImportError:
+         QByteArray = None
+
+      def valToStr(val):
+         if isinstance(val, str):
+            return val
+         elif QByteArray is not None and isinstance(val, QByteArray):
+            return str(val.data(), encoding='utf-8')
+         return str(val)
+
+      if self.settingsFormat == SETTINGS_FORMAT_JSON:
+         jsonMap = {}
+         for key,val in self.settingsMap.items():
+            if isinstance(val, (list, tuple)):
+               jsonMap[key] = [v if isinstance(v, (bool, int, float)) \
+                                 else valToStr(v) for v in val]
+            elif isinstance(val, (bool, int, float)):
+               jsonMap[key] = val
+            else:
+               jsonMap[key] = valToStr(val)
+         return json.dumps(jsonMap, indent=1, sort_keys=True).encode('utf-8')
+
+      lines = []
       for key,val in self.settingsMap.items():
          try:
             # Skip anything that throws an exception
-            from PySide2.QtCore import QByteArray
-
-            valStr = ''
-            if   isinstance(val, str):
-               valStr = val
-            elif isinstance(val, int) or \
-                 isinstance(val, float):
-               valStr = str(val)
-            elif isinstance(val, list) or \
-                 isinstance(val, tuple):
+            if isinstance(val, (list, tuple)):
                valStr = ' $  '.join([str(v) for v in val])
-            elif isinstance(val, QByteArray) and \
-                 sys.version_info >= (3,0):
-               valStr = str(val.data(), encoding='utf-8')
             else:
-               valStr = str(val)
-            f.write(key.ljust(36).encode('utf-8'))
-            f.write(b' | ')
-            if valStr:
-               f.write(valStr.encode('utf-8'))
-            f.write(b'\n')
+               valStr = valToStr(val)
+            lines.append(key.ljust(36).encode('utf-8') + b' | ' + \
+                         valStr.encode('utf-8'))
          except:
             LOGEXCEPT('Invalid entry in SettingsFile... skipping')
-      f.close()
+      return b''.join([line + b'\n' for line in lines])
 
    #############################################################################
    def loadSettingsFile(self, path=None):
@@ -161,6 +297,13 @@ class SettingsFile(object):
       sdata = f.read()
       f.close()
 
+      if self.settingsFormat == SETTINGS_FORMAT_JSON:
+         try:
+            self.settingsMap.update(json.loads(sdata.decode('utf-8')))
+         except:
+            LOGEXCEPT('Invalid settings file %s (skipping...)', path)
+         return
+
       # Automatically convert settings to numeric if possible
       def castVal(v):
          v = v.strip()
@@ -206,3 +349,13 @@ class SettingsFile(object):
       return "armory_" + langSetting + ".qm"
 
 TheSettings = SettingsFile(SETTINGS_PATH)
+
+################################################################################
+def exitProcess(code=0):
+   """
+   os._exit skips atexit, write pending settings and queued log records
+   first or they are lost
+   """
+   TheSettings.flush()
+   TheLogPipeline.stop()
+   os._exit(code)
@@ -0,0 +1,196 @@
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+
+"""
+Local ECDSA verification of tx signatures.
+
+Checks are (sigHash, pubKey, derSig) triplets. Results are memoized, so
+re-evaluating a partially signed tx after one more signature is added only
+verifies that signature, and large batches of new checks are spread over a
+process pool.
+
+   checks = [(sigHash, pubKey, derSig), ...]
+   results = TheSigVerifier.verifyBatch(checks)
+"""
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from armoryengine.ArmoryUtils import LOGWARN, LOGEXCEPT
+from armoryengine.Secp256k1 import getECBackend, liftX
+
+SIGVERIFY_CACHE_SIZE = 65536
+
+# below this many uncached checks, shipping them to workers costs more
+# than running them here
+SIGVERIFY_MIN_PARALLEL = 8
+
+################################################################################
+def parseDERSignature(derSig):
+   """ (r, s) from a DER signature without its hashtype byte """
+   if len(derSig) < 8 or derSig[0] != 0x30 or derSig[2] != 0x02:
+      raise ValueError('malformed DER signature')
+
+   rLen = derSig[3]
+   if derSig[4+rLen] != 0x02:
+      raise ValueError('malformed DER signature')
+   sLen = derSig[5+rLen]
+   if 6 + rLen + sLen > len(derSig):
+      raise ValueError('malformed DER signature')
+
+   r = int.from_bytes(derSig[4:4+rLen], 'big')
+   s = int.from_bytes(derSig[6+rLen:6+rLen+sLen], 'big')
+   return r, s
+
+################################################################################
+def parsePublicKey(pubKey):
+   """ (x, y) of a compressed or uncompressed secp256k1 public key """
+   if len(pubKey) == 65 and pubKey[0] == 0x04:
+      return int.from_bytes(pubKey[1:33], 'big'), \
+         int.from_bytes(pubKey[33:], 'big')
+
+   if len(pubKey) == 33 and pubKey[0] in (0x02, 0x03):
+      point = liftX(int.from_bytes(pubKey[1:], 'big'), pubKey[0] & 1)
+      if point is not None:
+         return point
+
+   raise ValueError('invalid public key')
+
+################################################################################
+def parseCheck(sigHash, pubKey, derSig):
+   """ (e, r, s, point) for the EC backend, None if malformed """
+   try:
+      r, s = parseDERSignature(derSig)
+      point = parsePublicKey(pubKey)
+   except (ValueError, IndexError):
+      return None
+   return int.from_bytes(sigHash, 'big'), r, s, point
+
+################################################################################
+def verifyDERSignature(sigHash, pubKey, derSig):
+   """
+   Raw ECDSA check of derSig (hashtype byte stripped) over the 32 byte
+   sigHash. Returns False for anything malformed rather than raising.
+   """
+   return verifyCheckList([(sigHash, pubKey, derSig)])[0]
+
+################################################################################
+def verifyCheckList(checkList):
+   # also the worker side of verifyBatch, one chunk of checks per call.
+   # The backend shares inverses and pubkey tables across the chunk
+   parsed = [parseCheck(*check) for check in checkList]
+   ecChecks = [check for check in parsed if check is not None]
+   ecResults = iter(getECBackend().verifyBatch(ecChecks))
+   return [False if check is None else next(ecResults) for check in parsed]
+
+################################################################################
+class SigVerifyScheduler(object):
+   """
+   Memoizing front end to verifyDERSignature. Uncached checks from a batch
+   are deduplicated, then run inline or fanned out to a process pool
+   depending on how many there are.
+   """
+
+   #############################################################################
+   def __init__(self, maxWorkers=None, minParallel=SIGVERIFY_MIN_PARALLEL,
+                                          cacheSize=SIGVERIFY_CACHE_SIZE):
+      self.maxWorkers  = maxWorkers or os.cpu_count() or 1
+      self.minParallel = minParallel
+      self.cacheSize   = cacheSize
+      self.resultMap   = {}
+      self.pool        = None
+      self.lock        = threading.Lock()
+
+   #############################################################################
+   def getPool(self):
+      if self.pool is None:
+         #spawn, forking the GUI process would copy the Qt and bridge
+         #threads' state into the workers
+         self.pool = ProcessPoolExecutor(max_workers=self.maxWorkers,
+            mp_context=multiprocessing.get_context('spawn'))
+      return self.pool
+
+   #############################################################################
+   def shutdown(self):
+      if self.pool is not None:
+         self.pool.shutdown(wait=False)
+         self.pool = None
+
+   #############################################################################
+   def getCached(self, sigHash, pubKey, derSig):
+      return self.resultMap.get((sigHash, pubKey, derSig))
+
+   #############################################################################
+   def storeResults(self, checkList, results):
+      with self.lock:
+         if len(self.resultMap) + len(checkList) > self.cacheSize:
+            self.resultMap.clear()
+         for check, result in zip(checkList, results):
+            self.resultMap[check] = result
+
+   #############################################################################
+   def runChecks(self, checkList):
+      if len(checkList) < self.minParallel or self.maxWorkers < 2:
+         return verifyCheckList(checkList)
+
+      nChunks = min(self.maxWorkers, len(checkList))
+      chunkList = [checkList[i::nChunks] for i in range(nChunks)]
+      try:
+         chunkResults = list(self.getPool().map(verifyCheckList, chunkList))
+      except Exception:
+         # broken pool (killed worker, no fork support...), do it here
+         LOGEXCEPT('Signature verification pool failed, verifying inline')
+         self.shutdown()
+         return verifyCheckList(checkList)
+
+      results = [None]*len(checkList)
+      for i, chunk in enumerate(chunkResults):
+         results[i::nChunks] = chunk
+      return results
+
+   #############################################################################
+   def verify(self, sigHash, pubKey, derSig):
+      return self.verifyBatch([(sigHash, pubKey, derSig)])[0]
+
+   #############################################################################
+   def verifyBatch(self, checks):
+      """
+      checks is a list of (sigHash, pubKey, derSig) tuples, returns the
+      list of results in the same order
+      """
+      checks = [(bytes(h), bytes(k), bytes(s)) for h,k,s in checks]
+      pending = []
+      seen = set()
+      for check in checks:
+         if check in self.resultMap or check in seen:
+            continue
+         seen.add(check)
+         pending.append(check)
+
+      if pending:
+         self.storeResults(pending, self.runChecks(pending))
+
+      results = []
+      for check in checks:
+         result = self.resultMap.get(check)
+         if result is None:
+            # evicted while we were running this batch
+            LOGWARN('Signature cache overflow, reverifying')
+            result = verifyDERSignature(*check)
+         results.append(result)
+      return results
+
+   #############################################################################
+   def clearCache(self):
+      with self.lock:
+         self.resultMap.clear()
+
+
+TheSigVerifier = SigVerifyScheduler()
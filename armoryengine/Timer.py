@@ -14,7 +14,10 @@ from __future__ import (absolute_import, division,
 # Orig Date:  20 November, 2011
 #
 ################################################################################
-from armoryengine.ArmoryUtils import LOGWARN, RightNow, LOGERROR
+import os
+import threading
+
+from armoryengine.ArmoryUtils import LOGWARN, RightNow, LOGERROR, LOGINFO
    
 class Timer(object):
    
@@ -66,7 +69,7 @@ class Timer(object):
       print('cumulTime'.rjust(13), end=' ')
       print('avgTime'.rjust(13))
       print('-'*70)
-      for tname,quad in self.timerMap.iteritems():
+      for tname,quad in self.timerMap.items():
          print(('%s' % tname).ljust(30), end=' ') 
          print(('%d' % quad[1]).rjust(13), end=' ')
          print(('%0.6f' % quad[0]).rjust(13), end=' ')
@@ -80,7 +83,7 @@ class Timer(object):
       f.write( 'nCall,')
       f.write( 'cumulTime,')
       f.write( 'avgTime\n\n')
-      for tname,quad in self.timerMap.iteritems():
+      for tname,quad in self.timerMap.items():
          f.write('%s,' % tname)
          f.write('%d,' % quad[1])
          f.write('%0.6f,' % quad[0])
@@ -102,3 +105,71 @@ def TimeThisFunction(func):
       timer.stopTimer(func.__name__)
       return ret
    return inner
+
+
+################################################################################
+class PeriodicStatsDump(object):
+   """
+   Every interval seconds, calls snapshotFunc and writes the rows it returns
+   to the log, or appends them to a CSV file if csvPath is set. snapshotFunc
+   returns a list of dicts, all with the same keys. A timestamp column is
+   prepended to each row.
+   """
+
+   def __init__(self, snapshotFunc, interval, csvPath=None, name='stats'):
+      self.snapshotFunc = snapshotFunc
+      self.interval = interval
+      self.csvPath = csvPath
+      self.name = name
+
+      self.stopEvent = threading.Event()
+      self.thread = None
+
+   def start(self):
+      self.stopEvent.clear()
+      self.thread = threading.Thread(group=None, target=self.loop,
+         name='PeriodicStatsDump-%s' % self.name, daemon=True)
+      self.thread.start()
+
+   def stop(self):
+      self.stopEvent.set()
+      if self.thread is not None and \
+         self.thread is not threading.current_thread():
+         self.thread.join()
+      self.thread = None
+
+   def loop(self):
+      while not self.stopEvent.wait(self.interval):
+         try:
+            self.dump()
+         except:
+            LOGERROR('Failed to dump %s' % self.name)
+
+   def dump(self):
+      rows = self.snapshotFunc()
+      if len(rows) == 0:
+         return
+
+      now = RightNow()
+      columns = list(rows[0].keys())
+
+      if self.csvPath is None:
+         for row in rows:
+            LOGINFO('%s: %s' % (self.name, ', '.join(
+               '%s=%s' % (col, formatStatsValue(row[col])) \
+               for col in columns)))
+         return
+
+      writeHeader = not os.path.exists(self.csvPath)
+      with open(self.csvPath, 'a') as f:
+         if writeHeader:
+            f.write(','.join(['time'] + columns) + '\n')
+         for row in rows:
+            f.write(','.join(['%0.3f' % now] + \
+               [formatStatsValue(row[col]) for col in columns]) + '\n')
+
+
+def formatStatsValue(val):
+   if isinstance(val, float):
+      return '%0.6f' % val
+   return str(val)
@@ -10,6 +10,7 @@ from __future__ import (absolute_import, division,
 import logging
 import os
 import binascii
+import hashlib
 
 from armoryengine.ArmoryUtils import BlockComponent, BIGENDIAN, \
    LITTLEENDIAN, enum, UINT32_MAX, UNINITIALIZED, hash256, \
@@ -18,20 +19,25 @@ from armoryengine.ArmoryUtils import BlockComponent, BIGENDIAN, \
    CPP_TXOUT_STDPUBKEY33, CPP_TXOUT_STDPUBKEY65, CPP_TXOUT_STDHASH160, \
    CPP_TXIN_STDUNCOMPR, CPP_TXIN_STDCOMPR, CPP_TXIN_SPENDP2SH, \
    CPP_TXIN_P2WPKH_P2SH, CPP_TXIN_P2WSH_P2SH, MIN_RELAY_TX_FEE, \
+   CPP_TXOUT_OPRETURN, CPP_TXOUT_HAS_ADDRSTR, CPP_TXIN_COINBASE, \
+   CPP_TXIN_WITNESS, CPP_TXIN_SPENDPUBKEY, ADDRBYTE, P2SHBYTE, \
+   SCRADDR_P2WPKH_BYTE, SCRADDR_P2WSH_BYTE, SCRADDR_MULTISIG_BYTE, \
    int_to_binary, SignatureError, indent, binary_to_hex, \
-   hash160, sha256, ONE_BTC
+   hash160, sha256, ONE_BTC, hash160_to_p2pkhash_script, \
+   script_to_p2sh_script
 from armoryengine.AddressUtils import hash160_to_addrStr, binary_to_base58, \
    CheckHash160, binScript_to_p2shAddrStr, script_to_addrStr, \
-   script_to_scrAddr, scrAddr_to_addrStr, BadAddressError
-from armoryengine.BinaryPacker import BinaryPacker, UINT8, UINT32, UINT64, \
-   VAR_INT, BINARY_CHUNK
+   script_to_scrAddr, script_to_scrAddrLocal, scrAddr_to_addrStr, \
+   BadAddressError
+from armoryengine.BinaryPacker import BinaryPacker, BufferPacker, UINT8, \
+   UINT32, UINT64, VAR_INT, BINARY_CHUNK, varIntSize, varIntToBinary
 from armoryengine.BinaryUnpacker import BinaryUnpacker
 from armoryengine.AsciiSerialize import AsciiSerializable
-from armoryengine.CppBridge import TheBridge, BridgeSigner
-from armoryengine.CoinSelection import sumTxOutList
+from armoryengine.CppBridge import TheBridge, BridgeSigner, BridgeCache
 from armoryengine.PyBtcAddress import PyBtcAddress
 from armoryengine.BDM import TheBDM, BDM_BLOCKCHAIN_READY
 from armoryengine.Script import convertScriptToOpStrings
+from armoryengine.SignatureVerifier import TheSigVerifier
 
 from qtdialogs.DlgUnlockWallet import UnlockWalletHandler
 
@@ -44,6 +50,12 @@ TXIN_EXT_P2SHSCRIPT = 0x10
 USTX_EXT_SIGNERTYPE = 0x20
 USTX_EXT_SIGNERSTATE = 0x30
 
+TXOUT_PREFIX_TYPES = {
+   ADDRBYTE            : CPP_TXOUT_STDHASH160,
+   P2SHBYTE            : CPP_TXOUT_P2SH,
+   SCRADDR_P2WPKH_BYTE : CPP_TXOUT_P2WPKH,
+   SCRADDR_P2WSH_BYTE  : CPP_TXOUT_P2WSH }
+
 SIGHASH_ALL = 1
 SIGHASH_NONE = 2
 SIGHASH_SINGLE = 3
@@ -168,6 +180,34 @@ class SignerObject(object):
       return self.signer.canLegacySerialize()
 
 
+################################################################################
+def matchMultisigScript(rawScript):
+   """
+   Template match for bare M-of-N: OP_M <pubkey>*N OP_N OP_CHECKMULTISIG.
+   Returns (M, N, pubKeyList) or None.
+   """
+   sz = len(rawScript)
+   if sz < 37 or rawScript[-1] != 0xae:
+      return None
+
+   M = rawScript[0] - 80
+   N = rawScript[-2] - 80
+   if not (1 <= M <= N <= 16):
+      return None
+
+   pubKeyList = []
+   pos = 1
+   while pos < sz-2:
+      keyLen = rawScript[pos]
+      if keyLen not in (33, 65) or pos+1+keyLen > sz-2:
+         return None
+      pubKeyList.append(rawScript[pos+1:pos+1+keyLen])
+      pos += 1 + keyLen
+
+   if len(pubKeyList) != N:
+      return None
+   return M, N, pubKeyList
+
 ################################################################################
 def getMultisigScriptInfo(rawScript):
    """
@@ -175,71 +215,173 @@ def getMultisigScriptInfo(rawScript):
    the keys that are needed to satisfy this transaction.  This currently
    only identifies M-of-N transaction types, returning unknown otherwise.
 
-   However, the address list it returns should be valid regardless of
-   whether the type was unknown:  we assume all 20-byte chunks of data
-   are public key hashes, and 65-byte chunks are public keys.
-
    M==0 (output[0]==0) indicates this isn't a multisig script
    """
-
-   if not getTxOutScriptType(rawScript)==CPP_TXOUT_MULTISIG:
-      return [0, 0, None, None]
-
-   scrAddr = ''
-   addr160List = []
-   pubKeyList   = []
-
-   M,N = 0,0
-
-   pubKeyStr = Cpp.BtcUtils().getMultisigPubKeyInfoStr(rawScript)
-
-   bu = BinaryUnpacker(pubKeyStr)
-   M = bu.get(UINT8)
-   N = bu.get(UINT8)
-
-   if M==0:
+   msInfo = matchMultisigScript(rawScript)
+   if msInfo is None:
       return [0, 0, None, None]
 
-   for i in range(N):
-      pkstr = bu.get(BINARY_CHUNK, 33)
-      if pkstr[0] == '\x04':
-         pkstr += bu.get(BINARY_CHUNK, 32)
-      pubKeyList.append(pkstr)
-      addr160List.append(hash160(pkstr))
-
+   M, N, pubKeyList = msInfo
+   addr160List = [hash160(pkstr) for pkstr in pubKeyList]
    return M, N, addr160List, pubKeyList
 
 
 ################################################################################
 def getHash160ListFromMultisigScrAddr(scrAddr):
    mslen = len(scrAddr) - 3
-   if not (mslen%20==0 and scrAddr[0]==SCRADDR_MULTISIG_BYTE):
+   if not (mslen%20==0 and scrAddr[:1]==SCRADDR_MULTISIG_BYTE):
       raise BadAddressError('Supplied ScrAddr is not multisig!')
 
    catList = scrAddr[3:]
-   return [catList[20*i:20*(i+1)] for i in range(len(catList)/20)]
+   return [catList[20*i:20*(i+1)] for i in range(len(catList)//20)]
 
 
 ################################################################################
-# These two methods are just easier-to-type wrappers around the C++ methods
-def getTxOutScriptType(script):
-   return TheBridge.scriptUtils.getTxOutScriptType(script)
+# Script classification. Standard txout templates are matched locally and
+# the (scrType, scrAddr, displayStr) result kept in an LRU, so showing a tx
+# does not cost a bridge round trip per output. Scripts that match no
+# template still go to the bridge, once.
+SCRIPT_INFO_CACHE_SIZE = 65536
+scriptInfoCache = BridgeCache('scriptInfo', SCRIPT_INFO_CACHE_SIZE)
 
 ################################################################################
-# These two methods are just easier-to-type wrappers around the C++ methods
-def getTxOutScriptDisplayStr(script):
-   scrAddr = script_to_scrAddr(script)
-   scrType = getTxOutScriptType(script)
+def matchTxOutScriptTemplate(script):
+   """ (scrType, scrAddr) for the standard templates, None otherwise """
+   sz = len(script)
+   if sz == 0:
+      return None
+
+   scrAddr = script_to_scrAddrLocal(script)
+   if scrAddr is not None:
+      return TXOUT_PREFIX_TYPES[scrAddr[:1]], scrAddr
+
+   if sz == 67 and script[0] == 65 and script[66] == 0xac:
+      return CPP_TXOUT_STDPUBKEY65, ADDRBYTE + hash160(script[1:66])
+   if sz == 35 and script[0] == 33 and script[34] == 0xac:
+      return CPP_TXOUT_STDPUBKEY33, ADDRBYTE + hash160(script[1:34])
+   if script[0] == 0x6a:
+      return CPP_TXOUT_OPRETURN, None
+
+   msInfo = matchMultisigScript(script)
+   if msInfo is not None:
+      M, N, pubKeyList = msInfo
+      a160List = sorted([hash160(pk) for pk in pubKeyList])
+      return CPP_TXOUT_MULTISIG, \
+         SCRADDR_MULTISIG_BYTE + bytes([M, N]) + b''.join(a160List)
+
+   return None
+
+################################################################################
+def buildTxOutScriptInfo(script):
+   match = matchTxOutScriptTemplate(script)
+   if match is None:
+      scrType, scrAddr = \
+         TheBridge.scriptUtils.getTxOutScriptType(script), None
+   else:
+      scrType, scrAddr = match
+   if scrAddr is None:
+      scrAddr = script_to_scrAddr(script)
+
    if scrType in CPP_TXOUT_HAS_ADDRSTR:
-      return scrAddr_to_addrStr(scrAddr)
-   elif scrType==CPP_TXOUT_MULTISIG:
-      M, N, addrs, pubs = getMultisigScriptInfo(script)
+      dispStr = scrAddr_to_addrStr(scrAddr)
+   elif scrType == CPP_TXOUT_MULTISIG:
+      M, N = scrAddr[1], scrAddr[2]
       p2shStr = script_to_addrStr(script_to_p2sh_script(script))
-      return '[Multisig %d-of-%d] (not P2SH but would be %s)' % (M,N,p2shStr)
+      dispStr = '[Multisig %d-of-%d] (not P2SH but would be %s)' % (M,N,p2shStr)
    else:
-      return '[Non-Standard Script: %s]: ' % binary_to_hex(scrAddr[1:65])
+      dispStr = '[Non-Standard Script: %s]: ' % binary_to_hex(scrAddr[1:65])
+
+   return scrType, scrAddr, dispStr
+
+################################################################################
+def unpackScriptBuffer(scriptBuffer):
+   """ Splits a buffer of VAR_INT length-prefixed scripts """
+   bu = BinaryUnpacker(scriptBuffer)
+   scriptList = []
+   while bu.getRemainingSize() > 0:
+      scriptList.append(bu.get(BINARY_CHUNK, bu.get(VAR_INT)))
+   return scriptList
+
+################################################################################
+def classifyTxOutScripts(scripts):
+   """
+   Takes a list of txout scripts, or a buffer of them packed with VAR_INT
+   length prefixes, and returns a (scrType, scrAddr, displayStr) tuple for
+   each, in order.
+   """
+   if isinstance(scripts, (bytes, bytearray, memoryview)):
+      scripts = unpackScriptBuffer(scripts)
+
+   infoMap = {}
+   result = []
+   for script in scripts:
+      script = bytes(script)
+      info = infoMap.get(script)
+      if info is None:
+         info = scriptInfoCache.get(script)
+         if info is BridgeCache.MISS:
+            info = buildTxOutScriptInfo(script)
+            scriptInfoCache.put(script, info)
+         infoMap[script] = info
+      result.append(info)
+   return result
+
+################################################################################
+def getTxOutScriptType(script):
+   return classifyTxOutScripts([script])[0][0]
+
+################################################################################
+def getTxOutScriptDisplayStr(script):
+   return classifyTxOutScripts([script])[0][2]
 
 
+################################################################################
+def matchTxInScriptTemplate(script, prevTxHash):
+   """ TxIn script type for the unambiguous cases, None otherwise """
+   sz = len(script)
+   if prevTxHash == b'\x00'*32:
+      return CPP_TXIN_COINBASE
+   if sz == 0:
+      return CPP_TXIN_WITNESS
+   if sz == 23 and script[:3] == b'\x16\x00\x14':
+      return CPP_TXIN_P2WPKH_P2SH
+   if sz == 35 and script[:3] == b'\x22\x00\x20':
+      return CPP_TXIN_P2WSH_P2SH
+
+   # <sig> [<pubkey>]
+   sigLen = script[0]
+   if 9 <= sigLen <= 73 and sz > sigLen and script[1] == 0x30:
+      rest = script[1+sigLen:]
+      if len(rest) == 0:
+         return CPP_TXIN_SPENDPUBKEY
+      if len(rest) == 66 and rest[:2] == b'\x41\x04':
+         return CPP_TXIN_STDUNCOMPR
+      if len(rest) == 34 and rest[0] == 33 and rest[1] in (2, 3):
+         return CPP_TXIN_STDCOMPR
+
+   return None
+
+################################################################################
+def getTxInScriptTypes(txinList):
+   """
+   NOTE: this method takes TXIN objects, not just the scripts.  This
+         is because it needs to see the OutPoint to distinguish an
+         UNKNOWN TxIn from a coinbase-TxIn
+   """
+   result = []
+   for txinObj in txinList:
+      script = bytes(txinObj.binScript)
+      prevTx = txinObj.outpoint.txHash
+      scrType = matchTxInScriptTemplate(script, prevTx)
+      if scrType is None:
+         cacheKey = ('txin', script)
+         scrType = scriptInfoCache.get(cacheKey)
+         if scrType is BridgeCache.MISS:
+            scrType = TheBridge.scriptUtils.getTxInScriptType(script, prevTx)
+            scriptInfoCache.put(cacheKey, scrType)
+      result.append(scrType)
+   return result
+
 ################################################################################
 def getTxInScriptType(txinObj):
    """
@@ -247,9 +389,7 @@ def getTxInScriptType(txinObj):
          is because this method needs to see the OutPoint to distinguish an
          UNKNOWN TxIn from a coinbase-TxIn
    """
-   script = txinObj.binScript
-   prevTx = txinObj.outpoint.txHash
-   return TheBridge.scriptUtils.getTxInScriptType(script, prevTx)
+   return getTxInScriptTypes([txinObj])[0]
 
 ################################################################################
 def getTxInP2SHScriptType(txinObj):
@@ -312,7 +452,57 @@ def TxInExtractPreImageIfAvail(txinObj):
 
 
 ################################################################################
-class PyOutPoint(BlockComponent):
+class CachedBlockComponent(BlockComponent):
+   """
+   BlockComponent that holds on to its serialized bytes (the span it was
+   unserialized from, or the last serialize() result) until one of its
+   SERIALIZED_FIELDS is assigned to. Assignments also bump a generation
+   counter, which containers read through getStamp() to tell whether a
+   child changed since they cached their own bytes.
+
+   In place changes to mutable fields are not seen here, containers check
+   their lists themselves.
+   """
+   SERIALIZED_FIELDS = frozenset()
+   serCache   = None
+   generation = 0
+
+   def __setattr__(self, name, value):
+      if name in self.SERIALIZED_FIELDS:
+         self.__dict__['serCache'] = None
+         self.__dict__['generation'] = self.generation + 1
+      object.__setattr__(self, name, value)
+
+   def getStamp(self):
+      return self.generation
+
+   def isCacheValid(self):
+      return self.serCache is not None
+
+   def setCache(self, binStr):
+      if binStr is not None:
+         self.__dict__['serCache'] = binStr
+
+   def serialize(self):
+      if not self.isCacheValid():
+         self.setCache(BlockComponent.serialize(self))
+      return self.serCache
+
+   def getSerializedSize(self):
+      if self.isCacheValid():
+         return len(self.serCache)
+      return self.getFieldsSize()
+
+   def serializeInto(self, binOut):
+      if self.isCacheValid():
+         binOut.put(BINARY_CHUNK, self.serCache)
+      else:
+         self.packFields(binOut)
+
+################################################################################
+class PyOutPoint(CachedBlockComponent):
+   SERIALIZED_FIELDS = frozenset(['txHash', 'txOutIndex'])
+
    def __init__(self, txHash=None, txOutIndex=None):
       self.txHash     = txHash
       self.txOutIndex = txOutIndex
@@ -329,15 +519,18 @@ class PyOutPoint(BlockComponent):
          opData = BinaryUnpacker( toUnpack )
 
       if opData.getRemainingSize() < 36: raise UnserializeError
+      startPos = opData.getPosition()
       self.txHash = opData.get(BINARY_CHUNK, 32)
       self.txOutIndex = opData.get(UINT32)
+      self.setCache(opData.getSpan(startPos, opData.getPosition()))
       return self
 
-   def serialize(self):
-      binOut = BinaryPacker()
+   def getFieldsSize(self):
+      return 36
+
+   def packFields(self, binOut):
       binOut.put(BINARY_CHUNK, self.txHash)
       binOut.put(UINT32, self.txOutIndex)
-      return binOut.getBinaryString()
 
    def getTxHashStr(self):
       return binascii.hexlify(self.txHash)
@@ -352,7 +545,9 @@ class PyOutPoint(BlockComponent):
 
 
 #####
-class PyTxIn(BlockComponent):
+class PyTxIn(CachedBlockComponent):
+   SERIALIZED_FIELDS = frozenset(['outpoint', 'binScript', 'intSeq'])
+
    def __init__(self):
       self.outpoint   = UNINITIALIZED
       self.binScript  = UNINITIALIZED
@@ -366,27 +561,44 @@ class PyTxIn(BlockComponent):
       else:
          txInData = BinaryUnpacker( toUnpack )
 
+      startPos       = txInData.getPosition()
       self.outpoint  = PyOutPoint().unserialize(txInData.get(BINARY_CHUNK, 36) )
 
       scriptSize     = txInData.get(VAR_INT)
       if txInData.getRemainingSize() < scriptSize+4: raise UnserializeError
       self.binScript = txInData.get(BINARY_CHUNK, scriptSize)
       self.intSeq    = txInData.get(UINT32)
+      self.setCache(txInData.getSpan(startPos, txInData.getPosition()))
       return self
 
+   # the outpoint can be changed in place, it's part of our stamp
+   def getStamp(self):
+      return (self.generation, self.outpoint.getStamp())
+
+   def isCacheValid(self):
+      return self.serCache is not None and \
+         self.outpoint.getStamp() == self.serOutpointStamp
+
+   def setCache(self, binStr):
+      if binStr is not None:
+         self.__dict__['serCache'] = binStr
+         self.__dict__['serOutpointStamp'] = self.outpoint.getStamp()
+
    def getOutPoint(self):
       return self.outpoint
 
    def getScript(self):
       return self.binScript
    
-   def serialize(self):
-      binOut = BinaryPacker()
-      binOut.put(BINARY_CHUNK, self.outpoint.serialize() )
+   def getFieldsSize(self):
+      scriptLen = len(self.binScript)
+      return 40 + varIntSize(scriptLen) + scriptLen
+
+   def packFields(self, binOut):
+      self.outpoint.serializeInto(binOut)
       binOut.put(VAR_INT, len(self.binScript))
       binOut.put(BINARY_CHUNK, self.binScript)
       binOut.put(UINT32, self.intSeq)
-      return binOut.getBinaryString()
 
    def pprint(self, nIndent=0, endian=BIGENDIAN):
       indstr = indent*nIndent
@@ -421,7 +633,9 @@ class PyTxIn(BlockComponent):
       return result
 
 #####
-class PyTxOut(BlockComponent):
+class PyTxOut(CachedBlockComponent):
+   SERIALIZED_FIELDS = frozenset(['value', 'binScript'])
+
    def __init__(self):
       self.value     = UNINITIALIZED
       self.binScript = UNINITIALIZED
@@ -432,10 +646,12 @@ class PyTxOut(BlockComponent):
       else:
          txOutData = BinaryUnpacker( toUnpack )
 
+      startPos         = txOutData.getPosition()
       self.value       = txOutData.get(UINT64)
       scriptSize       = txOutData.get(VAR_INT)
       if txOutData.getRemainingSize() < scriptSize: raise UnserializeError
       self.binScript = txOutData.get(BINARY_CHUNK, scriptSize)
+      self.setCache(txOutData.getSpan(startPos, txOutData.getPosition()))
       return self
 
    def getValue(self):
@@ -447,12 +663,14 @@ class PyTxOut(BlockComponent):
    def getScrAddressStr(self):
       return script_to_addrStr(self.binScript)
 
-   def serialize(self):
-      binOut = BinaryPacker()
+   def getFieldsSize(self):
+      scriptLen = len(self.binScript)
+      return 8 + varIntSize(scriptLen) + scriptLen
+
+   def packFields(self, binOut):
       binOut.put(UINT64, self.value)
       binOut.put(VAR_INT, len(self.binScript))
       binOut.put(BINARY_CHUNK, self.binScript)
-      return binOut.getBinaryString()
 
    def pprint(self, nIndent=0, endian=BIGENDIAN):
       print(self.toString(nIndent, endian))
@@ -507,18 +725,28 @@ class PyTxWitness(BlockComponent):
    def getWitnesses(self):
       return self.binWitness
 
+   # the stack is a plain list, changed in place, so it is its own stamp
+   def getStamp(self):
+      if self.binWitness is UNINITIALIZED:
+         return None
+      return tuple(self.binWitness)
+
    def getSize(self):
       if self.binWitness != UNINITIALIZED:
          return len(self.binWitness)
       return 0
 
-   def serialize(self):
-      binOut = BinaryPacker()
+   def getSerializedSize(self):
+      size = varIntSize(self.binWitness[0])
+      for i in range(1, len(self.binWitness), 2):
+         size += varIntSize(self.binWitness[i]) + len(self.binWitness[i+1])
+      return size
+
+   def serializeInto(self, binOut):
       binOut.put(VAR_INT, self.binWitness[0])
       for i in range(1, len(self.binWitness), 2):
          binOut.put(VAR_INT, self.binWitness[i])
          binOut.put(BINARY_CHUNK, self.binWitness[i+1])
-      return binOut.getBinaryString()
 
    def pprint(self, nIndent=0, endian=BIGENDIAN):
       print(self.toString(nIndent, endian))
@@ -535,13 +763,17 @@ class PyTxWitness(BlockComponent):
       return result
 
 #####
-class PyTx(BlockComponent):
+class PyTx(CachedBlockComponent):
+   SERIALIZED_FIELDS = frozenset(['version', 'inputs', 'outputs', \
+      'lockTime', 'witnesses', 'useWitness'])
+
    def __init__(self):
+      self.txCache    = {}
+      self.txSnapshot = None
       self.version    = UNINITIALIZED
       self.inputs     = UNINITIALIZED
       self.outputs    = UNINITIALIZED
       self.lockTime   = 0
-      self.thisHash   = UNINITIALIZED
       self.rbfFlag    = False
       self.witnesses  = UNINITIALIZED
       self.useWitness = False
@@ -550,35 +782,104 @@ class PyTx(BlockComponent):
    def isInitialized(self):
       return self.size != 0
 
-   def serialize(self):
-      binOut = BinaryPacker()
+   #############################################################################
+   # serialized bytes and hashes are cached against a snapshot of our own
+   # generation and the stamps of every child component, any assignment to
+   # a field (here or in a txin/txout/witness) or in place edit of the
+   # lists invalidates them
+   def getSnapshot(self):
+      children = []
+      if self.inputs is not UNINITIALIZED:
+         children.extend(self.inputs)
+      if self.outputs is not UNINITIALIZED:
+         children.extend(self.outputs)
+      if self.useWitness and self.witnesses is not UNINITIALIZED:
+         children.extend(self.witnesses)
+      return (self.generation, tuple(children), \
+         tuple([child.getStamp() for child in children]))
+
+   def isSnapshotCurrent(self):
+      if self.txSnapshot is None:
+         return False
+      generation, children, stamps = self.getSnapshot()
+      prevGeneration, prevChildren, prevStamps = self.txSnapshot
+      if generation != prevGeneration or stamps != prevStamps or \
+         len(children) != len(prevChildren):
+         return False
+      for cur, prev in zip(children, prevChildren):
+         if cur is not prev:
+            return False
+      return True
+
+   def getCached(self, key):
+      if not self.txCache or not self.isSnapshotCurrent():
+         return None
+      return self.txCache.get(key)
+
+   def setCached(self, key, value):
+      if not self.isSnapshotCurrent():
+         #state moved on, drop everything computed against the old one
+         self.txCache.clear()
+         self.txSnapshot = self.getSnapshot()
+      self.txCache[key] = value
+      return value
+
+   def invalidateCache(self):
+      self.txCache.clear()
+      self.txSnapshot = None
+
+   #############################################################################
+   def getSerializedSize(self, withWitness=True):
+      withWitness = withWitness and self.useWitness
+      cached = self.getCached('wit' if withWitness else 'nowit')
+      if cached is not None:
+         return len(cached)
+
+      size = 8 + varIntSize(len(self.inputs)) + varIntSize(len(self.outputs))
+      for txin in self.inputs:
+         size += txin.getSerializedSize()
+      for txout in self.outputs:
+         size += txout.getSerializedSize()
+      if withWitness:
+         size += 2
+         for witItem in self.witnesses:
+            size += witItem.getSerializedSize()
+      return size
+
+   def serializeInto(self, binOut, withWitness=True):
+      withWitness = withWitness and self.useWitness
+      cached = self.getCached('wit' if withWitness else 'nowit')
+      if cached is not None:
+         binOut.put(BINARY_CHUNK, cached)
+         return
+
       binOut.put(UINT32, self.version)
-      if self.useWitness:
+      if withWitness:
          binOut.put(UINT8, WITNESS_MARKER)
          binOut.put(UINT8, WITNESS_FLAG)
       binOut.put(VAR_INT, len(self.inputs))
       for txin in self.inputs:
-         binOut.put(BINARY_CHUNK, txin.serialize())
+         txin.serializeInto(binOut)
       binOut.put(VAR_INT, len(self.outputs))
       for txout in self.outputs:
-         binOut.put(BINARY_CHUNK, txout.serialize())
-      if self.useWitness:
+         txout.serializeInto(binOut)
+      if withWitness:
          for witItem in self.witnesses:
-            binOut.put(BINARY_CHUNK, witItem.serialize())
+            witItem.serializeInto(binOut)
       binOut.put(UINT32, self.lockTime)
-      return binOut.getBinaryString()
+
+   def serialize(self, withWitness=True):
+      key = 'wit' if withWitness and self.useWitness else 'nowit'
+      cached = self.getCached(key)
+      if cached is not None:
+         return cached
+
+      binOut = BufferPacker(self.getSerializedSize(withWitness))
+      self.serializeInto(binOut, withWitness)
+      return self.setCached(key, binOut.getBinaryString())
 
    def serializeWithoutWitness(self):
-      binOut = BinaryPacker()
-      binOut.put(UINT32, self.version)
-      binOut.put(VAR_INT, len(self.inputs))
-      for txin in self.inputs:
-         binOut.put(BINARY_CHUNK, txin.serialize())
-      binOut.put(VAR_INT, len(self.outputs))
-      for txout in self.outputs:
-         binOut.put(BINARY_CHUNK, txout.serialize())
-      binOut.put(UINT32, self.lockTime)
-      return binOut.getBinaryString()
+      return self.serialize(False)
 
    def unserialize(self, toUnpack):
       txsize = 0
@@ -615,7 +916,11 @@ class PyTx(BlockComponent):
       self.lockTime   = txData.get(UINT32)
       endPos = txData.getPosition()
       self.nBytes = endPos - startPos
-      self.thisHash = hash256(self.serializeWithoutWitness())
+
+      #keep the raw bytes, serialize() won't have to rebuild them
+      rawTx = txData.getSpan(startPos, endPos)
+      if rawTx is not None:
+         self.setCached('wit' if self.useWitness else 'nowit', rawTx)
 
       self.size = txsize
       return self
@@ -633,7 +938,16 @@ class PyTx(BlockComponent):
       return self.inputs[id]
 
    def getHash(self):
-      return self.thisHash
+      cached = self.getCached('hash')
+      if cached is not None:
+         return cached
+      return self.setCached('hash', hash256(self.serializeWithoutWitness()))
+
+   @property
+   def thisHash(self):
+      if self.inputs is UNINITIALIZED:
+         return UNINITIALIZED
+      return self.getHash()
 
    def getHashHex(self, endianness=LITTLEENDIAN):
       return binary_to_hex(self.getHash(), endOut=endianness)
@@ -667,10 +981,10 @@ class PyTx(BlockComponent):
       such as public keys and multi-sig type (M-of-N)
       """
       recipInfoList = []
-      for txout in self.outputs:
+      scriptInfo = classifyTxOutScripts([txout.binScript for txout in self.outputs])
+      for txout,(scrType,_,_) in zip(self.outputs, scriptInfo):
          recipInfoList.append([])
 
-         scrType = getTxOutScriptType(txout.binScript)
          recipInfoList[-1].append(scrType)
          recipInfoList[-1].append(txout.value)
          recipInfoList[-1].append(txout.binScript)
@@ -836,36 +1150,204 @@ def generatePreHashTxMsgToSign(pytx, txInIndex, prevTxOutScript, hashcode=1):
    into a few simple lines of code!
    (blank all scripts except this one, insert prev script, append hashcode)
 
-   Right now only supports SIGHASH_ALL
+   Use a SigHashEngine directly when signing more than one input of the
+   same tx, it reuses the parts of the message all inputs share.
    """
-   if not hashcode == 1:
-      # NO OTHER HASHCODES HAVE BEEN TESTED
-      LOGERROR('Only hashcode=1 is supported at this time!')
-      LOGERROR('Requested hashcode=%d' % hashcode)
+   preHashMsg = SigHashEngine(pytx).getLegacyPreimage( \
+      txInIndex, prevTxOutScript, hashcode)
+   if preHashMsg is None:
+      LOGERROR('SIGHASH_SINGLE without a matching output (input %d)', txInIndex)
       return None
 
-   # Create a copy of the tx with all scripts blanked out
-   txCopy = pytx.copyWithoutWitness()
-   for i in range(len(txCopy.inputs)):
-      txCopy.inputs[i].binScript = ''
+   hashCode1  = int_to_binary(hashcode, widthBytes=1)
+   return preHashMsg, hashCode1
 
-   # Set the script of the TxIn being signed, to the previous TxOut script
-   txCopy.inputs[txInIndex].binScript = prevTxOutScript
-   
-   # Remove outputs given SIGHASH type (DISABLED DUE TO FIRST CONDITIONAL ABOVE)
-   if hashcode & 0x7fffffff == SIGHASH_NONE:
-      txCopy.outputs = []
-   elif hashcode & 0x7fffffff == SIGHASH_SINGLE:
-      txCopy.outputs = [txCopy.outputs[txInIndex]]
 
-   # Remove all other inputs if needed (DISABLED DUE TO FIRST CONDITIONAL ABOVE)
-   if hashcode & SIGHASH_ANYONECANPAY:
-      txCopy.inputs = [txCopy.inputs[txInIndex]]
+SIGHASH_ZERO = b'\x00'*32
 
-   hashCode1  = int_to_binary(hashcode, widthBytes=1)
-   hashCode4  = int_to_binary(hashcode, widthBytes=4, endOut=LITTLEENDIAN)
-   preHashMsg = txCopy.serialize() + hashCode4
-   return preHashMsg, hashCode1
+# sighash "one", signed by SIGHASH_SINGLE inputs without a matching output
+SIGHASH_SINGLE_BUG = b'\x01' + b'\x00'*31
+
+################################################################################
+class SigHashEngine(object):
+   """
+   Computes the signature messages (preimages) and hashes for the inputs
+   of a tx without copying and blanking the whole tx for every input.
+
+   Everything that doesn't depend on the input being signed is serialized
+   once: version, outpoints, sequences, outputs and locktime, as well as
+   the BIP143 hashPrevouts/hashSequence/hashOutputs midstates (computed on
+   first use).  A legacy preimage still has to cover every input, but it
+   is now a join of cached chunks, and getSigHashesForAllInputs carries a
+   running sha256 state over the shared prefix.
+
+   Holds on to the serialized parts: build a new engine if the tx changes.
+   """
+
+   #############################################################################
+   def __init__(self, pytx):
+      self.numInputs  = len(pytx.inputs)
+      self.version    = pytx.version.to_bytes(4, 'little')
+      self.lockTime   = pytx.lockTime.to_bytes(4, 'little')
+      self.outpoints  = [txin.outpoint.serialize() for txin in pytx.inputs]
+      self.sequences  = \
+         [txin.intSeq.to_bytes(4, 'little') for txin in pytx.inputs]
+      self.txOuts     = [txout.serialize() for txout in pytx.outputs]
+
+      # input with an empty script, as every other input is for SIGHASH_ALL
+      self.blankInputs = [op + b'\x00' + seq \
+         for op,seq in zip(self.outpoints, self.sequences)]
+      self.allOutputs = varIntToBinary(len(self.txOuts)) + b''.join(self.txOuts)
+      self.numInputsBin = varIntToBinary(self.numInputs)
+
+      self.hashPrevouts = None
+      self.hashSequence = None
+      self.hashOutputs  = None
+
+   #############################################################################
+   def checkIndex(self, txInIndex):
+      if not 0 <= txInIndex < self.numInputs:
+         raise SignatureError('TxIn index is out of range for this tx')
+
+   #############################################################################
+   def getLegacyPreimage(self, txInIndex, scriptCode, hashcode=SIGHASH_ALL):
+      """
+      Original (pre-segwit) signature message.  Returns None for the
+      SIGHASH_SINGLE case without a matching output, there is no message to
+      sign, the hash is SIGHASH_SINGLE_BUG.
+      """
+      self.checkIndex(txInIndex)
+      baseType = hashcode & 0x1f
+      anyoneCanPay = hashcode & SIGHASH_ANYONECANPAY
+
+      if baseType == SIGHASH_SINGLE and txInIndex >= len(self.txOuts):
+         return None
+
+      thisInput = b''.join([self.outpoints[txInIndex],
+         varIntToBinary(len(scriptCode)), scriptCode,
+         self.sequences[txInIndex]])
+
+      # NONE and SINGLE let the other inputs update their sequence
+      if anyoneCanPay:
+         inputs = [b'\x01', thisInput]
+      elif baseType in (SIGHASH_NONE, SIGHASH_SINGLE):
+         zeroSeq = b'\x00'*4
+         inputs = [self.numInputsBin]
+         for i in range(self.numInputs):
+            if i == txInIndex:
+               inputs.append(thisInput)
+            else:
+               inputs.append(self.outpoints[i] + b'\x00' + zeroSeq)
+      else:
+         inputs = [self.numInputsBin]
+         inputs.extend(self.blankInputs[:txInIndex])
+         inputs.append(thisInput)
+         inputs.extend(self.blankInputs[txInIndex+1:])
+
+      if baseType == SIGHASH_NONE:
+         outputs = b'\x00'
+      elif baseType == SIGHASH_SINGLE:
+         # outputs before ours are kept as value -1 and an empty script
+         blankOut = b'\xff'*8 + b'\x00'
+         outputs = varIntToBinary(txInIndex+1) + blankOut*txInIndex + \
+            self.txOuts[txInIndex]
+      else:
+         outputs = self.allOutputs
+
+      return b''.join([self.version] + inputs + [outputs, self.lockTime,
+         hashcode.to_bytes(4, 'little')])
+
+   #############################################################################
+   def getSegwitPreimage(self, txInIndex, scriptCode, value,
+                                                   hashcode=SIGHASH_ALL):
+      """ BIP143 signature message """
+      self.checkIndex(txInIndex)
+      baseType = hashcode & 0x1f
+      anyoneCanPay = hashcode & SIGHASH_ANYONECANPAY
+
+      hashPrevouts = SIGHASH_ZERO
+      if not anyoneCanPay:
+         if self.hashPrevouts is None:
+            self.hashPrevouts = hash256(b''.join(self.outpoints))
+         hashPrevouts = self.hashPrevouts
+
+      hashSequence = SIGHASH_ZERO
+      if not anyoneCanPay and baseType not in (SIGHASH_NONE, SIGHASH_SINGLE):
+         if self.hashSequence is None:
+            self.hashSequence = hash256(b''.join(self.sequences))
+         hashSequence = self.hashSequence
+
+      hashOutputs = SIGHASH_ZERO
+      if baseType not in (SIGHASH_NONE, SIGHASH_SINGLE):
+         if self.hashOutputs is None:
+            self.hashOutputs = hash256(b''.join(self.txOuts))
+         hashOutputs = self.hashOutputs
+      elif baseType == SIGHASH_SINGLE and txInIndex < len(self.txOuts):
+         hashOutputs = hash256(self.txOuts[txInIndex])
+
+      return b''.join([self.version, hashPrevouts, hashSequence,
+         self.outpoints[txInIndex], varIntToBinary(len(scriptCode)),
+         scriptCode, value.to_bytes(8, 'little'),
+         self.sequences[txInIndex], hashOutputs, self.lockTime,
+         hashcode.to_bytes(4, 'little')])
+
+   #############################################################################
+   def getSigHash(self, txInIndex, scriptCode, hashcode=SIGHASH_ALL,
+                                             value=None, isSegWit=False):
+      if isSegWit:
+         return hash256(self.getSegwitPreimage( \
+            txInIndex, scriptCode, value, hashcode))
+
+      preimage = self.getLegacyPreimage(txInIndex, scriptCode, hashcode)
+      if preimage is None:
+         return SIGHASH_SINGLE_BUG
+      return hash256(preimage)
+
+   #############################################################################
+   def getSigHashesForAllInputs(self, scriptCodes, hashcode=SIGHASH_ALL,
+                                             values=None, segWitFlags=None):
+      """
+      Sighash of every input, scriptCodes[i] is the script signed for input
+      i (prev txout script, P2SH redeem script or BIP143 script code).
+      values and segWitFlags are only needed if some inputs are segwit.
+      """
+      if len(scriptCodes) != self.numInputs:
+         raise SignatureError('Need one script per input to compute sighashes')
+
+      if segWitFlags is None:
+         segWitFlags = [False]*self.numInputs
+      if values is None:
+         values = [None]*self.numInputs
+
+      # SIGHASH_ALL legacy inputs share everything ahead of the input being
+      # signed, keep a running sha256 over it instead of rehashing it
+      prefixState = None
+      if hashcode == SIGHASH_ALL:
+         prefixState = hashlib.sha256(self.version + self.numInputsBin)
+         tailHashcode = self.lockTime + hashcode.to_bytes(4, 'little')
+
+      sigHashes = []
+      for i in range(self.numInputs):
+         if segWitFlags[i]:
+            sigHashes.append(self.getSigHash(i, scriptCodes[i], hashcode,
+               values[i], True))
+         elif prefixState is not None:
+            hasher = prefixState.copy()
+            hasher.update(self.outpoints[i])
+            hasher.update(varIntToBinary(len(scriptCodes[i])))
+            hasher.update(scriptCodes[i])
+            hasher.update(self.sequences[i])
+            hasher.update(b''.join(self.blankInputs[i+1:]))
+            hasher.update(self.allOutputs)
+            hasher.update(tailHashcode)
+            sigHashes.append(sha256(hasher.digest()))
+         else:
+            sigHashes.append(self.getSigHash(i, scriptCodes[i], hashcode))
+
+         if prefixState is not None:
+            prefixState.update(self.blankInputs[i])
+
+      return sigHashes
 
 
 
@@ -1135,6 +1617,26 @@ class UnsignedTxInput(AsciiSerializable):
       signStat = self.evaluateSigningStatus(signer)
       return signStat.allSigned
 
+   #############################################################################
+   def getSigChecks(self, sigHashEngine, txInIndex):
+      """
+      Returns [msIndex, (sigHash, pubKey, derSig)] for every multisig slot
+      holding both a signature and a public key
+      """
+      sigHashScript = self.getSigHashScript()
+      if sigHashScript is None or not self.signatures or not self.pubKeys:
+         return []
+
+      scriptCode, isSegWit = sigHashScript
+      sigChecks = []
+      for msIndex,(sig,pubKey) in enumerate(zip(self.signatures, self.pubKeys)):
+         if not sig or not pubKey:
+            continue
+         sigHash = sigHashEngine.getSigHash(txInIndex, scriptCode, sig[-1],
+                                            self.value, isSegWit)
+         sigChecks.append([msIndex, (sigHash, pubKey, sig[:-1])])
+      return sigChecks
+
    #############################################################################
    def toJSONMap(self, lite=False):
       outjson = {}
@@ -1400,6 +1902,28 @@ class UnsignedTxInput(AsciiSerializable):
             val=self.value,
             fullScript=self.txoScript)
    
+   #############################################################################
+   def getSigHashScript(self):
+      """
+      Returns (script signed over, isSegWit) for this input, or None if
+      the P2SH/witness script needed to tell is missing from p2shMap
+      """
+      script = self.txoScript
+      if len(script) == 23 and script[:2] == b'\xa9\x14' and \
+         script[-1:] == b'\x87':
+         script = self.p2shMap.get(BASE_SCRIPT)
+         if script is None:
+            return None
+
+      if len(script) == 22 and script[:2] == b'\x00\x14':
+         return hash160_to_p2pkhash_script(script[2:]), True
+      if len(script) == 34 and script[:2] == b'\x00\x20':
+         witnessScript = self.p2shMap.get(script)
+         if witnessScript is None:
+            return None
+         return witnessScript, True
+      return script, False
+
    #############################################################################
    def getP2shMapForSigner(self):
       p2sh_map = {}
@@ -1969,6 +2493,7 @@ class UnsignedTransaction(AsciiSerializable):
                                 pubKeyMap=None, txMap=None, p2shMap=None,
                                 lockTime=0):
 
+      from armoryengine.CoinSelection import sumTxOutList
       totalUtxoSum = sumTxOutList(utxoSelection)
       totalOutputSum = sum([a[1] for a in scriptValuePairs])
       if not totalUtxoSum >= totalOutputSum:
@@ -2198,9 +2723,65 @@ class UnsignedTransaction(AsciiSerializable):
       return txSigStat
 
    #############################################################################
-   def verifySigsAllInputs(self):
+   def getSigHashesForAllInputs(self, hashcode=SIGHASH_ALL):
+      """
+      Sighash of every input of the unsigned tx, None for inputs we don't
+      have the P2SH/witness script for
+      """
+      scriptCodes, values, segWitFlags, known = [], [], [], []
       for ustxi in self.ustxInputs:
-         if not ustxi.verifyAllSignatures(self.signer):
+         sigHashScript = ustxi.getSigHashScript()
+         known.append(sigHashScript is not None)
+         if sigHashScript is None:
+            sigHashScript = (b'', False)
+         scriptCodes.append(sigHashScript[0])
+         segWitFlags.append(sigHashScript[1])
+         values.append(ustxi.value)
+
+      engine = SigHashEngine(self.pytxObj)
+      sigHashes = engine.getSigHashesForAllInputs( \
+         scriptCodes, hashcode, values, segWitFlags)
+      return [h if ok else None for h,ok in zip(sigHashes, known)]
+
+   #############################################################################
+   def verifyLocalSignatures(self, verifier=None):
+      """
+      Checks the signatures carried by the inputs themselves, without going
+      through the bridge signer.  Returns one list per input, holding
+      True/False per multisig slot, or None for slots without a signature.
+
+      Results are memoized by the verifier, so after a new signature is
+      inserted, only that one is actually verified.
+      """
+      if verifier is None:
+         verifier = TheSigVerifier
+
+      engine = SigHashEngine(self.pytxObj)
+      results = []
+      slotList = []
+      checkList = []
+      for iin,ustxi in enumerate(self.ustxInputs):
+         results.append([None] * len(ustxi.signatures or []))
+         for msIndex,sigCheck in ustxi.getSigChecks(engine, iin):
+            slotList.append((iin, msIndex))
+            checkList.append(sigCheck)
+
+      for (iin,msIndex),isValid in \
+         zip(slotList, verifier.verifyBatch(checkList)):
+         results[iin][msIndex] = isValid
+      return results
+
+   #############################################################################
+   def verifySigsAllInputs(self):
+      # signatures carried by the inputs (inserted locally, or no signer at
+      # all) are checked here in one memoized batch. The bridge signer only
+      # knows the ones it made or loaded, it is asked about the other inputs
+      localResults = self.verifyLocalSignatures()
+      for ustxi,slotResults in zip(self.ustxInputs, localResults):
+         if slotResults.count(None) < len(slotResults) or self.signer is None:
+            if slotResults.count(True) < max(ustxi.sigsNeeded, 1):
+               return False
+         elif not ustxi.verifyAllSignatures(self.signer):
             return False
       return True
       
@@ -10,10 +10,11 @@ from __future__ import (absolute_import, division,
 from armoryengine.ArmoryUtils import *
 from armoryengine.MultiSigUtils import readLockboxEntryStr, calcLockboxID, \
    isBareLockbox, isP2SHLockbox
-from armoryengine.Transaction import getTxOutScriptType, getMultisigScriptInfo
-from armoryengine.CppBridge import TheBridge, BridgeError
+from armoryengine.Transaction import getTxOutScriptType, getMultisigScriptInfo, \
+   classifyTxOutScripts
 from armoryengine.AddressUtils import script_to_scrAddr, script_to_addrStr, \
-   scrAddr_to_addrStr
+   scrAddr_to_addrStr, addrStr_to_scrAddr, scrAddr_to_script, \
+   addrStr_is_bech32
 
 #############################################################################
 def getScriptForUserStringImpl(userStr, wltMap, lboxList):
@@ -87,9 +88,10 @@ def getScriptForUserStringImpl(userStr, wltMap, lboxList):
             scrAddr = script_to_scrAddr(outScript)
             wltID = getWltIDForScrAddr(a160, wltMap)
       else:
-         scrAddr = TheBridge.utils.getScrAddrForAddrStr(userStr)
-         outScript = TheBridge.scriptUtils.getTxOutScriptForScrAddr(scrAddr)
+         scrAddr = addrStr_to_scrAddr(userStr)
+         outScript = scrAddr_to_script(scrAddr)
          hasAddrInIt = True
+         isBech32 = addrStr_is_bech32(userStr)
 
          # Check if it's a wallet scrAddr
          wltID = getWltIDForScrAddr(scrAddr, wltMap)
@@ -169,8 +171,7 @@ def getDisplayStringForScriptImpl(binScript, wltMap, lboxList, maxChars=256,
       LOGERROR('getDisplayStringForScript() req at least 32 bytes output')
       return None
 
-   scriptType = getTxOutScriptType(binScript) 
-   scrAddr = script_to_scrAddr(binScript)
+   scriptType, scrAddr, _ = classifyTxOutScripts([binScript])[0]
 
    if scriptType != CPP_TXOUT_OPRETURN:
       wlt = None
@@ -277,11 +278,7 @@ def getDisplayStringForScriptImpl(binScript, wltMap, lboxList, maxChars=256,
    # If we're here, it didn't match any loaded wlt or lockbox
    dispStr = ''
    if scriptType == CPP_TXOUT_P2WPKH or scriptType == CPP_TXOUT_P2WSH:
-      try:
-         dispStr = TheBridge.scriptUtils.getAddrStrForScrAddr(binScript)
-      except BridgeError as e:
-         scrAddr = TheBridge.scriptUtils.getScrAddrForScript(binScript)
-         dispStr = TheBridge.scriptUtils.getAddrStrForScrAddr(scrAddr)
+      dispStr = scrAddr_to_addrStr(scrAddr)
       addrStr = dispStr
    elif scriptType in CPP_TXOUT_HAS_ADDRSTR:
       addrStr = script_to_addrStr(binScript)
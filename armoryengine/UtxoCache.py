@@ -0,0 +1,237 @@
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+
+"""
+Per wallet UTXO cache.
+
+The full UTXO list is fetched from the bridge once, then kept current from
+BDM notifications instead of being fetched again on every call:
+
+   - NEW_ZC_ACTION: outputs spent by the wallet's zero conf txs are dropped,
+     the (small) ZC and RBF lists are refetched
+   - NEW_BLOCK_ACTION: confirmation counts move up. If the height did not
+     grow, outputs at or above it are rolled back as a reorg
+   - REFRESH_ACTION naming the wallet: full resync
+
+Notifications only flag what changed, the work happens on the next read.
+Before serving an incrementally updated set, the cache compares the gap
+between the wallet's spendable balance and the cached total against the
+one seen at the last full sync. A mismatch means some change could not be
+derived from the notifications (incoming funds, reorged spends...) and
+triggers a full resync.
+"""
+
+import threading
+
+from armoryengine.ArmoryUtils import LOGWARN, LOGEXCEPT
+from armoryengine.BDM import NEW_ZC_ACTION, NEW_BLOCK_ACTION, REFRESH_ACTION
+from armoryengine.UtxoSet import UtxoSet
+
+FULL_UTXO_LIST_VALUE = 2**64 - 1
+
+################################################################################
+class WalletUtxoCache(object):
+
+   #############################################################################
+   def __init__(self, bridgeWalletObj, walletId, getTopHeight=None,
+                getTxByHash=None):
+      self.bridgeWalletObj = bridgeWalletObj
+      self.walletId = walletId
+      if getTopHeight is None:
+         from armoryengine.BDM import TheBDM
+         getTopHeight = TheBDM.getTopBlockHeight
+      if getTxByHash is None:
+         from armoryengine.CppBridge import TheBridge
+         getTxByHash = TheBridge.service.getTxByHash
+      self.getTopHeight = getTopHeight
+      self.getTxByHash = getTxByHash
+
+      self.utxoSet = None
+      self.zcSet = None
+      self.rbfSet = None
+      self.syncHeight = None
+      self.balanceGap = None
+
+      # notifications come in on the bridge dispatcher, they only touch
+      # the pending state under eventLock. Bridge calls happen under
+      # syncLock so a notification never waits on a fetch
+      self.eventLock = threading.Lock()
+      self.syncLock = threading.RLock()
+      self.resetPending()
+      self.needsResync = True
+
+      self.fullSyncCount = 0
+      self.incrementalCount = 0
+
+   #############################################################################
+   def resetPending(self):
+      self.needsResync = False
+      self.spentTxHashes = []
+      self.rollbackHeight = None
+      self.newHeight = None
+      self.zcDirty = False
+
+   #############################################################################
+   def onNotification(self, action, *args):
+      if action == NEW_ZC_ACTION:
+         txHashes = [ledger.hash for ledger in args \
+                                       if ledger.id == self.walletId]
+         if not txHashes:
+            return
+
+         self.eventLock.acquire()
+         self.spentTxHashes.extend(txHashes)
+         self.zcDirty = True
+         self.eventLock.release()
+
+      elif action == NEW_BLOCK_ACTION:
+         height = args[0]
+         self.eventLock.acquire()
+         if self.syncHeight is not None and height <= self.syncHeight:
+            if self.rollbackHeight is None or height < self.rollbackHeight:
+               self.rollbackHeight = height
+         self.newHeight = height
+         self.zcDirty = True
+         self.eventLock.release()
+
+      elif action == REFRESH_ACTION:
+         if args and self.walletId not in args:
+            return
+         self.invalidate()
+
+   #############################################################################
+   def invalidate(self):
+      self.eventLock.acquire()
+      self.needsResync = True
+      self.eventLock.release()
+
+   #############################################################################
+   def getUtxoSet(self):
+      self.sync()
+      return self.utxoSet.copy()
+
+   #############################################################################
+   def getZCUtxoSet(self):
+      self.sync()
+      return self.zcSet.copy()
+
+   #############################################################################
+   def getRBFUtxoSet(self):
+      self.sync()
+      return self.rbfSet.copy()
+
+   #############################################################################
+   def getUtxosForValue(self, value):
+      """ Rows in bridge order, up to the first one that covers value """
+      self.sync()
+      if value >= self.utxoSet.getBalance():
+         return self.utxoSet.copy()
+
+      total = 0
+      rows = []
+      values = self.utxoSet.values
+      for row in range(len(values)):
+         rows.append(row)
+         total += values[row]
+         if total >= value:
+            break
+      return self.utxoSet.subset(rows)
+
+   #############################################################################
+   def sync(self):
+      self.syncLock.acquire()
+      try:
+         self.eventLock.acquire()
+         needsResync = self.needsResync or self.utxoSet is None
+         spentTxHashes = self.spentTxHashes
+         rollbackHeight = self.rollbackHeight
+         newHeight = self.newHeight
+         zcDirty = self.zcDirty
+         self.resetPending()
+         self.eventLock.release()
+
+         if needsResync:
+            self.fullSync()
+            return
+
+         if rollbackHeight is None and newHeight is None and \
+            not spentTxHashes and not zcDirty:
+            return
+
+         self.incrementalCount += 1
+         if rollbackHeight is not None:
+            self.rollbackFrom(rollbackHeight)
+
+         if spentTxHashes and not self.removeSpent(spentTxHashes):
+            self.fullSync()
+            return
+
+         if newHeight is not None:
+            self.syncHeight = newHeight
+            self.utxoSet.updateConfs(newHeight)
+
+         if zcDirty:
+            self.fetchZC()
+
+         if not self.isConsistent():
+            LOGWARN('UTXO cache for %s out of sync, refetching', self.walletId)
+            self.fullSync()
+      finally:
+         self.syncLock.release()
+
+   #############################################################################
+   def fullSync(self):
+      self.fullSyncCount += 1
+      self.syncHeight = self.getTopHeight()
+      utxoList = self.bridgeWalletObj.getUtxosForValue(FULL_UTXO_LIST_VALUE)
+      self.utxoSet = UtxoSet.fromBridgeUtxos(utxoList.utxo, self.syncHeight)
+      self.fetchZC()
+
+      balance = self.bridgeWalletObj.getBalanceAndCount()
+      self.balanceGap = balance.spendable - self.utxoSet.getBalance()
+
+   #############################################################################
+   def fetchZC(self):
+      self.zcSet = UtxoSet.fromBridgeUtxos(
+         self.bridgeWalletObj.getSpendableZCList().utxo, self.syncHeight)
+      self.rbfSet = UtxoSet.fromBridgeUtxos(
+         self.bridgeWalletObj.getRBFTxOutList().utxo, self.syncHeight)
+
+   #############################################################################
+   def rollbackFrom(self, height):
+      """ Drops the outputs mined at or above height """
+      heights = self.utxoSet.heights
+      self.utxoSet = self.utxoSet.subset(
+         [r for r in range(len(heights)) if heights[r] < height])
+
+   #############################################################################
+   def removeSpent(self, txHashes):
+      from armoryengine.Transaction import PyTx
+
+      spent = set()
+      try:
+         for txHash in txHashes:
+            tx = self.getTxByHash(txHash)
+            if tx is None:
+               return False
+            for txin in PyTx().unserialize(tx.raw).inputs:
+               spent.add((txin.outpoint.txHash, txin.outpoint.txOutIndex))
+      except:
+         LOGEXCEPT('Failed to resolve zero conf spends')
+         return False
+
+      spentRows = set(self.utxoSet.getRowsByOutpoint(spent))
+      if spentRows:
+         self.utxoSet = self.utxoSet.subset(
+            [r for r in range(len(self.utxoSet)) if r not in spentRows])
+      return True
+
+   #############################################################################
+   def isConsistent(self):
+      balance = self.bridgeWalletObj.getBalanceAndCount()
+      return balance.spendable - self.utxoSet.getBalance() == self.balanceGap
@@ -0,0 +1,308 @@
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+
+"""
+Columnar UTXO container.
+
+A PyUnspentTxOut per output costs around 500 bytes once its attribute dict,
+hex hash copy and script are counted, which adds up quickly for wallets with
+100k+ outputs. UtxoSet keeps the numeric fields in arrays, the tx hashes in a
+single bytearray and interns scrAddrs and scripts (most outputs of a wallet
+pay to a few addresses), for around 100 bytes per output.
+
+Rows are read through UtxoView, which has the PyUnspentTxOut accessors but
+looks its fields up in the set (and has no instance dict), so code written
+against utxo lists keeps working:
+
+   utxoSet = UtxoSet.fromBridgeUtxos(reply.utxo)
+   for utxo in utxoSet.subset(utxoSet.getRowsByConf(6)):
+      print(utxo.getValue(), utxo.getTxHashStr())
+
+Zero conf outputs keep the bridge's UINT32_MAX height (and their ZC id as
+tx index), the height and index columns are 64 bit for that reason. Their
+confirmation count is 0.
+"""
+
+from array import array
+
+from armoryengine.ArmoryUtils import binary_to_hex, UINT32_MAX
+from armoryengine.CoinSelection import UnspentTxOutBase
+
+TXHASH_SIZE = 32
+DEFAULT_SEQUENCE = 2**32-1
+ZC_HEIGHT = UINT32_MAX
+
+################################################################################
+class UtxoView(UnspentTxOutBase):
+   """
+   Lazy row of a UtxoSet. Writes to sequence and checked go to the set, so
+   coin control edits stick no matter which view made them.
+   """
+   __slots__ = ('utxoSet', 'row')
+
+   #############################################################################
+   def __init__(self, utxoSet, row):
+      self.utxoSet = utxoSet
+      self.row     = row
+
+   scrAddr    = property(lambda self: self.utxoSet.getScrAddr(self.row))
+   txHash     = property(lambda self: self.utxoSet.getTxHash(self.row))
+   txHashStr  = property(lambda self: binary_to_hex(self.txHash))
+   txOutIndex = property(lambda self: self.utxoSet.txOutIndexes[self.row])
+   val        = property(lambda self: self.utxoSet.values[self.row])
+   conf       = property(lambda self: self.utxoSet.confs[self.row])
+   txHeight   = property(lambda self: self.utxoSet.heights[self.row])
+   txIndex    = property(lambda self: self.utxoSet.txIndexes[self.row])
+   binScript  = property(lambda self: self.utxoSet.getScript(self.row))
+
+   #############################################################################
+   @property
+   def sequence(self):
+      return self.utxoSet.sequences[self.row]
+
+   @sequence.setter
+   def sequence(self, seq):
+      self.utxoSet.sequences[self.row] = seq
+
+   #############################################################################
+   @property
+   def checked(self):
+      return bool(self.utxoSet.checked[self.row])
+
+   @checked.setter
+   def checked(self, val):
+      self.utxoSet.checked[self.row] = 1 if val else 0
+
+   #############################################################################
+   def __eq__(self, other):
+      if isinstance(other, UtxoView):
+         return self.utxoSet is other.utxoSet and self.row == other.row
+      return NotImplemented
+
+   def __hash__(self):
+      return hash((id(self.utxoSet), self.row))
+
+
+################################################################################
+class UtxoSet(object):
+   """
+   Column store for unspent outputs. Row filters return arrays of row
+   numbers, which can be summed over or turned into a new set with subset().
+   """
+
+   #############################################################################
+   def __init__(self):
+      self.values       = array('q')
+      self.heights      = array('q')
+      self.confs        = array('i')
+      self.txIndexes    = array('q')
+      self.txOutIndexes = array('i')
+      self.sequences    = array('I')
+      self.checked      = bytearray()
+      self.addrIds      = array('i')
+      self.scriptIds    = array('i')
+      self.txHashArena  = bytearray()
+
+      # interned scrAddrs and scripts, rows store ids into these
+      self.scrAddrList  = []
+      self.scrAddrIdMap = {}
+      self.scriptList   = []
+      self.scriptIdMap  = {}
+
+   #############################################################################
+   @classmethod
+   def fromBridgeUtxos(cls, bridgeUtxos, topHeight=None):
+      if topHeight is None:
+         from armoryengine.BDM import TheBDM
+         topHeight = TheBDM.getTopBlockHeight()
+
+      utxoSet = cls()
+      for bridgeUtxo in bridgeUtxos:
+         utxoSet.append(bridgeUtxo.scraddr, bridgeUtxo.tx_hash,
+                        bridgeUtxo.tx_height, bridgeUtxo.tx_index,
+                        bridgeUtxo.txout_index, bridgeUtxo.value,
+                        topHeight - bridgeUtxo.tx_height + 1,
+                        bridgeUtxo.script)
+      return utxoSet
+
+   #############################################################################
+   @classmethod
+   def fromUtxoList(cls, utxoList):
+      utxoSet = cls()
+      for utxo in utxoList:
+         utxoSet.append(utxo.getRecipientScrAddr(), utxo.getTxHash(),
+                        utxo.getTxHeight(), utxo.getTxIndex(),
+                        utxo.getTxOutIndex(), utxo.getValue(),
+                        utxo.getNumConfirm(), utxo.getScript(),
+                        utxo.sequence)
+      return utxoSet
+
+   #############################################################################
+   def internId(self, obj, objList, idMap):
+      objId = idMap.get(obj)
+      if objId is None:
+         objId = len(objList)
+         objList.append(obj)
+         idMap[obj] = objId
+      return objId
+
+   #############################################################################
+   def append(self, scrAddr, txHash, txHeight, txIndex, txoIdx, val,
+              numConf=None, fullScript=None, sequence=DEFAULT_SEQUENCE):
+      if len(txHash) != TXHASH_SIZE:
+         raise ValueError('tx hash must be %d bytes' % TXHASH_SIZE)
+
+      if txHeight == ZC_HEIGHT:
+         # callers derive confs from the height, that is garbage for ZC
+         numConf = 0
+
+      self.values.append(val)
+      self.heights.append(-1 if txHeight is None else txHeight)
+      self.confs.append(-1 if numConf is None else numConf)
+      self.txIndexes.append(-1 if txIndex is None else txIndex)
+      self.txOutIndexes.append(txoIdx)
+      self.sequences.append(sequence)
+      self.checked.append(1)
+      self.txHashArena += txHash
+      self.addrIds.append(self.internId(
+         bytes(scrAddr or b''), self.scrAddrList, self.scrAddrIdMap))
+
+      # no script means derive it from the scrAddr on access, as
+      # PyUnspentTxOut.initialize does
+      scriptId = -1
+      if fullScript is not None:
+         scriptId = self.internId(
+            bytes(fullScript), self.scriptList, self.scriptIdMap)
+      self.scriptIds.append(scriptId)
+
+   #############################################################################
+   def __len__(self):
+      return len(self.values)
+
+   def __iter__(self):
+      for row in range(len(self.values)):
+         yield UtxoView(self, row)
+
+   def __getitem__(self, row):
+      if isinstance(row, slice):
+         return [UtxoView(self, r) for r in range(*row.indices(len(self)))]
+      if row < 0:
+         row += len(self)
+      if not 0 <= row < len(self):
+         raise IndexError('utxo row out of range')
+      return UtxoView(self, row)
+
+   #############################################################################
+   def getTxHash(self, row):
+      return bytes(self.txHashArena[row*TXHASH_SIZE:(row+1)*TXHASH_SIZE])
+
+   def getScrAddr(self, row):
+      return self.scrAddrList[self.addrIds[row]]
+
+   def getScript(self, row):
+      scriptId = self.scriptIds[row]
+      if scriptId < 0:
+         from armoryengine.AddressUtils import scrAddr_to_script
+         scrAddr = self.getScrAddr(row)
+         return scrAddr_to_script(scrAddr) if scrAddr else None
+      return self.scriptList[scriptId]
+
+   #############################################################################
+   def getRowsByConf(self, minConf, maxConf=None):
+      confs = self.confs
+      if maxConf is None:
+         return array('i', [r for r in range(len(confs)) if confs[r] >= minConf])
+      return array('i', [r for r in range(len(confs)) \
+                                    if minConf <= confs[r] <= maxConf])
+
+   #############################################################################
+   def getRowsByValue(self, minVal=0, maxVal=None):
+      values = self.values
+      if maxVal is None:
+         return array('i', [r for r in range(len(values)) if values[r] >= minVal])
+      return array('i', [r for r in range(len(values)) \
+                                    if minVal <= values[r] <= maxVal])
+
+   #############################################################################
+   def getRowsByScrAddr(self, scrAddrs):
+      # compare interned ids, not the scrAddrs themselves
+      if isinstance(scrAddrs, bytes):
+         scrAddrs = [scrAddrs]
+      wantIds = set(self.scrAddrIdMap[a] for a in scrAddrs \
+                                             if a in self.scrAddrIdMap)
+      addrIds = self.addrIds
+      return array('i', [r for r in range(len(addrIds)) \
+                                    if addrIds[r] in wantIds])
+
+   #############################################################################
+   def getRowsByOutpoint(self, outpoints):
+      """ outpoints is a set of (txHash, txOutIndex) """
+      arena, txOutIndexes = self.txHashArena, self.txOutIndexes
+      return array('i', [r for r in range(len(txOutIndexes)) \
+         if (bytes(arena[r*TXHASH_SIZE:(r+1)*TXHASH_SIZE]),
+             txOutIndexes[r]) in outpoints])
+
+   #############################################################################
+   def getBalance(self, rows=None):
+      if rows is None:
+         return sum(self.values)
+      values = self.values
+      return sum([values[r] for r in rows])
+
+   #############################################################################
+   def subset(self, rows):
+      """
+      New set holding the given rows. The interned scrAddr and script
+      tables are shared with this one.
+      """
+      sub = UtxoSet()
+      sub.scrAddrList, sub.scrAddrIdMap = self.scrAddrList, self.scrAddrIdMap
+      sub.scriptList, sub.scriptIdMap = self.scriptList, self.scriptIdMap
+
+      for name in ('values', 'heights', 'confs', 'txIndexes', 'txOutIndexes',
+                   'sequences', 'addrIds', 'scriptIds'):
+         col = getattr(self, name)
+         setattr(sub, name, array(col.typecode, [col[r] for r in rows]))
+
+      checked = self.checked
+      sub.checked = bytearray([checked[r] for r in rows])
+      arena = self.txHashArena
+      sub.txHashArena = bytearray(b''.join(
+         [arena[r*TXHASH_SIZE:(r+1)*TXHASH_SIZE] for r in rows]))
+      return sub
+
+   #############################################################################
+   def copy(self):
+      """ Same rows, own columns. Interned tables are shared """
+      dup = UtxoSet()
+      dup.scrAddrList, dup.scrAddrIdMap = self.scrAddrList, self.scrAddrIdMap
+      dup.scriptList, dup.scriptIdMap = self.scriptList, self.scriptIdMap
+
+      for name in ('values', 'heights', 'confs', 'txIndexes', 'txOutIndexes',
+                   'sequences', 'addrIds', 'scriptIds', 'checked',
+                   'txHashArena'):
+         setattr(dup, name, getattr(self, name)[:])
+      return dup
+
+   #############################################################################
+   def updateConfs(self, topHeight):
+      heights, confs = self.heights, self.confs
+      for r in range(len(heights)):
+         if 0 <= heights[r] < ZC_HEIGHT:
+            confs[r] = topHeight - heights[r] + 1
+
+   #############################################################################
+   def getMemoryUsage(self):
+      """ Rough byte count of the columns and interned tables """
+      cols = [self.values, self.heights, self.confs, self.txIndexes,
+              self.txOutIndexes, self.sequences, self.addrIds, self.scriptIds]
+      total = sum([c.itemsize * len(c) for c in cols])
+      total += len(self.checked) + len(self.txHashArena)
+      total += sum([len(a) for a in self.scrAddrList])
+      total += sum([len(s) for s in self.scriptList])
+      return total
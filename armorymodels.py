@@ -26,7 +26,7 @@ from armoryengine.ArmoryUtils import enum, coin2str, binary_to_hex, \
    CPP_TXIN_SCRIPT_NAMES, ADDRBYTE, P2SHBYTE
 from armoryengine.UserAddressUtils import getDisplayStringForScriptImpl
 from armoryengine.Transaction import UnsignedTransaction, \
-   getTxInScriptType
+   getTxInScriptTypes, classifyTxOutScripts
 from armoryengine.MultiSigUtils import calcLockboxID
 from armoryengine.Timer import TimeThisFunction
 from armoryengine.BDM import TheBDM, BDM_BLOCKCHAIN_READY
@@ -1195,10 +1195,11 @@ class TxInDispModel(QAbstractTableModel):
          pytx = ustx.pytxObj
       self.tx = pytx.copy()
 
+      scrTypes = getTxInScriptTypes(self.tx.inputs)
       for i,txin in enumerate(self.tx.inputs):
          self.dispTable.append([])
          wltID = ''
-         scrType = getTxInScriptType(txin)
+         scrType = scrTypes[i]
          if txinListFromBDM and len(txinListFromBDM[i][0])>0:
             # We had a BDM to help us get info on each input -- use it
             scrAddr,val,blk,hsh,idx,script = txinListFromBDM[i]
@@ -1324,6 +1325,16 @@ class TxOutDispModel(QAbstractTableModel):
       for i,txout in enumerate(self.tx.outputs):
          self.txOutList.append(txout)
 
+      # classify every output in one pass, data() is called per cell
+      self.dispRows = []
+      scriptInfo = classifyTxOutScripts([txout.binScript for txout in self.txOutList])
+      for txout,(stype,scrAddr,_) in zip(self.txOutList, scriptInfo):
+         dispInfo = self.main.getDisplayStringForScript(txout.binScript, 60)
+         stypeStr = CPP_TXOUT_SCRIPT_NAMES[stype]
+         if stype==CPP_TXOUT_MULTISIG:
+            stypeStr = 'MultiSig[%d-of-%d]' % (scrAddr[1], scrAddr[2])
+         self.dispRows.append((dispInfo, stypeStr))
+
    def rowCount(self, index=QModelIndex()):
       return len(self.txOutList)
 
@@ -1335,20 +1346,13 @@ class TxOutDispModel(QAbstractTableModel):
       COLS = TXOUTCOLS
       row,col = index.row(), index.column()
       txout = self.txOutList[row]
-      dispInfo = self.main.getDisplayStringForScript(txout.binScript, 60)
+      dispInfo, stypeStr = self.dispRows[row]
       wltID = ''
       if dispInfo['WltID']:
          wltID = dispInfo['WltID']
       elif dispInfo['LboxID']:
          wltID = dispInfo['LboxID']
 
-
-      stype = dispInfo['ScrType']
-      stypeStr = CPP_TXOUT_SCRIPT_NAMES[stype]
-      if stype==CPP_TXOUT_MULTISIG:
-         M,N = getMultisigScriptInfo(txout.binScript)[:2]
-         stypeStr = 'MultiSig[%d-of-%d]' % (M,N)
-
       if role==Qt.DisplayRole:
          if col==COLS.WltID:   return str(wltID)
          if col==COLS.ScrType: return str(stypeStr)
@@ -3,6 +3,8 @@ from __future__ import print_function
 import sys
 sys.path.append('..')
 from armoryengine.ALL import *
+# computed on first access, not exported by the star import
+from armoryengine.ArmoryUtils import OS_VARIANT, SystemSpecs
 
 # Integer/Hex/Binary/Base58 Conversions
 print('\nInteger/Hex/Binary/Base58 Conversions')
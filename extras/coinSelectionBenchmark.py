@@ -0,0 +1,167 @@
+from __future__ import print_function
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+#
+# Compares CoinSelectionEngine with the old single/multi input heuristics on
+# a synthetic, seeded corpus of wallets (1k to 200k UTXOs), so runs can be
+# compared across changes. For each wallet a fixed set of payments is
+# selected, and the time, fee, change and number of changeless results are
+# reported per algorithm.
+#
+################################################################################
+import sys
+sys.argv.append('--nologging')
+sys.path.append('..')
+
+import random
+import time
+
+from armoryengine.CoinSelection import PyUnspentTxOut, \
+   PySelectCoins_SingleInput_SingleValue, \
+   PySelectCoins_MultiInput_SingleValue, \
+   PySelectCoins_MultiInput_DoubleValue
+from armoryengine.CoinSelectionEngine import CoinSelectionEngine, \
+   TX_BASE_SIZE_ESTIMATE, TXIN_SIZE_ESTIMATE, TXOUT_SIZE_ESTIMATE
+
+CORPUS_SEED    = 0x41524d
+WALLET_SIZES   = [1000, 10000, 50000, 80000, 200000]
+PAYMENTS       = 25
+FEE_RATE       = 20
+DUST_LIMIT     = 546
+
+################################################################################
+def makeWallet(nUtxos, rng):
+   """
+   Mostly log-normal values around 0.005 BTC, with a share of round
+   amounts (exchange withdrawals, payouts) that make exact matches possible
+   """
+   values = []
+   for i in range(nUtxos):
+      if rng.random() < 0.2:
+         values.append(rng.choice([10**5, 5*10**5, 10**6, 5*10**6, 10**7]))
+      else:
+         values.append(max(DUST_LIMIT, int(rng.lognormvariate(13.1, 2.0))))
+   return values
+
+################################################################################
+def makePayments(values, rng):
+   total = sum(values)
+   payments = []
+   while len(payments) < PAYMENTS:
+      target = int(rng.lognormvariate(14.5, 1.8))
+      if target < total // 4:
+         payments.append(target)
+   return payments
+
+################################################################################
+def txFee(nInputs, hasChange):
+   size = TX_BASE_SIZE_ESTIMATE + nInputs*TXIN_SIZE_ESTIMATE + \
+      (2 if hasChange else 1)*TXOUT_SIZE_ESTIMATE
+   return size * FEE_RATE
+
+################################################################################
+class BenchStats(object):
+   def __init__(self, name):
+      self.name = name
+      self.seconds = 0.
+      self.fees = 0
+      self.change = 0
+      self.inputs = 0
+      self.changeless = 0
+      self.failed = 0
+
+   def add(self, seconds, nInputs, fee, change):
+      self.seconds += seconds
+      self.inputs += nInputs
+      self.fees += fee
+      self.change += change
+      if change == 0:
+         self.changeless += 1
+
+   def row(self):
+      n = max(1, PAYMENTS - self.failed)
+      return '   %-22s %10.2f %10d %14d %8.1f %6d/%d %6d' % (self.name,
+         1000*self.seconds/PAYMENTS, self.fees//n, self.change//n,
+         float(self.inputs)/n, self.changeless, PAYMENTS, self.failed)
+
+################################################################################
+def runLegacy(name, selectFunc, utxoList, payments, sortKey=None, rng=None):
+   stats = BenchStats(name)
+   for target in payments:
+      t0 = time.time()
+      if sortKey is not None:
+         utxos = sorted(utxoList, key=sortKey, reverse=True)
+      else:
+         utxos = list(utxoList)
+         rng.shuffle(utxos)
+
+      # the heuristics take a flat fee, guess 2 inputs like the GUI did
+      selected = selectFunc(utxos, target, txFee(2, True))
+      seconds = time.time() - t0
+
+      inputVal = sum([u.getValue() for u in selected])
+      excess = inputVal - target - txFee(len(selected), False)
+      if not selected or excess < 0:
+         stats.failed += 1
+         continue
+
+      change = inputVal - target - txFee(len(selected), True)
+      if change < DUST_LIMIT:
+         change = 0
+      fee = inputVal - target - change
+      stats.add(seconds, len(selected), fee, change)
+   return stats
+
+################################################################################
+def runEngine(utxoList, payments):
+   stats = BenchStats('CoinSelectionEngine')
+   t0 = time.time()
+   engine = CoinSelectionEngine.fromUtxoList(utxoList, seed=CORPUS_SEED)
+   setupTime = time.time() - t0
+
+   for target in payments:
+      t0 = time.time()
+      result = engine.select(target, FEE_RATE)
+      seconds = time.time() - t0
+      if result is None:
+         stats.failed += 1
+         continue
+      stats.add(seconds, len(result.indices), result.fee, result.change)
+   return stats, setupTime
+
+################################################################################
+def runBenchmark():
+   print('Fee rate %d sat/B, %d payments per wallet, seed 0x%x' % \
+      (FEE_RATE, PAYMENTS, CORPUS_SEED))
+   for nUtxos in WALLET_SIZES:
+      rng = random.Random(CORPUS_SEED + nUtxos)
+      values = makeWallet(nUtxos, rng)
+      payments = makePayments(values, rng)
+      utxoList = [PyUnspentTxOut(b'', b'\x00'*32, i, val, 6, b'') \
+                                          for i,val in enumerate(values)]
+
+      engineStats, setupTime = runEngine(utxoList, payments)
+      allStats = [
+         engineStats,
+         runLegacy('SingleInput_Single', PySelectCoins_SingleInput_SingleValue,
+                   utxoList, payments, PyUnspentTxOut.getValue),
+         runLegacy('MultiInput_Single', PySelectCoins_MultiInput_SingleValue,
+                   utxoList, payments, PyUnspentTxOut.getValue),
+         runLegacy('MultiInput_Double', PySelectCoins_MultiInput_DoubleValue,
+                   utxoList, payments, None, rng) ]
+
+      print('')
+      print('%d UTXOs (engine setup %0.1f ms)' % (nUtxos, 1000*setupTime))
+      print('   %-22s %10s %10s %14s %8s %8s %6s' % ('algorithm', 'ms/pay',
+         'avg fee', 'avg change', 'inputs', 'no chg', 'failed'))
+      for stats in allStats:
+         print(stats.row())
+
+
+if __name__ == '__main__':
+   runBenchmark()
@@ -46,8 +46,8 @@ if M>N:
    print('       You specified (M,N)=(%d,%d)' % (M,N))
    exit(0)
 
-if not 1<M<=8:
-   print('ERROR: You must select an M value between 2 and 8.')
+if M<2:
+   print('ERROR: You must select an M value of at least 2.')
    print('       Any value of N, greater than M, is valid.')
    exit(0)
 
@@ -0,0 +1,112 @@
+from __future__ import print_function
+################################################################################
+#                                                                              #
+# Copyright (C) 2019-2023, goatpig.                                            #
+#  Distributed under the MIT license                                           #
+#  See LICENSE-MIT or https://opensource.org/licenses/MIT                      #
+#                                                                              #
+################################################################################
+#
+# Measures armoryengine startup cost. Every scenario runs in a fresh
+# interpreter, several times, and reports the median time spent in the
+# scenario itself (import and first use) and the wall time of the whole
+# process, interpreter startup included.
+#
+#   python startupBenchmark.py [runs]
+#
+# "first wallet ready" goes up to a PyBtcWallet with its bridge wrapper and
+# the settings loaded, the time the bridge then takes to load the wallet is
+# not included. Scenarios whose dependencies are missing are reported as
+# failed, with the error.
+#
+################################################################################
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ENGINE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_RUNS = 5
+
+SCENARIOS = [
+   ('import ArmoryUtils',
+    'import armoryengine.ArmoryUtils'),
+
+   ('address conversion',
+    'from armoryengine.AddressUtils import hash160_to_addrStr\n'
+    'hash160_to_addrStr(b"\\x00"*20)'),
+
+   ('import ALL',
+    'import armoryengine.ALL'),
+
+   ('first wallet ready',
+    'from armoryengine.ALL import *\n'
+    'from armoryengine.Settings import TheSettings\n'
+    'TheSettings.get("LastDirectory")\n'
+    'PyBtcWallet(uniqueId="benchmark")'),
+]
+
+# the scenario's own time is printed last, so it can be told apart from
+# whatever the engine prints on import
+RUNNER = '''
+import sys, time
+sys.path.insert(0, %r)
+sys.argv = ['startupBenchmark', '--datadir=%s', '--satoshi-datadir=%s']
+t0 = time.perf_counter()
+%s
+print('\\nSCENARIO_MS %%f' %% (1000*(time.perf_counter() - t0)))
+'''
+
+################################################################################
+def runScenario(code, dataDir):
+   script = RUNNER % (ENGINE_DIR, dataDir, dataDir, code)
+   t0 = time.time()
+   # not from ENGINE_DIR: ArmoryUtils runs update_version.py when started
+   # from a git checkout, which would rewrite armoryengine/ArmoryBuild.py
+   proc = subprocess.Popen([sys.executable, '-c', script], cwd=dataDir,
+      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+   out, err = proc.communicate()
+   wallMs = 1000*(time.time() - t0)
+
+   lines = out.decode('utf-8', 'replace').strip().split('\n')
+   if proc.returncode != 0 or not lines[-1].startswith('SCENARIO_MS'):
+      errLines = err.decode('utf-8', 'replace').strip().split('\n')
+      return None, wallMs, errLines[-1]
+   return float(lines[-1].split()[1]), wallMs, None
+
+################################################################################
+def median(vals):
+   vals = sorted(vals)
+   return vals[len(vals)//2]
+
+################################################################################
+def runBenchmark(runs=DEFAULT_RUNS):
+   dataDir = tempfile.mkdtemp('armory_startup')
+   try:
+      print('%d runs per scenario, python %s, bytecode cache %s' % (runs,
+         sys.version.split()[0],
+         'off' if os.environ.get('PYTHONDONTWRITEBYTECODE') else 'on'))
+      print('   %-22s %12s %12s' % ('scenario', 'median ms', 'process ms'))
+      for name, code in SCENARIOS:
+         scenarioTimes, wallTimes = [], []
+         error = None
+         for i in range(runs):
+            scenarioMs, wallMs, error = runScenario(code, dataDir)
+            if error is not None:
+               break
+            scenarioTimes.append(scenarioMs)
+            wallTimes.append(wallMs)
+
+         if error is not None:
+            print('   %-22s failed: %s' % (name, error))
+            continue
+         print('   %-22s %12.1f %12.1f' % (name, median(scenarioTimes),
+            median(wallTimes)))
+   finally:
+      shutil.rmtree(dataDir)
+
+
+if __name__ == '__main__':
+   runBenchmark(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS)
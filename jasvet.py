@@ -12,12 +12,14 @@
 from __future__ import print_function
 import base64
 import hashlib
+import os
 import random
 import time
 
 #import CppBlockUtils
 from armoryengine.ArmoryUtils import getVersionString, BTCARMORY_VERSION, \
    ChecksumError, ADDRBYTE
+from armoryengine.Secp256k1 import getECBackend
 
 
 FTVerbose=False
@@ -31,28 +33,31 @@ _a = 0x0000000000000000000000000000000000000000000000000000000000000000
 _Gx = 0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798
 _Gy = 0x483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8
 
-BEGIN_MARKER = '-----BEGIN '
-END_MARKER = '-----END '
-DASHX5 = '-----'
-RN = '\r\n'
-RNRN = '\r\n\r\n'
-CLEARSIGN_MSG_TYPE_MARKER = 'BITCOIN SIGNED MESSAGE'
-BITCOIN_SIG_TYPE_MARKER = 'BITCOIN SIGNATURE'
-BASE64_MSG_TYPE_MARKER = 'BITCOIN MESSAGE'
-BITCOIN_ARMORY_COMMENT = ''
+BEGIN_MARKER = b'-----BEGIN '
+END_MARKER = b'-----END '
+DASHX5 = b'-----'
+RN = b'\r\n'
+RNRN = b'\r\n\r\n'
+CLEARSIGN_MSG_TYPE_MARKER = b'BITCOIN SIGNED MESSAGE'
+BITCOIN_SIG_TYPE_MARKER = b'BITCOIN SIGNATURE'
+BASE64_MSG_TYPE_MARKER = b'BITCOIN MESSAGE'
+BITCOIN_ARMORY_COMMENT = b''
 class UnknownSigBlockType(Exception): pass
 
 def randomk():
-   # Using Crypto++ CSPRNG instead of python's
-   #sbdRandK = CppBlockUtils.SecureBinaryData().GenerateRandom(32)
-   sbdRandK = 0
-   hexRandK = sbdRandK.toBinStr().encode('hex_codec')
-   return int(hexRandK, 16)
+   # OS CSPRNG rather than python's
+   return int.from_bytes(os.urandom(32), 'big')
+
+def toBytes(s):
+   # the GUI hands us str, everything below works on bytes
+   if isinstance(s, str):
+      return s.encode('utf-8')
+   return s
 
 
 # Common constants/functions for Bitcoin
 def hash_160_to_bc_address(h160, addrtype=0):
-   vh160 = chr(addrtype) + h160
+   vh160 = bytes([addrtype]) + h160
    h = Hash(vh160)
    addr = vh160 + h[0:4]
    return b58encode(addr)
@@ -70,46 +75,41 @@ def sha256(data):
 def sha1(data):
    return hashlib.sha1(data).digest()
 
-__b58chars = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+__b58chars = b'123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
 __b58base = len(__b58chars)
 
 def b58encode(v):
-   long_value = 0
-   for (i, c) in enumerate(v[::-1]):
-      long_value += (256**i) * ord(c)
+   long_value = int.from_bytes(v, 'big')
 
-   result = ''
+   result = []
    while long_value >= __b58base:
-      div, mod = divmod(long_value, __b58base)
-      result = __b58chars[mod] + result
-      long_value = div
-   result = __b58chars[long_value] + result
+      long_value, mod = divmod(long_value, __b58base)
+      result.append(__b58chars[mod])
+   result.append(__b58chars[long_value])
 
    nPad = 0
    for c in v:
-      if c == '\0': nPad += 1
+      if c == 0: nPad += 1
       else: break
 
-   return (__b58chars[0]*nPad) + result
+   return __b58chars[0:1]*nPad + bytes(reversed(result))
 
 def b58decode(v, length):
+   v = toBytes(v)
    long_value = 0
-   for (i, c) in enumerate(v[::-1]):
-      long_value += __b58chars.find(c) * (__b58base**i)
+   for c in v:
+      long_value = long_value*__b58base + __b58chars.find(c)
 
-   result = ''
-   while long_value >= 256:
-      div, mod = divmod(long_value, 256)
-      result = chr(mod) + result
-      long_value = div
-   result = chr(long_value) + result
+   result = long_value.to_bytes((long_value.bit_length() + 7) // 8, 'big')
+   if not result:
+      result = b'\0'
 
    nPad = 0
    for c in v:
       if c == __b58chars[0]: nPad += 1
       else: break
 
-   result = chr(0)*nPad + result
+   result = b'\0'*nPad + result
    if length is not None and len(result) != length:
       return None
 
@@ -117,7 +117,7 @@ def b58decode(v, length):
 
 def ASecretToSecret(key):
    vch = DecodeBase58Check(key)
-   if vch and vch[0] == chr(128):
+   if vch and vch[0] == 128:
       return vch[1:]
    else:
       return False
@@ -139,7 +139,7 @@ def regenerate_key(sec):
    if not b:
       return False
    b = b[0:32]
-   secret = int('0x' + b.encode('hex'), 16)
+   secret = int.from_bytes(b, 'big')
    return EC_KEY(secret)
 
 def GetPubKey(pkey, compressed=False):
@@ -149,7 +149,7 @@ def GetPrivKey(pkey, compressed=False):
    return i2d_ECPrivateKey(pkey, compressed)
 
 def GetSecret(pkey):
-   return ('%064x' % pkey.secret).decode('hex')
+   return pkey.secret.to_bytes(32, 'big')
 
 
 def i2d_ECPrivateKey(pkey, compressed=False):#, crypted=True):
@@ -178,7 +178,7 @@ def i2d_ECPrivateKey(pkey, compressed=False):#, crypted=True):
          '%064x' % _r + \
          '020101a144034200'
 
-   return key.decode('hex') + i2o_ECPublicKey(pkey, compressed)
+   return bytes.fromhex(key) + i2o_ECPublicKey(pkey, compressed)
 
 def i2o_ECPublicKey(pkey, compressed=False):
    if compressed:
@@ -191,7 +191,7 @@ def i2o_ECPublicKey(pkey, compressed=False):
          '%064x' % pkey.pubkey.point.x() + \
          '%064x' % pkey.pubkey.point.y()
 
-   return key.decode('hex')
+   return bytes.fromhex(key)
 
 def hash_160(public_key):
    md = hashlib.new('ripemd160')
@@ -200,7 +200,7 @@ def hash_160(public_key):
 
 def public_key_to_bc_address(public_key, v=ADDRBYTE):
    h160 = hash_160(public_key)
-   if isinstance(v, str):
+   if isinstance(v, (str, bytes)):
       v = ord(v)
    return hash_160_to_bc_address(h160, v)
 
@@ -264,7 +264,7 @@ class Point( object ):
          assert x > 0
          result = 1
          while result <= x: result = 2 * result
-         return result / 2
+         return result // 2
 
       e = other
       if self.__order: e = e % self.__order
@@ -273,13 +273,13 @@ class Point( object ):
       assert e > 0
       e3 = 3 * e
       negative_self = Point( self.__curve, self.__x, -self.__y, self.__order )
-      i = leftmost_bit( e3 ) / 2
+      i = leftmost_bit( e3 ) // 2
       result = self
       while i > 1:
          result = result.double()
          if ( e3 & i ) != 0 and ( e & i ) == 0: result = result + self
          if ( e3 & i ) == 0 and ( e & i ) != 0: result = result + negative_self
-         i = i / 2
+         i = i // 2
       return result
 
    def __rmul__( self, other ):
@@ -316,12 +316,7 @@ class Point( object ):
 INFINITY = Point( None, None, None )
 
 def str_to_long(b):
-   res = 0
-   pos = 1
-   for a in reversed(b):
-      res += ord(a) * pos
-      pos *= 256
-   return res
+   return int.from_bytes(b, 'big')
 
 class Public_key( object ):
    def __init__( self, generator, point, c ):
@@ -332,26 +327,17 @@ class Public_key( object ):
       n = generator.order()
       if not n:
          raise RuntimeError("Generator point must have order.")
-      if not n * point == INFINITY:
-         raise RuntimeError("Generator point order is bad.")
+      # secp256k1 has cofactor 1, any point on it has order n
+      if not self.curve.contains_point(point.x(), point.y()):
+         raise RuntimeError("Point is not on the curve.")
       if point.x() < 0 or n <= point.x() or point.y() < 0 or n <= point.y():
          raise RuntimeError("Generator point has x or y out of range.")
 
    def verify( self, hashValue, signature ):
-      if isinstance(hashValue, str):
+      if isinstance(hashValue, bytes):
          hashValue=str_to_long(hashValue)
-      G = self.generator
-      n = G.order()
-      r = signature.r
-      s = signature.s
-      if r < 1 or r > n-1: return False
-      if s < 1 or s > n-1: return False
-      c = inverse_mod( s, n )
-      u1 = ( hashValue * c ) % n
-      u2 = ( r * c ) % n
-      xy = u1 * G + u2 * self.point
-      v = xy.x() % n
-      return v == r
+      return getECBackend().verify(hashValue, signature.r, signature.s,
+                                   (self.point.x(), self.point.y()))
 
    def ser(self):
       if self.compressed:
@@ -364,16 +350,17 @@ class Public_key( object ):
             '%064x' % self.point.x() + \
             '%064x' % self.point.y()
 
-      return key.decode('hex')
+      return bytes.fromhex(key)
 
 
 class Signature( object ):
-   def __init__( self, r, s ):
+   def __init__( self, r, s, recid=None ):
       self.r = r
       self.s = s
+      self.recid = recid
 
    def ser(self):
-      return ("%064x%064x"%(self.r,self.s)).decode('hex')
+      return self.r.to_bytes(32, 'big') + self.s.to_bytes(32, 'big')
 
 class Private_key( object ):
    def __init__( self, public_key, secret_multiplier ):
@@ -389,24 +376,24 @@ class Private_key( object ):
 #      return hex_der_key.decode('hex')
 
    def sign( self, hashValue, random_k ):
-      if isinstance(hashValue, str):
+      if isinstance(hashValue, bytes):
          hashValue=str_to_long(hashValue)
-      G = self.public_key.generator
-      n = G.order()
-      k = random_k % n
-      p1 = k * G
-      r = p1.x()
-      if r == 0: raise RuntimeError("amazingly unlucky random number r")
-      s = ( inverse_mod( k, n ) * \
-               ( hashValue + ( self.secret_multiplier * r ) % n ) ) % n
-      if s == 0: raise RuntimeError("amazingly unlucky random number s")
-      return Signature( r, s )
+      try:
+         r, s, recid = getECBackend().sign(
+            hashValue, self.secret_multiplier, random_k)
+      except ValueError:
+         raise RuntimeError("amazingly unlucky random number")
+      return Signature( r, s, recid )
 
 class EC_KEY(object):
    def __init__( self, secret, c=False):
-      curve = CurveFp( _p, _a, _b )
-      generator = Point( curve, _Gx, _Gy, _r )
-      self.pubkey = Public_key( generator, generator * secret, c )
+      generator = generator_secp256k1
+      pt = getECBackend().mulG(secret)
+      if pt is None:
+         # secret is 0 mod n, its pubkey is the point at infinity
+         raise RuntimeError("Generator point has x or y out of range.")
+      x, y = pt
+      self.pubkey = Public_key( generator, Point( generator.curve(), x, y ), c )
       self.privkey = Private_key( self.pubkey, secret )
       self.secret = secret
 
@@ -416,7 +403,7 @@ def decbin(d, l=0, rev=False):
       if len(a)%2: a='0'+a
    else:
       a=("%0"+str(2*l)+"x")%d
-   a=a.decode('hex')
+   a=bytes.fromhex(a)
    if rev:
       a=a[::-1]
    return a
@@ -425,16 +412,16 @@ def decvi(d):
    if d<0xfd:
       return decbin(d)
    elif d<0xffff:
-      return '\xfd'+decbin(d,2,True)
+      return b'\xfd'+decbin(d,2,True)
    elif d<0xffffffff:
-      return '\xfe'+decbin(d,4,True)
-   return '\xff'+decbin(d,8,True)
+      return b'\xfe'+decbin(d,4,True)
+   return b'\xff'+decbin(d,8,True)
 
 def format_msg_to_sign(msg):
-   return "\x18Bitcoin Signed Message:\n"+decvi(len(msg))+msg
+   return b"\x18Bitcoin Signed Message:\n"+decvi(len(msg))+msg
 
 def sqrt_mod(a, p):
-   return pow(a, (p+1)/4, p)
+   return pow(a, (p+1)//4, p)
 
 
 
@@ -444,62 +431,81 @@ randrange = random.SystemRandom().randrange
 
 # Signing/verifying
 
-def verify_message_Bitcoin(signature, message, pureECDSASigning=False, networkVersionNumber=0):
-   msg=message
+def parse_message_Bitcoin(signature, message, pureECDSASigning=False):
+   """ (e, r, s, recid, compressed) of a base64 message signature """
+   msg=toBytes(message)
    if not pureECDSASigning:
-      msg=Hash(format_msg_to_sign(message))
-
-   compressed=False
-   curve = curve_secp256k1
-   G = generator_secp256k1
-   _a,_b,_p=curve.a(),curve.b(),curve.p()
+      msg=Hash(format_msg_to_sign(msg))
 
-   order = G.order()
    sig = base64.b64decode(signature)
    if len(sig) != 65:
       raise Exception("vmB","Bad signature")
 
-   hb = ord(sig[0])
+   hb = sig[0]
    r,s = map(str_to_long,[sig[1:33],sig[33:65]])
 
    if hb < 27 or hb >= 35:
       raise Exception("vmB","Bad first byte")
+   compressed=False
    if hb >= 31:
       compressed = True
       hb -= 4
 
-   recid = hb - 27
-   x = (r + (recid/2) * order) % _p
-   y2 = ( pow(x,3,_p) + _a*x + _b ) % _p
-   yomy = sqrt_mod(y2, _p)
-   if (yomy - recid) % 2 == 0:
-      y=yomy
+   return str_to_long(msg), r, s, hb - 27, compressed
+
+def pubkey_to_address(point, compressed, networkVersionNumber):
+   if compressed:
+      pub = bytes([2 + (point[1] & 1)]) + point[0].to_bytes(32, 'big')
    else:
-      y=_p - yomy
+      pub = b'\x04' + point[0].to_bytes(32, 'big') + \
+         point[1].to_bytes(32, 'big')
+   return public_key_to_bc_address(pub, networkVersionNumber)
 
-   R = Point(curve, x, y, order)
-   e = str_to_long(msg)
-   minus_e = -e % order
-   inv_r = inverse_mod(r,order)
-   Q = inv_r * ( R*s + G*minus_e )
-   public_key = Public_key(G, Q, compressed)
-   addr = public_key_to_bc_address(public_key.ser(), networkVersionNumber)
-   return addr
+def verify_message_Bitcoin(signature, message, pureECDSASigning=False, networkVersionNumber=0):
+   e, r, s, recid, compressed = parse_message_Bitcoin(
+      signature, message, pureECDSASigning)
+   Q = getECBackend().recover(e, r, s, recid)
+   if Q is None:
+      raise Exception("vmB","Bad signature")
+   return pubkey_to_address(Q, compressed, networkVersionNumber)
+
+def verify_messages_Bitcoin(sigsAndMsgs, pureECDSASigning=False, networkVersionNumber=0):
+   """
+   Signing address of each (signature, message) pair, None for the ones
+   that don't parse or recover. Recoveries are done as one batch
+   """
+   parsed = []
+   for signature, message in sigsAndMsgs:
+      try:
+         parsed.append(parse_message_Bitcoin(
+            signature, message, pureECDSASigning))
+      except Exception:
+         parsed.append(None)
+
+   items = [p[:4] for p in parsed if p is not None]
+   points = iter(getECBackend().recoverBatch(items))
+
+   addrs = []
+   for p in parsed:
+      Q = None if p is None else next(points)
+      if Q is None:
+         addrs.append(None)
+      else:
+         addrs.append(pubkey_to_address(Q, p[4], networkVersionNumber))
+   return addrs
 
 def sign_message(secret, message, pureECDSASigning=False):
    if len(secret) == 32:
-      pkey = EC_KEY(str_to_long(secret))
       compressed = False
    elif len(secret) == 33:
-      pkey = EC_KEY(str_to_long(secret[:-1]))
       secret=secret[:-1]
       compressed = True
    else:
       raise Exception("sm","Bad private key size")
 
-   msg=message
+   msg=toBytes(message)
    if not pureECDSASigning:
-      msg=Hash(format_msg_to_sign(message))
+      msg=Hash(format_msg_to_sign(msg))
 
    eckey           = EC_KEY(str_to_long(secret), compressed)
    private_key     = eckey.privkey
@@ -514,43 +520,44 @@ def sign_message(secret, message, pureECDSASigning=False):
 
 def sign_message_Bitcoin(secret, msg, pureECDSASigning=False):
    sig,addr,compressed,public_key=sign_message(secret, msg, pureECDSASigning)
+   msg=toBytes(msg)
 
-   for i in range(4):
-      hb=27+i
-      if compressed:
-         hb+=4
-      sign=base64.b64encode(chr(hb)+sig.ser())
-      try:
-         networkVersionNumber = str_to_long(b58decode(addr, None)) >> (8*24)
-         if addr == verify_message_Bitcoin(sign, msg, pureECDSASigning, networkVersionNumber):
-            return {'address':addr, 'b64-signature':sign, 'signature':chr(hb)+sig.ser(), 'message':msg}
-      except Exception as e:
-#         print e.args
-         pass
+   # the signer knows R, so the recovery id doesn't need to be searched for
+   hb=27+sig.recid
+   if compressed:
+      hb+=4
+   sign=base64.b64encode(bytes([hb])+sig.ser())
+   try:
+      networkVersionNumber = str_to_long(b58decode(addr, None)) >> (8*24)
+      if addr == verify_message_Bitcoin(sign, msg, pureECDSASigning, networkVersionNumber):
+         return {'address':addr, 'b64-signature':sign, 'signature':bytes([hb])+sig.ser(), 'message':msg}
+   except Exception as e:
+      pass
 
    raise Exception("smB","Unable to construct recoverable key")
 
 def FormatText(t, sigctx=False, verbose=False):   #sigctx: False=what is displayed, True=what is signed
-   r=''
-   te=t.split('\n')
+   t=toBytes(t)
+   r=b''
+   te=t.split(b'\n')
    for l in te:
-      while len(l) and l[len(l)-1] in [' ', '\r', '\t', chr(9)]:
+      while len(l) and l[-1:] in [b' ', b'\r', b'\t']:
          l=l[:-1]
-      if not len(l) or l[len(l)-1]!='\r':
-         l+='\r'
+      if not len(l) or l[-1:]!=b'\r':
+         l+=b'\r'
       if not sigctx:
-         if len(l) and l[0]=='-':
-            l='- '+l
-      r+=l+'\n'
+         if len(l) and l[0:1]==b'-':
+            l=b'- '+l
+      r+=l+b'\n'
    r=r[:-2]
 
    global FTVerbose
    if FTVerbose:
-      print('  -- Sent:      '+t.encode('hex'))
+      print('  -- Sent:      '+t.hex())
       if sigctx:
-         print('  -- Signed:    '+r.encode('hex'))
+         print('  -- Signed:    '+r.hex())
       else:
-         print('  -- Displayed: '+r.encode('hex'))
+         print('  -- Displayed: '+r.hex())
 
    return r
 
@@ -559,17 +566,13 @@ def crc24(m):
    INIT = 0xB704CE
    POLY = 0x1864CFB
    crc = INIT
-   r = ''
    for o in m:
-      o=ord(o)
       crc ^= (o << 16)
-      for i in xrange(8):
+      for i in range(8):
          crc <<= 1
          if crc & 0x1000000:
             crc ^= POLY
-   for i in range(3):
-      r += chr( ( crc & (0xff<<(8*i))) >> (8*i) )
-   return r
+   return bytes([(crc >> (8*i)) & 0xff for i in range(3)])
 
 def chunks(t, n):
    return [t[i:i+n] for i in range(0, len(t), n)]
@@ -580,7 +583,7 @@ def ASCIIArmory(block, name, addComment=False):
    if addComment:
       r+= BITCOIN_ARMORY_COMMENT
    r+=RNRN
-   r+=RN.join(chunks(base64.b64encode(block), 64))+RN+'='
+   r+=RN.join(chunks(base64.b64encode(block), 64))+RN+b'='
    r+=base64.b64encode(crc24(block))+RN
 
    r+=END_MARKER+name+DASHX5
@@ -588,15 +591,15 @@ def ASCIIArmory(block, name, addComment=False):
 
 def readSigBlock(r):
    # Take the name off of the end because the BEGIN markers are confusing
-   r = FormatText(r, True)
+   r = FormatText(toBytes(r), True)
    name = r.split(BEGIN_MARKER)[1].split(DASHX5)[0]
    if name == BASE64_MSG_TYPE_MARKER:
-      encoded,crc = r.split(BEGIN_MARKER)[1].split(END_MARKER)[0].split(DASHX5)[1].strip().split('\n=')
+      encoded,crc = r.split(BEGIN_MARKER)[1].split(END_MARKER)[0].split(DASHX5)[1].strip().split(b'\n=')
       crc = crc.strip()
       # Always starts with a blank line (\r\n\r\n) chop that off with the comment oand process the rest
       encoded = encoded.split(RNRN)[1]
       # Combines 64 byte chunks that are separated by \r\n
-      encoded = ''.join(encoded.split(RN))
+      encoded = b''.join(encoded.split(RN))
       # decode the message.
       decoded = base64.b64decode(encoded)
       # Check sum of decoded messgae
@@ -617,9 +620,9 @@ def readSigBlock(r):
       msg = msg.split(RN+DASHX5)[0]
       # Only the signature is encoded, use the original r to pull out the encoded signature
       encoded =  r.split(BEGIN_MARKER)[2].split(DASHX5)[1].split(BITCOIN_SIG_TYPE_MARKER)[0]
-      encoded, crc = encoded.split('\n=')
-      encoded = ''.join(encoded.split('\n'))
-      signature = ''.join(encoded.split('\r'))
+      encoded, crc = encoded.split(b'\n=')
+      encoded = b''.join(encoded.split(b'\n'))
+      signature = b''.join(encoded.split(b'\r'))
       crc = crc.strip()
       if base64.b64decode(crc) != crc24(base64.b64decode(signature)):
          raise ChecksumError
@@ -635,6 +638,12 @@ def verifySignature(b64sig, msg, signVer='v0', networkVersionNumber=0):
       msg = FormatText(msg, True)
    return verify_message_Bitcoin(b64sig, msg, networkVersionNumber = networkVersionNumber)
 
+def verifySignatures(sigsAndMsgs, signVer='v0', networkVersionNumber=0):
+   """ verifySignature over a list of (b64sig, msg), as one batch """
+   if signVer=='v1':
+      sigsAndMsgs = [(sig, FormatText(msg, True)) for sig,msg in sigsAndMsgs]
+   return verify_messages_Bitcoin(sigsAndMsgs, networkVersionNumber = networkVersionNumber)
+
 def ASv0(privkey, msg):
    return sign_message_Bitcoin(privkey, msg)
 
@@ -657,13 +666,13 @@ def ASv1B64(privkey, msg):
 #
 
 if __name__=='__main__':
-   pvk1='\x01'*32
-   text0='Hello world!'
-   text1='Hello world!\n'
-   text2='Hello world!\n\t'
-   text3='Hello world!\n-jackjack'
-   text4='Hello world!\n-jackjack '
-   text5='Hello world!'
+   pvk1=b'\x01'*32
+   text0=b'Hello world!'
+   text1=b'Hello world!\n'
+   text2=b'Hello world!\n\t'
+   text3=b'Hello world!\n-jackjack'
+   text4=b'Hello world!\n-jackjack '
+   text5=b'Hello world!'
 
    FTVerbose=True
 
@@ -6,6 +6,7 @@ Created on Jul 29, 2013
 import sys
 sys.path.append('..')
 import hashlib
+import io
 import locale
 from random import shuffle
 import time
@@ -15,6 +16,10 @@ import unittest
 from armoryengine.ArmoryUtils import *
 from armoryengine.BinaryPacker import *
 from armoryengine.BinaryUnpacker import *
+from armoryengine.AddressUtils import bech32_encode, bech32_decode, \
+   addrStrs_to_scripts, scripts_to_addrStrs, scrAddr_to_script, \
+   script_to_scrAddr, scrAddr_to_addrStr, addrStr_to_scrAddr, \
+   BadAddressError
 import armoryengine.ArmoryUtils
 from armoryengine import ArmoryUtils
 
@@ -506,6 +511,57 @@ class ArmoryEngineTest(unittest.TestCase):
       self.assertEqual(scraddr, script_to_scrAddr(script))  # this uses C++
       self.assertEqual(scraddr, addrStr_to_scrAddr(scrAddr_to_addrStr(scraddr)))
 
+   #############################################################################
+   def testSegwitScrAddr(self):
+      ##### P2WPKH
+      script  = hex_to_binary("0014751e76e8199196d454941c45d1b3a323f1433bd6")
+      scraddr = hex_to_binary(  "90751e76e8199196d454941c45d1b3a323f1433bd6")
+
+      self.assertEqual(script,  scrAddr_to_script(scraddr))
+      self.assertEqual(scraddr, script_to_scrAddr(script))
+      self.assertEqual(scraddr, addrStr_to_scrAddr(scrAddr_to_addrStr(scraddr)))
+
+      ##### P2WSH
+      script  = hex_to_binary("00201863143c14c5166804bd19203356da136c985678"
+                              "cd4d27a1b8c6329604903262")
+      scraddr = hex_to_binary(  "951863143c14c5166804bd19203356da136c985678"
+                              "cd4d27a1b8c6329604903262")
+
+      self.assertEqual(script,  scrAddr_to_script(scraddr))
+      self.assertEqual(scraddr, script_to_scrAddr(script))
+      self.assertEqual(scraddr, addrStr_to_scrAddr(scrAddr_to_addrStr(scraddr)))
+
+   #############################################################################
+   def testBech32(self):
+      # BIP173 test vector
+      witProg = hex_to_binary("751e76e8199196d454941c45d1b3a323f1433bd6")
+      addrStr = 'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4'
+
+      self.assertEqual(bech32_encode(witProg, 0, 'bc'), addrStr)
+      self.assertEqual(bech32_decode(addrStr, 'bc'), (0, witProg))
+      self.assertEqual(bech32_decode(addrStr.upper(), 'bc'), (0, witProg))
+
+      self.assertRaises(ChecksumError, bech32_decode, addrStr[:-1] + '5', 'bc')
+      self.assertRaises(BadAddressError, bech32_decode, addrStr, 'tb')
+      self.assertRaises(BadAddressError, bech32_decode,
+         'bc1qW508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4', 'bc')
+
+   #############################################################################
+   def testBatchAddrConversion(self):
+      scrAddrs = [hex_to_binary("00a134408afa258a50ed7a1d9817f26b63cc9002cc"),
+                  hex_to_binary("05d0c15a7d41500976056b3345f542d8c944077c8a"),
+                  hex_to_binary("90751e76e8199196d454941c45d1b3a323f1433bd6")]
+      addrStrs = [scrAddr_to_addrStr(scrAddr) for scrAddr in scrAddrs]
+      scripts  = [scrAddr_to_script(scrAddr) for scrAddr in scrAddrs]
+
+      self.assertEqual(addrStrs_to_scripts(addrStrs), scripts)
+      self.assertEqual(scripts_to_addrStrs(scripts), addrStrs)
+
+      # bad entries come back as None instead of failing the batch
+      badAddr = addrStrs[0][:-1] + ('1' if addrStrs[0][-1] != '1' else '2')
+      self.assertEqual(addrStrs_to_scripts([badAddr, addrStrs[1], 'xyz']),
+                       [None, scripts[1], None])
+
 
 ################################################################################
 ################################################################################
@@ -513,7 +569,7 @@ class BinaryPackerUnpackerTest(unittest.TestCase):
 
    #############################################################################
    def testBinaryUnpacker(self):
-      ts = '\xff\xff\xff'
+      ts = b'\xff\xff\xff'
       bu = BinaryUnpacker(ts)
       self.assertEqual(bu.getSize(), len(ts))
       bu.advance(1)
@@ -578,6 +634,61 @@ class BinaryPackerUnpackerTest(unittest.TestCase):
       self.assertRaises(UnpackerError, bu.get, UNKNOWN_TYPE)
       self.assertRaises(UnpackerError, bu.get, BINARY_CHUNK, 1)
 
+   #############################################################################
+   def testBufferPacker(self):
+      bp = BinaryPacker()
+      bufp = BufferPacker(4 + 8 + 3 + 3 + 4)
+      for packer in [bp, bufp]:
+         packer.put(UINT32, 0xdeadbeef)
+         packer.put(INT64, -2)
+         packer.put(VAR_INT, 300)
+         packer.put(VAR_STR, b'ab')
+         packer.put(BINARY_CHUNK, b'\x01', 4)
+
+      self.assertEqual(bufp.getBinaryString(), bp.getBinaryString())
+      self.assertEqual(bufp.getSize(), bp.getSize())
+      self.assertEqual(varIntSize(300), 3)
+
+      # the buffer doesn't grow
+      self.assertRaises(PackerError, bufp.put, UINT8, 1)
+      self.assertRaises(PackerError, bufp.put, BINARY_CHUNK, b'\x01')
+
+   #############################################################################
+   def testBinaryUnpackerStream(self):
+      bp = BinaryPacker()
+      for i in range(1000):
+         bp.put(UINT32, i)
+         bp.put(VAR_STR, b'\xab'*(i % 300))
+         bp.put(VAR_INT, i*1000)
+      ts = bp.getBinaryString()
+
+      # small chunks so fields straddle the refills
+      for bu in [BinaryUnpacker(ts), BinaryUnpacker(io.BytesIO(ts), 7)]:
+         self.assertEqual(bu.getSize(), len(ts))
+         for i in range(1000):
+            self.assertEqual(bu.get(UINT32), i)
+            self.assertEqual(bu.get(VAR_STR), b'\xab'*(i % 300))
+            self.assertEqual(bu.get(VAR_INT), i*1000)
+         self.assertEqual(bu.getRemainingSize(), 0)
+         self.assertRaises(UnpackerError, bu.get, UINT8)
+
+      # data dropped from the stream window can't be rewound into
+      bu = BinaryUnpacker(io.BytesIO(ts), 16)
+      bu.advance(100)
+      self.assertEqual(bu.get(UINT32), int.from_bytes(ts[100:104], 'little'))
+      bu.rewind(4)
+      self.assertEqual(bu.getRemainingString(), ts[100:])
+      self.assertRaises(UnpackerError, bu.resetPosition, 0)
+
+   #############################################################################
+   def testBinaryUnpackerView(self):
+      bu = BinaryUnpacker(b'\x01\x02\x03\x04')
+      view = bu.getView(2)
+      self.assertEqual(view.tobytes(), b'\x01\x02')
+      bu.append(b'\x05')
+      self.assertEqual(bu.get(BINARY_CHUNK, 3), b'\x03\x04\x05')
+      self.assertEqual(view.tobytes(), b'\x01\x02')
+
 # Running tests with "python <module name>" will NOT work for any Armory tests
 # You must run tests with "python -m unittest <module name>" or run all tests with "python -m unittest discover"
 # if __name__ == "__main__":
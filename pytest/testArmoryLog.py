@@ -0,0 +1,61 @@
+import sys
+sys.path.append('..')
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from armoryengine.ArmoryLog import LogPipeline
+
+################################################################################
+class LogPipelineTest(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      self.logDir = tempfile.mkdtemp('armory_log')
+      self.logFile = os.path.join(self.logDir, 'armorylog.txt')
+      self.jsonFile = os.path.join(self.logDir, 'armorylog.jsonl')
+
+      self.logger = logging.getLogger('testArmoryLog')
+      self.logger.propagate = False
+      self.pipeline = LogPipeline(self.logger)
+      self.pipeline.start(self.logFile, logging.INFO, logging.CRITICAL+100,
+                          jsonFile=self.jsonFile, maxBytes=2048)
+
+   def tearDown(self):
+      self.pipeline.stop()
+      shutil.rmtree(self.logDir)
+
+   #############################################################################
+   def testWriterThread(self):
+      self.assertFalse(self.logger.isEnabledFor(logging.DEBUG))
+      self.assertTrue(self.logger.isEnabledFor(logging.INFO))
+
+      self.logger.info('hello %s', 'there')
+      self.logger.debug('not written')
+      self.pipeline.flush()
+
+      with open(self.logFile) as f:
+         lines = f.readlines()
+      self.assertEqual(len(lines), 1)
+      self.assertTrue('(INFO) -- testArmoryLog.py:' in lines[0])
+      self.assertTrue(lines[0].rstrip().endswith('hello there'))
+
+      with open(self.jsonFile) as f:
+         entry = json.loads(f.readline())
+      self.assertEqual(entry['level'], 'INFO')
+      self.assertEqual(entry['msg'], 'hello there')
+      self.assertEqual(entry['func'], 'testWriterThread')
+
+   #############################################################################
+   def testRotation(self):
+      for i in range(100):
+         self.logger.info('line %d %s', i, 'x'*40)
+      self.pipeline.stop()
+
+      self.assertTrue(os.path.getsize(self.logFile) <= 2048)
+      self.assertTrue(os.path.exists(self.logFile + '.1'))
+      with open(self.logFile) as f:
+         self.assertTrue('line 99 ' in f.readlines()[-1])
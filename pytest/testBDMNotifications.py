@@ -0,0 +1,73 @@
+import sys
+sys.path.append('..')
+import threading
+import unittest
+
+from armoryengine.BDM import NotificationCoalescer, mergeRefreshIds, \
+   postRefresh, REFRESH_ACTION, NEW_BLOCK_ACTION
+
+################################################################################
+class Listener(object):
+   def __init__(self):
+      self.calls = []
+      self.delivered = threading.Event()
+
+   def __call__(self, act, args):
+      self.calls.append((act, list(args)))
+      self.delivered.set()
+
+################################################################################
+class NotificationCoalescerTest(unittest.TestCase):
+
+   #############################################################################
+   def testMergeRefreshIds(self):
+      self.assertEqual(mergeRefreshIds(['a', 'b'], ['b', 'c']),
+         ['a', 'b', 'c'])
+
+   #############################################################################
+   def testRefreshBurst(self):
+      listener = Listener()
+      coalescer = NotificationCoalescer(listener, window=60)
+
+      for ids in (['a'], ['b'], ['a', 'c']):
+         postRefresh(coalescer, ids)
+      coalescer.flush()
+
+      self.assertEqual(listener.calls, [(REFRESH_ACTION, ['a', 'b', 'c'])])
+      self.assertEqual(coalescer.postedCount, 3)
+      self.assertEqual(coalescer.deliveredCount, 1)
+
+   #############################################################################
+   def testFullAndWalletRefresh(self):
+      # the per wallet ids still reach the listener next to a full refresh
+      listener = Listener()
+      coalescer = NotificationCoalescer(listener, window=60)
+
+      postRefresh(coalescer, ['a'])
+      postRefresh(coalescer, [])
+      postRefresh(coalescer, ['b'])
+      postRefresh(coalescer, [])
+      coalescer.flush()
+
+      self.assertEqual(sorted(listener.calls),
+         [(REFRESH_ACTION, []), (REFRESH_ACTION, ['a', 'b'])])
+
+   #############################################################################
+   def testDeliverNowFlushesFirst(self):
+      listener = Listener()
+      coalescer = NotificationCoalescer(listener, window=60)
+
+      coalescer.post(REFRESH_ACTION, REFRESH_ACTION, ['a'], mergeRefreshIds)
+      coalescer.deliverNow(NEW_BLOCK_ACTION, [100])
+
+      self.assertEqual(listener.calls,
+         [(REFRESH_ACTION, ['a']), (NEW_BLOCK_ACTION, [100])])
+
+   #############################################################################
+   def testTimerDelivers(self):
+      listener = Listener()
+      coalescer = NotificationCoalescer(listener, window=0.01)
+
+      coalescer.post(REFRESH_ACTION, REFRESH_ACTION, ['a'], mergeRefreshIds)
+      self.assertTrue(listener.delivered.wait(5))
+      self.assertEqual(listener.calls, [(REFRESH_ACTION, ['a'])])
@@ -0,0 +1,129 @@
+import sys
+sys.path.append('..')
+import os
+import time
+import unittest
+
+from armoryengine.ArmoryUtils import hex_to_binary, hash256, ChecksumError
+from armoryengine.AddressUtils import BASE58CHARS, NonBase58CharacterError, \
+   binary_to_base58, base58_to_binary, binary_to_base58check, \
+   base58check_to_binary, base58_encode_many, base58_decode_many
+
+BENCH_COUNT = 20000
+
+################################################################################
+# Straight per-character implementation, kept as a reference for both
+# correctness and speed
+def naiveEncode(binstr):
+   padding = len(binstr) - len(binstr.lstrip(b'\x00'))
+   n = int.from_bytes(binstr, 'big')
+   b58 = ''
+   while n > 0:
+      n, r = divmod(n, 58)
+      b58 = BASE58CHARS[r] + b58
+   return '1'*padding + b58
+
+def naiveDecode(s):
+   n = 0
+   for c in s:
+      n = n*58 + BASE58CHARS.index(c)
+   pad = len(s) - len(s.lstrip('1'))
+   return b'\x00'*pad + n.to_bytes((n.bit_length() + 7) // 8, 'big')
+
+################################################################################
+class Base58Test(unittest.TestCase):
+
+   #############################################################################
+   def testKnownVectors(self):
+      vectors = [
+         (b'', ''),
+         (b'\x00', '1'),
+         (b'\x00\x00', '11'),
+         (b'\x61', '2g'),
+         (b'\x62\x62\x62', 'a3gV'),
+         (b'\x00\x00\x00\x01', '1112'),
+         (hex_to_binary('00eb15231dfceb60925886b67d065299925915aeb172c06647'),
+          '1NS17iag9jJgTHD1VXjvLCEnZuQ3rJDE9L')]
+
+      for binstr, b58 in vectors:
+         self.assertEqual(binary_to_base58(binstr), b58)
+         self.assertEqual(base58_to_binary(b58), binstr)
+
+   #############################################################################
+   def testLeadingZeros(self):
+      for pad in range(5):
+         binstr = b'\x00'*pad + b'\x01\x02\x03'
+         b58 = binary_to_base58(binstr)
+         self.assertTrue(b58.startswith('1'*pad))
+         self.assertEqual(base58_to_binary(b58), binstr)
+
+   #############################################################################
+   def testRandomRoundTrip(self):
+      for i in range(500):
+         binstr = b'\x00'*(i % 3) + os.urandom(i % 80)
+         b58 = binary_to_base58(binstr)
+         self.assertEqual(b58, naiveEncode(binstr))
+         self.assertEqual(base58_to_binary(b58), binstr)
+
+   #############################################################################
+   def testBadCharacter(self):
+      self.assertRaises(NonBase58CharacterError, base58_to_binary, '1O0l')
+
+   #############################################################################
+   def testChecksum(self):
+      payload = b'\x00' + b'\xab'*20
+      b58 = binary_to_base58check(payload)
+      self.assertEqual(b58, binary_to_base58(payload + hash256(payload)[:4]))
+      self.assertEqual(base58check_to_binary(b58), payload)
+
+      badStr = b58[:-1] + ('2' if b58[-1] != '2' else '3')
+      self.assertRaises(ChecksumError, base58check_to_binary, badStr)
+
+   #############################################################################
+   def testBatch(self):
+      payloads = [b'\x00' + os.urandom(20) for i in range(100)]
+      strList = base58_encode_many(payloads)
+      self.assertEqual(base58_decode_many(strList), payloads)
+
+      rawList = base58_encode_many(payloads, withChecksum=False)
+      self.assertEqual(base58_decode_many(rawList, withChecksum=False), payloads)
+
+      strList[10] = strList[10][:-1] + ('2' if strList[10][-1] != '2' else '3')
+      strList[20] = '0OIl'
+      decoded = base58_decode_many(strList)
+      self.assertEqual(decoded[10], None)
+      self.assertEqual(decoded[20], None)
+      self.assertEqual(decoded[30], payloads[30])
+
+################################################################################
+class Base58BenchmarkTest(unittest.TestCase):
+   """
+   Micro-benchmark, address sized payloads. Timings are only printed, they
+   are too machine dependent to assert on.
+   """
+
+   #############################################################################
+   def testBenchmark(self):
+      payloads = [b'\x00' + os.urandom(24) for i in range(BENCH_COUNT)]
+
+      start = time.time()
+      strList = [naiveEncode(p) for p in payloads]
+      naiveEnc = time.time() - start
+
+      start = time.time()
+      fastList = base58_encode_many(payloads, withChecksum=False)
+      fastEnc = time.time() - start
+
+      start = time.time()
+      [naiveDecode(s) for s in strList]
+      naiveDec = time.time() - start
+
+      start = time.time()
+      decoded = base58_decode_many(fastList, withChecksum=False)
+      fastDec = time.time() - start
+
+      self.assertEqual(fastList, strList)
+      self.assertEqual(decoded, payloads)
+
+      print('\nbase58 x%d: encode %.3fs (naive %.3fs), decode %.3fs (naive %.3fs)' % \
+         (BENCH_COUNT, fastEnc, naiveEnc, fastDec, naiveDec))
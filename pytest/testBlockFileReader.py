@@ -0,0 +1,119 @@
+import sys
+sys.path.append('..')
+import os
+import shutil
+import tempfile
+import unittest
+
+from armoryengine.ArmoryUtils import MAGIC_BYTES, hash256
+from armoryengine.Block import PyBlock, MerkleBuilder
+from armoryengine.BlockFileReader import BlockFileReader, BlockFileIndex, \
+   getBlockFilePath
+
+BLK170_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'extras', 'blk170.bin')
+
+################################################################################
+def frameBlock(pyBlock):
+   rawBlock = pyBlock.serialize()
+   return MAGIC_BYTES + len(rawBlock).to_bytes(4, 'little') + rawBlock
+
+################################################################################
+class BlockFileReaderTest(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      with open(BLK170_PATH, 'rb') as f:
+         self.blk170 = PyBlock().unserialize(f.read())
+
+      # tiny chain on top of a null prev hash so heights resolve
+      self.chain = []
+      prevHash = b'\x00'*32
+      for i in range(3):
+         blk = PyBlock().unserialize(self.blk170.serialize())
+         blk.blockHeader.prevBlkHash = prevHash
+         blk.blockHeader.nonce = i
+         blk.blockHeader.theHash = ''
+         prevHash = blk.blockHeader.getHash()
+         self.chain.append(blk)
+
+      self.blkDir = tempfile.mkdtemp('armory_blkfiles')
+
+   def tearDown(self):
+      shutil.rmtree(self.blkDir)
+
+   #############################################################################
+   def writeBlockFile(self, fileNum, blockList, padding=0):
+      with open(getBlockFilePath(fileNum, self.blkDir), 'wb') as f:
+         for blk in blockList:
+            f.write(frameBlock(blk))
+         f.write(b'\x00' * padding)
+
+   #############################################################################
+   def testMerkleBuilder(self):
+      for numTx in range(1, 12):
+         hashes = [hash256(bytes([i])) for i in range(numTx)]
+         merkle = MerkleBuilder()
+         for txHash in hashes:
+            merkle.addHash(txHash)
+
+         # reference: full tree, last node duplicated on odd levels
+         level = hashes
+         while len(level) > 1:
+            if len(level) % 2:
+               level = level + level[-1:]
+            level = [hash256(level[i] + level[i+1]) \
+                                       for i in range(0, len(level), 2)]
+         self.assertEqual(merkle.getRoot(), level[0])
+
+      self.assertEqual(self.blk170.blockData.getMerkleRoot(),
+                       self.blk170.blockHeader.merkleRoot)
+
+   #############################################################################
+   def testReader(self):
+      self.writeBlockFile(0, self.chain[:2], padding=64)
+
+      with BlockFileReader(getBlockFilePath(0, self.blkDir)) as reader:
+         entries = list(reader.iterBlocks())
+         self.assertEqual(len(entries), 2)
+         self.assertEqual(reader.endOffset,
+                          sum(len(frameBlock(b)) for b in self.chain[:2]))
+
+         entry = entries[1]
+         self.assertEqual(entry.getHash(), self.chain[1].blockHeader.getHash())
+         self.assertEqual(entry.getNumTx(), 2)
+         self.assertTrue(entry.checkMerkleRoot())
+         self.assertEqual(entry.getTxHashes(),
+                          [tx.getHash() for tx in self.blk170.blockData.txList])
+         self.assertEqual(entry.getTx(1).serialize(),
+                          self.blk170.tx(1).serialize())
+         self.assertEqual(entry.getRawBlock(), self.chain[1].serialize())
+
+   #############################################################################
+   def testIndex(self):
+      # last block only half written, like a file Core is appending to
+      self.writeBlockFile(0, self.chain[:2])
+      with open(getBlockFilePath(1, self.blkDir), 'wb') as f:
+         f.write(frameBlock(self.chain[2])[:100])
+
+      indexPath = os.path.join(self.blkDir, 'blkindex.bin')
+      index = BlockFileIndex(indexPath, blkDir=self.blkDir)
+      self.assertEqual(index.update(), 2)
+      self.assertEqual(index.getTopHeight(), 1)
+      index.save()
+
+      self.writeBlockFile(1, self.chain[2:])
+      index = BlockFileIndex(indexPath, blkDir=self.blkDir)
+      self.assertTrue(index.load())
+      self.assertEqual(index.update(), 1)
+      self.assertEqual(index.getTopHeight(), 2)
+
+      topHash = self.chain[2].blockHeader.getHash()
+      self.assertEqual(index.getHashByHeight(2), topHash)
+      self.assertEqual(index.getBlockLocation(topHash)[0], 1)
+      self.assertEqual(index.getBlockByHeight(2).serialize(),
+                       self.chain[2].serialize())
+
+      coinbase = self.blk170.tx(0)
+      self.assertEqual(index.getTx(coinbase.getHash()).serialize(),
+                       coinbase.serialize())
@@ -0,0 +1,42 @@
+import sys
+sys.path.append('..')
+import unittest
+
+from armoryengine.CoinSelectionEngine import CoinSelectionEngine, \
+   selectCoinsBnB, TXIN_SIZE_ESTIMATE
+
+################################################################################
+class CoinSelectionEngineTest(unittest.TestCase):
+
+   #############################################################################
+   def testBnBExactMatch(self):
+      effValues = [50, 40, 30, 20, 10]
+      feeDiffs = [0] * len(effValues)
+      sel = selectCoinsBnB(effValues, feeDiffs, 60, 0)
+      self.assertEqual(sum(effValues[i] for i in sel), 60)
+      self.assertEqual(selectCoinsBnB(effValues, feeDiffs, 151, 0), None)
+
+   #############################################################################
+   def testChangelessSelection(self):
+      feeRate = 10
+      values = [v + TXIN_SIZE_ESTIMATE*feeRate \
+                           for v in [7000000, 3000000, 2000000, 1500000]]
+      engine = CoinSelectionEngine(values, seed=1)
+
+      # base fee of a 1 recipient tx is 450 at this rate
+      result = engine.select(5000000 - 450, feeRate)
+      self.assertEqual(result.algo, 'bnb')
+      self.assertEqual(result.change, 0)
+      self.assertEqual(sorted(result.indices), [1, 2])
+      self.assertEqual(result.inputValue, result.fee + 5000000 - 450)
+
+   #############################################################################
+   def testSrdFallback(self):
+      engine = CoinSelectionEngine([10**8] * 5, seed=1)
+      result = engine.select(150000000, 10)
+      self.assertEqual(result.algo, 'srd')
+      self.assertEqual(len(result.indices), 2)
+      self.assertEqual(result.inputValue,
+                       150000000 + result.fee + result.change)
+
+      self.assertEqual(engine.select(5 * 10**8, 10), None)
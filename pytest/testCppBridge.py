@@ -0,0 +1,557 @@
+import sys
+sys.path.append('..')
+import asyncio
+import struct
+import threading
+import time
+import unittest
+
+from armoryengine import BridgeProto_pb2
+from armoryengine import CppBridge
+from armoryengine.CppBridge import BridgeSocket, BridgeError, \
+   CallbackDispatcher, CallbackWrapper, BridgeCache, BridgeCacheSet, BlockchainService, \
+   PyPromFut, BRIDGE_CLIENT_HEADER, RECV_BUFFER_INITIAL_SIZE, \
+   BRIDGE_CACHE_REORG_DEPTH
+from armoryengine.AsyncBridge import AsyncBridgeSocket, BridgeProtocol
+
+################################################################################
+class FakeAEAD(object):
+   """
+   Stands in for BIP15xConnection once the channel is up: frames are a
+   4 byte little endian length followed by the cleartext, no MAC.
+   """
+   def encrypted(self):
+      return True
+
+   def ready(self):
+      return True
+
+   def needsRekey(self, size):
+      return False
+
+   def encrypt(self, clearText, size):
+      return struct.pack('<I', size) + bytes(clearText)
+
+   def decodeSize(self, data):
+      return struct.unpack('<I', bytes(data[:4]))[0]
+
+   def getMacLen(self):
+      return 0
+
+   def decryptInPlace(self, data, size):
+      return data[4:4+size]
+
+   def decrypt(self, data, size):
+      return bytes(data[4:4+size])
+
+################################################################################
+class FakeSocket(object):
+   """ Records what is sent, serves what the test feeds it """
+   def __init__(self):
+      self.sent = []
+      self.inbound = bytearray()
+      self.closed = False
+      self.cv = threading.Condition()
+
+   def sendall(self, data):
+      self.sent.append(bytes(data))
+
+   def feed(self, data):
+      with self.cv:
+         self.inbound += data
+         self.cv.notify_all()
+
+   def close(self):
+      with self.cv:
+         self.closed = True
+         self.cv.notify_all()
+
+   def recv_into(self, view, size):
+      with self.cv:
+         while len(self.inbound) == 0 and not self.closed:
+            self.cv.wait()
+         if len(self.inbound) == 0:
+            return 0
+
+         count = min(size, len(self.inbound))
+         view[:count] = self.inbound[:count]
+         del self.inbound[:count]
+         return count
+
+################################################################################
+class FakeTransport(object):
+   def __init__(self, protocol):
+      self.protocol = protocol
+      self.written = []
+      self.closed = False
+
+   def write(self, data):
+      self.written.append(bytes(data))
+
+   def is_closing(self):
+      return self.closed
+
+   def close(self):
+      if not self.closed:
+         self.closed = True
+         self.protocol.connection_lost(None)
+
+################################################################################
+def makeRequest():
+   msg = BridgeProto_pb2.Request()
+   msg.service.get_node_status = True
+   return msg
+
+################################################################################
+def makeReplyFrame(refId, error=''):
+   payload = BridgeProto_pb2.Payload()
+   payload.reply.success = True
+   payload.reply.reference_id = refId
+   payload.reply.error = error
+
+   clearText = bytes([BRIDGE_CLIENT_HEADER]) + payload.SerializeToString()
+   return FakeAEAD().encrypt(clearText, len(clearText))
+
+################################################################################
+def parseRequestFrames(data):
+   requests = []
+   while len(data) > 0:
+      size = struct.unpack('<I', data[:4])[0]
+      clearText = data[4:4+size]
+      data = data[4+size:]
+
+      msg = BridgeProto_pb2.Request()
+      msg.ParseFromString(clearText[1:])
+      requests.append((clearText[0], msg))
+   return requests
+
+################################################################################
+class BridgeSocketTest(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      self.bridge = BridgeSocket()
+      self.bridge.bip15xConn = FakeAEAD()
+      self.bridge.clientSocket = FakeSocket()
+      self.bridge.rwLock = threading.Lock()
+      self.bridge.run = True
+      self.bridge.dispatcher.start()
+
+      self.reader = threading.Thread(target=self.bridge.readBridgeSocket)
+      self.reader.start()
+
+   def tearDown(self):
+      self.bridge.run = False
+      self.bridge.clientSocket.close()
+      self.reader.join(5)
+      self.bridge.dispatcher.stop()
+
+   #############################################################################
+   def testFraming(self):
+      fut = self.bridge.sendToBridgeProto(makeRequest(), True, None, [],
+         BRIDGE_CLIENT_HEADER)
+      fut2 = self.bridge.sendToBridgeProto(makeRequest(), True, None, [],
+         BRIDGE_CLIENT_HEADER)
+
+      requests = parseRequestFrames(b''.join(self.bridge.clientSocket.sent))
+      self.assertEqual(len(requests), 2)
+      self.assertEqual([r[0] for r in requests], [BRIDGE_CLIENT_HEADER]*2)
+      self.assertEqual([r[1].reference_id for r in requests], [0, 1])
+      self.assertTrue(requests[0][1].service.get_node_status)
+
+      self.bridge.clientSocket.feed(makeReplyFrame(0) + makeReplyFrame(1))
+      self.assertEqual(fut.getVal().reference_id, 0)
+      self.assertEqual(fut2.getVal().reference_id, 1)
+
+   #############################################################################
+   def testBatchRepliesOutOfOrder(self):
+      futs = self.bridge.sendToBridgeBatch([makeRequest() for i in range(3)])
+
+      #the whole batch goes out in a single write
+      self.assertEqual(len(self.bridge.clientSocket.sent), 1)
+      requests = parseRequestFrames(self.bridge.clientSocket.sent[0])
+      refIds = [r[1].reference_id for r in requests]
+      self.assertEqual(refIds, [0, 1, 2])
+
+      for refId in (2, 0, 1):
+         self.bridge.clientSocket.feed(makeReplyFrame(refId, str(refId)))
+
+      for refId, fut in zip(refIds, futs):
+         self.assertEqual(fut.getVal().error, str(refId))
+      self.assertEqual(len(self.bridge.responseDict), 0)
+
+   #############################################################################
+   def testSplitAndOversizedFrames(self):
+      futs = self.bridge.sendToBridgeBatch([makeRequest() for i in range(3)])
+
+      #the big reply doesn't fit the initial receive buffer, the small one
+      #comes right after it in the same chunk
+      bigError = 'x' * (3 * RECV_BUFFER_INITIAL_SIZE)
+      data = makeReplyFrame(0, 'a') + makeReplyFrame(1, bigError) + \
+         makeReplyFrame(2, 'c')
+
+      shrinkSize = CppBridge.RECV_BUFFER_SHRINK_SIZE
+      CppBridge.RECV_BUFFER_SHRINK_SIZE = 2 * RECV_BUFFER_INITIAL_SIZE
+      try:
+         for i in range(0, len(data), 4093):
+            self.bridge.clientSocket.feed(data[i:i+4093])
+
+         self.assertEqual(futs[0].getVal().error, 'a')
+         self.assertEqual(futs[1].getVal().error, bigError)
+         self.assertEqual(futs[2].getVal().error, 'c')
+      finally:
+         CppBridge.RECV_BUFFER_SHRINK_SIZE = shrinkSize
+
+      #the oversized buffer was released once the frame was parsed
+      self.assertEqual(len(self.bridge.recvBuffer), RECV_BUFFER_INITIAL_SIZE)
+
+   #############################################################################
+   def testRequestTrackingReleased(self):
+      stats = self.bridge.stats
+      fut = self.bridge.sendToBridgeProto(makeRequest(), True, None, [],
+         BRIDGE_CLIENT_HEADER)
+      lateFut = self.bridge.sendToBridgeProto(makeRequest(), True, None, [],
+         BRIDGE_CLIENT_HEADER)
+      self.assertEqual(len(stats.inFlight), 2)
+
+      self.bridge.clientSocket.feed(makeReplyFrame(0))
+      fut.getVal()
+      self.assertRaises(BridgeError, lateFut.getVal, 0.01)
+
+      self.assertEqual(len(stats.methodByRefId), 0)
+      self.assertEqual(len(stats.inFlight), 0)
+      self.assertEqual(len(self.bridge.responseDict), 0)
+
+      #a reply past the timeout is ignored
+      self.bridge.clientSocket.feed(makeReplyFrame(1))
+      self.bridge.run = False
+      fut = self.bridge.sendToBridgeProto(makeRequest(), True, None, [],
+         BRIDGE_CLIENT_HEADER)
+      self.assertRaises(BridgeError, fut.getVal)
+      self.assertEqual(len(stats.methodByRefId), 0)
+      self.assertEqual(
+         stats.snapshot()['methods']['service.get_node_status']['count'], 2)
+
+   #############################################################################
+   def testNotRunningFailsRightAway(self):
+      self.bridge.run = False
+
+      fut = self.bridge.sendToBridgeProto(makeRequest(), True, None, [],
+         BRIDGE_CLIENT_HEADER)
+      self.assertRaises(BridgeError, fut.getVal)
+
+      futs = self.bridge.sendToBridgeBatch([makeRequest(), makeRequest()])
+      self.assertEqual(len(futs), 2)
+      for fut in futs:
+         self.assertRaises(BridgeError, fut.getVal)
+
+      self.assertEqual(len(self.bridge.clientSocket.sent), 0)
+      self.assertEqual(len(self.bridge.responseDict), 0)
+
+   #############################################################################
+   def testConnectionLostFailsPending(self):
+      fut = self.bridge.sendToBridgeProto(makeRequest(), True, None, [],
+         BRIDGE_CLIENT_HEADER)
+      self.bridge.clientSocket.close()
+      self.reader.join(5)
+
+      self.assertRaises(BridgeError, fut.getVal)
+      self.assertFalse(self.bridge.run)
+      self.assertEqual(len(self.bridge.responseDict), 0)
+      self.assertEqual(len(self.bridge.stats.inFlight), 0)
+
+      #later requests don't hang either
+      fut = self.bridge.sendToBridgeProto(makeRequest(), True, None, [],
+         BRIDGE_CLIENT_HEADER)
+      self.assertRaises(BridgeError, fut.getVal)
+
+   #############################################################################
+   def testLazyConnectionCreatedOnce(self):
+      created = []
+      def slowConnection(sendFunc):
+         time.sleep(0.05)
+         conn = FakeAEAD()
+         created.append(conn)
+         return conn
+
+      bridge = BridgeSocket()
+      origConnection = CppBridge.BIP15xConnection
+      CppBridge.BIP15xConnection = slowConnection
+      try:
+         seen = []
+         threads = [threading.Thread(
+            target=lambda: seen.append(bridge.bip15xConnection)) \
+            for i in range(8)]
+         for thr in threads:
+            thr.start()
+         for thr in threads:
+            thr.join(5)
+      finally:
+         CppBridge.BIP15xConnection = origConnection
+
+      self.assertEqual(len(created), 1)
+      self.assertEqual(len(seen), 8)
+      self.assertTrue(all(conn is created[0] for conn in seen))
+
+################################################################################
+class CallbackDispatcherTest(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      self.dispatcher = CallbackDispatcher(workerCount=4)
+      self.dispatcher.start()
+
+   def tearDown(self):
+      self.dispatcher.stop()
+
+   #############################################################################
+   def waitIdle(self):
+      for i in range(500):
+         if self.dispatcher.getMetrics()['pending'] == 0:
+            return
+         time.sleep(0.01)
+      self.fail('dispatcher did not drain')
+
+   #############################################################################
+   def testSameKeyInOrder(self):
+      lock = threading.Lock()
+      running = []
+      order = []
+
+      def handler(i):
+         with lock:
+            running.append(i)
+            self.assertEqual(len(running), 1)
+         time.sleep(0.001)
+         with lock:
+            running.remove(i)
+            order.append(i)
+
+      for i in range(50):
+         self.dispatcher.submit('key', handler, i)
+      self.waitIdle()
+
+      self.assertEqual(order, list(range(50)))
+      metrics = self.dispatcher.getMetrics()
+      self.assertEqual(metrics['handlers']['key']['count'], 50)
+      self.assertEqual(metrics['handlers']['key']['depth'], 0)
+
+   #############################################################################
+   def testKeysRunInParallel(self):
+      #blocks until both keys are in their handler at the same time
+      barrier = threading.Barrier(2, timeout=5)
+      results = []
+
+      def handler(key):
+         barrier.wait()
+         results.append(key)
+
+      self.dispatcher.submit('a', handler, 'a')
+      self.dispatcher.submit('b', handler, 'b')
+      self.waitIdle()
+      self.assertEqual(sorted(results), ['a', 'b'])
+
+   #############################################################################
+   def testHandlerErrorKeepsWorker(self):
+      results = []
+
+      def failing():
+         raise ValueError('boom')
+
+      for i in range(8):
+         self.dispatcher.submit('key', failing)
+      self.dispatcher.submit('key', results.append, 1)
+      self.waitIdle()
+
+      self.assertEqual(results, [1])
+      self.assertEqual(self.dispatcher.getMetrics()['workers'], 4)
+
+   #############################################################################
+   def testCallbacksKeyedPerInstance(self):
+      #two instances of the same method must not wait on each other
+      barrier = threading.Barrier(2, timeout=5)
+      results = []
+
+      class Dialog(object):
+         def fetchCallback(self, reply):
+            barrier.wait()
+            results.append(reply)
+
+      dlgA, dlgB = Dialog(), Dialog()
+      wrapperA = CallbackWrapper(dlgA.fetchCallback)
+      self.assertEqual(wrapperA.getOrderingKey(),
+         CallbackWrapper(dlgA.fetchCallback).getOrderingKey())
+
+      wrapperA.execute(self.dispatcher, 'a')
+      CallbackWrapper(dlgB.fetchCallback).execute(self.dispatcher, 'b')
+      self.waitIdle()
+      self.assertEqual(sorted(results), ['a', 'b'])
+
+################################################################################
+class HeaderBridge(object):
+   """ Answers get_header_by_height, counts the round trips """
+   def __init__(self):
+      self.requestCount = 0
+
+   def sendToBridgeProto(self, msg, needsReply, callback, cbArgs, msgType):
+      self.requestCount += 1
+      height = msg.service.get_header_by_height.height
+
+      reply = BridgeProto_pb2.Reply()
+      reply.success = True
+      reply.service.header_data = height.to_bytes(80, 'little')
+
+      fut = PyPromFut()
+      fut.setVal(reply)
+      return fut
+
+################################################################################
+class BridgeCacheTest(unittest.TestCase):
+
+   #############################################################################
+   def testLruEviction(self):
+      cache = BridgeCache('test', 3)
+      for i in range(3):
+         cache.put(i, str(i))
+
+      #touch 0 so that 1 is the oldest
+      self.assertEqual(cache.get(0), '0')
+      cache.put(3, '3')
+      self.assertIs(cache.get(1), BridgeCache.MISS)
+      self.assertEqual(cache.get(0), '0')
+      self.assertEqual(cache.get(3), '3')
+
+      stats = cache.getStats()
+      self.assertEqual(stats['entries'], 3)
+      self.assertEqual(stats['evictions'], 1)
+      self.assertEqual(stats['hits'], 3)
+      self.assertEqual(stats['misses'], 1)
+
+   #############################################################################
+   def testByteBound(self):
+      cache = BridgeCache('test', 100, maxBytes=10, sizeFunc=len)
+      cache.put('a', b'x'*4)
+      cache.put('b', b'x'*4)
+      cache.put('c', b'x'*4)
+      self.assertIs(cache.get('a'), BridgeCache.MISS)
+      self.assertEqual(cache.getStats()['bytes'], 8)
+
+      #too big to ever fit, not cached and nothing evicted for it
+      cache.put('d', b'x'*11)
+      self.assertIs(cache.get('d'), BridgeCache.MISS)
+      self.assertEqual(cache.get('b'), b'x'*4)
+
+      #replacing a key doesn't count its old size twice
+      cache.put('b', b'x'*2)
+      self.assertEqual(cache.getStats()['bytes'], 6)
+
+   #############################################################################
+   def testReorgInvalidation(self):
+      caches = BridgeCacheSet()
+      caches.header.put(100, b'old', 100)
+      caches.header.put(200, b'new', 200)
+      caches.script.put('addr', b'scrAddr')
+
+      caches.onNewBlock(200 + BRIDGE_CACHE_REORG_DEPTH)
+      self.assertEqual(caches.header.get(100), b'old')
+      self.assertIs(caches.header.get(200), BridgeCache.MISS)
+      self.assertEqual(caches.script.get('addr'), b'scrAddr')
+      self.assertEqual(caches.header.getStats()['invalidations'], 1)
+
+   #############################################################################
+   def testServiceHitsCache(self):
+      bridge = HeaderBridge()
+      service = BlockchainService(bridge, BridgeCacheSet())
+
+      for i in range(3):
+         self.assertEqual(service.getHeaderByHeight(500),
+            (500).to_bytes(80, 'little'))
+      self.assertEqual(bridge.requestCount, 1)
+
+      #a new block close enough to 500 drops it, it may have been reorged
+      service.caches.onNewBlock(503)
+      service.getHeaderByHeight(500)
+      self.assertEqual(bridge.requestCount, 2)
+
+################################################################################
+class AsyncBridgeTest(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      self.loop = asyncio.new_event_loop()
+      self.bridge = AsyncBridgeSocket(self.loop)
+      self.bridge.bip15xConnection = FakeAEAD()
+      self.bridge.connected = self.loop.create_future()
+      self.bridge.closed = self.loop.create_future()
+      self.bridge.run = True
+
+      self.protocol = BridgeProtocol(self.bridge)
+      self.transport = FakeTransport(self.protocol)
+      self.protocol.connection_made(self.transport)
+
+   def tearDown(self):
+      self.loop.close()
+
+   #############################################################################
+   def getResult(self, fut):
+      return self.loop.run_until_complete(fut)
+
+   #############################################################################
+   def testStopBeforeConnect(self):
+      bridge = AsyncBridgeSocket(self.loop)
+      bridge.connected = self.loop.create_future()
+      bridge.closed = self.loop.create_future()
+      bridge.run = True
+
+      self.getResult(asyncio.wait_for(bridge.stop(), 5))
+      self.assertTrue(bridge.connected.cancelled())
+      self.assertTrue(bridge.closed.done())
+
+   #############################################################################
+   def testPartialPackets(self):
+      fut = self.bridge.sendToBridgeProto(makeRequest())
+      fut2 = self.bridge.sendToBridgeProto(makeRequest())
+      requests = parseRequestFrames(b''.join(self.transport.written))
+      self.assertEqual([r[1].reference_id for r in requests], [0, 1])
+
+      #one byte at a time, the second frame straddles the first
+      data = makeReplyFrame(1, 'b') + makeReplyFrame(0, 'a')
+      for i in range(len(data)):
+         self.protocol.data_received(data[i:i+1])
+
+      self.assertEqual(self.getResult(fut).error, 'a')
+      self.assertEqual(self.getResult(fut2).error, 'b')
+      self.assertFalse(self.transport.closed)
+      self.assertEqual(len(self.bridge.responseDict), 0)
+
+   #############################################################################
+   def testMalformedPayload(self):
+      fut = self.bridge.sendToBridgeProto(makeRequest())
+
+      #valid frame, garbage protobuf
+      clearText = bytes([BRIDGE_CLIENT_HEADER]) + b'\x0f\xff\xff'
+      self.protocol.data_received(
+         FakeAEAD().encrypt(clearText, len(clearText)) + makeReplyFrame(0))
+
+      self.assertTrue(self.transport.closed)
+      self.assertFalse(self.bridge.run)
+      self.assertRaises(BridgeError, self.getResult, fut)
+      self.assertTrue(self.bridge.closed.done())
+
+      #anything trailing the bad frame is ignored
+      self.protocol.data_received(makeReplyFrame(0))
+      self.assertEqual(len(self.protocol.buffer), 0)
+
+   #############################################################################
+   def testOversizedFrame(self):
+      fut = self.bridge.sendToBridgeProto(makeRequest())
+      self.protocol.data_received(struct.pack('<I', 2**31))
+
+      self.assertTrue(self.transport.closed)
+      self.assertRaises(BridgeError, self.getResult, fut)
+
+   #############################################################################
+   def testUserDataBeforeHandshake(self):
+      self.bridge.bip15xConnection.encrypted = lambda: False
+      self.protocol.data_received(makeReplyFrame(0)[4:])
+      self.assertTrue(self.transport.closed)
@@ -7,21 +7,20 @@
 ################################################################################
 import sys
 sys.path.append('..')
-from pytest.Tiab import TiabTest
 from armoryengine.ArmoryUtils import SplitSecret, binary_to_hex, ReconstructSecret,\
-   FiniteFieldError
+   FiniteFieldError, testReconstructSecrets
 import itertools
 import unittest
 
 
-SECRET = '\x00\x01\x02\x03\x04\x05\x06\x07'
+SECRET = b'\x00\x01\x02\x03\x04\x05\x06\x07'
 
-BAD_SECRET = '\xff\xff\xff\xff\xff\xff\xff\xff'
+BAD_SECRET = b'\xff\xff\xff\xff\xff\xff\xff\xff'
 
 # Fragment combination to String abreviated name for debugging purposes
 def c2s(combinationMap):
    return '\n'.join([' '.join([str(k), binary_to_hex(v[0]), binary_to_hex(v[1])]) \
-                      for k,v in combinationMap.iteritems()])
+                      for k,v in combinationMap.items()])
    
 def splitSecretToFragmentMap(splitSecret):
    fragMap = {}
@@ -30,7 +29,7 @@ def splitSecretToFragmentMap(splitSecret):
    return fragMap
 
 
-class Test(TiabTest):
+class Test(unittest.TestCase):
 
    def setUp(self):
       pass
@@ -39,7 +38,7 @@ class Test(TiabTest):
       pass
 
    def getNextCombination(self, fragmentMap, m):
-      combinationIterator = itertools.combinations(fragmentMap.iterkeys(), m)
+      combinationIterator = itertools.combinations(fragmentMap.keys(), m)
       for keyList in combinationIterator:
          combinationMap = {}
          for key in keyList:
@@ -50,7 +49,7 @@ class Test(TiabTest):
    def subtestAllFragmentedBackups(self, secret, m, n):
       fragmentMap = splitSecretToFragmentMap(SplitSecret(secret, m, n))
       for combinationMap in self.getNextCombination(fragmentMap, m):
-         fragmentList = [value for value in combinationMap.itervalues()]
+         fragmentList = [value for value in combinationMap.values()]
          reconSecret = ReconstructSecret(fragmentList, m, len(secret))
          self.assertEqual(reconSecret, secret)
          
@@ -70,8 +69,8 @@ class Test(TiabTest):
       # More needed than pieces
       self.assertRaises(FiniteFieldError, SplitSecret, SECRET, 4,3)
       
-      # Secret Too many needed needed
-      self.assertRaises(FiniteFieldError, SplitSecret, SECRET, 9, 12)
+      # More than 8 needed
+      self.subtestAllFragmentedBackups(SECRET, 11, 12)
 
       # Too few pieces needed
       self.assertRaises(FiniteFieldError, SplitSecret, SECRET, 1, 12)
@@ -81,6 +80,19 @@ class Test(TiabTest):
       reconSecret = ReconstructSecret(fragmentList[:2], 2, len(SECRET))
       self.assertNotEqual(reconSecret, SECRET)
 
+   def testReconstructAllSubsets(self):
+      fragmentMap = splitSecretToFragmentMap(SplitSecret(SECRET, 8, 12))
+      isRandom, results = testReconstructSecrets(fragmentMap, 8, None)
+      self.assertFalse(isRandom)
+      self.assertEqual(len(results), 495)
+      self.assertEqual(len(set(sub for sub, _ in results)), 495)
+      self.assertTrue(all(secret == SECRET for _, secret in results))
+
+      # a cap still samples at random
+      isRandom, results = testReconstructSecrets(fragmentMap, 8, 100)
+      self.assertTrue(isRandom)
+      self.assertEqual(len(results), 100)
+
 # Running tests with "python <module name>" will NOT work for any Armory tests
 # You must run tests with "python -m unittest <module name>" or run all tests with "python -m unittest discover"
 # if __name__ == "__main__":
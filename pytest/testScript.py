@@ -0,0 +1,92 @@
+import sys
+sys.path.append('..')
+import unittest
+from unittest import mock
+
+from armoryengine.ArmoryUtils import hex_to_binary
+from armoryengine.Script import PyScriptProcessor, parseScript, \
+   scriptParseCache, SCRIPT_NO_ERROR, SCRIPT_ERROR, OP_DISABLED, TX_INVALID, \
+   SCRIPT_STACK_SIZE_ERROR, HASH_OPS, OP_HASH160
+
+KEY = b'\x02' + b'\x33'*32
+# hash160(KEY)
+KEY_HASH160 = '5eb9b5e445db673f0ed8935d18cd205b214e5187'
+
+
+################################################################################
+class ScriptProcessorTest(unittest.TestCase):
+
+   #############################################################################
+   def runScript(self, hexScript, stack=None):
+      psp = PyScriptProcessor()
+      exitCode = psp.executeScript(hex_to_binary(hexScript), stack)
+      return exitCode, psp.stack
+
+   #############################################################################
+   def testParseScript(self):
+      script = hex_to_binary('76a914' + '11'*20 + '88ac')
+      instrList = parseScript(script)
+      self.assertEqual([op for op,_,_ in instrList], [0x76, 0xa9, 0x14, 0x88, 0xac])
+      self.assertEqual(instrList[2][1], b'\x11'*20)
+      self.assertEqual(instrList[-1][2], len(script))
+      self.assertTrue(parseScript(script) is instrList)
+      self.assertTrue(script in scriptParseCache)
+
+      # pushes running past the end of the script
+      self.assertEqual(parseScript(hex_to_binary('4c05aabb')), None)
+      self.assertEqual(parseScript(hex_to_binary('4d')), None)
+      self.assertEqual(parseScript(hex_to_binary('4e00000000aa'))[0][1], b'')
+
+   #############################################################################
+   def testIfElse(self):
+      # 1 IF 2 ELSE 3 ENDIF
+      self.assertEqual(self.runScript('516352675368'), (SCRIPT_NO_ERROR, [2]))
+      self.assertEqual(self.runScript('006352675368'), (SCRIPT_NO_ERROR, [3]))
+      # NOTIF flips the condition
+      self.assertEqual(self.runScript('006452675368'), (SCRIPT_NO_ERROR, [2]))
+
+      # nested, the inner IF doesn't pop anything in a skipped branch
+      # 0 IF 1 IF 4 ENDIF ELSE 5 ENDIF
+      self.assertEqual(self.runScript('006351635468675568'),
+                       (SCRIPT_NO_ERROR, [5]))
+      # 1 1 IF IF 6 ELSE 7 ENDIF ENDIF
+      self.assertEqual(self.runScript('515163635667576868'),
+                       (SCRIPT_NO_ERROR, [6]))
+
+      # ops in a skipped branch don't run, disabled ones still fail
+      self.assertEqual(self.runScript('00636a68'), (SCRIPT_NO_ERROR, []))
+      self.assertEqual(self.runScript('00637e68'), (OP_DISABLED, []))
+
+   #############################################################################
+   def testUnbalancedFlow(self):
+      self.assertEqual(self.runScript('5163')[0], SCRIPT_ERROR)
+      self.assertEqual(self.runScript('67')[0], SCRIPT_ERROR)
+      self.assertEqual(self.runScript('68')[0], SCRIPT_ERROR)
+      self.assertEqual(self.runScript('63')[0], SCRIPT_STACK_SIZE_ERROR)
+
+   #############################################################################
+   def testStackOps(self):
+      #hash160 goes through the bridge, serve the one hash this script needs
+      hashOps = {OP_HASH160: lambda bits: \
+         hex_to_binary(KEY_HASH160) if bits == KEY else b'\x00'*20}
+      with mock.patch.dict(HASH_OPS, hashOps):
+         script = '76a914' + KEY_HASH160 + '88'
+         self.assertEqual(self.runScript(script, [KEY]),
+                          (SCRIPT_NO_ERROR, [KEY]))
+         self.assertEqual(self.runScript(script, [b'\x02'])[0], TX_INVALID)
+
+      # 1 2 3 4 5 6 2ROT
+      self.assertEqual(self.runScript('51525354555671')[1], [3,4,5,6,1,2])
+      # 1 2 3 4 2SWAP
+      self.assertEqual(self.runScript('5152535472')[1], [3,4,1,2])
+      # 7 8 9 2 PICK, 7 8 9 2 ROLL
+      self.assertEqual(self.runScript('5758595279')[1], [7,8,9,7])
+      self.assertEqual(self.runScript('575859527a')[1], [8,9,7])
+      # 0NOTEQUAL, WITHIN
+      self.assertEqual(self.runScript('5592')[1], [1])
+      self.assertEqual(self.runScript('535258a5')[1], [1])
+      self.assertEqual(self.runScript('75')[0], SCRIPT_STACK_SIZE_ERROR)
+
+
+if __name__ == "__main__":
+   unittest.main()
@@ -0,0 +1,76 @@
+import sys
+sys.path.append('..')
+import random
+import unittest
+
+from armoryengine.Secp256k1 import JacobianBackend, AffineBackend, \
+   getWNAF, liftX, isOnCurve, G, N
+
+################################################################################
+class Secp256k1Test(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      self.rng = random.Random(1234)
+      self.fast = JacobianBackend()
+      self.slow = AffineBackend()
+
+   #############################################################################
+   def makeSigs(self, secret, count):
+      pubKey = self.fast.mulG(secret)
+      sigs = []
+      for i in range(count):
+         e = self.rng.randrange(2**256)
+         r, s, recid = self.fast.sign(e, secret, self.rng.randrange(1, N))
+         sigs.append((e, r, s, recid, pubKey))
+      return sigs
+
+   #############################################################################
+   def testWNAF(self):
+      for k in [1, 2, 15, 16, 0xdeadbeef, N-1]:
+         digits = getWNAF(k)
+         self.assertEqual(sum([d << i for i,d in enumerate(digits)]), k)
+         self.assertTrue(all([d == 0 or d & 1 for d in digits]))
+
+   #############################################################################
+   def testMatchesAffine(self):
+      self.assertEqual(self.fast.mulG(1), G)
+      self.assertIsNone(self.fast.mulG(N))
+      self.assertTrue(isOnCurve(liftX(G[0], 1)))
+
+      for i in range(3):
+         k = self.rng.randrange(1, N)
+         self.assertEqual(self.fast.mulG(k), self.slow.mulG(k))
+
+      for e, r, s, recid, pubKey in self.makeSigs(0x1234567, 2):
+         self.assertTrue(self.slow.verify(e, r, s, pubKey))
+         self.assertEqual(self.slow.recover(e, r, s, recid), pubKey)
+
+   #############################################################################
+   def testVerifyBatch(self):
+      # one key signing several times, as in an announcement file
+      sigs = self.makeSigs(0xabcdef, 4) + self.makeSigs(0x12345, 2)
+      checks = []
+      for e, r, s, recid, pubKey in sigs:
+         checks.append((e, r, s, pubKey))
+         checks.append((e+1, r, s, pubKey))
+      checks.append((1, 0, 1, G))
+      checks.append((1, 1, 1, (G[0], G[1]+1)))
+
+      results = self.fast.verifyBatch(checks)
+      self.assertEqual(results, [True, False]*6 + [False, False])
+      self.assertEqual(results, [self.fast.verify(*c) for c in checks])
+
+   #############################################################################
+   def testRecoverBatch(self):
+      sigs = self.makeSigs(0x777, 3) + self.makeSigs(0x888, 3)
+      items = [(e, r, s, recid) for e, r, s, recid, pubKey in sigs]
+      items.append((1, N, 1, 0))
+
+      recovered = self.fast.recoverBatch(items)
+      self.assertEqual(recovered[:-1], [sig[4] for sig in sigs])
+      self.assertIsNone(recovered[-1])
+
+      # the wrong recovery id gets some other key
+      e, r, s, recid, pubKey = sigs[0]
+      self.assertNotEqual(self.fast.recover(e, r, s, recid ^ 1), pubKey)
@@ -0,0 +1,65 @@
+import sys
+sys.path.append('..')
+import itertools
+import unittest
+
+from armoryengine.ArmoryUtils import FiniteField, FiniteFieldError
+from armoryengine.SecretSharing import ShamirEngine, batchInverse
+
+SECRET = 0x0123456789abcdef0123456789abcdef
+RAND_COEFFS = [0x1111 * (i+1) for i in range(15)]
+
+################################################################################
+class ShamirEngineTest(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      self.engine = ShamirEngine(16)
+
+   #############################################################################
+   def testBatchInverse(self):
+      prime = FiniteField.PRIMES[16]
+      vals = [1, 2, 12345, prime-1]
+      for v, inv in zip(vals, batchInverse(vals, prime)):
+         self.assertEqual(v * inv % prime, 1)
+      self.assertRaises(FiniteFieldError, batchInverse, [3, prime], prime)
+
+   #############################################################################
+   def testReconstruct(self):
+      points = self.engine.split(SECRET, 3, 5, RAND_COEFFS)
+      for subset in itertools.combinations(points, 3):
+         self.assertEqual(self.engine.reconstruct(list(subset)), SECRET)
+
+      # too few points interpolate some other polynomial
+      self.assertNotEqual(self.engine.reconstruct(points[:2]), SECRET)
+
+      # duplicate fragment
+      self.assertRaises(FiniteFieldError, self.engine.reconstruct,
+                        [points[0], points[0], points[1]])
+
+   #############################################################################
+   def testLargeM(self):
+      points = self.engine.split(SECRET, 16, 20, RAND_COEFFS)
+      self.assertEqual(self.engine.reconstruct(points[4:]), SECRET)
+      self.assertEqual(self.engine.reconstruct(points[:16]), SECRET)
+
+   #############################################################################
+   def testReconstructSubsets(self):
+      points = self.engine.split(SECRET, 4, 7, RAND_COEFFS)
+      xyMap = dict((i, pt) for i,pt in enumerate(points))
+      subsets = list(itertools.combinations(range(7), 4))
+
+      weights = self.engine.getWeightsBatch(
+         [[xyMap[k][0] for k in subset] for subset in subsets])
+      for subset, subWeights in zip(subsets, weights):
+         xs = [xyMap[k][0] for k in subset]
+         self.assertEqual(subWeights, self.engine.getWeights(xs))
+
+      results = self.engine.reconstructSubsets(xyMap, subsets)
+      self.assertEqual([r[0] for r in results], subsets)
+      self.assertTrue(all([r[1] == SECRET for r in results]))
+
+      # a corrupted fragment shows up in exactly the subsets using it
+      xyMap[2] = (xyMap[2][0], xyMap[2][1] + 1)
+      for subset, secret in self.engine.reconstructSubsets(xyMap, subsets):
+         self.assertEqual(secret == SECRET, 2 not in subset)
@@ -0,0 +1,117 @@
+import sys
+sys.path.append('..')
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from armoryengine.Settings import SettingsFile
+
+# os._exit skips atexit, so this has to go through a real process exit
+EXIT_SCRIPT = '''
+import sys
+sys.path[:0] = %r
+sys.argv = ['testSettings', '--datadir=%s']
+from armoryengine import Settings
+from armoryengine.ArmoryUtils import LOGERROR
+%s
+Settings.exitProcess(3)
+'''
+
+################################################################################
+class SettingsFileTest(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      self.settingsDir = tempfile.mkdtemp('armory_settings')
+      self.textPath = os.path.join(self.settingsDir, 'ArmorySettings.txt')
+      self.jsonPath = os.path.join(self.settingsDir, 'ArmorySettings.json')
+
+   def tearDown(self):
+      shutil.rmtree(self.settingsDir)
+
+   #############################################################################
+   def testBatchedWrites(self):
+      # a long delay, nothing reaches the disk until flush()
+      settings = SettingsFile(self.textPath, flushDelay=60)
+      for i in range(50):
+         settings.set('Wallet_abc_Prop%d' % i, i)
+      settings.extend('ListSetting', [1, 2])
+      settings.delete('Wallet_abc_Prop0')
+      self.assertEqual(settings.writeCount, 0)
+      self.assertFalse(os.path.exists(self.textPath))
+
+      settings.flush()
+      self.assertEqual(settings.writeCount, 1)
+      settings.flush()
+      self.assertEqual(settings.writeCount, 1)
+
+      reloaded = SettingsFile(self.textPath)
+      self.assertFalse(reloaded.hasSetting('Wallet_abc_Prop0'))
+      self.assertEqual(reloaded.get('Wallet_abc_Prop49'), 49)
+      self.assertEqual(reloaded.get('ListSetting'), [1, 2])
+      self.assertFalse(os.path.exists(self.textPath + '.tmp'))
+
+   #############################################################################
+   def testTransaction(self):
+      settings = SettingsFile(self.textPath, flushDelay=60)
+      with settings.transaction():
+         settings.set('MainGeometry', 'abcd')
+         settings.set('MainWalletCols', [10, 20])
+      self.assertEqual(settings.writeCount, 1)
+
+      try:
+         with settings.transaction():
+            settings.set('MainGeometry', 'efgh')
+            settings.extend('MainWalletCols', 30)
+            raise ValueError('abort')
+      except ValueError:
+         pass
+
+      self.assertEqual(settings.get('MainGeometry'), 'abcd')
+      self.assertEqual(settings.get('MainWalletCols'), [10, 20])
+      self.assertEqual(settings.writeCount, 1)
+      self.assertFalse(settings.dirty)
+
+   #############################################################################
+   def testJsonFormat(self):
+      settings = SettingsFile(self.jsonPath, flushDelay=0)
+      settings.set('DefaultFee', 1000)
+      settings.set('Language', 'en')
+      settings.set('NotifyIgnore', (True, 'abc'))
+
+      with open(self.jsonPath) as f:
+         self.assertEqual(json.load(f)['NotifyIgnore'], [True, 'abc'])
+
+      reloaded = SettingsFile(self.jsonPath)
+      self.assertEqual(reloaded.get('DefaultFee'), 1000)
+      self.assertEqual(reloaded.get('Language'), 'en')
+      self.assertEqual(reloaded.get('NotifyIgnore'), [True, 'abc'])
+
+   #############################################################################
+   def runExitScript(self, body):
+      paths = [os.path.abspath(p) for p in sys.path]
+      script = EXIT_SCRIPT % (paths, self.settingsDir, body)
+      proc = subprocess.run([sys.executable, '-c', script],
+         cwd=self.settingsDir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+      self.assertEqual(proc.returncode, 3, proc.stderr)
+
+   #############################################################################
+   def testPendingWriteOnExit(self):
+      self.runExitScript(
+         'Settings.TheSettings = Settings.SettingsFile(%r, flushDelay=60)\n'
+         'Settings.TheSettings.set("MainGeometry", "abcd")' % self.textPath)
+      reloaded = SettingsFile(self.textPath)
+      self.assertEqual(reloaded.get('MainGeometry'), 'abcd')
+
+   #############################################################################
+   def testQueuedLogsOnExit(self):
+      self.runExitScript(
+         'for i in range(200):\n'
+         '   LOGERROR("exit test line %d", i)')
+      with open(os.path.join(self.settingsDir, 'armorylog.txt')) as f:
+         lines = [l for l in f if 'exit test line' in l]
+      self.assertEqual(len(lines), 200)
+      self.assertTrue(lines[-1].rstrip().endswith('exit test line 199'))
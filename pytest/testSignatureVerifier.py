@@ -0,0 +1,127 @@
+import sys
+sys.path.append('..')
+import unittest
+
+from armoryengine.ArmoryUtils import hex_to_binary
+from armoryengine.SignatureVerifier import SigVerifyScheduler, \
+   verifyDERSignature
+from armoryengine.Transaction import PyTx, SigHashEngine, \
+   UnsignedTransaction
+from jasvet import EC_KEY
+
+# mainnet tx, single P2PKH input, sig and uncompressed pubkey in the txin
+signedTx = hex_to_binary( \
+   '01000000016290dce984203b6a5032e543e9e272d8bce934c7de4d15fa0fe44d'
+   'd49ae4ece9010000008b48304502204f2fa458d439f957308bca264689aa175e'
+   '3b7c5f78a901cb450ebd20936b2c500221008ea3883a5b80128e55c9c6070aa6'
+   '264e1e0ce3d18b7cd7e85108ce3d18b7419a0141044202550a5a6d3bb81549c4'
+   'a7803b1ad59cdbba4770439a4923624a8acfc7d34900beb54a24188f7f0a4068'
+   '9d905d4847cc7d6c8d808a457d833c2d44ef83f76bffffffff0242582c0a0000'
+   '00001976a914c1b4695d53b6ee57a28647ce63e45665df6762c288ac80d1f008'
+   '000000001976a9140e0aec36fe2545fb31a41164fb6954adcd96b34288ac00000000')
+
+################################################################################
+def derEncode(r, s):
+   def encInt(v):
+      b = v.to_bytes((v.bit_length() + 8) // 8, 'big')
+      return b'\x02' + bytes([len(b)]) + b
+   body = encInt(r) + encInt(s)
+   return b'\x30' + bytes([len(body)]) + body
+
+################################################################################
+class FakeInput(object):
+   """ Records the inputs the bridge signer is asked about """
+   def __init__(self, sigsNeeded, signerAnswer, asked):
+      self.sigsNeeded = sigsNeeded
+      self.signerAnswer = signerAnswer
+      self.asked = asked
+
+   def verifyAllSignatures(self, signer):
+      self.asked.append(self)
+      return self.signerAnswer
+
+################################################################################
+class SignatureVerifierTest(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      tx = PyTx().unserialize(signedTx)
+      sigScript = tx.inputs[0].binScript
+      self.sig = sigScript[1:1+sigScript[0]]
+      self.pubKey = sigScript[2+sigScript[0]:]
+
+      #P2PKH script of the output it spends, hash160 of self.pubKey
+      prevScript = hex_to_binary(
+         '76a914aff189b24a36a1b93de2ea4d157c13d18251270a88ac')
+      self.sigHash = SigHashEngine(tx).getSigHash(0, prevScript, self.sig[-1])
+
+   #############################################################################
+   def testMainnetSignature(self):
+      self.assertTrue(verifyDERSignature(self.sigHash, self.pubKey,
+                                         self.sig[:-1]))
+      self.assertFalse(verifyDERSignature(self.sigHash[::-1], self.pubKey,
+                                          self.sig[:-1]))
+      self.assertFalse(verifyDERSignature(self.sigHash, self.pubKey,
+                                          b'\x30\x02\x00'))
+
+   #############################################################################
+   def testCompressedKey(self):
+      key = EC_KEY(0x1234567)
+      point = key.pubkey.point
+      pubKey = bytes([2 + (point.y() & 1)]) + point.x().to_bytes(32, 'big')
+      rs = key.privkey.sign(int.from_bytes(self.sigHash, 'big'), 0xabcdef)
+
+      self.assertTrue(verifyDERSignature(self.sigHash, pubKey,
+                                         derEncode(rs.r, rs.s)))
+      self.assertFalse(verifyDERSignature(self.sigHash, pubKey,
+                                          derEncode(rs.r, rs.s + 1)))
+
+   #############################################################################
+   def testMemoizedBatch(self):
+      verifier = SigVerifyScheduler(maxWorkers=1)
+      good = (self.sigHash, self.pubKey, self.sig[:-1])
+      bad  = (self.sigHash[::-1], self.pubKey, self.sig[:-1])
+
+      self.assertEqual(verifier.verifyBatch([good, bad, good]),
+                       [True, False, True])
+      self.assertEqual(len(verifier.resultMap), 2)
+      self.assertEqual(verifier.getCached(*bad), False)
+
+      # cached results are served without verifying again
+      verifier.resultMap[good] = 'cached'
+      self.assertEqual(verifier.verify(*good), 'cached')
+
+   #############################################################################
+   def testProcessPool(self):
+      verifier = SigVerifyScheduler(maxWorkers=2, minParallel=2)
+      try:
+         checks = [(self.sigHash, self.pubKey, self.sig[:-1]),
+                   (self.sigHash[::-1], self.pubKey, self.sig[:-1])]
+         self.assertEqual(verifier.verifyBatch(checks), [True, False])
+      finally:
+         verifier.shutdown()
+
+   #############################################################################
+   def testVerifySigsRouting(self):
+      asked = []
+      localIn  = FakeInput(1, False, asked)
+      bridgeIn = FakeInput(1, True, asked)
+
+      ustx = UnsignedTransaction()
+      ustx.ustxInputs = [localIn, bridgeIn]
+      ustx.signer = object()
+      localResults = [[True], [None]]
+      ustx.verifyLocalSignatures = lambda: localResults
+
+      # inputs carrying signatures are settled locally, the signer is only
+      # asked about the others
+      self.assertTrue(ustx.verifySigsAllInputs())
+      self.assertEqual(asked, [bridgeIn])
+
+      localResults[0] = [False]
+      self.assertFalse(ustx.verifySigsAllInputs())
+
+      # no signer, unsigned inputs fail
+      ustx.signer = None
+      localResults[0] = [True]
+      self.assertFalse(ustx.verifySigsAllInputs())
@@ -0,0 +1,197 @@
+import sys
+sys.path.append('..')
+import hashlib
+import unittest
+from unittest import mock
+
+from armoryengine.ArmoryUtils import hex_to_binary, ONE_BTC, \
+   ADDRBYTE, SCRADDR_MULTISIG_BYTE, CPP_TXOUT_STDHASH160, CPP_TXOUT_P2SH, \
+   CPP_TXOUT_P2WPKH, CPP_TXOUT_STDPUBKEY65, CPP_TXOUT_MULTISIG, \
+   CPP_TXIN_STDUNCOMPR
+from armoryengine.BinaryPacker import varIntToBinary
+from armoryengine.Block import PyBlock
+from armoryengine.Transaction import PyTx, getMultisigScriptInfo, \
+   SigHashEngine, SIGHASH_ALL, SIGHASH_NONE, SIGHASH_SINGLE, \
+   SIGHASH_ANYONECANPAY, SIGHASH_SINGLE_BUG, classifyTxOutScripts, \
+   getTxInScriptTypes
+
+# BIP143 native P2WPKH example, input 1 spends 6 BTC
+bip143Tx = hex_to_binary( \
+   '0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f'
+   '0000000000eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57'
+   'b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85'
+   'c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2'
+   'f0167faa815988ac11000000')
+bip143ScriptCode = hex_to_binary( \
+   '76a9141d0f172a0ecb48aee1be1f2687d2963ae33f71a188ac')
+bip143SigHash = hex_to_binary( \
+   'c37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670')
+
+# Unserialize an reserialize
+tx1raw = hex_to_binary( \
+   '01000000016290dce984203b6a5032e543e9e272d8bce934c7de4d15fa0fe44d'
+   'd49ae4ece9010000008b48304502204f2fa458d439f957308bca264689aa175e'
+   '3b7c5f78a901cb450ebd20936b2c500221008ea3883a5b80128e55c9c6070aa6'
+   '264e1e0ce3d18b7cd7e85108ce3d18b7419a0141044202550a5a6d3bb81549c4'
+   'a7803b1ad59cdbba4770439a4923624a8acfc7d34900beb54a24188f7f0a4068'
+   '9d905d4847cc7d6c8d808a457d833c2d44ef83f76bffffffff0242582c0a0000'
+   '00001976a914c1b4695d53b6ee57a28647ce63e45665df6762c288ac80d1f008'
+   '000000001976a9140e0aec36fe2545fb31a41164fb6954adcd96b34288ac00000000')
+
+multiTx1raw = hex_to_binary( \
+   '0100000004a14fd232f045f0c9f28c6848a22fee393152e901eaa61a9f18438b3ba05c6035010000008a47304402201b19808aa145dbebf775ed11a15d763eaa2'
+   'b5df92b20f9835f62c72404918b1b02205aea3e816ac6ac7545254b9c34a00c37f20024793bbe0a64958934343f3c577b014104c0f3d0a4920bb6825769dd6ae1'
+   'e36b0ac36581639d605241cdd548c4ef5d46cda5ac21723d478041a63118f192fdb730c4cf76106789824cd68879a7afeb5288ffffffffa14fd232f045f0c9f28'
+   'c6848a22fee393152e901eaa61a9f18438b3ba05c6035000000008b4830450220796307d9787b892c8b1ada8511d99e855ea3099e1a76ce0f7aa783ed352a6e59'
+   '022100fc38d05d7dfbe51e28c36d854dd0dcc938d60a3e406573c3dc39253694d14a12014104630aaf9d5c8d757cb5759428d4075911a2b2ff13dd7208ad7ea1d'
+   '1682738a7138be93ee526c9d774e0dea03fa2a5fbb68043259ddfb942c0763f9b636b40c43fffffffffa14fd232f045f0c9f28c6848a22fee393152e901eaa61a'
+   '9f18438b3ba05c6035020000008c493046022100cb423b63197ef3cdbfaed69f61aac59755f0025bd6d7a9d3c78024d897ebcf94022100f3ad14804a3c8042387'
+   'eca9b9053abe99e12651a795cae7f546b08e1c08c6464014104649694df12dcd7fdb5a8c54c376b904bd7337891d865b8d306beb5d2e5d8fdf2a537d6f9df65ff'
+   '44eb0b6042ebfdf9e338bff7f4afacb359dd6c71aea7b9b92dffffffffa14fd232f045f0c9f28c6848a22fee393152e901eaa61a9f18438b3ba05c60350300000'
+   '08b483045022100fb9f4ddc68497a266362d489abf05184909a2b99aa64803061c88597b725877802207f39cf5a90a305aee45f365cf9e2d258e37cab4da6c123'
+   'aa287635cd1fd40dd001410438252055130f3dd242201684931550c4065efc1b87c48192f75868f747e2a9df9a700fed7e90068bd395c58680bd593780c8119e7'
+   '981dae08c345588f120fcb4ffffffff02e069f902000000001976a914ad00cf2b893e132c33a79a22ae938d6309c780a488ac80f0fa02000000001976a9143155'
+   '18b646ea65ad148ee1e2f0360233617447e288ac00000000')
+
+hexBlock = ( \
+    '01000000eb10c9a996a2340a4d74eaab41421ed8664aa49d18538bab59010000000000005a2f06efa9f2bd804f17877537f2080030cadbfa1eb50e02338117cc'
+    '604d91b9b7541a4ecfbb0a1a64f1ade70301000000010000000000000000000000000000000000000000000000000000000000000000ffffffff0804cfbb0a1a'
+    '02360affffffff0100f2052a01000000434104c2239c4eedb3beb26785753463be3ec62b82f6acd62efb65f452f8806f2ede0b338e31d1f69b1ce449558d7061'
+    'aa1648ddc2bf680834d3986624006a272dc21cac000000000100000003e8caa12bcb2e7e86499c9de49c45c5a1c6167ea4b894c8c83aebba1b6100f343010000'
+    '008c493046022100e2f5af5329d1244807f8347a2c8d9acc55a21a5db769e9274e7e7ba0bb605b26022100c34ca3350df5089f3415d8af82364d7f567a6a297f'
+    'cc2c1d2034865633238b8c014104129e422ac490ddfcb7b1c405ab9fb42441246c4bca578de4f27b230de08408c64cad03af71ee8a3140b40408a7058a1984a9'
+    'f246492386113764c1ac132990d1ffffffff5b55c18864e16c08ef9989d31c7a343e34c27c30cd7caa759651b0e08cae0106000000008c4930460221009ec9aa'
+    '3e0caf7caa321723dea561e232603e00686d4bfadf46c5c7352b07eb00022100a4f18d937d1e2354b2e69e02b18d11620a6a9332d563e9e2bbcb01cee559680a'
+    '014104411b35dd963028300e36e82ee8cf1b0c8d5bf1fc4273e970469f5cb931ee07759a2de5fef638961726d04bd5eb4e5072330b9b371e479733c942964bb8'
+    '6e2b22ffffffff3de0c1e913e6271769d8c0172cea2f00d6d3240afc3a20f9fa247ce58af30d2a010000008c493046022100b610e169fd15ac9f60fe2b507529'
+    '281cf2267673f4690ba428cbb2ba3c3811fd022100ffbe9e3d71b21977a8e97fde4c3ba47b896d08bc09ecb9d086bb59175b5b9f03014104ff07a1833fd8098b'
+    '25f48c66dcf8fde34cbdbcc0f5f21a8c2005b160406cbf34cc432842c6b37b2590d16b165b36a3efc9908d65fb0e605314c9b278f40f3e1affffffff0240420f'
+    '00000000001976a914adfa66f57ded1b655eb4ccd96ee07ca62bc1ddfd88ac007d6a7d040000001976a914981a0c9ae61fa8f8c96ae6f8e383d6e07e77133e88'
+    'ac00000000010000000138e7586e0784280df58bd3dc5e3d350c9036b1ec4107951378f45881799c92a4000000008a47304402207c945ae0bbdaf9dadba07bdf'
+    '23faa676485a53817af975ddf85a104f764fb93b02201ac6af32ddf597e610b4002e41f2de46664587a379a0161323a85389b4f82dda014104ec8883d3e4f7a3'
+    '9d75c9f5bb9fd581dc9fb1b7cdf7d6b5a665e4db1fdb09281a74ab138a2dba25248b5be38bf80249601ae688c90c6e0ac8811cdb740fcec31dffffffff022f66'
+    'ac61050000001976a914964642290c194e3bfab661c1085e47d67786d2d388ac2f77e200000000001976a9141486a7046affd935919a3cb4b50a8a0c233c286c'
+    '88ac00000000')
+
+################################################################################
+class TransactionTest(unittest.TestCase):
+
+   #############################################################################
+   def testSerializedSize(self):
+      tx1 = PyTx().unserialize(tx1raw)
+      self.assertEqual(tx1.getSerializedSize(), len(tx1raw))
+      self.assertEqual(tx1.inputs[0].getSerializedSize(),
+                       len(tx1.inputs[0].serialize()))
+      self.assertEqual(tx1.outputs[0].getSerializedSize(),
+                       len(tx1.outputs[0].serialize()))
+
+      blkRaw = hex_to_binary(hexBlock)
+      blk = PyBlock().unserialize(blkRaw)
+      self.assertEqual(blk.getSize(), len(blkRaw))
+
+   #############################################################################
+   def testSerializeCacheInvalidation(self):
+      tx1 = PyTx().unserialize(tx1raw)
+      origHash = tx1.getHash()
+      self.assertEqual(tx1.serialize(), tx1raw)
+      self.assertEqual(tx1.thisHash, origHash)
+
+      # assigning to a field of a child drops the cached bytes & hash
+      origScript = tx1.inputs[0].binScript
+      tx1.inputs[0].binScript = b'\x51'
+      self.assertNotEqual(tx1.serialize(), tx1raw)
+      self.assertNotEqual(tx1.getHash(), origHash)
+      tx1.inputs[0].binScript = origScript
+      self.assertEqual(tx1.serialize(), tx1raw)
+      self.assertEqual(tx1.getHash(), origHash)
+
+      # same for an outpoint, two levels down
+      tx1.inputs[0].outpoint.txOutIndex += 1
+      self.assertNotEqual(tx1.getHash(), origHash)
+      tx1.inputs[0].outpoint.txOutIndex -= 1
+      self.assertEqual(tx1.getHash(), origHash)
+
+      # and for in place edits of the txout list
+      txout = tx1.outputs.pop()
+      self.assertNotEqual(tx1.getHash(), origHash)
+      tx1.outputs.append(txout)
+      self.assertEqual(tx1.getHash(), origHash)
+
+      tx1.lockTime += 1
+      self.assertNotEqual(tx1.serialize(), tx1raw)
+
+   #############################################################################
+   def testSigHashEngine(self):
+      engine = SigHashEngine(PyTx().unserialize(bip143Tx))
+      self.assertEqual(engine.getSigHash(1, bip143ScriptCode, SIGHASH_ALL,
+                                         6 * ONE_BTC, True), bip143SigHash)
+
+      # legacy messages match the blank-a-copy method, for every hashtype
+      multiTx = PyTx().unserialize(multiTx1raw)
+      engine = SigHashEngine(multiTx)
+      scripts = [b'\x51\x52'] * len(multiTx.inputs)
+      txCopy = multiTx.copyWithoutWitness()
+      for txin in txCopy.inputs:
+         txin.binScript = b''
+      txCopy.inputs[2].binScript = scripts[2]
+      self.assertEqual(engine.getLegacyPreimage(2, scripts[2]),
+                       txCopy.serialize() + b'\x01\x00\x00\x00')
+
+      for hashcode in [SIGHASH_ALL, SIGHASH_NONE, SIGHASH_SINGLE]:
+         for acp in [0, SIGHASH_ANYONECANPAY]:
+            oneByOne = [engine.getSigHash(i, scripts[i], hashcode | acp) \
+                                             for i in range(len(scripts))]
+            self.assertEqual(oneByOne,
+               engine.getSigHashesForAllInputs(scripts, hashcode | acp))
+
+      # SIGHASH_SINGLE past the last output signs the constant "one"
+      self.assertEqual(len(multiTx.outputs), 2)
+      self.assertEqual(engine.getLegacyPreimage(3, b'', SIGHASH_SINGLE), None)
+      self.assertEqual(engine.getSigHash(3, b'', SIGHASH_SINGLE),
+                       SIGHASH_SINGLE_BUG)
+
+   #############################################################################
+   def testClassifyTxOutScripts(self):
+      tx1 = PyTx().unserialize(tx1raw)
+      pk33 = b'\x02' + b'\x11'*32
+      pk65 = b'\x04' + b'\x22'*64
+
+      #hash160 goes through the bridge, compute it locally instead
+      if 'ripemd160' not in hashlib.algorithms_available:
+         self.skipTest('no local ripemd160')
+
+      def hash160(data):
+         digest = hashlib.sha256(data).digest()
+         return hashlib.new('ripemd160', digest).digest()
+
+      for target in ['armoryengine.ArmoryUtils.hash160',
+                     'armoryengine.Transaction.hash160']:
+         patcher = mock.patch(target, hash160)
+         patcher.start()
+         self.addCleanup(patcher.stop)
+
+      msScript = b'\x51\x21' + pk33 + b'\x41' + pk65 + b'\x52\xae'
+      scripts = [tx1.outputs[0].binScript,
+                 b'\xa9\x14' + b'\x33'*20 + b'\x87',
+                 b'\x00\x14' + b'\x44'*20,
+                 b'\x41' + pk65 + b'\xac',
+                 msScript]
+
+      infoList = classifyTxOutScripts(scripts)
+      self.assertEqual([info[0] for info in infoList],
+         [CPP_TXOUT_STDHASH160, CPP_TXOUT_P2SH, CPP_TXOUT_P2WPKH,
+          CPP_TXOUT_STDPUBKEY65, CPP_TXOUT_MULTISIG])
+      self.assertEqual(infoList[0][1], ADDRBYTE + tx1.outputs[0].binScript[3:23])
+      self.assertEqual(infoList[3][1], ADDRBYTE + hash160(pk65))
+      self.assertEqual(infoList[4][1], SCRADDR_MULTISIG_BYTE + b'\x01\x02' + \
+         b''.join(sorted([hash160(pk33), hash160(pk65)])))
+      self.assertTrue(infoList[4][2].startswith('[Multisig 1-of-2]'))
+      self.assertEqual(getMultisigScriptInfo(msScript)[:2], (1, 2))
+
+      # packed buffer form gives the same answers
+      packed = b''.join([varIntToBinary(len(s)) + s for s in scripts])
+      self.assertEqual(classifyTxOutScripts(packed), infoList)
+
+      # txin templates
+      txinTypes = getTxInScriptTypes(tx1.inputs)
+      self.assertEqual(txinTypes, [CPP_TXIN_STDUNCOMPR])
@@ -0,0 +1,174 @@
+import sys
+sys.path.append('..')
+import unittest
+
+from armoryengine.ArmoryUtils import UINT32_MAX
+from armoryengine.BDM import TheBDM, NEW_ZC_ACTION, NEW_BLOCK_ACTION, \
+   REFRESH_ACTION
+from armoryengine.PyBtcWallet import PyBtcWallet
+from armoryengine.Transaction import PyTx, PyTxIn, PyTxOut, PyOutPoint
+from armoryengine.UtxoCache import WalletUtxoCache
+
+WALLET_ID = 'wltA'
+SCRADDR   = b'\x00' + b'\xaa'*20
+SCRIPT    = b'\x76\xa9\x14' + b'\xaa'*20 + b'\x88\xac'
+
+################################################################################
+class Record(object):
+   def __init__(self, **kwargs):
+      self.__dict__.update(kwargs)
+
+################################################################################
+def makeUtxo(n, height, value, txIndex=1):
+   return Record(tx_hash=bytes([n])*32, txout_index=0, value=value,
+                 tx_height=height, tx_index=txIndex, script=SCRIPT,
+                 scraddr=SCRADDR)
+
+################################################################################
+class FakeBridgeWallet(object):
+   """ Stands in for BridgeWalletWrapper, counts full list fetches """
+   def __init__(self, utxos):
+      self.utxos = utxos
+      self.zcUtxos = []
+      self.fetchCount = 0
+
+   def getUtxosForValue(self, value):
+      self.fetchCount += 1
+      return Record(utxo=list(self.utxos))
+
+   def getSpendableZCList(self):
+      return Record(utxo=list(self.zcUtxos))
+
+   def getRBFTxOutList(self):
+      return Record(utxo=[])
+
+   def getBalanceAndCount(self):
+      return Record(spendable=sum(u.value for u in self.utxos))
+
+################################################################################
+class WalletUtxoCacheTest(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      self.topHeight = 100
+      self.txMap = {}
+      self.bridgeWlt = FakeBridgeWallet(
+         [makeUtxo(i, 90+i, (i+1)*1000) for i in range(5)])
+      self.cache = WalletUtxoCache(self.bridgeWlt, WALLET_ID,
+                                   lambda: self.topHeight,
+                                   self.txMap.get)
+
+   #############################################################################
+   def testBuiltOnce(self):
+      self.assertEqual(len(self.cache.getUtxoSet()), 5)
+      self.assertEqual(self.cache.getUtxoSet()[0].getNumConfirm(), 11)
+      self.assertEqual(self.bridgeWlt.fetchCount, 1)
+
+      # copies are handed out, edits don't leak into the cache
+      self.cache.getUtxoSet()[0].sequence = 0
+      self.assertEqual(self.cache.getUtxoSet()[0].sequence, 2**32-1)
+
+   #############################################################################
+   def testNewBlock(self):
+      self.cache.getUtxoSet()
+      self.topHeight = 101
+      self.cache.onNotification(NEW_BLOCK_ACTION, 101)
+      self.assertEqual(self.cache.getUtxoSet()[0].getNumConfirm(), 12)
+      self.assertEqual(self.bridgeWlt.fetchCount, 1)
+
+      # block paying the wallet: balance check fails, full resync
+      self.bridgeWlt.utxos.append(makeUtxo(9, 102, 500))
+      self.topHeight = 102
+      self.cache.onNotification(NEW_BLOCK_ACTION, 102)
+      self.assertEqual(len(self.cache.getUtxoSet()), 6)
+      self.assertEqual(self.bridgeWlt.fetchCount, 2)
+
+   #############################################################################
+   def testZeroConfSpend(self):
+      self.cache.getUtxoSet()
+
+      tx = PyTx()
+      tx.version = 1
+      tx.lockTime = 0
+      txin = PyTxIn()
+      txin.outpoint = PyOutPoint(bytes([2])*32, 0)
+      txin.binScript = b''
+      txin.intSeq = 2**32-1
+      txout = PyTxOut()
+      txout.value = 1000
+      txout.binScript = SCRIPT
+      tx.inputs = [txin]
+      tx.outputs = [txout]
+      self.txMap[b'\x77'*32] = Record(raw=tx.serialize())
+
+      self.bridgeWlt.utxos = [u for u in self.bridgeWlt.utxos \
+                                 if u.tx_hash != bytes([2])*32]
+      self.cache.onNotification(NEW_ZC_ACTION,
+         Record(id='otherWlt', hash=b'\x66'*32),
+         Record(id=WALLET_ID, hash=b'\x77'*32))
+
+      utxoSet = self.cache.getUtxoSet()
+      self.assertEqual(len(utxoSet), 4)
+      self.assertEqual(utxoSet.getBalance(), 12000)
+      self.assertEqual(self.bridgeWlt.fetchCount, 1)
+
+   #############################################################################
+   def testReorgAndRefresh(self):
+      self.cache.getUtxoSet()
+
+      # chain shrinks to 93: outputs from 93 up are rolled back, the bridge
+      # agrees so no resync is needed
+      self.bridgeWlt.utxos = self.bridgeWlt.utxos[:3]
+      self.topHeight = 93
+      self.cache.onNotification(NEW_BLOCK_ACTION, 93)
+      self.assertEqual(len(self.cache.getUtxoSet()), 3)
+      self.assertEqual(self.bridgeWlt.fetchCount, 1)
+
+      self.cache.onNotification(REFRESH_ACTION, 'otherWlt')
+      self.cache.getUtxoSet()
+      self.assertEqual(self.bridgeWlt.fetchCount, 1)
+
+      self.cache.onNotification(REFRESH_ACTION, WALLET_ID)
+      self.cache.getUtxoSet()
+      self.assertEqual(self.bridgeWlt.fetchCount, 2)
+
+   #############################################################################
+   def testZeroConfHeights(self):
+      # zero conf outputs carry UINT32_MAX heights and can have tx indexes
+      # past the int32 range, in the full list as well as the ZC one
+      zcUtxo = makeUtxo(7, UINT32_MAX, 700, 2**31+5)
+      self.bridgeWlt.utxos.append(zcUtxo)
+      self.bridgeWlt.zcUtxos = [zcUtxo]
+
+      utxoSet = self.cache.getUtxoSet()
+      self.assertEqual(len(utxoSet), 6)
+      self.assertEqual(utxoSet[5].getTxHeight(), UINT32_MAX)
+      self.assertEqual(utxoSet[5].getTxIndex(), 2**31+5)
+      self.assertEqual(utxoSet[5].getNumConfirm(), 0)
+
+      zcSet = self.cache.getZCUtxoSet()
+      self.assertEqual(len(zcSet), 1)
+      self.assertEqual(zcSet[0].getTxHeight(), UINT32_MAX)
+      self.assertEqual(zcSet[0].getNumConfirm(), 0)
+
+      self.topHeight = 101
+      self.cache.onNotification(NEW_BLOCK_ACTION, 101)
+      utxoSet = self.cache.getUtxoSet()
+      self.assertEqual(utxoSet[5].getNumConfirm(), 0)
+      self.assertEqual(self.cache.getZCUtxoSet()[0].getNumConfirm(), 0)
+      self.assertEqual(self.bridgeWlt.fetchCount, 1)
+
+   #############################################################################
+   def testReleaseUtxoCache(self):
+      wlt = PyBtcWallet()
+      wlt.uniqueIDB58 = WALLET_ID
+      wlt.bridgeWalletObj = self.bridgeWlt
+
+      cache = wlt.getUtxoCache()
+      self.assertIn(cache.onNotification, TheBDM.getListenerList())
+      self.assertIs(wlt.getUtxoCache(), cache)
+
+      wlt.releaseUtxoCache()
+      self.assertNotIn(cache.onNotification, TheBDM.getListenerList())
+      self.assertIsNone(wlt.utxoCache)
+      wlt.releaseUtxoCache()
@@ -0,0 +1,107 @@
+import sys
+sys.path.append('..')
+import unittest
+
+from armoryengine.ArmoryUtils import binary_to_hex, UINT32_MAX
+from armoryengine.CoinSelection import PyUnspentTxOut, UnspentTxOutBase
+from armoryengine.UtxoSet import UtxoSet
+
+SCRADDR_A = b'\x00' + b'\xaa'*20
+SCRADDR_B = b'\x00' + b'\xbb'*20
+SCRIPT_A  = b'\x76\xa9\x14' + b'\xaa'*20 + b'\x88\xac'
+SCRIPT_B  = b'\x76\xa9\x14' + b'\xbb'*20 + b'\x88\xac'
+
+################################################################################
+class BridgeUtxo(object):
+   def __init__(self, **kwargs):
+      self.__dict__.update(kwargs)
+
+################################################################################
+class UtxoSetTest(unittest.TestCase):
+
+   #############################################################################
+   def setUp(self):
+      self.utxoSet = UtxoSet()
+      for i in range(10):
+         scrAddr, script = (SCRADDR_A, SCRIPT_A) if i%2 else \
+                           (SCRADDR_B, SCRIPT_B)
+         self.utxoSet.append(scrAddr, bytes([i])*32, 100+i, i, i%3,
+                             (i+1)*1000, 10-i, script)
+
+   #############################################################################
+   def testViews(self):
+      self.assertEqual(len(self.utxoSet), 10)
+      utxo = self.utxoSet[3]
+      self.assertTrue(isinstance(utxo, UnspentTxOutBase))
+      self.assertFalse(hasattr(utxo, '__dict__'))
+      self.assertEqual(utxo.getValue(), 4000)
+      self.assertEqual(utxo.getTxHash(), b'\x03'*32)
+      self.assertEqual(utxo.getTxHashStr(), binary_to_hex(b'\x03'*32))
+      self.assertEqual(utxo.getTxOutIndex(), 0)
+      self.assertEqual(utxo.getTxHeight(), 103)
+      self.assertEqual(utxo.getNumConfirm(), 7)
+      self.assertEqual(utxo.getRecipientScrAddr(), SCRADDR_A)
+      self.assertEqual(utxo.getScript(), SCRIPT_A)
+      self.assertEqual(self.utxoSet[-1].getValue(), 10000)
+
+      # edits through one view are seen by the others
+      utxo.sequence = 0xfffffffd
+      utxo.setChecked(False)
+      self.assertEqual(self.utxoSet[3].sequence, 0xfffffffd)
+      self.assertFalse(self.utxoSet[3].isChecked())
+
+      # scrAddrs and scripts are stored once
+      self.assertEqual(len(self.utxoSet.scrAddrList), 2)
+      self.assertEqual(len(self.utxoSet.scriptList), 2)
+
+   #############################################################################
+   def testFilters(self):
+      rows = self.utxoSet.getRowsByConf(6)
+      self.assertEqual(list(rows), [0, 1, 2, 3, 4])
+      self.assertEqual(list(self.utxoSet.getRowsByValue(3000, 5000)),
+                       [2, 3, 4])
+      self.assertEqual(list(self.utxoSet.getRowsByScrAddr(SCRADDR_A)),
+                       [1, 3, 5, 7, 9])
+      self.assertEqual(self.utxoSet.getBalance(), 55000)
+      self.assertEqual(self.utxoSet.getBalance(rows), 15000)
+
+      sub = self.utxoSet.subset(rows)
+      self.assertEqual(len(sub), 5)
+      self.assertEqual(sub.getBalance(), 15000)
+      self.assertEqual(sub[4].getTxHash(), b'\x04'*32)
+      self.assertEqual(sub[4].getScript(), SCRIPT_B)
+
+   #############################################################################
+   def testFromUtxoList(self):
+      utxoList = [PyUnspentTxOut(SCRADDR_A, b'\x01'*32, 2, 5000, 3, SCRIPT_A)]
+      utxoSet = UtxoSet.fromUtxoList(utxoList)
+      self.assertEqual(utxoSet[0].getValue(), 5000)
+      self.assertEqual(utxoSet[0].getTxOutIndex(), 2)
+      self.assertEqual(utxoSet[0].getScript(), SCRIPT_A)
+
+   #############################################################################
+   def testZeroConf(self):
+      # ZC outputs come from the bridge with UINT32_MAX heights and a ZC id
+      # past INT32_MAX as tx index
+      bridgeUtxo = BridgeUtxo(tx_hash=b'\x0f'*32, txout_index=1, value=7000,
+         tx_height=UINT32_MAX, tx_index=2**31 + 5, script=SCRIPT_A,
+         scraddr=SCRADDR_A)
+
+      utxoSet = UtxoSet.fromBridgeUtxos([bridgeUtxo], topHeight=500)
+      self.assertEqual(utxoSet[0].getTxHeight(), UINT32_MAX)
+      self.assertEqual(utxoSet[0].getTxIndex(), 2**31 + 5)
+      self.assertEqual(utxoSet[0].getNumConfirm(), 0)
+
+      self.utxoSet.append(SCRADDR_A, b'\x0f'*32, UINT32_MAX, 2**31 + 5, 1,
+                          7000, 500 - UINT32_MAX + 1, SCRIPT_A)
+      self.assertEqual(self.utxoSet[10].getNumConfirm(), 0)
+      self.assertEqual(list(self.utxoSet.getRowsByConf(0, 0)), [10])
+
+      # a new block doesn't give it confirmations
+      self.utxoSet.updateConfs(1000)
+      self.assertEqual(self.utxoSet[10].getNumConfirm(), 0)
+      self.assertEqual(self.utxoSet[0].getNumConfirm(), 901)
+
+      self.assertEqual(self.utxoSet.copy()[10].getTxHeight(), UINT32_MAX)
+      self.assertEqual(UtxoSet.fromUtxoList([self.utxoSet[10]])[0].getTxIndex(),
+                       2**31 + 5)
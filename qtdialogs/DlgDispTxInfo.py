@@ -27,7 +27,7 @@ from armoryengine.AddressUtils import addrStr_to_hash160, \
 
 from armoryengine.BDM import TheBDM, BDM_BLOCKCHAIN_READY
 from armoryengine.Transaction import UnsignedTransaction, \
-   determineSentToSelfAmt, PyTx, getTxInScriptType, getTxOutScriptType, \
+   determineSentToSelfAmt, PyTx, getTxInScriptTypes, classifyTxOutScripts, \
    TxInExtractAddrStrIfAvail
 from armoryengine.Block import PyBlockHeader
 from armoryengine.Script import convertScriptToOpStrings
@@ -60,7 +60,7 @@ class DlgDisplayTxIn(ArmoryDialog):
          pytx = ustx.getPyTxSignedIfPossible()
 
       txin = pytx.inputs[txiIndex]
-      scrType  = getTxInScriptType(txin)
+      scrType  = getTxInScriptTypes([txin])[0]
       typeName = CPP_TXIN_SCRIPT_NAMES[scrType]
       txHashBE = binary_to_hex(txin.outpoint.txHash, BIGENDIAN)
       txIdxBE  = int_to_hex(txin.outpoint.txOutIndex, 4, BIGENDIAN)
@@ -98,12 +98,11 @@ class DlgDisplayTxIn(ArmoryDialog):
             dispLines.append('      %s' % op)
 
       wltID = ''
-      scrType = getTxInScriptType(txin)
       if txinListFromBDM and len(txinListFromBDM[txiIndex][0])>0:
 
          # We had a BDM to help us get info on each input -- use it
          scrAddr,val,blk,hsh,idx,script = txinListFromBDM[txiIndex]
-         scrType = getTxOutScriptType(script)
+         scrType = classifyTxOutScripts([script])[0][0]
 
          dispInfo = self.main.getDisplayStringForScript(script, 100, prefIDOverAddr=True)
          #print dispInfo
@@ -176,8 +175,7 @@ class DlgDisplayTxOut(ArmoryDialog):
       txout   = pytx.outputs[txoIndex]
       val     = txout.value
       script  = txout.binScript
-      scrAddr = script_to_scrAddr(script)
-      scrType = getTxOutScriptType(script)
+      scrType, scrAddr, _ = classifyTxOutScripts([script])[0]
 
       dispInfo = self.main.getDisplayStringForScript(script, 100, prefIDOverAddr=True)
       #print dispInfo
@@ -803,7 +801,7 @@ class DlgDispTxInfo(ArmoryDialog):
       if hexScript:
          binScript = hex_to_binary(hexScript)
          addrStr = None
-         scrType = getTxOutScriptType(binScript)
+         scrType = classifyTxOutScripts([binScript])[0][0]
          if scrType in CPP_TXOUT_HAS_ADDRSTR:
             addrStr = script_to_addrStr(binScript)
 
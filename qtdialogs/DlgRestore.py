@@ -967,7 +967,8 @@ class DlgRestoreFragged(ArmoryDialog):
          fragMap[binary_to_int(x, BIGENDIAN) - 1] = [x, y]
       typeToBytes = {'0': 64, BACKUP_TYPE_135A: 64, BACKUP_TYPE_135C: 32}
 
-      isRandom, results = testReconstructSecrets(fragMap, M, 100)
+      # the batched solver makes testing every subset cheap, even 8-of-12
+      isRandom, results = testReconstructSecrets(fragMap, M, None)
       def privAndChainFromRow(secret):
          priv, chain = None, None
          #if len(secret) == 64:
@@ -982,8 +983,15 @@ class DlgRestoreFragged(ArmoryDialog):
             #LOGERROR('Root secret is %s bytes ?!' % len(secret))
             #raise KeyDataError
 
-      results = [(row[0], privAndChainFromRow(row[1])) for row in results]
-      subsAndIDs = [(row[0], calcWalletIDFromRoot(*row[1])) for row in results]
+      # a sound backup yields one secret for every subset, only compute the
+      # wallet ID once per distinct secret
+      idPerSecret = {}
+      subsAndIDs = []
+      for subset, secret in results:
+         if secret not in idPerSecret:
+            idPerSecret[secret] = \
+               calcWalletIDFromRoot(*privAndChainFromRow(secret))
+         subsAndIDs.append((subset, idPerSecret[secret]))
 
       DlgShowTestResults(self, isRandom, subsAndIDs, \
          M, len(fragMtrx), self.testWltID).exec_()
@@ -232,7 +232,7 @@ sys.path.append('/usr/lib/armory')
 from armoryengine.ALL import PyBtcWallet, binary_to_hex, hex_to_binary, \
                              SecureBinaryData, addrStr_to_hash160, sha256, \
                              ADDRBYTE
-from jasvet import ASv1CS, readSigBlock, verifySignature
+from jasvet import ASv1CS, readSigBlock, verifySignatures
    
 origDLFile   = os.path.join(srcAnnounce, 'dllinks.txt')
 newDLFile    = os.path.join(srcAnnounce, 'dllinks_temp.txt')
@@ -374,13 +374,20 @@ print('*'*80)
 
 print('')
 print('Verifying files')
+sigNames, sigsAndMsgs = [], []
 for fname,vals in fileMappings.iteritems():
    if 'bootstrap' in fname:
       continue
    with open(os.path.join(dstAnnounce, fname), 'rb') as f:
-      sig,msg = readSigBlock(f.read())
-      addrB58 = verifySignature(sig, msg, 'v1', ord(ADDRBYTE))
-      print('Sign addr for:', vals[0].ljust(longestID+3), addrB58)
+      sigNames.append(vals[0])
+      sigsAndMsgs.append(readSigBlock(f.read()))
+
+# one batch for all the files, None for a signature that fails
+addrList = verifySignatures(sigsAndMsgs, 'v1', ord(ADDRBYTE))
+for name,addrB58 in zip(sigNames, addrList):
+   if addrB58 is None:
+      raise Exception('Bad signature for %s' % name)
+   print('Sign addr for:', name.ljust(longestID+3), addrB58)
    
 
 
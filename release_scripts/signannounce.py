@@ -14,7 +14,7 @@ sys.path.append('..')
 sys.path.append('/usr/lib/armory')
 
 from armoryengine.ALL import *
-from jasvet import ASv1CS, readSigBlock, verifySignature
+from jasvet import ASv1CS, readSigBlock, verifySignatures
 
 
 def signAnnounceFiles(wltPath):
@@ -214,13 +214,20 @@ def signAnnounceFiles(wltPath):
    
    print('')
    print('Verifying files')
+   sigNames, sigsAndMsgs = [], []
    for fname,vals in fileMappings.iteritems():
       if 'bootstrap' in fname:
          continue
       with open(os.path.join(outDir, fname), 'rb') as f:
-         sig,msg = readSigBlock(f.read())
-         addrB58 = verifySignature(sig, msg, 'v1', ord(ADDRBYTE))
-         print('Sign addr for:', vals[0].ljust(longestID+3), addrB58)
+         sigNames.append(vals[0])
+         sigsAndMsgs.append(readSigBlock(f.read()))
+
+   # one batch for all the files, None for a signature that fails
+   addrList = verifySignatures(sigsAndMsgs, 'v1', ord(ADDRBYTE))
+   for name,addrB58 in zip(sigNames, addrList):
+      if addrB58 is None:
+         raise Exception('Bad signature for %s' % name)
+      print('Sign addr for:', name.ljust(longestID+3), addrB58)
       
    
    
@@ -140,7 +140,7 @@ class MessageSigningWidget(QWidget):
             privateKey = self.getPrivateKeyFromAddrInput()
             if privateKey:
                signature = ASv0(privateKey, messageText)
-               self.signatureDisplay.setPlainText(signature['b64-signature'])
+               self.signatureDisplay.setPlainText(signature['b64-signature'].decode('ascii'))
             else:
                QMessageBox.warning(self, self.tr('Private Key Not Known'), self.tr('The private key is not known for this address.'), QMessageBox.Ok)
          except:
@@ -156,7 +156,7 @@ class MessageSigningWidget(QWidget):
             privateKey = self.getPrivateKeyFromAddrInput()
             if privateKey:
                signature = ASv1B64(self.getPrivateKeyFromAddrInput(), messageText)
-               self.signatureDisplay.setPlainText(signature)    
+               self.signatureDisplay.setPlainText(signature.decode('utf-8'))    
             else:
                QMessageBox.warning(self, self.tr('Private Key Not Known'), self.tr('The private key is not known for this address.'), QMessageBox.Ok)
          except:
@@ -175,7 +175,7 @@ class MessageSigningWidget(QWidget):
             raise
          if privateKey:
             signature = ASv1CS(privateKey, messageText)
-            self.signatureDisplay.setPlainText(signature)
+            self.signatureDisplay.setPlainText(signature.decode('utf-8'))
          else:
             QMessageBox.warning(self, self.tr('Private Key Not Known'), self.tr('The private key is not known for this address.'), QMessageBox.Ok)
 
@@ -288,7 +288,7 @@ class BareSignatureVerificationWidget(SignatureVerificationWidget):
       messageString = str(self.messageTextEdit.toPlainText())
       try:
          addrB58 = verifySignature(str(self.signatureTextEdit.toPlainText()), \
-                         messageString, 'v0', ord(ADDRBYTE))
+                         messageString, 'v0', ord(ADDRBYTE)).decode('ascii')
          if addrB58 == str(self.addressLineEdit.text()):
             self.displayVerifiedBox(addrB58, messageString)
          else:
@@ -328,7 +328,8 @@ class SignedMessageBlockVerificationWidget(SignatureVerificationWidget):
    def verifySignature(self):
       try:
          sig, msg = readSigBlock(str(self.signedMessageBlockTextEdit.toPlainText()))
-         addrB58 = verifySignature(sig, msg, 'v1', ord(ADDRBYTE) )
+         msg = msg.decode('utf-8')
+         addrB58 = verifySignature(sig, msg, 'v1', ord(ADDRBYTE) ).decode('ascii')
          self.displayVerifiedBox(addrB58, msg)
          self.messageTextEdit.setPlainText(msg)
       except:   